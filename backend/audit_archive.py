@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Audit Partition Archive Tool for Gold Shop ERP
+==============================================
+Manages the month-partitioned audit collections (see audit_partitions.py):
+
+- list      show every partition with its status, record count and archive
+- archive   archive hot partitions older than the retention window now
+            (the server does this daily), or one month with --month
+- restore   load an archived month back so it can be searched again
+- migrate   move the rows of the old unpartitioned audit_logs /
+            auth_audit_logs collections into month partitions; run ONCE
+            after deploying partitioned storage (safe to re-run)
+
+Usage:
+    python audit_archive.py list
+    python audit_archive.py archive [--retention-months 12] [--base audit_logs --month 2025-01]
+    python audit_archive.py restore --base audit_logs --month 2025-01
+    python audit_archive.py migrate [--base audit_logs]
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from audit_partitions import BASES, RETENTION_MONTHS, AuditPartitions
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'gold_shop_erp')
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[DB_NAME]
+
+
+def month_arg(value: str) -> str:
+    """YYYY-MM or YYYYMM -> partition month key."""
+    key = value.replace("-", "")
+    if len(key) != 6 or not key.isdigit() or not 1 <= int(key[4:]) <= 12:
+        raise ValueError(f"Invalid month {value!r}, expected YYYY-MM")
+    return key
+
+
+async def list_partitions(partitions: AuditPartitions):
+    entries = await partitions.list_partitions()
+    print(f"\n  {'collection':<28} {'status':<10} {'records':>9}  archive")
+    for entry in entries:
+        if entry["status"] == "hot":
+            records = await db[entry["collection"]].estimated_document_count()
+        else:
+            records = entry.get("archived_count", "")
+        print(f"  {entry['collection']:<28} {entry['status']:<10} {records:>9}  {entry.get('archive_path') or ''}")
+    for base in BASES:
+        legacy = await db[base].estimated_document_count()
+        if legacy:
+            print(f"\n  ⚠️  {base} (unpartitioned) still holds {legacy} records - run: python audit_archive.py migrate")
+    print(f"\n  {len(entries)} partitions")
+
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List, archive, restore or migrate month-partitioned audit logs')
+    parser.add_argument('command', choices=['list', 'archive', 'restore', 'migrate'])
+    parser.add_argument('--base', choices=BASES, help='audit_logs or auth_audit_logs (default: both for migrate)')
+    parser.add_argument('--month', help='Partition month, YYYY-MM')
+    parser.add_argument('--retention-months', type=int, default=RETENTION_MONTHS,
+                        help='Archive partitions older than this many months')
+    args = parser.parse_args()
+
+    partitions = AuditPartitions(db, retention_months=args.retention_months)
+    try:
+        if args.command == 'list':
+            await list_partitions(partitions)
+        elif args.command == 'archive':
+            if args.month:
+                if not args.base:
+                    parser.error("--month needs --base")
+                results = [await partitions.archive_partition(args.base, month_arg(args.month))]
+            else:
+                results = await partitions.archive_expired()
+            for result in results:
+                print(f"  ✓ {result['collection']}: {result['archived_count']} records -> {result['archive_path']}")
+            print(f"\n  Archived {len(results)} partitions")
+        elif args.command == 'restore':
+            if not (args.base and args.month):
+                parser.error("restore needs --base and --month")
+            result = await partitions.restore_partition(args.base, month_arg(args.month))
+            print(f"  ✓ {result['collection']}: {result['restored']} records restored "
+                  f"({result['duplicates']} already present) from {result['archive_path']}")
+        else:
+            for base in ([args.base] if args.base else BASES):
+                result = await partitions.migrate_legacy(base)
+                print(f"  ✓ {base}: moved {result['moved']} records into {result['months']} partitions"
+                      + (f", {result['left']} without a timestamp left in place" if result['left'] else ""))
+    except Exception as e:
+        print(f"\n✗ {args.command} failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,436 @@
+"""
+Month-Partitioned Audit Storage
+-------------------------------
+``audit_logs`` and ``auth_audit_logs`` grew without bound and every audit
+list call counted and sorted the whole collection. Records are now written
+to one collection per calendar month (``audit_logs_202610``,
+``auth_audit_logs_202610``) and ``AuditPartitions`` routes reads:
+
+- ``collection_for`` names the partition for a record's timestamp, creating
+  its indexes and catalog entry (``audit_partitions``) on first use; a late
+  record (WAL replay, clock skew) for an archived month reopens that month
+  as hot, and archiving it again merges the earlier archive into the new one
+- ``read_collections`` lists the hot partitions covering a date range,
+  newest first, followed by the legacy unpartitioned collection while it
+  still holds rows (it only holds rows older than every partition; run
+  ``audit_archive.py migrate`` once to move them)
+- ``paginate`` / ``find`` page through those collections in order: page mode
+  skips whole partitions by their counts, cursor mode resumes in the
+  partition of the cursor row, so no query touches more than the months
+  it needs
+
+Partitions older than AUDIT_RETENTION_MONTHS (default 12) are archived by a
+background task (every AUDIT_ARCHIVE_INTERVAL_HOURS) to gzip-compressed
+JSONL files under AUDIT_ARCHIVE_DIR and dropped once the file is written and
+its line count verified. ``restore_partition`` loads an archive back into a
+hot partition, held for AUDIT_RESTORE_HOLD_DAYS before it may be archived
+again. Archived months are not searched; ``audit_archive.py`` lists,
+archives, restores and migrates from the command line.
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError
+
+from db_indexes import register_indexes
+from pagination import COUNT_MODES, count_documents, decode_cursor, encode_cursor, keyset_filter
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', '12'))
+ARCHIVE_DIR = os.environ.get('AUDIT_ARCHIVE_DIR', str(Path(__file__).parent / 'audit_archive'))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('AUDIT_ARCHIVE_INTERVAL_HOURS', '24'))
+RESTORE_HOLD_DAYS = int(os.environ.get('AUDIT_RESTORE_HOLD_DAYS', '7'))
+BATCH_SIZE = 1000
+
+DUPLICATE_KEY = 11000
+
+# Indexes of every partition, mirroring the unpartitioned collections
+PARTITION_INDEXES = {
+    "audit_logs": [
+        {"name": "id_unique", "keys": [("id", 1)], "options": {"unique": True}},
+        {"name": "timestamp_id", "keys": [("timestamp", -1), ("id", -1)], "options": {}},
+        {"name": "module_timestamp", "keys": [("module", 1), ("timestamp", -1)], "options": {}},
+        {"name": "user_timestamp", "keys": [("user_id", 1), ("timestamp", -1)], "options": {}},
+        {"name": "record_id", "keys": [("record_id", 1)], "options": {}},
+    ],
+    "auth_audit_logs": [
+        {"name": "id_unique", "keys": [("id", 1)], "options": {"unique": True}},
+        {"name": "timestamp_id", "keys": [("timestamp", -1), ("id", -1)], "options": {}},
+    ],
+}
+BASES = tuple(PARTITION_INDEXES)
+
+register_indexes("audit_partitions", [
+    {"name": "id_unique", "keys": [("id", 1)], "options": {"unique": True}},
+    {"name": "base_status_month", "keys": [("base", 1), ("status", 1), ("month", -1)], "options": {}},
+])
+
+
+def month_key(moment: datetime) -> str:
+    return f"{moment.year:04d}{moment.month:02d}"
+
+
+def shift_month(key: str, months: int) -> str:
+    index = int(key[:4]) * 12 + int(key[4:]) - 1 + months
+    return f"{index // 12:04d}{index % 12 + 1:02d}"
+
+
+def partition_name(base: str, key: str) -> str:
+    return f"{base}_{key}"
+
+
+def partition_month(name: str) -> Optional[str]:
+    """Month key of a partition collection name; None for the legacy collection."""
+    suffix = name.rsplit("_", 1)[-1]
+    return suffix if len(suffix) == 6 and suffix.isdigit() else None
+
+
+class AuditPartitions:
+    def __init__(self, db, retention_months: int = RETENTION_MONTHS, archive_dir: str = ARCHIVE_DIR):
+        self.db = db
+        self.retention_months = retention_months
+        self.archive_dir = Path(archive_dir)
+        self._ready: set = set()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    # ------------------------------------------------------------------
+    # Write routing
+    # ------------------------------------------------------------------
+
+    async def collection_for(self, base: str, timestamp: Optional[datetime] = None) -> str:
+        """Partition collection for a record written at ``timestamp``."""
+        now = datetime.now(timezone.utc)
+        key = month_key(timestamp or now)
+        name = partition_name(base, key)
+        if name in self._ready and key < month_key(now):
+            # Past months may have been archived (by any process) since they were prepared here
+            entry = await self.db.audit_partitions.find_one({"id": name}, {"_id": 0, "status": 1})
+            if not entry or entry.get("status") != "hot":
+                self._ready.discard(name)
+        if name not in self._ready:
+            lock = self._locks.setdefault(name, asyncio.Lock())
+            async with lock:
+                if name not in self._ready:
+                    await self._prepare(base, key)
+                    await self._reopen(name)
+                    self._ready.add(name)
+        return name
+
+    async def _prepare(self, base: str, key: str, status: str = "hot"):
+        name = partition_name(base, key)
+        collection = self.db[name]
+        for spec in PARTITION_INDEXES[base]:
+            await collection.create_index(spec["keys"], name=spec["name"], **spec["options"])
+        now = datetime.now(timezone.utc)
+        await self.db.audit_partitions.update_one(
+            {"id": name},
+            {"$setOnInsert": {"id": name, "base": base, "month": key, "collection": name,
+                              "status": status, "created_at": now}},
+            upsert=True
+        )
+
+    async def _reopen(self, name: str):
+        """
+        Make an archived partition hot again so its late records are read and archived.
+        The earlier archive is kept as ``previous_archive_path`` and merged on the next archive.
+        """
+        entry = await self.db.audit_partitions.find_one({"id": name, "status": "archived"})
+        if not entry:
+            return
+        result = await self.db.audit_partitions.update_one(
+            {"id": name, "status": "archived"},
+            {"$set": {"status": "hot", "reopened_at": datetime.now(timezone.utc),
+                      "previous_archive_path": entry.get("archive_path"),
+                      "previous_archived_count": entry.get("archived_count", 0)}}
+        )
+        if result.modified_count:
+            logger.warning(f"Late audit record reopened archived partition {name}")
+
+    # ------------------------------------------------------------------
+    # Read routing
+    # ------------------------------------------------------------------
+
+    async def read_collections(self, base: str, date_from: Optional[datetime] = None,
+                               date_to: Optional[datetime] = None) -> List[str]:
+        """Hot partitions covering [date_from, date_to], newest first, then the legacy collection."""
+        query: Dict[str, Any] = {"base": base, "status": "hot"}
+        months: Dict[str, str] = {}
+        if date_from:
+            months["$gte"] = month_key(date_from)
+        if date_to:
+            months["$lte"] = month_key(date_to)
+        if months:
+            query["month"] = months
+        names = [entry["collection"] async for entry in
+                 self.db.audit_partitions.find(query, {"_id": 0, "collection": 1}).sort("month", -1)]
+        # Metadata count: the legacy collection is read until it has been migrated
+        if await self.db[base].estimated_document_count():
+            names.append(base)
+        return names
+
+    async def find(self, collections: List[str], query: Dict, sort_field: str, skip: int, limit: int,
+                   projection: Optional[Dict] = None) -> Tuple[List[Dict], int]:
+        """skip/limit across partitions in order; returns (rows, total count)."""
+        counts = [await self.db[name].count_documents(query) for name in collections]
+        rows: List[Dict] = []
+        for name, partition_count in zip(collections, counts):
+            if len(rows) >= limit:
+                break
+            if skip >= partition_count:
+                skip -= partition_count
+                continue
+            need = limit - len(rows)
+            rows.extend(await self.db[name].find(query, projection).sort(sort_field, -1)
+                        .skip(skip).limit(need).to_list(need))
+            skip = 0
+        return rows, sum(counts)
+
+    async def paginate(self, collections: List[str], query: Dict, sort_field: str, page: int, page_size: int,
+                       cursor: Optional[str] = None, count: Optional[str] = None,
+                       projection: Optional[Dict] = None) -> Tuple[List[Dict], Dict[str, Any]]:
+        """pagination.paginate_find over partitions; same page_info."""
+        if cursor is None:
+            items, total_count = await self.find(
+                collections, query, sort_field, (page - 1) * page_size, page_size, projection
+            )
+            return items, {"total_count": total_count, "page": page, "page_size": page_size}
+
+        page_size = max(page_size, 1)
+        count = count or "estimated"
+        if count not in COUNT_MODES:
+            raise HTTPException(status_code=400, detail=f"count must be one of: {', '.join(COUNT_MODES)}")
+
+        page_query = query
+        remaining = collections
+        if cursor:
+            after = decode_cursor(cursor)
+            page_query = keyset_filter(query, sort_field, after)
+            if isinstance(after[0], datetime):
+                # Partitions newer than the cursor row's month hold no later rows
+                cursor_month = month_key(after[0])
+                remaining = [name for name in collections if (partition_month(name) or "") <= cursor_month]
+
+        items: List[Dict] = []
+        for name in remaining:
+            need = page_size + 1 - len(items)
+            if need <= 0:
+                break
+            items.extend(await self.db[name].find(page_query, projection)
+                         .sort([(sort_field, -1), ("id", -1)]).limit(need).to_list(need))
+
+        next_cursor = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            last = items[-1]
+            next_cursor = encode_cursor(last.get(sort_field), last["id"])
+
+        total_count: Optional[int] = None
+        exact = count != "none"
+        if count != "none":
+            total_count = 0
+            for name in collections:
+                partition_count, partition_exact = await count_documents(self.db[name], query, count)
+                total_count += partition_count
+                exact = exact and partition_exact
+        return items, {
+            "total_count": total_count,
+            "page": page,
+            "page_size": page_size,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "total_count_exact": exact,
+        }
+
+    # ------------------------------------------------------------------
+    # Archiving
+    # ------------------------------------------------------------------
+
+    async def list_partitions(self, base: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = {"base": base} if base else {}
+        return await self.db.audit_partitions.find(query, {"_id": 0}).sort([("base", 1), ("month", -1)]) \
+            .to_list(None)
+
+    def _archive_path(self, name: str) -> Path:
+        return self.archive_dir / f"{name}.jsonl.gz"
+
+    async def archive_partition(self, base: str, key: str) -> Dict[str, Any]:
+        """Write one partition to <archive_dir>/<collection>.jsonl.gz, verify it, then drop it."""
+        name = partition_name(base, key)
+        # Claim the partition so two processes never archive it together
+        entry = await self.db.audit_partitions.find_one_and_update(
+            {"id": name, "status": "hot"},
+            {"$set": {"status": "archiving", "archive_started_at": datetime.now(timezone.utc)}}
+        )
+        if not entry:
+            raise ValueError(f"{name} is not a hot partition")
+        path = self._archive_path(name)
+        # A reopened partition only holds its late records; the rest are in the earlier archive
+        previous = Path(entry["previous_archive_path"]) if entry.get("previous_archive_path") else None
+        previous_count = entry.get("previous_archived_count", 0) if previous else 0
+        try:
+            written = await self._dump(name, path, previous)
+            stored = await self.db[name].count_documents({})
+            if written != stored + previous_count:
+                raise RuntimeError(
+                    f"archive of {name} holds {written} records, collection {stored} + earlier archive {previous_count}"
+                )
+        except Exception:
+            await self.db.audit_partitions.update_one({"id": name}, {"$set": {"status": "hot"}})
+            raise
+        await self.db[name].drop()
+        self._ready.discard(name)
+        result = {"archive_path": str(path), "archived_count": written,
+                  "archived_at": datetime.now(timezone.utc)}
+        await self.db.audit_partitions.update_one({"id": name}, {
+            "$set": {"status": "archived", **result},
+            "$unset": {"previous_archive_path": "", "previous_archived_count": ""},
+        })
+        logger.info(f"Archived audit partition {name}: {written} records to {path}")
+        return {"collection": name, **result}
+
+    async def _dump(self, name: str, path: Path, previous: Optional[Path] = None) -> int:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        written = 0
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            batch = []
+            if previous:
+                with gzip.open(previous, 'rt', encoding='utf-8') as earlier:
+                    for line in earlier:
+                        if line.strip():
+                            batch.append(line.rstrip("\n"))
+                        if len(batch) >= BATCH_SIZE:
+                            await asyncio.to_thread(f.write, "\n".join(batch) + "\n")
+                            written += len(batch)
+                            batch = []
+            async for doc in self.db[name].find({}, {"_id": 0}).sort("timestamp", 1):
+                batch.append(json_util.dumps(doc))
+                if len(batch) >= BATCH_SIZE:
+                    await asyncio.to_thread(f.write, "\n".join(batch) + "\n")
+                    written += len(batch)
+                    batch = []
+            if batch:
+                await asyncio.to_thread(f.write, "\n".join(batch) + "\n")
+                written += len(batch)
+        os.replace(tmp_path, path)
+        return written
+
+    async def archive_expired(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Archive every hot partition older than the retention window."""
+        now = now or datetime.now(timezone.utc)
+        cutoff = shift_month(month_key(now), -self.retention_months)
+        results = []
+        async for entry in self.db.audit_partitions.find({"status": "hot", "month": {"$lt": cutoff}}):
+            hold_until = entry.get("hold_until")
+            if hold_until is not None:
+                if hold_until.tzinfo is None:
+                    hold_until = hold_until.replace(tzinfo=timezone.utc)
+                if hold_until > now:
+                    continue
+            try:
+                results.append(await self.archive_partition(entry["base"], entry["month"]))
+            except Exception as e:
+                logger.error(f"Archiving audit partition {entry['collection']} failed: {e}")
+        return results
+
+    async def restore_partition(self, base: str, key: str) -> Dict[str, Any]:
+        """Load an archived partition back into its collection (kept hot for the hold period)."""
+        name = partition_name(base, key)
+        entry = await self.db.audit_partitions.find_one({"id": name})
+        path = Path(entry["archive_path"]) if entry and entry.get("archive_path") else self._archive_path(name)
+        if not path.exists():
+            raise FileNotFoundError(f"No archive for {name} at {path}")
+        await self._prepare(base, key, status="archived")
+        restored = duplicates = 0
+        batch: List[Dict] = []
+
+        async def insert(docs):
+            nonlocal restored, duplicates
+            try:
+                await self.db[name].insert_many(docs, ordered=False)
+                restored += len(docs)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                    raise
+                duplicates += len(errors)
+                restored += len(docs) - len(errors)
+
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    batch.append(json_util.loads(line))
+                if len(batch) >= BATCH_SIZE:
+                    await insert(batch)
+                    batch = []
+        if batch:
+            await insert(batch)
+        now = datetime.now(timezone.utc)
+        # The partition now holds every archived record, so there is nothing left to merge
+        await self.db.audit_partitions.update_one({"id": name}, {
+            "$set": {"status": "hot", "restored_at": now, "hold_until": now + timedelta(days=RESTORE_HOLD_DAYS)},
+            "$unset": {"previous_archive_path": "", "previous_archived_count": ""},
+        })
+        self._ready.add(name)
+        return {"collection": name, "restored": restored, "duplicates": duplicates, "archive_path": str(path)}
+
+    async def migrate_legacy(self, base: str) -> Dict[str, int]:
+        """Move rows of the unpartitioned collection into their month partitions, newest month first."""
+        legacy = self.db[base]
+        moved = 0
+        months = 0
+        newest = await legacy.find_one({"timestamp": {"$ne": None}}, sort=[("timestamp", -1)])
+        oldest = await legacy.find_one({"timestamp": {"$ne": None}}, sort=[("timestamp", 1)])
+        if newest:
+            key = month_key(newest["timestamp"])
+            last = month_key(oldest["timestamp"])
+            while key >= last:
+                start = datetime(int(key[:4]), int(key[4:]), 1)
+                end_key = shift_month(key, 1)
+                end = datetime(int(end_key[:4]), int(end_key[4:]), 1)
+                month_query = {"timestamp": {"$gte": start, "$lt": end}}
+                if await legacy.count_documents(month_query, limit=1):
+                    name = await self.collection_for(base, start)
+                    moved += await self._move(legacy, self.db[name], month_query)
+                    months += 1
+                key = shift_month(key, -1)
+        # Rows without a timestamp cannot be routed; they stay in the legacy collection
+        return {"moved": moved, "months": months, "left": await legacy.count_documents({})}
+
+    async def _move(self, source, target, query: Dict) -> int:
+        moved = 0
+        while True:
+            docs = await source.find(query).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+            if not docs:
+                return moved
+            try:
+                await target.insert_many([{k: v for k, v in doc.items() if k != "_id"} for doc in docs],
+                                         ordered=False)
+            except BulkWriteError as e:
+                if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                    raise
+            await source.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            moved += len(docs)
+
+
+async def run_audit_archiver(partitions: AuditPartitions, interval_hours: float = ARCHIVE_INTERVAL_HOURS):
+    """Background loop archiving partitions past the retention window."""
+    while True:
+        try:
+            archived = await partitions.archive_expired()
+            if archived:
+                logger.info(f"Archived {len(archived)} audit partitions")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Audit partition archiving failed: {e}")
+        await asyncio.sleep(interval_hours * 3600)
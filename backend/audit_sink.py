@@ -0,0 +1,258 @@
+"""
+Buffered Audit Log Writer
+-------------------------
+``create_audit_log`` and ``create_auth_audit_log`` used to await an
+``insert_one`` inside every mutating request, often two or three per request
+(finalize, payments, purchases). ``AuditSink`` takes those records off the
+request path:
+
+- ``write`` appends the record to an in-memory buffer and returns; a
+  background task flushes the buffer with one ``insert_many`` per collection
+  when it reaches AUDIT_BATCH_SIZE records or every AUDIT_FLUSH_SECONDS
+- when the buffer holds AUDIT_MAX_BUFFER records the writer waits for a
+  flush instead of growing without bound (a database outage shows up as
+  latency, not memory)
+- AUDIT_WAL_PATH enables a write-ahead file: every record is appended (and
+  flushed to the OS) before ``write`` returns, replayed into the buffer on
+  start and trimmed after each successful flush, so a crashed process loses
+  nothing. AUDIT_WAL_FSYNC=1 also fsyncs each record (survives power loss,
+  costs a disk sync per write)
+- ``stop`` (shutdown hook) drains the buffer
+- ``stats`` reports queue depth and flush latency for /api/admin/audit-sink
+
+Replayed records may already have been inserted before the crash; the
+unique ``id`` indexes turn those into ignored duplicate key errors. Until the
+sink is started (scripts, tests importing server) ``write`` inserts directly.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from db_indexes import register_indexes
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '100'))
+FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', '0.5'))
+MAX_BUFFER = int(os.environ.get('AUDIT_MAX_BUFFER', '10000'))
+WAL_PATH = os.environ.get('AUDIT_WAL_PATH') or None
+WAL_FSYNC = os.environ.get('AUDIT_WAL_FSYNC', '0') == '1'
+# Failed flushes back off up to this long before retrying
+MAX_RETRY_SECONDS = 30.0
+
+DUPLICATE_KEY = 11000
+
+for _collection in ("audit_logs", "auth_audit_logs"):
+    register_indexes(_collection, [
+        {"name": "id_unique", "keys": [("id", 1)], "options": {"unique": True}},
+    ])
+
+
+class AuditSink:
+    def __init__(self, db, batch_size: int = BATCH_SIZE, flush_seconds: float = FLUSH_SECONDS,
+                 max_buffer: int = MAX_BUFFER, wal_path: Optional[str] = WAL_PATH):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max(self.batch_size, max_buffer)
+        self.wal_path = wal_path
+        self._buffer: List[Tuple[str, Dict[str, Any]]] = []
+        self._wal = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stats = {
+            "written": 0, "flushed": 0, "duplicates": 0, "flushes": 0, "failed_flushes": 0,
+            "replayed": 0, "last_flush_ms": None, "max_flush_ms": 0.0, "total_flush_ms": 0.0,
+            "last_error": None,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ------------------------------------------------------------------
+    # Write-ahead file
+    # ------------------------------------------------------------------
+
+    def _open_wal(self):
+        directory = os.path.dirname(os.path.abspath(self.wal_path))
+        os.makedirs(directory, exist_ok=True)
+        self._wal = open(self.wal_path, 'a', encoding='utf-8')
+
+    def _append_wal(self, collection: str, doc: Dict[str, Any]):
+        self._wal.write(json_util.dumps({"c": collection, "d": doc}) + "\n")
+        self._wal.flush()
+        if WAL_FSYNC:
+            os.fsync(self._wal.fileno())
+
+    def _replay_wal(self) -> int:
+        if not os.path.exists(self.wal_path):
+            return 0
+        replayed = 0
+        with open(self.wal_path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json_util.loads(line)
+                except ValueError:
+                    # A torn last line from the crash; the record never returned to its caller
+                    logger.warning("Skipping unreadable audit WAL line")
+                    continue
+                self._buffer.append((entry["c"], entry["d"]))
+                replayed += 1
+        return replayed
+
+    def _rewrite_wal(self):
+        """Keep only the records still buffered (written while the flush ran)."""
+        self._wal.close()
+        tmp_path = f"{self.wal_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for collection, doc in self._buffer:
+                f.write(json_util.dumps({"c": collection, "d": doc}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.wal_path)
+        self._open_wal()
+
+    # ------------------------------------------------------------------
+    # Writing and flushing
+    # ------------------------------------------------------------------
+
+    async def write(self, collection: str, doc: Dict[str, Any]):
+        """Queue one audit record (inserted directly when the sink is not running)."""
+        if not self.running:
+            await self.db[collection].insert_one(doc)
+            return
+        if self._wal is not None:
+            self._append_wal(collection, doc)
+        self._buffer.append((collection, doc))
+        self._stats["written"] += 1
+        if len(self._buffer) >= self.max_buffer:
+            await self.flush()
+        elif len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Insert everything buffered so far; returns the number of records flushed."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = self._buffer[:]
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            by_collection: Dict[str, List[Dict[str, Any]]] = {}
+            for collection, doc in batch:
+                by_collection.setdefault(collection, []).append(doc)
+            try:
+                for collection, docs in by_collection.items():
+                    await self._insert(collection, docs)
+            except Exception as e:
+                self._stats["failed_flushes"] += 1
+                self._stats["last_error"] = str(e)
+                raise
+            # Records written during the flush stay buffered for the next one
+            del self._buffer[:len(batch)]
+            if self._wal is not None:
+                self._rewrite_wal()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._stats["flushes"] += 1
+            self._stats["flushed"] += len(batch)
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+            self._stats["total_flush_ms"] += elapsed_ms
+            return len(batch)
+
+    async def _insert(self, collection: str, docs: List[Dict[str, Any]]):
+        # insert_many adds _id to the dicts; a retried flush must send the same documents
+        try:
+            await self.db[collection].insert_many([dict(doc) for doc in docs], ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors) or e.details.get("writeConcernErrors"):
+                raise
+            self._stats["duplicates"] += len(errors)
+
+    async def _run(self):
+        retry_seconds = self.flush_seconds
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=retry_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                retry_seconds = self.flush_seconds
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                retry_seconds = min(max(retry_seconds * 2, 1.0), MAX_RETRY_SECONDS)
+                logger.error(f"Audit log flush failed ({len(self._buffer)} records buffered), "
+                             f"retrying in {retry_seconds:.0f}s: {e}")
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        if self.wal_path:
+            replayed = self._replay_wal()
+            self._open_wal()
+            if replayed:
+                self._stats["replayed"] += replayed
+                logger.warning(f"Replaying {replayed} audit records from {self.wal_path}")
+                self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and drain the buffer (shutdown hook)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            # The WAL (if enabled) still holds the records for the next start
+            logger.error(f"Audit log drain failed, {len(self._buffer)} records not written: {e}")
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    def stats(self) -> Dict[str, Any]:
+        flushes = self._stats["flushes"]
+        return {
+            "running": self.running,
+            "queue_depth": len(self._buffer),
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "max_buffer": self.max_buffer,
+            "wal_path": self.wal_path,
+            "written": self._stats["written"],
+            "flushed": self._stats["flushed"],
+            "duplicates_ignored": self._stats["duplicates"],
+            "replayed": self._stats["replayed"],
+            "flushes": flushes,
+            "failed_flushes": self._stats["failed_flushes"],
+            "last_flush_ms": self._stats["last_flush_ms"],
+            "avg_flush_ms": round(self._stats["total_flush_ms"] / flushes, 2) if flushes else None,
+            "max_flush_ms": self._stats["max_flush_ms"],
+            "last_error": self._stats["last_error"],
+        }
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Multi-Item Write Path Benchmark
+===============================
+Database round-trips and latency of the two multi-line stock write paths
+for documents of 1, 10 and 100 items:
+
+- purchase:  create_purchase (Stock IN movements, header increments,
+             payment + payable transactions, advance gold ledger entry)
+- invoice:   finalize_invoice (Stock OUT movements and conditional header
+             decrements across three categories)
+- per-item:  the pattern both used before batching, replayed on the same
+             database - one header find_one, one movement insert_one and one
+             header update_one per item
+
+Round-trips are counted with a pymongo command listener, so the numbers are
+what the server sends, not what the code looks like. The batched paths keep
+the command count flat as items grow; latency grows only with payload size.
+
+Runs against a real MongoDB in a scratch database that is dropped afterwards.
+
+Usage:
+    MONGO_URL=mongodb://localhost:27017 python benchmark_bulk_writes.py [--items 1 10 100] [--repeat 5]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = ["Bench Ring", "Bench Chain", "Bench Bangle"]
+ITEM_WEIGHT = 2.5
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def measure(counter, call, repeat):
+    """Median latency (ms) and commands per call of ``await call()``."""
+    timings, commands = [], []
+    for _ in range(repeat):
+        before = counter.count
+        started = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - started) * 1000)
+        commands.append(counter.count - before)
+    return statistics.median(timings), max(commands)
+
+
+def purchase_payload(vendor_id: str, account_id: str, items: int) -> dict:
+    return {
+        "vendor_party_id": vendor_id,
+        "conversion_factor": 0.920,
+        "items": [
+            {"description": f"Bench item {i}", "weight_grams": ITEM_WEIGHT, "entered_purity": 916,
+             "rate_per_gram_22k": 25.0}
+            for i in range(items)
+        ],
+        "paid_amount_money": 1.0,
+        "account_id": account_id,
+        "payment_mode": "Cash",
+        "advance_in_gold_grams": 1.0,
+    }
+
+
+def draft_invoice(server, items: int, user_id: str) -> dict:
+    lines = [
+        server.InvoiceItem(
+            category=CATEGORIES[i % len(CATEGORIES)], description=f"Bench item {i}", qty=1, weight=ITEM_WEIGHT,
+            net_gold_weight=ITEM_WEIGHT, gross_weight=ITEM_WEIGHT, purity=916, metal_rate=25.0,
+            gold_value=62.5, making_value=5.0, vat_percent=5.0, vat_amount=3.375, line_total=70.875
+        )
+        for i in range(items)
+    ]
+    invoice = server.Invoice(
+        invoice_number=f"BENCH-{uuid.uuid4().hex[:8]}", customer_type="walk_in", walk_in_name="Benchmark",
+        items=lines, subtotal=67.5 * items, vat_total=3.375 * items, grand_total=70.875 * items,
+        balance_due=70.875 * items, created_by=user_id
+    )
+    return invoice.model_dump()
+
+
+async def per_item_writes(server, items: int, user_id: str):
+    """The per-item loop both write paths used before batching."""
+    db = server.db
+    for i in range(items):
+        header = await db.inventory_headers.find_one({"name": CATEGORIES[i % len(CATEGORIES)], "is_deleted": False})
+        movement = server.StockMovement(
+            movement_type="Stock IN", header_id=header["id"], header_name=header["name"],
+            description=f"Bench item {i}", qty_delta=1, weight_delta=ITEM_WEIGHT, purity=916,
+            reference_type="benchmark", reference_id="per-item", created_by=user_id
+        )
+        await db.stock_movements.insert_one(server.convert_stock_movement_to_decimal(movement.model_dump()))
+        await db.inventory_headers.update_one(
+            {"id": header["id"]}, {"$inc": {"current_qty": 1, "current_weight": ITEM_WEIGHT}}
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Round-trips and latency of the batched multi-item write paths')
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 10, 100], help='Items per document')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per size (median reported)')
+    parser.add_argument('--db', default=f"bench_bulk_{uuid.uuid4().hex[:8]}", help='Scratch database name')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch database')
+    args = parser.parse_args()
+
+    # Listeners registered before the client is created see all of its commands
+    counter = CommandCounter()
+    monitoring.register(counter)
+    os.environ['DB_NAME'] = args.db
+    import server
+
+    db = server.db
+    create_purchase = getattr(server.create_purchase, '__wrapped__', server.create_purchase)
+    rows = []
+    try:
+        await server.ensure_indexes(db)
+        user = server.User(username="bench", email="bench@example.com", full_name="Benchmark", role="admin",
+                           permissions=server.get_user_permissions("admin"))
+        vendor = server.Party(name="Bench Vendor", party_type="vendor", created_by=user.id)
+        account = server.Account(name="Bench Cash", account_type="asset", created_by=user.id)
+        await db.parties.insert_one(vendor.model_dump())
+        await db.accounts.insert_one(account.model_dump())
+        for name in CATEGORIES:
+            header = server.InventoryHeader(name=name, current_qty=1_000_000, current_weight=1_000_000 * ITEM_WEIGHT,
+                                            created_by=user.id)
+            await db.inventory_headers.insert_one(header.model_dump())
+
+        # Warm up connections, indexes and the user cache
+        await create_purchase(None, purchase_payload(vendor.id, account.id, 1), current_user=user)
+
+        for items in args.items:
+            async def purchase():
+                await create_purchase(None, purchase_payload(vendor.id, account.id, items), current_user=user)
+
+            drafts = [draft_invoice(server, items, user.id) for _ in range(args.repeat)]
+            await db.invoices.insert_many([dict(draft) for draft in drafts])
+            pending = [draft["id"] for draft in drafts]
+
+            async def invoice():
+                await server.finalize_invoice(pending.pop(), current_user=user)
+
+            async def per_item():
+                await per_item_writes(server, items, user.id)
+
+            rows.append((items,
+                         await measure(counter, purchase, args.repeat),
+                         await measure(counter, invoice, args.repeat),
+                         await measure(counter, per_item, args.repeat)))
+    finally:
+        if not args.keep:
+            await server.client.drop_database(args.db)
+
+    print(f"{'items':>6} | {'purchase':>18} | {'invoice':>18} | {'per-item loop':>18}")
+    print(f"{'':>6} | {'cmds':>6} {'ms':>10} | {'cmds':>6} {'ms':>10} | {'cmds':>6} {'ms':>10}")
+    for items, (p_ms, p_cmds), (i_ms, i_cmds), (l_ms, l_cmds) in rows:
+        print(f"{items:>6} | {p_cmds:>6} {p_ms:>10.2f} | {i_cmds:>6} {i_ms:>10.2f} | {l_cmds:>6} {l_ms:>10.2f}")
+
+    if len(rows) > 1:
+        (small, (p0, _), (i0, _), (l0, _)), (large, (p1, _), (i1, _), (l1, _)) = rows[0], rows[-1]
+        print(f"\n{small} -> {large} items ({large / small:.0f}x): purchase {p1 / p0:.1f}x, "
+              f"invoice {i1 / i0:.1f}x, per-item loop {l1 / l0:.1f}x latency")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Excel Export Benchmark
+======================
+Peak memory and time to export N stock movements (the inventory export):
+
+- legacy: to_list() of every document, a regular openpyxl Workbook filled
+          cell by cell, header styled per cell, saved into a BytesIO
+- engine: excel_export.ExcelExport - documents consumed from an async
+          iterator (as from a Motor cursor), write-only workbook, finished
+          file spooled and read back in chunks as StreamingResponse sends it
+
+Documents are generated in memory with the shape and BSON types Motor
+returns, so no database is needed. Both workbooks are read back and
+compared row by row (on a smaller sample) before measuring.
+
+Usage:
+    python benchmark_excel_export.py [--rows 200000] [--check-rows 2000]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import openpyxl
+from bson import Decimal128
+from openpyxl.styles import Alignment, Font, PatternFill
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from excel_export import ExcelExport
+
+HEADERS = ["Date", "Type", "Category", "Description", "Quantity", "Weight (g)", "Purity", "Notes"]
+
+
+def make_movement(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()), "date": datetime(2025, 1, 1) + timedelta(minutes=i * 3),
+        "movement_type": "Stock OUT" if i % 3 else "Stock IN", "header_id": str(uuid.uuid4()),
+        "header_name": ["Ring", "Chain", "Bangle", "Necklace"][i % 4],
+        "description": f"Invoice INV-2025-{i:06d}", "qty_delta": -1 if i % 3 else 2,
+        "weight_delta": Decimal128(Decimal(f"{(i % 500) / 7:.3f}")), "purity": 916,
+        "notes": "", "is_deleted": False,
+    }
+
+
+def row(movement: dict) -> list:
+    return [
+        str(movement.get('date', ''))[:10], movement.get('movement_type', ''), movement.get('header_name', ''),
+        movement.get('description', ''), movement.get('qty_delta', 0), movement.get('weight_delta', 0),
+        movement.get('purity', 0), movement.get('notes', ''),
+    ]
+
+
+async def cursor(rows: int):
+    """Stands in for a Motor cursor: one document at a time."""
+    for i in range(rows):
+        yield make_movement(i)
+
+
+async def legacy(rows: int) -> bytes:
+    movements = [document async for document in cursor(rows)]  # to_list()
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Inventory Movements"
+    for col, header in enumerate(HEADERS, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        cell.font = Font(color="FFFFFF", bold=True)
+        cell.alignment = Alignment(horizontal="center")
+    for row_idx, movement in enumerate(movements, 2):
+        for col, value in enumerate(row(movement), 1):
+            if isinstance(value, Decimal128):
+                value = float(value.to_decimal())
+            ws.cell(row=row_idx, column=col, value=value)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+async def engine(rows: int) -> int:
+    export = ExcelExport()
+    ws = export.sheet("Inventory Movements", headers=HEADERS, widths=[15] * 8)
+    await export.write_rows(ws, cursor(rows), row)
+    response = await export.response("inventory_export.xlsx")
+    size = 0
+    async for chunk in response.body_iterator:  # sent to the client, not kept
+        size += len(chunk)
+    return size
+
+
+async def engine_bytes(rows: int) -> bytes:
+    export = ExcelExport()
+    ws = export.sheet("Inventory Movements", headers=HEADERS, widths=[15] * 8)
+    await export.write_rows(ws, cursor(rows), row)
+    response = await export.response("inventory_export.xlsx")
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def read_rows(data: bytes) -> list:
+    return list(openpyxl.load_workbook(io.BytesIO(data), read_only=True).active.iter_rows(values_only=True))
+
+
+async def measure(label: str, fn, rows: int):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = await fn(rows)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = result if isinstance(result, int) else len(result)
+    print(f"  {label:<8} {elapsed:8.1f} s   peak {peak / 1_048_576:8.1f} MiB   file {size / 1_048_576:6.1f} MiB")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark the streaming Excel export engine')
+    parser.add_argument('--rows', type=int, default=200000, help='Stock movements to export')
+    parser.add_argument('--check-rows', type=int, default=2000, help='Rows compared between both paths')
+    parser.add_argument('--skip-legacy', action='store_true', help='Only measure the engine')
+    args = parser.parse_args()
+
+    assert read_rows(await legacy(args.check_rows)) == read_rows(await engine_bytes(args.check_rows)), \
+        "engine output differs from legacy export"
+
+    print(f"\n{args.rows:,} stock movements -> xlsx")
+    if not args.skip_legacy:
+        await measure("legacy", legacy, args.rows)
+    await measure("engine", engine, args.rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
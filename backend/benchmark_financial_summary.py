@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Financial Summary Benchmark
+===========================
+Compares the two ways of computing /api/reports/financial-summary on a
+seeded dataset:
+
+- legacy:   load transactions/accounts/invoices into Python, convert every
+            Decimal128 with decimal_to_float and sum row by row (the old
+            endpoint did this with a to_list(10000) cap)
+- pipeline: report_pipelines.financial_summary_figures ($group/$facet on
+            Decimal128 inside MongoDB, no row cap; transaction totals read
+            from the daily rollups, which are backfilled after seeding)
+
+The dataset is written to a separate database (default: <DB_NAME>_benchmark)
+and is reused on later runs unless --reseed is given.
+
+Usage:
+    python benchmark_financial_summary.py [--transactions 1000000] [--reseed] [--legacy-cap 10000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+from bson import Decimal128
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from daily_rollups import backfill_daily_rollups, rollups_ready
+from report_pipelines import financial_summary_figures
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'gold_shop_erp')
+
+BATCH_SIZE = 10000
+
+ACCOUNTS = [
+    ("Cash", "asset"), ("Bank", "asset"), ("Petty Cash", "asset"),
+    ("Sales Income", "income"), ("Gold Exchange Income", "income"),
+    ("Rent", "expense"), ("Salaries", "expense"), ("Vendor Payable", "liability"),
+]
+
+
+def money(value: float) -> Decimal128:
+    return Decimal128(Decimal(str(round(value, 3))))
+
+
+async def seed(db, transaction_count: int, invoice_count: int):
+    """Create accounts, transactions and invoices spread over two years."""
+    print(f"Seeding {transaction_count:,} transactions and {invoice_count:,} invoices...")
+    for name in ("accounts", "transactions", "invoices", "returns", "daily_closings",
+                 "daily_rollups", "daily_rollup_state"):
+        await db[name].drop()
+
+    accounts = [{
+        "id": str(uuid.uuid4()), "name": name, "account_type": account_type,
+        "opening_balance": money(0), "current_balance": money(random.uniform(0, 100000)),
+        "is_deleted": False,
+    } for name, account_type in ACCOUNTS]
+    await db.accounts.insert_many(accounts)
+
+    start = datetime.now(timezone.utc) - timedelta(days=730)
+    categories = ["sales", "purchase", "expense", "sales_return", "transfer"]
+
+    inserted = 0
+    while inserted < transaction_count:
+        batch = []
+        for _ in range(min(BATCH_SIZE, transaction_count - inserted)):
+            account = random.choice(accounts)
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "date": start + timedelta(minutes=random.randint(0, 730 * 24 * 60)),
+                "transaction_type": random.choice(["credit", "debit"]),
+                "account_id": account["id"],
+                "account_name": account["name"],
+                "amount": money(random.uniform(1, 5000)),
+                "category": random.choice(categories),
+                "is_deleted": random.random() < 0.02,
+            })
+        await db.transactions.insert_many(batch, ordered=False)
+        inserted += len(batch)
+        print(f"  transactions: {inserted:,}", end="\r")
+    print()
+
+    inserted = 0
+    while inserted < invoice_count:
+        batch = []
+        for _ in range(min(BATCH_SIZE, invoice_count - inserted)):
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "date": start + timedelta(minutes=random.randint(0, 730 * 24 * 60)),
+                "status": random.choice(["draft", "finalized", "finalized"]),
+                "balance_due": money(random.uniform(0, 2000)),
+                "grand_total": money(random.uniform(100, 5000)),
+                "is_deleted": False,
+            })
+        await db.invoices.insert_many(batch, ordered=False)
+        inserted += len(batch)
+
+    await db.transactions.create_index([("date", -1)], partialFilterExpression={"is_deleted": False})
+    await db.invoices.create_index([("date", -1)], partialFilterExpression={"is_deleted": False})
+
+
+def decimal_to_float(obj):
+    if isinstance(obj, dict):
+        return {k: decimal_to_float(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [decimal_to_float(item) for item in obj]
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj
+
+
+async def legacy_summary(db, cap):
+    """The previous in-Python computation (transaction/account/invoice figures)."""
+    transactions = await db.transactions.find({"is_deleted": False}, {"_id": 0}).to_list(cap)
+    accounts = await db.accounts.find({"is_deleted": False}, {"_id": 0}).to_list(1000)
+    invoices = await db.invoices.find({"is_deleted": False, "status": "finalized"}, {"_id": 0}).to_list(cap)
+    transactions = [decimal_to_float(t) for t in transactions]
+    accounts = [decimal_to_float(a) for a in accounts]
+    invoices = [decimal_to_float(i) for i in invoices]
+
+    account_type_map = {a['id']: a['account_type'].lower() for a in accounts}
+    sales_credits = sum(t['amount'] for t in transactions
+                        if t['transaction_type'] == 'credit' and account_type_map.get(t['account_id']) == 'income')
+    sales_returns = sum(t['amount'] for t in transactions
+                        if t.get('category') == 'sales_return' or
+                        (t['transaction_type'] == 'debit' and account_type_map.get(t['account_id']) == 'income'))
+    total_credit = sum(t['amount'] for t in transactions if t['transaction_type'] == 'credit')
+    total_debit = sum(t['amount'] for t in transactions if t['transaction_type'] == 'debit')
+    return {
+        "total_sales": sales_credits - sales_returns,
+        "total_credit": total_credit,
+        "total_debit": total_debit,
+        "total_outstanding": sum(i['balance_due'] for i in invoices),
+    }
+
+
+async def timed(label, coro_factory, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await coro_factory()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(f"  {label:<28} best {best * 1000:10.1f} ms   mean {sum(timings) / len(timings) * 1000:10.1f} ms")
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark financial summary computation paths')
+    parser.add_argument('--db', default=f"{DB_NAME}_benchmark", help='Database to seed and query')
+    parser.add_argument('--transactions', type=int, default=1_000_000, help='Transactions to seed')
+    parser.add_argument('--invoices', type=int, default=200_000, help='Invoices to seed')
+    parser.add_argument('--reseed', action='store_true', help='Drop and reseed the dataset')
+    parser.add_argument('--legacy-cap', type=int, default=10000,
+                        help='Row cap for the legacy path (old endpoint used 10000; 0 = uncapped)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per path')
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[args.db]
+    try:
+        if args.reseed or await db.transactions.estimated_document_count() == 0:
+            await seed(db, args.transactions, args.invoices)
+        if not await rollups_ready(db):
+            print("Backfilling daily rollups...")
+            await backfill_daily_rollups(db)
+
+        count = await db.transactions.estimated_document_count()
+        cap = args.legacy_cap or None
+        print(f"\nDataset: {count:,} transactions in '{args.db}'")
+        print(f"Legacy cap: {cap if cap else 'none'}\n")
+
+        legacy = await timed("legacy (python sums)", lambda: legacy_summary(db, cap), args.repeat)
+        closing_range = {"$gte": datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)}
+        pipeline = await timed("pipeline ($group/$facet)",
+                               lambda: financial_summary_figures(db, None, None, closing_range), args.repeat)
+
+        print("\nFigure comparison:")
+        for key in legacy:
+            match = "✓" if abs(legacy[key] - pipeline[key]) < 0.01 else "✗ differs"
+            print(f"  {key:<20} legacy {legacy[key]:>18,.3f}   pipeline {pipeline[key]:>18,.3f}   {match}")
+        if cap:
+            print("\n  ℹ️  Differences are expected when the dataset exceeds the legacy cap.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
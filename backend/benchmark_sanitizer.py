@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Input Sanitizer Benchmark
+=========================
+Times sanitization of a 200-line invoice payload:
+
+- legacy: json.loads, a recursive walk calling bleach.clean on every
+          non-technical string (regexes recompiled through re.match), then
+          json.dumps - the previous InputSanitizationMiddleware behavior
+- engine: sanitizer.SanitizationEngine.sanitize_body (precompiled patterns,
+          bleach only for strings containing '<', '&' or control characters,
+          cached results, no re-serialization when nothing changed)
+
+Both are checked to produce the same decoded body before timing.
+
+Usage:
+    python benchmark_sanitizer.py [--lines 200] [--repeat 200] [--markup]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sanitizer import SanitizationEngine
+from validators import sanitize_html
+
+
+def legacy_is_technical(value: str) -> bool:
+    if re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', value, re.IGNORECASE):
+        return True
+    if re.match(r'^\d{4}-\d{2}-\d{2}', value):
+        return True
+    if len(value) < 5 and value.replace('-', '').replace('_', '').isalnum():
+        return True
+    return False
+
+
+def legacy_sanitize_value(value: Any) -> Any:
+    """The previous middleware's recursive sanitizer."""
+    if isinstance(value, str):
+        if len(value) > 0 and not legacy_is_technical(value):
+            return sanitize_html(value)
+        return value
+    elif isinstance(value, dict):
+        return {k: legacy_sanitize_value(v) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [legacy_sanitize_value(item) for item in value]
+    return value
+
+
+def legacy_sanitize_body(body: bytes) -> bytes:
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        return body
+    return json.dumps(legacy_sanitize_value(data)).encode('utf-8')
+
+
+def invoice_body(lines: int, markup: bool) -> bytes:
+    categories = ["Necklace", "Ring", "Bangle", "Chain", "Earrings", "Pendant"]
+    notes = "Customer <b>VIP</b> & gift wrap" if markup else "Customer VIP, gift wrap"
+    return json.dumps({
+        "customer_id": "5f0c7c1e-6a8b-4e52-9a3f-1c2d3e4f5a6b",
+        "customer_type": "saved",
+        "customer_name": "Al Noor Jewellers",
+        "invoice_type": "sale",
+        "date": "2026-01-15T10:00:00Z",
+        "notes": notes,
+        "items": [{
+            "description": f"22K {categories[i % len(categories)]} design",
+            "category": categories[i % len(categories)],
+            "qty": 1,
+            "gross_weight": 12.345,
+            "stone_weight": 0.0,
+            "weight": 12.345,
+            "purity": 916,
+            "metal_rate": 24.5,
+            "making_charge_type": "per_gram",
+            "making_value": 1.5,
+            "vat_percent": 5.0,
+            "remarks": "<i>engraved</i>" if markup and i % 20 == 0 else "standard finish",
+        } for i in range(lines)],
+    }).encode('utf-8')
+
+
+def timed(label: str, fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_call = (time.perf_counter() - started) / repeat
+    print(f"  {label:<32} {per_call * 1000:9.3f} ms/body")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON input sanitization')
+    parser.add_argument('--lines', type=int, default=200, help='Invoice line items')
+    parser.add_argument('--repeat', type=int, default=200, help='Bodies sanitized per path')
+    parser.add_argument('--markup', action='store_true', help='Include some HTML in notes/remarks')
+    args = parser.parse_args()
+
+    body = invoice_body(args.lines, args.markup)
+    engine = SanitizationEngine()
+
+    legacy_result = json.loads(legacy_sanitize_body(body))
+    engine_result = json.loads(engine.sanitize_body(body, 'POST', '/api/invoices'))
+    assert legacy_result == engine_result, "engine output differs from legacy sanitizer"
+
+    print(f"\n{args.lines}-line invoice, {len(body):,} bytes{' (with markup)' if args.markup else ''}")
+    legacy = timed("legacy (bleach every string)", lambda: legacy_sanitize_body(body), args.repeat)
+    cold = SanitizationEngine()
+    timed("engine (cold cache, 1 body)", lambda: cold.sanitize_body(body, 'POST', '/api/invoices'), 1)
+    engine_time = timed("engine (warm cache)", lambda: engine.sanitize_body(body, 'POST', '/api/invoices'), args.repeat)
+    print(f"\n  speedup: {legacy / engine_time:.1f}x   cache: {engine.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Security Middleware Benchmark
+=============================
+Requests/sec through the security middleware stack, before and after the
+pure-ASGI rewrite:
+
+- legacy: the four BaseHTTPMiddleware layers (HTTPS redirect, security
+          headers, input sanitization, CSRF) stacked as server.py used to
+- fused:  security_middleware.SecurityMiddleware with every layer enabled
+
+Both stacks wrap the same minimal FastAPI app and are driven in-process with
+httpx's ASGI transport, so the numbers isolate middleware overhead (no
+network, no database). Scenarios: GET /api/health and a typical JSON POST
+(an invoice-sized payload with CSRF cookie + header).
+
+Usage:
+    python benchmark_security_middleware.py [--requests 2000] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response as StarletteResponse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_sanitizer import legacy_sanitize_value
+from security_middleware import CSP_DIRECTIVES, CSRF_EXEMPT_PATHS, PERMISSIONS_POLICY, SecurityMiddleware
+
+# ============================================================================
+# LEGACY STACK (BaseHTTPMiddleware, as previously defined in server.py)
+# ============================================================================
+
+
+class LegacySecurityHeaders(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        response.headers['Content-Security-Policy'] = "; ".join(CSP_DIRECTIVES)
+        response.headers['X-Frame-Options'] = 'DENY'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
+        response.headers['X-XSS-Protection'] = '1; mode=block'
+        response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+        response.headers['Permissions-Policy'] = ", ".join(PERMISSIONS_POLICY)
+        return response
+
+
+class LegacyInputSanitization(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        if request.method in ['POST', 'PUT', 'PATCH']:
+            body = await request.body()
+            if body:
+                try:
+                    request._body = json.dumps(legacy_sanitize_value(json.loads(body))).encode('utf-8')
+                except json.JSONDecodeError:
+                    pass
+        return await call_next(request)
+
+
+class LegacyHTTPSRedirect(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        forwarded_proto = request.headers.get('X-Forwarded-Proto', '')
+        if forwarded_proto == 'http' or (
+            not forwarded_proto and
+            request.url.scheme == 'http' and
+            request.url.hostname not in ['localhost', '127.0.0.1', 'testserver']
+        ):
+            return StarletteResponse(status_code=301, headers={'Location': str(request.url.replace(scheme='https'))})
+        return await call_next(request)
+
+
+class LegacyCSRF(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        if request.method in ['POST', 'PUT', 'PATCH', 'DELETE'] and request.url.path not in CSRF_EXEMPT_PATHS:
+            csrf_cookie = request.cookies.get('csrf_token')
+            csrf_header = request.headers.get('X-CSRF-Token')
+            if not csrf_cookie or not csrf_header:
+                return StarletteResponse(content='{"detail": "CSRF token missing"}', status_code=403,
+                                         media_type='application/json')
+            if csrf_cookie != csrf_header:
+                return StarletteResponse(content='{"detail": "CSRF token validation failed"}', status_code=403,
+                                         media_type='application/json')
+        return await call_next(request)
+
+
+# ============================================================================
+# BENCHMARK APP
+# ============================================================================
+
+
+def build_app(stack: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.post("/api/invoices")
+    async def create_invoice(request: Request):
+        data = await request.json()
+        return {"id": "bench", "items": len(data.get("items", []))}
+
+    if stack == "legacy":
+        # Same registration order as server.py used (last added = outermost)
+        app.add_middleware(LegacyHTTPSRedirect)
+        app.add_middleware(LegacySecurityHeaders)
+        app.add_middleware(LegacyInputSanitization)
+        app.add_middleware(LegacyCSRF)
+    else:
+        app.add_middleware(SecurityMiddleware)
+    return app
+
+
+def invoice_payload(lines: int = 20) -> dict:
+    return {
+        "customer_id": "5f0c7c1e-6a8b-4e52-9a3f-1c2d3e4f5a6b",
+        "customer_name": "Al Noor Jewellers",
+        "date": "2026-01-15T10:00:00Z",
+        "notes": "Bench <b>order</b> & delivery",
+        "items": [{
+            "description": f"22K necklace design {i}",
+            "category": "Necklace",
+            "qty": 1, "weight": 12.345, "purity": 916,
+            "metal_rate": 24.5, "making_charge_type": "per_gram", "making_value": 1.5,
+        } for i in range(lines)],
+    }
+
+
+async def run_scenario(app, method: str, path: str, total: int, concurrency: int, **kwargs) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="https://testserver") as http:
+        # Warm-up and sanity check
+        response = await http.request(method, path, **kwargs)
+        assert response.status_code == 200, response.text
+
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await http.request(method, path, **kwargs)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark the security middleware stack')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=20, help='Concurrent in-flight requests')
+    args = parser.parse_args()
+
+    body = json.dumps(invoice_payload())
+    post_kwargs = {
+        "content": body,
+        "headers": {"content-type": "application/json", "x-csrf-token": "bench-token",
+                    "cookie": "csrf_token=bench-token"},
+    }
+
+    print(f"\n{'scenario':<24}{'legacy req/s':>16}{'fused req/s':>16}{'speedup':>10}")
+    for label, method, path, kwargs in (
+        ("GET /api/health", "GET", "/api/health", {}),
+        ("POST /api/invoices", "POST", "/api/invoices", post_kwargs),
+    ):
+        legacy = await run_scenario(build_app("legacy"), method, path, args.requests, args.concurrency, **kwargs)
+        fused = await run_scenario(build_app("fused"), method, path, args.requests, args.concurrency, **kwargs)
+        print(f"{label:<24}{legacy:>16,.0f}{fused:>16,.0f}{fused / legacy:>9.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Response Serialization Benchmark
+================================
+CPU time and peak memory to turn a 10k-invoice ``/api/reports/invoices-view``
+result set into JSON bytes:
+
+- legacy:     decimal_to_float over the whole response, then FastAPI's
+              JSONResponse path (jsonable_encoder + json.dumps)
+- direct:     bson_json.BSONJSONResponse (encoder hook for BSON types)
+- projection: BSONJSONResponse with INVOICE_NUMERIC_FIELDS (projection-aware)
+
+Invoices are generated in memory with the same shape and BSON types Motor
+returns (Decimal128 money/weights, datetime dates), so no database is needed.
+The three outputs are decoded and compared before timing.
+
+Usage:
+    python benchmark_serialization.py [--invoices 10000] [--items 3] [--repeat 3]
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bson import Decimal128
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bson_json import BSONJSONResponse, INVOICE_NUMERIC_FIELDS, orjson
+
+
+def d128(value: float, places: str = '0.01') -> Decimal128:
+    return Decimal128(Decimal(str(value)).quantize(Decimal(places)))
+
+
+def make_invoice(i: int, items: int) -> dict:
+    date = datetime(2025, 1, 1) + timedelta(minutes=i * 37)
+    lines = [{
+        "description": "22K Necklace", "category": "Necklace", "qty": 1,
+        "gross_weight": d128(random.uniform(5, 40), '0.001'), "stone_weight": d128(0, '0.001'),
+        "net_gold_weight": d128(random.uniform(5, 40), '0.001'), "weight": d128(random.uniform(5, 40), '0.001'),
+        "purity": 916, "metal_rate": d128(24.5), "gold_value": d128(random.uniform(100, 900)),
+        "making_charge_type": "per_gram", "making_value": d128(1.5), "stone_charges": d128(0),
+        "wastage_charges": d128(0), "item_discount": d128(0), "vat_percent": 5.0,
+        "vat_amount": d128(random.uniform(5, 45)), "line_total": d128(random.uniform(100, 950)),
+    } for _ in range(items)]
+    total = random.uniform(100, 3000)
+    paid = random.uniform(0, total)
+    return {
+        "id": str(uuid.uuid4()), "invoice_number": f"INV-2025-{i:05d}", "date": date,
+        "due_date": date + timedelta(days=30), "customer_type": "saved", "customer_id": str(uuid.uuid4()),
+        "customer_name": f"Customer {i % 500}", "invoice_type": "sale", "payment_status": "partial",
+        "status": "finalized", "items": lines,
+        "subtotal": d128(total / 1.05), "discount_amount": d128(0), "vat_total": d128(total - total / 1.05),
+        "grand_total": d128(total), "paid_amount": d128(paid), "balance_due": d128(total - paid),
+        "created_at": date, "created_by": str(uuid.uuid4()), "is_deleted": False,
+    }
+
+
+def response_body(invoices):
+    return {"invoices": invoices, "summary": {"total_amount": 1.0, "total_paid": 1.0, "total_balance": 0.0},
+            "count": len(invoices)}
+
+
+def decimal_to_float(obj):
+    """server.decimal_to_float, copied so the benchmark does not import server.py."""
+    if isinstance(obj, dict):
+        return {k: decimal_to_float(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [decimal_to_float(item) for item in obj]
+    elif isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    elif isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj
+
+
+def legacy(invoices) -> bytes:
+    return JSONResponse(jsonable_encoder(decimal_to_float(response_body(invoices)))).body
+
+
+def direct(invoices) -> bytes:
+    return BSONJSONResponse(response_body(invoices)).body
+
+
+def projection(invoices) -> bytes:
+    return BSONJSONResponse(response_body(invoices), numeric_fields=INVOICE_NUMERIC_FIELDS,
+                            documents_key="invoices").body
+
+
+def measure(label, fn, dataset, repeat):
+    timings = []
+    for _ in range(repeat):
+        data = copy.deepcopy(dataset)  # projection mode converts in place
+        started = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - started)
+
+    data = copy.deepcopy(dataset)
+    tracemalloc.start()
+    body = fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<14} best {min(timings) * 1000:9.1f} ms   peak {peak / 1_048_576:8.1f} MiB   "
+          f"body {len(body) / 1_048_576:6.1f} MiB")
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark invoices-view response serialization')
+    parser.add_argument('--invoices', type=int, default=10000, help='Invoices in the response')
+    parser.add_argument('--items', type=int, default=3, help='Line items per invoice')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per path')
+    args = parser.parse_args()
+
+    random.seed(7)
+    dataset = [make_invoice(i, args.items) for i in range(args.invoices)]
+
+    reference = json.loads(legacy(copy.deepcopy(dataset)))
+    assert json.loads(direct(copy.deepcopy(dataset))) == reference, "direct output differs"
+    assert json.loads(projection(copy.deepcopy(dataset))) == reference, "projection output differs"
+
+    print(f"\n{args.invoices:,} invoices x {args.items} items  (encoder: {'orjson' if orjson else 'stdlib json'})")
+    base = measure("legacy", legacy, dataset, args.repeat)
+    fast = measure("direct", direct, dataset, args.repeat)
+    proj = measure("projection", projection, dataset, args.repeat)
+    print(f"\n  speedup: direct {base / fast:.1f}x, projection {base / proj:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+BSON -> JSON Serialization
+--------------------------
+Encodes MongoDB documents straight to JSON bytes in one pass.
+
+``decimal_to_float`` rebuilds every dict and list of a result set to replace
+Decimal128/datetime/ObjectId values, and FastAPI then walks the rebuilt tree
+again with ``jsonable_encoder`` before ``json.dumps``. Here the encoder itself
+handles the BSON types through its ``default`` hook, so a document is visited
+exactly once and no intermediate copies are made:
+
+- Decimal128 / Decimal -> float (same value decimal_to_float produced, decoded
+                          from the BID bits instead of via decimal.Decimal)
+- datetime             -> ISO 8601 string (datetime.isoformat)
+- ObjectId             -> string
+
+orjson is used when installed, otherwise the stdlib encoder with the same
+settings as FastAPI's JSONResponse.
+
+Projection-aware mode: endpoints that know which fields of their documents
+are numeric can pass ``numeric_fields`` (dotted paths, ``*`` for list items).
+Only those paths are converted in place before encoding; any Decimal128
+elsewhere is still handled by the hook. With the BID decoder below the plain
+mode is usually faster (see benchmark_serialization.py), so projection mode
+is meant for callers that need the converted numbers before encoding.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+
+from bson import Decimal128, ObjectId
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+_COMBINATION_MASK = 0x6000000000000000
+_COEFFICIENT_MASK = (1 << 113) - 1
+_EXPONENT_BIAS = 6176
+_POW10 = [10 ** i for i in range(64)]
+
+
+def decimal128_to_float(value: Decimal128) -> float:
+    """
+    Decimal128 -> float without building a decimal.Decimal.
+
+    Decodes the BID bits directly; int/int true division is correctly rounded,
+    so the result equals float(value.to_decimal()). Special values (NaN,
+    infinity, non-canonical encodings) fall back to to_decimal().
+    """
+    bits = int.from_bytes(value.bid, 'little')
+    high = bits >> 64
+    if high & _COMBINATION_MASK == _COMBINATION_MASK:
+        return float(value.to_decimal())
+    exponent = ((high >> 49) & 0x3FFF) - _EXPONENT_BIAS
+    coefficient = bits & _COEFFICIENT_MASK
+    if exponent < 0:
+        scale = _POW10[-exponent] if -exponent < 64 else 10 ** -exponent
+        result = coefficient / scale
+    else:
+        try:
+            result = float(coefficient * 10 ** exponent)
+        except OverflowError:
+            return float(value.to_decimal())
+    return -result if high >> 63 else result
+
+
+def _default(value: Any) -> Any:
+    """Encoder hook for the BSON types the JSON encoders don't know."""
+    if isinstance(value, Decimal128):
+        return decimal128_to_float(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        """Serialize BSON-typed content to JSON bytes."""
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(
+        default=_default, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    )
+
+    def dumps(content: Any) -> bytes:
+        """Serialize BSON-typed content to JSON bytes."""
+        return _encoder.encode(content).encode("utf-8")
+
+
+def _to_number(value: Any) -> Any:
+    if isinstance(value, Decimal128):
+        return decimal128_to_float(value)
+    return value
+
+
+def _convert_path(node: Any, parts: list) -> None:
+    """Convert Decimal128 values at one dotted path of a document, in place."""
+    key, rest = parts[0], parts[1:]
+    if key == '*':
+        if isinstance(node, list):
+            if rest:
+                for item in node:
+                    _convert_path(item, rest)
+            else:
+                node[:] = [_to_number(item) for item in node]
+        return
+    if not isinstance(node, dict) or key not in node:
+        return
+    if rest:
+        _convert_path(node[key], rest)
+    else:
+        node[key] = _to_number(node[key])
+
+
+def convert_numeric_fields(documents: Iterable[dict], numeric_fields: Iterable[str]) -> None:
+    """
+    Convert Decimal128 values at the given dotted paths of every document, in place.
+    Used for projection-aware serialization; documents must not be reused as BSON.
+    """
+    paths = [field.split('.') for field in numeric_fields]
+    for document in documents:
+        for parts in paths:
+            _convert_path(document, parts)
+
+
+class BSONJSONResponse(Response):
+    """
+    JSON response that serializes Mongo documents directly (ORJSONResponse-style).
+
+    Args:
+        content: Response body; may contain Decimal128, datetime and ObjectId values
+        numeric_fields: Optional projection-aware mode - dotted numeric paths to
+                        convert in the documents of ``documents_key`` (or in the
+                        content itself when it is a list)
+        documents_key: Key of the document list inside ``content``
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, content: Any, status_code: int = 200, numeric_fields: Optional[Iterable[str]] = None,
+                 documents_key: Optional[str] = None, **kwargs):
+        if numeric_fields:
+            documents = content.get(documents_key, []) if documents_key else content
+            convert_numeric_fields(documents, numeric_fields)
+        super().__init__(content, status_code=status_code, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Numeric fields of documents as stored by server.py (used in projection-aware mode)
+INVOICE_NUMERIC_FIELDS = [
+    "subtotal", "discount_amount", "cgst_total", "sgst_total", "igst_total",
+    "vat_total", "grand_total", "paid_amount", "balance_due",
+    "gold_received_rate", "gold_received_value", "gold_received_weight",
+    "items.*.gross_weight", "items.*.stone_weight", "items.*.net_gold_weight", "items.*.weight", "items.*.inches",
+    "items.*.metal_rate", "items.*.gold_value", "items.*.making_value", "items.*.stone_charges",
+    "items.*.wastage_charges", "items.*.item_discount", "items.*.vat_amount", "items.*.line_total",
+]
+
+TRANSACTION_NUMERIC_FIELDS = ["amount"]
@@ -0,0 +1,344 @@
+"""
+Daily Cash-Book Rollups
+-----------------------
+One document per (UTC day, account) in ``daily_rollups`` holding the sums
+and counts of that day's live transactions on the account, so the daily
+closing, the transactions summary and the financial summary read O(days)
+rollup rows instead of every transaction in the range.
+
+Stored figures (Decimal128 sums, counts as ints):
+- credit_total / credit_count:   transaction_type "credit"
+- debit_total / debit_count:     transaction_type "debit"
+- other_total / other_count:     any other transaction_type
+- sales_return_total:            category "sales_return" (any type)
+- sales_return_debit_total:      category "sales_return" and type "debit"
+
+Write paths apply deltas with one upserting $inc per (day, account) as
+transactions are inserted (insert_transaction / insert_transactions) and
+removed (after_transaction_removed).
+
+``rollup_totals`` answers any inclusive [start, end] range exactly: whole
+days inside the range come from the rollups, the partial first and last day
+from a $group over just those hours of raw transactions.
+
+Rollups only replace the raw scan once ``backfill_daily_rollups`` (see
+rebuild_daily_rollups.py) has built them from the existing transactions and
+marked them complete in ``daily_rollup_state``; until then ``rollup_totals``
+aggregates the raw transactions. A database without transactions is marked
+complete at startup. Scripts that write transactions directly (restores,
+seeders) bypass the deltas: re-run the backfill afterwards, and use
+--verify to detect drift.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Decimal128
+from pymongo import UpdateOne
+
+from db_indexes import register_indexes
+
+logger = logging.getLogger(__name__)
+
+register_indexes("daily_rollups", [
+    {"name": "date_account_unique", "keys": [("date", 1), ("account_id", 1)], "options": {"unique": True}},
+])
+
+SUM_FIELDS = ("credit_total", "debit_total", "other_total", "sales_return_total", "sales_return_debit_total")
+COUNT_FIELDS = ("credit_count", "debit_count", "other_count")
+STATE_ID = "daily_rollups"
+ONE_DAY = timedelta(days=1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Set once the backfill has been seen (per process)
+_ready = False
+
+
+def _to_decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value))
+
+
+def _utc(value: datetime) -> datetime:
+    """Naive UTC datetime, as MongoDB returns it."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def day_start(value: datetime) -> datetime:
+    return _utc(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def empty_totals() -> Dict[str, Any]:
+    totals: Dict[str, Any] = {field: Decimal('0') for field in SUM_FIELDS}
+    totals.update({field: 0 for field in COUNT_FIELDS})
+    return totals
+
+
+# ---------------------------------------------------------------------------
+# Write path
+# ---------------------------------------------------------------------------
+
+def _transaction_deltas(transaction: dict, sign: int) -> Dict[str, Decimal]:
+    amount = _to_decimal(transaction.get('amount')) * sign
+    kind = transaction.get('transaction_type')
+    kind = kind if kind in ("credit", "debit") else "other"
+    deltas = {f"{kind}_total": amount, f"{kind}_count": Decimal(sign)}
+    if transaction.get('category') == 'sales_return':
+        deltas["sales_return_total"] = amount
+        if kind == "debit":
+            deltas["sales_return_debit_total"] = amount
+    return deltas
+
+
+async def apply_rollup_changes(db, transactions: List[dict], sign: int):
+    """$inc the rollups of the transactions' days and accounts (sign 1 = inserted, -1 = removed)."""
+    per_key: Dict[Tuple[datetime, Optional[str]], Dict[str, Decimal]] = {}
+    for transaction in transactions:
+        date = transaction.get('date')
+        if not isinstance(date, datetime):
+            continue
+        totals = per_key.setdefault((day_start(date), transaction.get('account_id')), {})
+        for field, delta in _transaction_deltas(transaction, sign).items():
+            totals[field] = totals.get(field, Decimal('0')) + delta
+    if not per_key:
+        return
+    now = datetime.now(timezone.utc)
+    operations = []
+    for (date, account_id), deltas in per_key.items():
+        inc = {field: int(delta) if field in COUNT_FIELDS else Decimal128(delta)
+               for field, delta in deltas.items() if delta != 0}
+        if inc:
+            operations.append(UpdateOne({"date": date, "account_id": account_id},
+                                        {"$inc": inc, "$set": {"updated_at": now}}, upsert=True))
+    if operations:
+        await db.daily_rollups.bulk_write(operations, ordered=False)
+
+
+async def apply_rollup_change(db, transaction: dict, sign: int):
+    await apply_rollup_changes(db, [transaction], sign)
+
+
+# ---------------------------------------------------------------------------
+# Read path
+# ---------------------------------------------------------------------------
+
+def _raw_group(group_id) -> Dict[str, Any]:
+    """$group of raw transactions into the rollup figures."""
+    amount = {"$ifNull": ["$amount", 0]}
+    is_credit = {"$eq": ["$transaction_type", "credit"]}
+    is_debit = {"$eq": ["$transaction_type", "debit"]}
+    is_other = {"$and": [{"$ne": ["$transaction_type", "credit"]}, {"$ne": ["$transaction_type", "debit"]}]}
+    is_return = {"$eq": ["$category", "sales_return"]}
+    return {"$group": {
+        "_id": group_id,
+        "credit_total": {"$sum": {"$cond": [is_credit, amount, 0]}},
+        "debit_total": {"$sum": {"$cond": [is_debit, amount, 0]}},
+        "other_total": {"$sum": {"$cond": [is_other, amount, 0]}},
+        "sales_return_total": {"$sum": {"$cond": [is_return, amount, 0]}},
+        "sales_return_debit_total": {"$sum": {"$cond": [{"$and": [is_return, is_debit]}, amount, 0]}},
+        "credit_count": {"$sum": {"$cond": [is_credit, 1, 0]}},
+        "debit_count": {"$sum": {"$cond": [is_debit, 1, 0]}},
+        "other_count": {"$sum": {"$cond": [is_other, 1, 0]}},
+    }}
+
+
+def _add(into: Dict[str, Dict[str, Any]], row: dict, account_id: Optional[str]):
+    totals = into.setdefault(account_id, empty_totals())
+    for field in SUM_FIELDS:
+        totals[field] += _to_decimal(row.get(field))
+    for field in COUNT_FIELDS:
+        totals[field] += int(row.get(field) or 0)
+
+
+async def _raw_totals(db, into, date_condition: Optional[Dict[str, Any]], account_id: Optional[str]):
+    match: Dict[str, Any] = {"is_deleted": False}
+    if date_condition:
+        match["date"] = date_condition
+    if account_id:
+        match["account_id"] = account_id
+    async for row in db.transactions.aggregate([{"$match": match}, _raw_group("$account_id")]):
+        _add(into, row, row["_id"])
+
+
+async def _rollup_rows(db, into, first_day: Optional[datetime], end_day: datetime, account_id: Optional[str]):
+    date_condition: Dict[str, Any] = {"$lt": end_day}
+    if first_day is not None:
+        date_condition["$gte"] = first_day
+    match: Dict[str, Any] = {"date": date_condition}
+    if account_id:
+        match["account_id"] = account_id
+    group: Dict[str, Any] = {"_id": "$account_id"}
+    for field in SUM_FIELDS + COUNT_FIELDS:
+        group[field] = {"$sum": f"${field}"}
+    async for row in db.daily_rollups.aggregate([{"$match": match}, {"$group": group}]):
+        _add(into, row, row["_id"])
+
+
+async def rollups_ready(db) -> bool:
+    global _ready
+    if not _ready:
+        _ready = await db.daily_rollup_state.find_one({"_id": STATE_ID, "complete": True}) is not None
+    return _ready
+
+
+async def rollup_totals(db, start: Optional[datetime], end: Optional[datetime],
+                        account_id: Optional[str] = None) -> Dict[Optional[str], Dict[str, Any]]:
+    """
+    Rollup figures per account_id for live transactions dated in [start, end]
+    (either bound may be None), as Decimal sums and int counts.
+    """
+    totals: Dict[Optional[str], Dict[str, Any]] = {}
+    start = _utc(start) if start else None
+    end = _utc(end) if end else None
+    if not await rollups_ready(db):
+        condition = {}
+        if start:
+            condition["$gte"] = start
+        if end:
+            condition["$lte"] = end
+        await _raw_totals(db, totals, condition or None, account_id)
+        return totals
+
+    # Whole days [first_day, end_day) come from the rollups
+    first_day = None
+    if start is not None:
+        first_day = start if start == day_start(start) else day_start(start) + ONE_DAY
+    if end is None:
+        end_day = day_start(datetime.now(timezone.utc)) + ONE_DAY * 2
+        # Nothing is dated after "tomorrow" in practice, but stay exact if it is
+        await _raw_totals(db, totals, {"$gte": end_day}, account_id)
+    else:
+        end_day = day_start(end + ONE_MICROSECOND)
+
+    if first_day is not None and first_day >= end_day:
+        # The range lies within one day: raw rows only
+        await _raw_totals(db, totals, {"$gte": start, "$lte": end}, account_id)
+        return totals
+
+    await _rollup_rows(db, totals, first_day, end_day, account_id)
+    if start is not None and first_day != start:
+        await _raw_totals(db, totals, {"$gte": start, "$lt": first_day}, account_id)
+    if end is not None and end_day <= end:
+        await _raw_totals(db, totals, {"$gte": end_day, "$lte": end}, account_id)
+    return totals
+
+
+def sum_totals(per_account: Dict[Optional[str], Dict[str, Any]]) -> Dict[str, Any]:
+    """Add the per-account figures of rollup_totals into one set."""
+    total = empty_totals()
+    for figures in per_account.values():
+        for field in SUM_FIELDS + COUNT_FIELDS:
+            total[field] += figures[field]
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Backfill / verify
+# ---------------------------------------------------------------------------
+
+async def compute_rollups_from_transactions(db) -> Dict[Tuple[datetime, Optional[str]], Dict[str, Any]]:
+    day = {"$dateFromParts": {"year": {"$year": "$date"}, "month": {"$month": "$date"},
+                              "day": {"$dayOfMonth": "$date"}}}
+    computed = {}
+    async for row in db.transactions.aggregate([
+        {"$match": {"is_deleted": False, "date": {"$type": "date"}}},
+        _raw_group({"date": day, "account_id": "$account_id"}),
+    ], allowDiskUse=True):
+        figures = empty_totals()
+        for field in SUM_FIELDS:
+            figures[field] = _to_decimal(row.get(field))
+        for field in COUNT_FIELDS:
+            figures[field] = int(row.get(field) or 0)
+        computed[(row["_id"]["date"], row["_id"].get("account_id"))] = figures
+    return computed
+
+
+def _differs(stored: dict, computed: dict) -> Dict[str, Dict[str, float]]:
+    diffs = {}
+    for field in SUM_FIELDS + COUNT_FIELDS:
+        stored_value = _to_decimal(stored.get(field))
+        computed_value = _to_decimal(computed.get(field))
+        if abs(stored_value - computed_value) > Decimal('0.0005'):
+            diffs[field] = {"stored": float(stored_value), "computed": float(computed_value)}
+    return diffs
+
+
+async def backfill_daily_rollups(db, verify_only: bool = False) -> Dict[str, Any]:
+    """
+    Compare (and unless verify_only, overwrite) every rollup with the raw transactions.
+
+    Transactions written while the backfill runs may be counted twice or
+    not at all; run it when no transactions are being posted and verify
+    afterwards.
+
+    Returns:
+        Counts of rollups checked/written/removed and the mismatches found
+    """
+    computed = await compute_rollups_from_transactions(db)
+    stored = {}
+    async for doc in db.daily_rollups.find({}, {"_id": 0}):
+        stored[(doc.get("date"), doc.get("account_id"))] = doc
+
+    mismatches = []
+    operations = []
+    now = datetime.now(timezone.utc)
+    for key, figures in computed.items():
+        date, account_id = key
+        current = stored.get(key)
+        diffs = _differs(current, figures) if current else {"missing": {"stored": 0, "computed": 1}}
+        if not diffs:
+            continue
+        mismatches.append({"date": date.date().isoformat(), "account_id": account_id, "fields": diffs})
+        values = {field: Decimal128(figures[field]) for field in SUM_FIELDS}
+        values.update({field: figures[field] for field in COUNT_FIELDS})
+        operations.append(UpdateOne({"date": date, "account_id": account_id},
+                                    {"$set": {**values, "updated_at": now}}, upsert=True))
+    # Rollups of days/accounts that no longer have transactions
+    stale = [key for key, doc in stored.items()
+             if key not in computed and any(_to_decimal(doc.get(field)) != 0 for field in SUM_FIELDS + COUNT_FIELDS)]
+    for date, account_id in stale:
+        mismatches.append({"date": date.date().isoformat() if date else None, "account_id": account_id,
+                           "fields": {"stale": {"stored": 1, "computed": 0}}})
+
+    removed = 0
+    if not verify_only:
+        for start in range(0, len(operations), 1000):
+            await db.daily_rollups.bulk_write(operations[start:start + 1000], ordered=False)
+        for date, account_id in stale:
+            removed += (await db.daily_rollups.delete_one({"date": date, "account_id": account_id})).deleted_count
+        await mark_rollups_complete(db)
+
+    return {
+        "checked": len(computed),
+        "written": 0 if verify_only else len(operations),
+        "removed": removed,
+        "mismatches": mismatches,
+    }
+
+
+async def mark_rollups_complete(db):
+    global _ready
+    await db.daily_rollup_state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {"complete": True, "completed_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    _ready = True
+
+
+async def init_daily_rollups(db):
+    """Startup hook: mark an empty database complete, warn when a backfill is still needed."""
+    if await rollups_ready(db):
+        return
+    if await db.transactions.estimated_document_count() == 0:
+        await mark_rollups_complete(db)
+        return
+    logger.warning("daily_rollups have not been backfilled; cash-book reports scan raw transactions "
+                   "until `python rebuild_daily_rollups.py` is run")
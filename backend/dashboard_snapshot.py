@@ -0,0 +1,205 @@
+"""
+Dashboard Snapshot
+------------------
+Pre-aggregated figures behind ``/api/dashboard``.
+
+The dashboard used to load every inventory header, up to 10k unpaid invoices
+and run five count_documents on each page view. The figures are now computed
+with a handful of $group aggregations and stored in one document
+(``dashboard_snapshots``, ``_id: "main"``) that the endpoint reads in a
+single lookup.
+
+Freshness:
+- a background task started with the app recomputes the snapshot every
+  DASHBOARD_REFRESH_SECONDS (default 60)
+- writes to a module that feeds the dashboard (invoices, inventory, parties,
+  job cards, purchases, returns) mark the snapshot stale through the audit
+  log hook, and the refresher picks that up within DASHBOARD_STALE_CHECK_SECONDS
+  (default 5) instead of waiting for the full interval
+- a snapshot older than twice the interval (e.g. no refresher running) is
+  recomputed on read
+- ``/api/dashboard?refresh=true`` forces a recompute
+
+Every response carries the snapshot's ``computed_at`` and age so the UI can
+show how fresh the numbers are.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from bson import Decimal128
+
+from db_indexes import LIVE_ONLY, register_indexes
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL_SECONDS = float(os.environ.get('DASHBOARD_REFRESH_SECONDS', '60'))
+STALE_CHECK_SECONDS = min(float(os.environ.get('DASHBOARD_STALE_CHECK_SECONDS', '5')), REFRESH_INTERVAL_SECONDS)
+LOW_STOCK_QTY = 5
+SNAPSHOT_ID = "main"
+
+register_indexes("invoices", [
+    {"name": "live_created", "keys": [("created_at", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+
+# Audit log modules whose writes change dashboard figures
+DASHBOARD_MODULES = {
+    "invoice", "inventory", "inventory_header", "stock_movement",
+    "party", "jobcard", "purchases", "returns",
+}
+
+# Set by write paths; cleared when a snapshot is computed (per process)
+_stale = False
+_refresh_lock = asyncio.Lock()
+
+
+def mark_dashboard_stale(module: Optional[str] = None) -> None:
+    """Ask the refresher for an early recompute (only for dashboard modules when given)."""
+    global _stale
+    if module is None or module in DASHBOARD_MODULES:
+        _stale = True
+
+
+def _num(value) -> float:
+    if value is None:
+        return 0.0
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    return float(value)
+
+
+async def _first(cursor) -> Dict[str, Any]:
+    async for row in cursor:
+        return row
+    return {}
+
+
+async def compute_dashboard_snapshot(db) -> Dict[str, Any]:
+    """Aggregate every dashboard figure and store the snapshot document."""
+    global _stale
+    _stale = False
+    computed_at = datetime.now(timezone.utc)
+
+    inventory = await _first(db.inventory_headers.aggregate([
+        {"$match": {"is_deleted": False}},
+        {"$group": {
+            "_id": None,
+            "total_categories": {"$sum": 1},
+            "total_stock_weight": {"$sum": {"$ifNull": ["$current_weight", 0]}},
+            "total_stock_qty": {"$sum": {"$ifNull": ["$current_qty", 0]}},
+            "low_stock_items": {"$sum": {"$cond": [
+                {"$lt": [{"$ifNull": ["$current_qty", 0]}, LOW_STOCK_QTY]}, 1, 0
+            ]}},
+        }},
+    ]))
+
+    outstanding = await _first(db.invoices.aggregate([
+        {"$match": {"is_deleted": False, "payment_status": {"$ne": "paid"}}},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": {"$ifNull": ["$balance_due", 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]))
+
+    parties = {row["_id"]: row["count"] async for row in db.parties.aggregate([
+        {"$match": {"is_deleted": False}},
+        {"$group": {"_id": "$party_type", "count": {"$sum": 1}}},
+    ])}
+
+    jobcards = {row["_id"]: row["count"] async for row in db.jobcards.aggregate([
+        {"$match": {"is_deleted": False}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ])}
+
+    recent_invoices = await db.invoices.find(
+        {"is_deleted": False},
+        {"_id": 0}
+    ).sort("created_at", -1).limit(5).to_list(5)
+
+    customers = parties.get("customer", 0)
+    vendors = parties.get("vendor", 0)
+    snapshot = {
+        "_id": SNAPSHOT_ID,
+        "inventory": {
+            "total_categories": inventory.get("total_categories", 0),
+            "total_stock_weight_grams": round(_num(inventory.get("total_stock_weight")), 3),
+            "total_stock_qty": round(_num(inventory.get("total_stock_qty")), 2),
+            "low_stock_items": inventory.get("low_stock_items", 0),
+        },
+        "financial": {
+            "total_outstanding_omr": round(_num(outstanding.get("total")), 2),
+            "outstanding_invoices_count": outstanding.get("count", 0),
+        },
+        "parties": {
+            "total_customers": customers,
+            "total_vendors": vendors,
+            "total": customers + vendors,
+        },
+        "job_cards": {
+            "total": sum(jobcards.values()),
+            "pending": jobcards.get("pending", 0),
+            "completed": jobcards.get("completed", 0),
+        },
+        "recent_activity": {
+            "recent_invoices": recent_invoices,
+        },
+        "computed_at": computed_at,
+    }
+    await db.dashboard_snapshots.replace_one({"_id": SNAPSHOT_ID}, snapshot, upsert=True)
+    return snapshot
+
+
+async def get_dashboard_snapshot(db, force: bool = False) -> Dict[str, Any]:
+    """
+    Read the dashboard snapshot, recomputing it when forced, missing or too old.
+
+    Returns:
+        Snapshot document (without _id) plus a "snapshot" block with its age
+    """
+    snapshot = None if force else await db.dashboard_snapshots.find_one({"_id": SNAPSHOT_ID})
+    if snapshot is not None and _age_seconds(snapshot) > 2 * REFRESH_INTERVAL_SECONDS:
+        snapshot = None
+    if snapshot is None:
+        async with _refresh_lock:
+            snapshot = await compute_dashboard_snapshot(db)
+
+    snapshot.pop("_id", None)
+    computed_at = snapshot.pop("computed_at")
+    snapshot["snapshot"] = {
+        "computed_at": _aware(computed_at).isoformat(),
+        "age_seconds": round(_age_seconds({"computed_at": computed_at}), 1),
+        "refresh_interval_seconds": REFRESH_INTERVAL_SECONDS,
+    }
+    return snapshot
+
+
+def _aware(value: datetime) -> datetime:
+    # Motor returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _age_seconds(snapshot: Dict[str, Any]) -> float:
+    computed_at: Optional[datetime] = snapshot.get("computed_at")
+    if computed_at is None:
+        return float("inf")
+    return (datetime.now(timezone.utc) - _aware(computed_at)).total_seconds()
+
+
+async def run_dashboard_refresher(db, interval: float = REFRESH_INTERVAL_SECONDS,
+                                  check_every: float = STALE_CHECK_SECONDS):
+    """Background loop keeping the snapshot at most one interval old (sooner after writes)."""
+    while True:
+        try:
+            snapshot = await db.dashboard_snapshots.find_one({"_id": SNAPSHOT_ID}, {"computed_at": 1})
+            if _stale or snapshot is None or _age_seconds(snapshot) >= interval:
+                async with _refresh_lock:
+                    await compute_dashboard_snapshot(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dashboard snapshot refresh failed: {e}")
+        await asyncio.sleep(check_every)
@@ -0,0 +1,281 @@
+"""
+Database Index Catalog
+----------------------
+Central registry of every MongoDB index the API relies on.
+
+server.py looks records up by their UUID ``id`` together with the soft-delete
+flag (``{"id": ..., "is_deleted": False}``), filters ledgers by party/account
+and date, and generates document numbers with anchored prefix regexes. Without
+indexes each of those is a collection scan.
+
+Indexes are declared here once and created idempotently on startup via
+``ensure_indexes``. ``get_index_report`` compares the catalog against what
+actually exists in the database (used by the admin index endpoint).
+
+Conventions:
+- ``id`` lookups get a unique index with no partial filter, because several
+  code paths fetch by ``id`` without the ``is_deleted`` condition.
+- List/report filters that always include ``is_deleted: False`` use partial
+  indexes restricted to live documents, which keeps them small.
+- Modules that own a collection or field (e.g. sequences.py for the unique
+  document-number indexes) add their entries with ``register_indexes``.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Partial filter shared by every "live documents only" index
+LIVE_ONLY = {"is_deleted": False}
+
+
+def _index(name: str, keys: List[tuple], **options) -> Dict[str, Any]:
+    """Build a catalog entry: index name, key pattern and create_index options."""
+    return {"name": name, "keys": keys, "options": options}
+
+
+def _id_index() -> Dict[str, Any]:
+    return _index("id_unique", [("id", 1)], unique=True)
+
+
+# collection name -> list of index specs
+INDEX_CATALOG: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        _id_index(),
+        _index("username", [("username", 1)]),
+        _index("email", [("email", 1)]),
+    ],
+    "parties": [
+        _id_index(),
+        _index("live_type_created", [("party_type", 1), ("created_at", -1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("live_name", [("name", 1)], partialFilterExpression=LIVE_ONLY),
+    ],
+    "invoices": [
+        _id_index(),
+        _index("live_date", [("date", -1)], partialFilterExpression=LIVE_ONLY),
+        _index("live_customer_status_date", [("customer_id", 1), ("status", 1), ("date", -1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("live_payment_status", [("payment_status", 1), ("status", 1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("jobcard_id", [("jobcard_id", 1)]),
+    ],
+    "transactions": [
+        _id_index(),
+        _index("transaction_number", [("transaction_number", 1)]),
+        _index("live_date", [("date", -1)], partialFilterExpression=LIVE_ONLY),
+        _index("live_account_date", [("account_id", 1), ("date", 1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("live_party_date", [("party_id", 1), ("date", -1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("reference", [("reference_type", 1), ("reference_id", 1)]),
+    ],
+    "accounts": [
+        _id_index(),
+        _index("name", [("name", 1)]),
+        _index("live_account_type", [("account_type", 1)], partialFilterExpression=LIVE_ONLY),
+    ],
+    "gold_ledger": [
+        _id_index(),
+        _index("live_party_date", [("party_id", 1), ("date", -1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("live_date", [("date", -1)], partialFilterExpression=LIVE_ONLY),
+        _index("reference", [("reference_type", 1), ("reference_id", 1)]),
+    ],
+    "stock_movements": [
+        _id_index(),
+        _index("live_header_date", [("header_id", 1), ("date", -1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("live_date", [("date", -1)], partialFilterExpression=LIVE_ONLY),
+        _index("reference", [("reference_type", 1), ("reference_id", 1)]),
+    ],
+    "inventory_headers": [
+        _id_index(),
+        _index("name", [("name", 1)]),
+    ],
+    "purchases": [
+        _id_index(),
+        _index("live_date", [("date", -1)], partialFilterExpression=LIVE_ONLY),
+        _index("live_vendor_date", [("vendor_party_id", 1), ("date", -1)],
+               partialFilterExpression=LIVE_ONLY),
+    ],
+    "returns": [
+        _id_index(),
+        _index("reference_status", [("reference_id", 1), ("status", 1)]),
+        _index("live_created", [("created_at", -1)], partialFilterExpression=LIVE_ONLY),
+        _index("live_date", [("date", -1)], partialFilterExpression=LIVE_ONLY),
+    ],
+    "jobcards": [
+        _id_index(),
+        _index("live_type_created", [("card_type", 1), ("created_at", -1)],
+               partialFilterExpression=LIVE_ONLY),
+        _index("customer_id", [("customer_id", 1)]),
+    ],
+    "workers": [_id_index()],
+    "work_types": [_id_index()],
+    "daily_closings": [
+        _id_index(),
+        _index("date", [("date", -1)]),
+    ],
+    "audit_logs": [
+        _index("timestamp", [("timestamp", -1)]),
+        _index("module_timestamp", [("module", 1), ("timestamp", -1)]),
+        _index("user_timestamp", [("user_id", 1), ("timestamp", -1)]),
+        _index("record_id", [("record_id", 1)]),
+    ],
+    "auth_audit_logs": [
+        _index("timestamp", [("timestamp", -1)]),
+    ],
+    "password_reset_tokens": [
+        _index("token", [("token", 1)]),
+    ],
+}
+
+
+def register_indexes(collection: str, specs: List[Dict[str, Any]]) -> None:
+    """
+    Add index specs to the catalog for a collection.
+    Subsystems that own their own collections call this at import time so
+    their indexes are built and reported alongside the core ones.
+    """
+    existing = INDEX_CATALOG.setdefault(collection, [])
+    names = {spec["name"] for spec in existing}
+    for spec in specs:
+        if spec["name"] not in names:
+            existing.append(spec)
+            names.add(spec["name"])
+
+
+async def ensure_indexes(db) -> Dict[str, Any]:
+    """
+    Create every catalog index that does not exist yet.
+
+    create_index is a no-op when an identical index is already present, so
+    this is safe to run on every startup. A conflicting index (same keys,
+    different options) or a unique index that cannot be built because of
+    duplicate data is logged and skipped so startup is never blocked.
+
+    Returns:
+        Dictionary with the names of indexes ensured and any failures
+    """
+    ensured = []
+    failed = []
+    for collection, specs in INDEX_CATALOG.items():
+        for spec in specs:
+            try:
+                await db[collection].create_index(spec["keys"], name=spec["name"], **spec["options"])
+                ensured.append(f"{collection}.{spec['name']}")
+            except OperationFailure as e:
+                logger.warning(f"Could not create index {collection}.{spec['name']}: {e}")
+                failed.append({"collection": collection, "index": spec["name"], "error": str(e)})
+    return {"ensured": ensured, "failed": failed}
+
+
+async def _index_sizes(db, collection: str) -> Dict[str, int]:
+    """Index sizes in bytes for a collection (empty if stats are unavailable)."""
+    sizes: Dict[str, int] = {}
+    try:
+        async for stats in db[collection].aggregate([{"$collStats": {"storageStats": {}}}]):
+            for name, size in stats.get("storageStats", {}).get("indexSizes", {}).items():
+                sizes[name] = sizes.get(name, 0) + int(size)
+    except OperationFailure:
+        # Collection does not exist yet or $collStats is not permitted
+        pass
+    return sizes
+
+
+def _key_pattern(keys, weights: Optional[Dict[str, Any]] = None) -> List[tuple]:
+    """
+    Comparable key pattern: numeric directions as ints, index types ("text",
+    "2dsphere", "hashed") as strings. Text indexes are reported by the server
+    as ``_fts``/``_ftsx`` plus ``weights``; they are mapped back to the
+    indexed fields so they compare equal to the registered spec.
+    """
+    pattern = []
+    for field, direction in keys:
+        if field == "_ftsx":
+            continue
+        if field == "_fts" and direction == "text":
+            pattern.extend((name, "text") for name in sorted(weights or {}))
+            continue
+        pattern.append((field, direction if isinstance(direction, str) else int(direction)))
+    return pattern
+
+
+def _spec_pattern(keys) -> List[tuple]:
+    """_key_pattern of a registered spec, with its text fields in the server's (sorted) order."""
+    pattern = _key_pattern(keys)
+    text = sorted(key for key in pattern if key[1] == "text")
+    if not text:
+        return pattern
+    first = next(i for i, key in enumerate(pattern) if key[1] == "text")
+    rest = [key for key in pattern if key[1] != "text"]
+    return rest[:first] + text + rest[first:]
+
+
+async def get_index_report(db) -> Dict[str, Any]:
+    """
+    Compare the catalog with the indexes present in the database.
+
+    An existing index counts as present when its key pattern matches the
+    registered one, even if it was created under a different name.
+
+    Returns:
+        Per-collection lists of present, missing and unregistered indexes
+        with their sizes, plus overall totals
+    """
+    collections = {}
+    total_present = 0
+    total_missing = 0
+
+    for collection, specs in INDEX_CATALOG.items():
+        existing = await db[collection].index_information()
+        sizes = await _index_sizes(db, collection)
+
+        by_keys = {tuple(_key_pattern(info["key"], info.get("weights"))): name for name, info in existing.items()}
+        matched_names = {"_id_"}
+        present = []
+        missing = []
+
+        for spec in specs:
+            existing_name = by_keys.get(tuple(_spec_pattern(spec["keys"])))
+            entry = {
+                "name": spec["name"],
+                "keys": dict(spec["keys"]),
+                "unique": spec["options"].get("unique", False),
+                "partial": "partialFilterExpression" in spec["options"],
+            }
+            if existing_name:
+                matched_names.add(existing_name)
+                entry["existing_name"] = existing_name
+                entry["size_bytes"] = sizes.get(existing_name)
+                present.append(entry)
+            else:
+                missing.append(entry)
+
+        unregistered = [
+            {"name": name, "keys": dict(info["key"]), "size_bytes": sizes.get(name)}
+            for name, info in existing.items()
+            if name not in matched_names
+        ]
+
+        total_present += len(present)
+        total_missing += len(missing)
+        collections[collection] = {
+            "present": present,
+            "missing": missing,
+            "unregistered": unregistered,
+            "total_index_size_bytes": sum(sizes.values()),
+        }
+
+    return {
+        "collections": collections,
+        "summary": {
+            "registered": total_present + total_missing,
+            "present": total_present,
+            "missing": total_missing,
+        },
+    }
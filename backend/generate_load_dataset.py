@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Load-Test Dataset Generator for Gold Shop ERP
+=============================================
+Fills a scratch database with a production-scale synthetic dataset for
+load_test.py. The seed dashboard / dummy data scripts create tens of records;
+this one creates (at --scale 1):
+
+    1,000,000 transactions     200,000 invoices (1-4 items each)
+       50,000 parties            500,000 stock movements
+           24 inventory headers        8 accounts
+
+Documents are built with the server's own models and Decimal128 converters,
+so they have exactly the shape and BSON types the API writes. Every id,
+amount and date comes from one random.Random(--seed): the same arguments
+always produce the same data (pass --end for identical dates on another
+day). Header stock equals the sum of the generated movements.
+
+Rows are written with concurrent insert_many batches; the catalog indexes,
+the daily transaction rollups and the inventory snapshots are built at the
+end. A login user for the load test is created and a manifest (counts,
+seed, sample ids per collection) is written for load_test.py.
+
+The target database must be empty unless --drop is given. It defaults to
+gold_shop_loadtest, never the DB_NAME of the .env file.
+
+Usage:
+    MONGO_URL=mongodb://localhost:27017 python generate_load_dataset.py [--scale 1] [--seed 42] [--drop]
+    python generate_load_dataset.py --transactions 100000 --invoices 20000 --parties 5000 --movements 50000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DB = "gold_shop_loadtest"
+LOAD_TEST_USER = "loadtest"
+LOAD_TEST_PASSWORD = "LoadTest!2025secure"
+BATCH_SIZE = 5000
+PARALLEL_BATCHES = 4
+SAMPLE_IDS = 1000
+
+COUNTS = {"transactions": 1_000_000, "invoices": 200_000, "parties": 50_000, "movements": 500_000}
+ACCOUNTS = [
+    ("Cash", "asset"), ("Bank - Main", "asset"), ("Bank - Savings", "asset"), ("Sales", "income"),
+    ("Making Charges", "income"), ("Purchases", "expense"), ("Rent", "expense"), ("Salaries", "expense"),
+]
+CATEGORIES = [f"{kind} {karat}K" for kind in ("Ring", "Chain", "Bangle", "Necklace", "Earring", "Bracelet")
+              for karat in (18, 21, 22, 24)]
+PURITY = {18: 750, 21: 875, 22: 916, 24: 999}
+TRANSACTION_CATEGORIES = ["Sales", "Purchase Payment", "Customer Payment", "Rent", "Salary", "Expense", "Transfer"]
+
+
+class Generator:
+    def __init__(self, server, rng: random.Random, end: datetime, days: int, user_id: str):
+        self.server = server
+        self.rng = rng
+        self.end = end
+        self.days = days
+        self.user_id = user_id
+
+    def uid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def date(self) -> datetime:
+        return self.end - timedelta(seconds=self.rng.randrange(self.days * 86400))
+
+    def money(self, low: float, high: float) -> float:
+        return round(self.rng.uniform(low, high), 3)
+
+    def account(self, name: str, account_type: str) -> dict:
+        account = self.server.Account(id=self.uid(), name=name, account_type=account_type,
+                                      opening_balance=0, current_balance=0, created_by=self.user_id)
+        return self.server.convert_account_to_decimal(account.model_dump())
+
+    def party(self, index: int) -> dict:
+        party_type = "vendor" if self.rng.random() < 0.2 else "customer"
+        created = self.date()
+        return self.server.Party(
+            id=self.uid(), name=f"{party_type.title()} {index:06d}", phone=f"9{self.rng.randrange(10**7):07d}",
+            party_type=party_type, created_at=created, created_by=self.user_id
+        ).model_dump()
+
+    def invoice(self, index: int, customers: list) -> dict:
+        when = self.date()
+        items = []
+        for _ in range(self.rng.randint(1, 4)):
+            category = self.rng.choice(CATEGORIES)
+            weight = round(self.rng.uniform(1, 40), 3)
+            rate = round(self.rng.uniform(20, 30), 2)
+            gold_value = round(weight * rate, 3)
+            making = round(weight * self.rng.uniform(0.5, 3), 3)
+            vat = round((gold_value + making) * 0.05, 3)
+            items.append(self.server.InvoiceItem(
+                id=self.uid(), category=category, description=f"{category} design {self.rng.randrange(500)}",
+                qty=1, gross_weight=weight, net_gold_weight=weight, weight=weight,
+                purity=PURITY[int(category[-3:-1])], metal_rate=rate, gold_value=gold_value,
+                making_charge_type="per_gram", making_value=making, vat_percent=5.0, vat_amount=vat,
+                line_total=round(gold_value + making + vat, 3)
+            ))
+        subtotal = round(sum(item.gold_value + item.making_value for item in items), 3)
+        vat_total = round(sum(item.vat_amount for item in items), 3)
+        grand_total = round(subtotal + vat_total, 3)
+        status = "finalized" if self.rng.random() < 0.9 else "draft"
+        paid = 0.0
+        if status == "finalized":
+            paid = self.rng.choice([grand_total, grand_total, round(grand_total * self.rng.random(), 3), 0.0])
+        payment_status = "paid" if paid >= grand_total else ("partial" if paid > 0 else "unpaid")
+        customer = self.rng.choice(customers) if customers and self.rng.random() < 0.7 else None
+        invoice = self.server.Invoice(
+            id=self.uid(), invoice_number=f"INV-{when.year}-{index:07d}", date=when, created_at=when,
+            due_date=when + timedelta(days=30),
+            customer_type="saved" if customer else "walk_in",
+            customer_id=customer["id"] if customer else None,
+            customer_name=customer["name"] if customer else None,
+            walk_in_name=None if customer else f"Walk-in {index}",
+            status=status, finalized_at=when if status == "finalized" else None,
+            finalized_by=self.user_id if status == "finalized" else None,
+            payment_status=payment_status, paid_at=when if payment_status == "paid" else None,
+            updated_at=when, items=items, subtotal=subtotal, vat_total=vat_total, grand_total=grand_total,
+            paid_amount=paid, balance_due=round(grand_total - paid, 3), created_by=self.user_id
+        )
+        return self.server.convert_invoice_to_decimal(invoice.model_dump())
+
+    def transaction(self, index: int, accounts: list, parties: list) -> dict:
+        when = self.date()
+        account = self.rng.choice(accounts)
+        party = self.rng.choice(parties) if parties and self.rng.random() < 0.6 else None
+        transaction = self.server.Transaction(
+            id=self.uid(), transaction_number=f"TXN-{when.year}-{index:07d}", date=when, created_at=when,
+            transaction_type=self.rng.choice(("credit", "debit")), mode=self.rng.choice(("Cash", "Card", "Bank Transfer")),
+            account_id=account["id"], account_name=account["name"],
+            party_id=party["id"] if party else None, party_name=party["name"] if party else None,
+            amount=self.money(1, 5000), category=self.rng.choice(TRANSACTION_CATEGORIES),
+            created_by=self.user_id
+        )
+        return self.server.convert_transaction_to_decimal(transaction.model_dump())
+
+    def movement(self, headers: list, stock: dict) -> dict:
+        when = self.date()
+        header = self.rng.choice(headers)
+        stock_in = self.rng.random() < 0.55
+        weight = round(self.rng.uniform(1, 40), 3)
+        qty = 1 if stock_in else -1
+        weight_delta = weight if stock_in else -weight
+        totals = stock[header["id"]]
+        totals[0] += qty
+        totals[1] += weight_delta
+        movement = self.server.StockMovement(
+            id=self.uid(), date=when, created_at=when, movement_type="Stock IN" if stock_in else "Stock OUT",
+            header_id=header["id"], header_name=header["name"], description=f"Load test {header['name']}",
+            qty_delta=qty, weight_delta=weight_delta, purity=PURITY[int(header["name"][-3:-1])],
+            reference_type="load_test", created_by=self.user_id
+        )
+        return self.server.convert_stock_movement_to_decimal(movement.model_dump())
+
+
+async def insert_all(collection, make, total: int, label: str):
+    """Generate and insert ``total`` documents with a few insert_many batches in flight."""
+    started = time.perf_counter()
+    pending = set()
+    done = 0
+    for offset in range(0, total, BATCH_SIZE):
+        batch = [make(offset + i) for i in range(min(BATCH_SIZE, total - offset))]
+        pending.add(asyncio.create_task(collection.insert_many(batch, ordered=False)))
+        if len(pending) >= PARALLEL_BATCHES:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                task.result()
+        done += len(batch)
+        if done % (BATCH_SIZE * 20) == 0 or done == total:
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"  {label:<16} {done:>10,} / {total:,}  ({rate:,.0f}/s)", flush=True)
+    for task in pending:
+        await task
+
+
+def sample(docs: list, rng: random.Random) -> list:
+    return rng.sample([doc["id"] for doc in docs], min(SAMPLE_IDS, len(docs)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic production-scale dataset for load_test.py')
+    parser.add_argument('--db', default=DEFAULT_DB, help='Target database (must be empty unless --drop)')
+    parser.add_argument('--drop', action='store_true', help='Drop the target database first')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every default volume')
+    for name, default in COUNTS.items():
+        parser.add_argument(f'--{name}', type=int, help=f'Number of {name} (default {default:,} x scale)')
+    parser.add_argument('--days', type=int, default=730, help='Spread dates over this many days')
+    parser.add_argument('--end', help='Newest date, YYYY-MM-DD (default today)')
+    parser.add_argument('--password', default=LOAD_TEST_PASSWORD, help=f'Password of the {LOAD_TEST_USER!r} user')
+    parser.add_argument('--manifest', default='load_dataset.json', help='Manifest written for load_test.py')
+    args = parser.parse_args()
+
+    counts = {name: getattr(args, name) if getattr(args, name) is not None else int(default * args.scale)
+              for name, default in COUNTS.items()}
+    end = (datetime.strptime(args.end, "%Y-%m-%d").replace(tzinfo=timezone.utc) if args.end
+           else datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)) + timedelta(days=1)
+
+    os.environ['DB_NAME'] = args.db
+    import server
+    from db_indexes import ensure_indexes
+    from daily_rollups import backfill_daily_rollups
+    from inventory_snapshots import fill_inventory_snapshots
+
+    db = server.db
+    if args.drop:
+        await server.client.drop_database(args.db)
+    elif await db.invoices.estimated_document_count() or await db.transactions.estimated_document_count():
+        print(f"✗ Database {args.db} is not empty; pass --drop to replace it")
+        return 1
+
+    rng = random.Random(args.seed)
+    user = server.User(id=str(uuid.UUID(int=rng.getrandbits(128), version=4)), username=LOAD_TEST_USER,
+                       email="loadtest@example.com", full_name="Load Test", role="admin",
+                       permissions=server.get_user_permissions("admin"))
+    gen = Generator(server, rng, end, args.days, user.id)
+    print(f"Generating into {args.db} (seed {args.seed}, {args.days} days up to {end.date() - timedelta(days=1)})")
+    started = time.perf_counter()
+
+    await db.users.insert_one({**user.model_dump(), "hashed_password": server.pwd_context.hash(args.password)})
+    accounts = [gen.account(name, kind) for name, kind in ACCOUNTS]
+    await db.accounts.insert_many([dict(account) for account in accounts])
+    headers = []
+    for name in CATEGORIES:
+        headers.append(server.InventoryHeader(id=gen.uid(), name=name, created_by=user.id).model_dump())
+
+    parties = []
+
+    def make_party(index):
+        party = gen.party(index)
+        parties.append(party)
+        return party
+
+    await insert_all(db.parties, make_party, counts["parties"], "parties")
+    customers = [party for party in parties if party["party_type"] == "customer"]
+    invoice_ids = []
+
+    def make_invoice(index):
+        invoice = gen.invoice(index, customers)
+        if len(invoice_ids) < SAMPLE_IDS * 10:
+            invoice_ids.append(invoice["id"])
+        return invoice
+
+    await insert_all(db.invoices, make_invoice, counts["invoices"], "invoices")
+    await insert_all(db.transactions, lambda i: gen.transaction(i, accounts, parties), counts["transactions"],
+                     "transactions")
+    stock = {header["id"]: [1000, 20000.0] for header in headers}
+    await insert_all(db.stock_movements, lambda i: gen.movement(headers, stock), counts["movements"], "movements")
+    for header in headers:
+        header["current_qty"], header["current_weight"] = stock[header["id"]][0], round(stock[header["id"]][1], 3)
+    await db.inventory_headers.insert_many([dict(header) for header in headers])
+
+    print("  building indexes ...", flush=True)
+    index_result = await ensure_indexes(db)
+    print("  backfilling daily rollups ...", flush=True)
+    await backfill_daily_rollups(db)
+    print("  writing inventory snapshots ...", flush=True)
+    await fill_inventory_snapshots(db)
+    elapsed = time.perf_counter() - started
+
+    manifest = {
+        "database": args.db,
+        "seed": args.seed,
+        "days": args.days,
+        "end": (end - timedelta(days=1)).date().isoformat(),
+        "counts": {**counts, "accounts": len(accounts), "inventory_headers": len(headers)},
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "generation_seconds": round(elapsed, 1),
+        "username": LOAD_TEST_USER,
+        "password": args.password,
+        "sample_ids": {
+            "parties": sample(parties, rng),
+            "customers": sample(customers, rng),
+            "invoices": rng.sample(invoice_ids, min(SAMPLE_IDS, len(invoice_ids))),
+            "accounts": [account["id"] for account in accounts],
+            "inventory_headers": [header["id"] for header in headers],
+        },
+    }
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"\n✓ Generated in {elapsed:.0f}s ({len(index_result['ensured'])} indexes); manifest {args.manifest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
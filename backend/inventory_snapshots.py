@@ -0,0 +1,398 @@
+"""
+Inventory Snapshots
+-------------------
+Per-header cumulative stock snapshots over ``stock_movements``, the
+append-only record of every stock change, and an incremental reconciler
+that checks ``inventory_headers.current_qty/current_weight`` against it.
+
+A snapshot ``{header_id, as_of, qty, weight, movement_count,
+last_movement_id}`` holds the sums of the header's live movements dated
+before ``as_of`` (a UTC midnight). Stock at any time T is the latest
+snapshot at or before T plus the movements in [as_of, T), so neither the
+reconciler nor a point-in-time query replays more than the movements since
+the last snapshot:
+
+- ``take_inventory_snapshots`` writes the snapshot of a boundary (default:
+  today's midnight) for every header, starting from each header's previous
+  snapshot
+- ``fill_inventory_snapshots`` keeps a snapshot at every month start since
+  the first movement plus today's, writing the missing ones oldest first,
+  so a point-in-time query (``stock_at``) sums at most a month of
+  movements; ``run_inventory_snapshotter`` runs it every
+  INVENTORY_SNAPSHOT_INTERVAL_HOURS in the background
+- ``reconcile_inventory`` compares each header's stored totals with its
+  latest snapshot plus the later movements and reports (or with fix=True
+  corrects) the drift
+
+Movements are not always dated "now" - purchases carry the purchase date -
+and manual movements can be soft deleted, so write paths call
+``invalidate_inventory_snapshots`` after inserting or removing movements.
+That drops the header's snapshots after the earliest affected date (a
+no-op for the usual "dated now" movement) and bumps the header's snapshot
+version, which is checked before a snapshot computed concurrently is kept
+(the same scheme as running_balances.py).
+
+Run ``python reconcile_inventory_stock.py --rebuild`` (repository root)
+after movements are written outside the API (seed or fix scripts).
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import Decimal128
+from pymongo import UpdateOne
+
+from db_indexes import register_indexes
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL_HOURS = float(os.environ.get('INVENTORY_SNAPSHOT_INTERVAL_HOURS', '24'))
+# Header weights are stored as floats; tolerate float residue below half a milligram
+WEIGHT_TOLERANCE = Decimal('0.0005')
+
+register_indexes("inventory_snapshots", [
+    {"name": "header_as_of_unique", "keys": [("header_id", 1), ("as_of", -1)], "options": {"unique": True}},
+])
+register_indexes("inventory_snapshot_versions", [
+    {"name": "header_id_unique", "keys": [("header_id", 1)], "options": {"unique": True}},
+])
+
+
+def _to_decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value))
+
+
+def _utc(value: datetime) -> datetime:
+    """Naive UTC datetime, as MongoDB returns it."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def snapshot_boundary(value: Optional[datetime] = None) -> datetime:
+    """The UTC midnight at or before ``value`` (default: now)."""
+    value = _utc(value or datetime.now(timezone.utc))
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _empty(header_id: str) -> Dict[str, Any]:
+    return {"header_id": header_id, "as_of": None, "qty": Decimal('0'), "weight": Decimal('0'),
+            "movement_count": 0, "last_movement_id": None, "last_movement_date": None}
+
+
+async def movement_totals(db, header_ids: List[str], start: Optional[datetime],
+                          end: Optional[datetime]) -> Dict[str, Dict[str, Any]]:
+    """
+    Sums of the headers' live movements dated in [start, end) (either bound
+    may be None), with the (date, id) of the last one.
+    """
+    match: Dict[str, Any] = {"header_id": {"$in": header_ids}, "is_deleted": False}
+    dates = {}
+    if start is not None:
+        dates["$gte"] = start
+    if end is not None:
+        dates["$lt"] = end
+    if dates:
+        match["date"] = dates
+    totals = {}
+    async for row in db.stock_movements.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$header_id",
+            "qty": {"$sum": {"$ifNull": ["$qty_delta", 0]}},
+            "weight": {"$sum": {"$ifNull": ["$weight_delta", 0]}},
+            "count": {"$sum": 1},
+            "last": {"$max": {"date": "$date", "id": "$id"}},
+        }},
+    ]):
+        last = row.get("last") or {}
+        totals[row["_id"]] = {"qty": _to_decimal(row.get("qty")), "weight": _to_decimal(row.get("weight")),
+                              "count": row.get("count", 0), "last_id": last.get("id"), "last_date": last.get("date")}
+    return totals
+
+
+async def latest_snapshots(db, header_ids: List[str], at: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """Each header's latest snapshot with as_of <= ``at`` (any when None); headers without one are omitted."""
+    match: Dict[str, Any] = {"header_id": {"$in": header_ids}}
+    if at is not None:
+        match["as_of"] = {"$lte": _utc(at)}
+    snapshots = {}
+    async for row in db.inventory_snapshots.aggregate([
+        {"$match": match},
+        {"$sort": {"header_id": 1, "as_of": -1}},
+        {"$group": {"_id": "$header_id", "snapshot": {"$first": "$$ROOT"}}},
+    ]):
+        snapshot = row["snapshot"]
+        snapshot["qty"] = _to_decimal(snapshot.get("qty"))
+        snapshot["weight"] = _to_decimal(snapshot.get("weight"))
+        snapshots[row["_id"]] = snapshot
+    return snapshots
+
+
+async def stock_at(db, header_ids: List[str], at: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Cumulative stock of each header from its movements dated before ``at``
+    (every movement when None): the latest snapshot plus one grouped
+    aggregation over the movements after it, per distinct snapshot date.
+    """
+    end = _utc(at) if at is not None else None
+    snapshots = await latest_snapshots(db, header_ids, end)
+    result = {header_id: dict(snapshots.get(header_id) or _empty(header_id)) for header_id in header_ids}
+
+    by_base: Dict[Optional[datetime], List[str]] = {}
+    for header_id, state in result.items():
+        by_base.setdefault(state["as_of"], []).append(header_id)
+    for base, ids in by_base.items():
+        for header_id, delta in (await movement_totals(db, ids, base, end)).items():
+            state = result[header_id]
+            state["qty"] += delta["qty"]
+            state["weight"] += delta["weight"]
+            state["movement_count"] = state.get("movement_count", 0) + delta["count"]
+            if delta["last_id"] is not None:
+                state["last_movement_id"] = delta["last_id"]
+                state["last_movement_date"] = delta["last_date"]
+    return result
+
+
+async def _snapshot_versions(db, header_ids: List[str]) -> Dict[str, int]:
+    versions = {header_id: 0 for header_id in header_ids}
+    async for doc in db.inventory_snapshot_versions.find({"header_id": {"$in": header_ids}}):
+        versions[doc["header_id"]] = doc.get("version", 0)
+    return versions
+
+
+async def _all_header_ids(db) -> List[str]:
+    # Deleted headers keep their history, so they keep their snapshots too
+    return [doc["id"] async for doc in db.inventory_headers.find({}, {"_id": 0, "id": 1})]
+
+
+async def take_inventory_snapshots(db, as_of: Optional[datetime] = None,
+                                   header_ids: Optional[List[str]] = None) -> int:
+    """
+    Write the snapshot at ``as_of`` (default: today's UTC midnight) for the
+    headers (default: all), built from each header's previous snapshot.
+
+    Returns:
+        Number of snapshots written
+    """
+    as_of = snapshot_boundary(as_of)
+    header_ids = header_ids if header_ids is not None else await _all_header_ids(db)
+    if not header_ids:
+        return 0
+    versions = await _snapshot_versions(db, header_ids)
+    states = await stock_at(db, header_ids, as_of)
+
+    now = datetime.now(timezone.utc)
+    await db.inventory_snapshots.bulk_write([
+        UpdateOne({"header_id": header_id, "as_of": as_of}, {"$set": {
+            "qty": Decimal128(state["qty"]),
+            "weight": Decimal128(state["weight"]),
+            "movement_count": state.get("movement_count", 0),
+            "last_movement_id": state.get("last_movement_id"),
+            "last_movement_date": state.get("last_movement_date"),
+            "created_at": now,
+        }}, upsert=True)
+        for header_id, state in states.items()
+    ], ordered=False)
+
+    # A movement inserted or removed while summing may be missing from the snapshot
+    raced = [header_id for header_id, version in (await _snapshot_versions(db, header_ids)).items()
+             if version != versions[header_id]]
+    if raced:
+        await db.inventory_snapshots.delete_many({"header_id": {"$in": raced}, "as_of": as_of})
+    return len(header_ids) - len(raced)
+
+
+def _month_starts(first: datetime, until: datetime) -> List[datetime]:
+    """Month starts after ``first`` and before ``until``, then ``until`` itself."""
+    boundaries = []
+    year, month = first.year, first.month
+    while True:
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        boundary = datetime(year, month, 1)
+        if boundary >= until:
+            break
+        boundaries.append(boundary)
+    return boundaries + [until]
+
+
+async def fill_inventory_snapshots(db) -> int:
+    """
+    Write the missing month-start snapshots since the first movement and
+    today's, oldest first so each one builds on the previous.
+
+    Returns:
+        Number of snapshots written
+    """
+    header_ids = await _all_header_ids(db)
+    first = await db.stock_movements.find_one({"is_deleted": False, "date": {"$type": "date"}},
+                                              {"_id": 0, "date": 1}, sort=[("date", 1)])
+    if not header_ids or not first:
+        return 0
+    today = snapshot_boundary()
+    boundaries = _month_starts(_utc(first["date"]), today) if _utc(first["date"]) < today else [today]
+    present: Dict[datetime, int] = {}
+    async for row in db.inventory_snapshots.aggregate([
+        {"$match": {"as_of": {"$in": boundaries}}},
+        {"$group": {"_id": "$as_of", "count": {"$sum": 1}}},
+    ]):
+        present[row["_id"]] = row["count"]
+
+    written = 0
+    for boundary in boundaries:
+        if present.get(boundary, 0) < len(header_ids):
+            written += await take_inventory_snapshots(db, boundary, header_ids)
+    return written
+
+
+async def movement_flow(db, header_ids: List[str], start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> Dict[str, Dict[str, float]]:
+    """Qty/weight moved in and out per header by live movements dated in [start, end] (inclusive)."""
+    match: Dict[str, Any] = {"header_id": {"$in": header_ids}, "is_deleted": False}
+    dates = {}
+    if start is not None:
+        dates["$gte"] = start
+    if end is not None:
+        dates["$lte"] = end
+    if dates:
+        match["date"] = dates
+    qty = {"$ifNull": ["$qty_delta", 0]}
+    weight = {"$ifNull": ["$weight_delta", 0]}
+    flows = {}
+    async for row in db.stock_movements.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$header_id",
+            "qty_in": {"$sum": {"$cond": [{"$gt": [qty, 0]}, qty, 0]}},
+            "qty_out": {"$sum": {"$cond": [{"$lt": [qty, 0]}, qty, 0]}},
+            "weight_in": {"$sum": {"$cond": [{"$gt": [weight, 0]}, weight, 0]}},
+            "weight_out": {"$sum": {"$cond": [{"$lt": [weight, 0]}, weight, 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]):
+        flows[row["_id"]] = {
+            "qty_in": float(_to_decimal(row.get("qty_in"))),
+            "qty_out": -float(_to_decimal(row.get("qty_out"))),
+            "weight_in": float(_to_decimal(row.get("weight_in"))),
+            "weight_out": -float(_to_decimal(row.get("weight_out"))),
+            "count": row.get("count", 0),
+        }
+    return flows
+
+
+async def invalidate_inventory_snapshots(db, movements: Iterable[Dict[str, Any]]) -> None:
+    """
+    Drop the snapshots affected by movements inserted or removed.
+    Must be called after the movement write itself.
+    """
+    earliest: Dict[str, Optional[datetime]] = {}
+    for movement in movements:
+        header_id = movement.get("header_id")
+        if not header_id:
+            continue
+        date = movement.get("date")
+        date = _utc(date) if isinstance(date, datetime) else None
+        if header_id not in earliest:
+            earliest[header_id] = date
+        elif earliest[header_id] is not None and (date is None or date < earliest[header_id]):
+            earliest[header_id] = date
+    if not earliest:
+        return
+    await db.inventory_snapshot_versions.bulk_write([
+        UpdateOne({"header_id": header_id}, {"$inc": {"version": 1}}, upsert=True) for header_id in earliest
+    ], ordered=False)
+    for header_id, date in earliest.items():
+        stale: Dict[str, Any] = {"header_id": header_id}
+        if date is not None:
+            stale["as_of"] = {"$gt": date}
+        await db.inventory_snapshots.delete_many(stale)
+
+
+async def reconcile_inventory(db, fix: bool = False, snapshot: bool = True) -> Dict[str, Any]:
+    """
+    Compare every header's current_qty/current_weight with its movements.
+
+    Expected stock is the latest snapshot plus the movements after it; with
+    ``snapshot`` missing snapshots up to today's are written first, so only
+    today's movements are replayed. With ``fix`` drifted headers are set to the
+    expected values, unless they changed meanwhile or hold a pending stock
+    reservation (stock_reservations.py), which is skipped and reported.
+
+    Returns:
+        {"checked", "drift": [...], "fixed", "skipped"}
+    """
+    if snapshot:
+        await fill_inventory_snapshots(db)
+    headers = await db.inventory_headers.find(
+        {}, {"_id": 0, "id": 1, "name": 1, "current_qty": 1, "current_weight": 1, "pending_reservations": 1}
+    ).to_list(None)
+    expected = await stock_at(db, [header["id"] for header in headers])
+
+    drift = []
+    fixed = skipped = 0
+    for header in headers:
+        state = expected[header["id"]]
+        stored_qty = _to_decimal(header.get("current_qty"))
+        stored_weight = _to_decimal(header.get("current_weight"))
+        if stored_qty == state["qty"] and abs(stored_weight - state["weight"]) <= WEIGHT_TOLERANCE:
+            continue
+        entry = {
+            "header_id": header["id"],
+            "header_name": header.get("name"),
+            "stored_qty": float(stored_qty),
+            "expected_qty": float(state["qty"]),
+            "stored_weight": float(stored_weight),
+            "expected_weight": float(state["weight"]),
+            "last_movement_id": state.get("last_movement_id"),
+        }
+        drift.append(entry)
+        if not fix:
+            continue
+        if header.get("pending_reservations"):
+            entry["fixed"] = False
+            skipped += 1
+            continue
+        result = await db.inventory_headers.update_one(
+            {"id": header["id"], "current_qty": header.get("current_qty"),
+             "current_weight": header.get("current_weight")},
+            {"$set": {"current_qty": float(state["qty"]), "current_weight": round(float(state["weight"]), 3)}}
+        )
+        entry["fixed"] = result.modified_count == 1
+        if entry["fixed"]:
+            fixed += 1
+        else:
+            skipped += 1
+
+    return {"checked": len(headers), "drift": drift, "fixed": fixed, "skipped": skipped}
+
+
+async def rebuild_inventory_snapshots(db) -> int:
+    """Discard every snapshot and write the month-start and today's snapshots from the movements."""
+    await db.inventory_snapshots.delete_many({})
+    await db.inventory_snapshot_versions.update_many({}, {"$inc": {"version": 1}})
+    return await fill_inventory_snapshots(db)
+
+
+async def run_inventory_snapshotter(db, interval_hours: float = SNAPSHOT_INTERVAL_HOURS):
+    """Background loop writing the missing snapshots and logging drift."""
+    while True:
+        try:
+            result = await reconcile_inventory(db)
+            if result["drift"]:
+                logger.warning(f"Inventory drift on {len(result['drift'])} headers: "
+                               + ", ".join(entry["header_name"] or entry["header_id"] for entry in result["drift"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Inventory snapshot failed: {e}")
+        # Wake at the next snapshot boundary at the latest
+        until_midnight = (snapshot_boundary() + timedelta(days=1) - _utc(datetime.now(timezone.utc))).total_seconds()
+        await asyncio.sleep(max(60.0, min(interval_hours * 3600, until_midnight + 60)))
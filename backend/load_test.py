@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+HTTP Load Test for Gold Shop ERP
+================================
+Drives the read-heavy endpoints of a running server concurrently and reports
+throughput and latency percentiles per endpoint as JSON, so a run can be kept
+as a baseline and later runs compared against it.
+
+1. Generate a dataset (see generate_load_dataset.py):
+       python generate_load_dataset.py --drop
+2. Start the server on it, with the per-user rate limits off:
+       DB_NAME=gold_shop_loadtest RATE_LIMIT_ENABLED=false uvicorn server:app --port 8001 --workers 4
+3. Run the load and keep the result:
+       python load_test.py --concurrency 32 --duration 60 --output baseline.json
+4. After a change, compare:
+       python load_test.py --concurrency 32 --duration 60 --baseline baseline.json --output run.json
+
+Each of --concurrency workers picks a request from a weighted mix (list pages,
+cursor pages, detail views, ledgers, summaries, reports) with ids from the
+dataset manifest and sends it as soon as the previous one answered (closed
+loop). Requests during --warmup seconds are not counted. Per endpoint the
+report holds request and error counts, status codes, requests/second and
+p50/p95/p99/mean/max latency in milliseconds; the server's own per-route and
+MongoDB statistics (/api/admin/metrics) are attached when available.
+
+With --baseline the exit status is 1 when any endpoint's p95 grew, or its
+throughput fell, by more than --max-regression (default 20%), so the run can
+gate CI. Runs are only comparable on the same hardware, dataset (--seed and
+volumes) and concurrency.
+
+Usage:
+    python load_test.py [--url http://localhost:8001] [--manifest load_dataset.json]
+                        [--concurrency 32] [--duration 60] [--warmup 5] [--seed 1]
+                        [--only invoices_list parties_ledger] [--output run.json]
+                        [--baseline baseline.json --max-regression 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+REQUEST_TIMEOUT = 60.0
+
+
+class LoadContext:
+    """Random request parameters drawn from the dataset manifest."""
+
+    def __init__(self, manifest: dict, rng: random.Random):
+        self.rng = rng
+        self.ids = manifest.get("sample_ids", {})
+        self.end = datetime.strptime(manifest["end"], "%Y-%m-%d").replace(tzinfo=timezone.utc) \
+            if manifest.get("end") else datetime.now(timezone.utc)
+        self.days = manifest.get("days", 365)
+        # Cursor chains per list endpoint; a worker continues one or starts over
+        self.cursors: Dict[str, List[str]] = {}
+
+    def pick(self, kind: str) -> Optional[str]:
+        ids = self.ids.get(kind) or []
+        return self.rng.choice(ids) if ids else None
+
+    def page(self) -> int:
+        # Mostly the first pages, occasionally deep ones (offset cost)
+        return 1 if self.rng.random() < 0.6 else self.rng.randint(2, 200)
+
+    def date_range(self, max_days: int) -> Dict[str, str]:
+        span = self.rng.randint(1, max_days)
+        end = self.end - timedelta(days=self.rng.randrange(max(1, self.days - span)))
+        return {"start_date": (end - timedelta(days=span)).date().isoformat(), "end_date": end.date().isoformat()}
+
+    def cursor_page(self, name: str) -> Dict[str, Any]:
+        chain = self.cursors.get(name)
+        if chain and self.rng.random() < 0.9:
+            return {"cursor": self.rng.choice(chain), "page_size": 50}
+        return {"cursor": "", "page_size": 50}
+
+    def remember_cursor(self, name: str, response: httpx.Response):
+        try:
+            cursor = response.json().get("pagination", {}).get("next_cursor")
+        except ValueError:
+            return
+        if cursor:
+            chain = self.cursors.setdefault(name, [])
+            if len(chain) < 500:
+                chain.append(cursor)
+
+
+Request = Tuple[str, Dict[str, Any]]
+
+# name -> (weight, builder returning (path, params) or None when the manifest lacks the ids)
+ENDPOINTS: Dict[str, Tuple[int, Callable[[LoadContext], Optional[Request]]]] = {
+    "dashboard": (8, lambda ctx: ("/api/dashboard", {})),
+    "invoices_list": (10, lambda ctx: ("/api/invoices", {"page": ctx.page(), "page_size": 20})),
+    "invoices_cursor": (6, lambda ctx: ("/api/invoices", ctx.cursor_page("invoices_cursor"))),
+    "invoice_detail": (10, lambda ctx: ("/api/invoices/" + ctx.pick("invoices"), {})
+                       if ctx.pick("invoices") else None),
+    "transactions_list": (8, lambda ctx: ("/api/transactions", {"page": ctx.page(), "page_size": 20})),
+    "transactions_cursor": (4, lambda ctx: ("/api/transactions", ctx.cursor_page("transactions_cursor"))),
+    "transactions_summary": (3, lambda ctx: ("/api/transactions/summary", ctx.date_range(90))),
+    "parties_list": (6, lambda ctx: ("/api/parties", {"page": ctx.page(), "page_size": 20})),
+    "party_summary": (8, lambda ctx: (f"/api/parties/{ctx.pick('parties')}/summary", {})
+                      if ctx.pick("parties") else None),
+    "party_ledger": (8, lambda ctx: (f"/api/parties/{ctx.pick('parties')}/ledger", {})
+                     if ctx.pick("parties") else None),
+    "stock_movements": (5, lambda ctx: ("/api/inventory/movements", {"page": ctx.page(), "page_size": 20})),
+    "stock_totals": (4, lambda ctx: ("/api/inventory/stock-totals", {})),
+    "stock_as_of": (2, lambda ctx: ("/api/inventory/as-of", {"date": ctx.date_range(30)["end_date"]})),
+    "financial_summary": (3, lambda ctx: ("/api/reports/financial-summary", ctx.date_range(365))),
+    "outstanding_report": (2, lambda ctx: ("/api/reports/outstanding", {"party_type": "customer"})),
+    "audit_logs": (2, lambda ctx: ("/api/audit-logs", {"page": 1, "page_size": 50})),
+}
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile of an ascending list (q in 0..100)."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[str, int] = {}
+        self.last_error: Optional[str] = None
+
+    def record(self, elapsed_ms: float, status_code: Optional[int], error: Optional[str] = None):
+        key = str(status_code) if status_code is not None else "error"
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if error is not None or status_code is None or status_code >= 400:
+            self.errors += 1
+            self.last_error = error or f"HTTP {status_code}"
+        else:
+            self.latencies_ms.append(elapsed_ms)
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        values = sorted(self.latencies_ms)
+        requests = len(values) + self.errors
+
+        def ms(value):
+            return round(value, 2) if value is not None else None
+
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / requests, 4) if requests else 0.0,
+            "statuses": self.statuses,
+            "throughput_rps": round(len(values) / seconds, 2) if seconds else 0.0,
+            "p50_ms": ms(percentile(values, 50)),
+            "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)),
+            "mean_ms": ms(sum(values) / len(values)) if values else None,
+            "max_ms": ms(values[-1]) if values else None,
+            "last_error": self.last_error,
+        }
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/api/auth/login", json={"username": username, "password": password})
+    if response.status_code != 200:
+        raise RuntimeError(f"Login as {username!r} failed: HTTP {response.status_code} {response.text[:200]}")
+    return response.json()["access_token"]
+
+
+async def worker(client: httpx.AsyncClient, ctx: LoadContext, names: List[str], weights: List[int],
+                 stats: Dict[str, EndpointStats], measure_from: float, deadline: float):
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            return
+        name = ctx.rng.choices(names, weights)[0]
+        built = ENDPOINTS[name][1](ctx)
+        if built is None:
+            continue
+        path, params = built
+        status_code, error = None, None
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, params=params)
+            status_code = response.status_code
+            if name.endswith("_cursor") and status_code == 200:
+                ctx.remember_cursor(name, response)
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if started >= measure_from:
+            stats[name].record(elapsed_ms, status_code, error)
+
+
+async def fetch_server_metrics(client: httpx.AsyncClient) -> Optional[dict]:
+    try:
+        response = await client.get("/api/admin/metrics", params={"limit": 50})
+    except httpx.HTTPError:
+        return None
+    return response.json() if response.status_code == 200 else None
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> List[dict]:
+    """Endpoints whose p95 rose or throughput fell by more than max_regression."""
+    regressions = []
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before.get("p95_ms") or not now.get("p95_ms"):
+            continue
+        p95_change = now["p95_ms"] / before["p95_ms"] - 1
+        rps_change = (now["throughput_rps"] / before["throughput_rps"] - 1) if before.get("throughput_rps") else 0.0
+        if p95_change > max_regression or rps_change < -max_regression:
+            regressions.append({
+                "endpoint": name,
+                "p95_ms": [before["p95_ms"], now["p95_ms"]],
+                "p95_change": round(p95_change, 3),
+                "throughput_rps": [before.get("throughput_rps"), now["throughput_rps"]],
+                "throughput_change": round(rps_change, 3),
+            })
+    return regressions
+
+
+def print_table(report: dict, baseline: Optional[dict]):
+    print(f"\n  {'endpoint':<22} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}"
+          + ("   p95 vs baseline" if baseline else ""))
+    for name, row in report["endpoints"].items():
+        line = (f"  {name:<22} {row['requests']:>7} {row['errors']:>5} {row['throughput_rps']:>8.1f} "
+                f"{row['p50_ms'] or 0:>8.1f} {row['p95_ms'] or 0:>8.1f} {row['p99_ms'] or 0:>8.1f}")
+        before = (baseline or {}).get("endpoints", {}).get(name)
+        if before and before.get("p95_ms") and row["p95_ms"]:
+            line += f"   {(row['p95_ms'] / before['p95_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+    total = report["total"]
+    print(f"\n  total: {total['requests']} requests, {total['errors']} errors, "
+          f"{total['throughput_rps']:.1f} req/s, p95 {total['p95_ms'] or 0:.1f} ms")
+
+
+async def run(args) -> int:
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    names = args.only or list(ENDPOINTS)
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        print(f"✗ Unknown endpoints: {', '.join(unknown)} (choose from {', '.join(ENDPOINTS)})")
+        return 2
+    weights = [ENDPOINTS[name][0] for name in names]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        token = await login(client, args.username or manifest["username"], args.password or manifest["password"])
+        client.headers["Authorization"] = f"Bearer {token}"
+        if (await client.get("/api/dashboard")).status_code == 429:
+            print("✗ The server is rate limiting; start it with RATE_LIMIT_ENABLED=false")
+            return 2
+
+        stats = {name: EndpointStats() for name in names}
+        rng = random.Random(args.seed)
+        contexts = [LoadContext(manifest, random.Random(rng.getrandbits(64))) for _ in range(args.concurrency)]
+        print(f"Load testing {args.url}: {args.concurrency} workers, {args.warmup}s warmup + {args.duration}s")
+        started = time.perf_counter()
+        measure_from = started + args.warmup
+        deadline = measure_from + args.duration
+        await asyncio.gather(*(worker(client, ctx, names, weights, stats, measure_from, deadline)
+                               for ctx in contexts))
+        measured = time.perf_counter() - measure_from
+        server_metrics = await fetch_server_metrics(client)
+
+    total = EndpointStats()
+    for row in stats.values():
+        total.latencies_ms.extend(row.latencies_ms)
+        total.errors += row.errors
+        for key, value in row.statuses.items():
+            total.statuses[key] = total.statuses.get(key, 0) + value
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "duration_seconds": round(measured, 2),
+            "warmup_seconds": args.warmup,
+            "seed": args.seed,
+            "dataset": {"database": manifest.get("database"), "seed": manifest.get("seed"),
+                        "counts": manifest.get("counts")},
+            "client_host": platform.node(),
+            "python": platform.python_version(),
+        },
+        "total": total.report(measured),
+        "endpoints": {name: stats[name].report(measured) for name in names},
+        "server_metrics": server_metrics,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["regressions"] = compare(report, baseline, args.max_regression)
+    print_table(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"  report: {args.output}")
+    else:
+        print(json.dumps({"total": report["total"], "endpoints": report["endpoints"]}, indent=2))
+
+    if baseline is not None:
+        if report["regressions"]:
+            print(f"\n✗ {len(report['regressions'])} endpoints regressed more than "
+                  f"{args.max_regression:.0%}: {', '.join(r['endpoint'] for r in report['regressions'])}")
+            return 1
+        print(f"\n✓ No endpoint regressed more than {args.max_regression:.0%}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent HTTP load test with per-endpoint percentiles')
+    parser.add_argument('--url', default='http://localhost:8001', help='Server base URL')
+    parser.add_argument('--manifest', default='load_dataset.json', help='Manifest from generate_load_dataset.py')
+    parser.add_argument('--username', help='Login user (default: from the manifest)')
+    parser.add_argument('--password', help='Login password (default: from the manifest)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent workers')
+    parser.add_argument('--duration', type=float, default=60, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before measuring')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the request mix')
+    parser.add_argument('--only', nargs='+', metavar='ENDPOINT', help='Restrict the mix to these endpoints')
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed p95 increase / throughput drop vs the baseline (fraction)')
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Request and Database Metrics
+----------------------------
+Per-route latency and per-request MongoDB round-trips, without an external
+client library:
+
+- ``MetricsMiddleware`` (pure ASGI) times every HTTP request and files it
+  under its route template (``/api/invoices/{invoice_id}``, not the raw
+  path) in a fixed-bucket latency histogram
+- ``DBCommandListener`` is a pymongo command listener passed to the Motor
+  client. Motor runs commands on its executor with a copy of the caller's
+  context, so each command is attributed to the request that issued it
+  through a ContextVar: count and time by collection and command, per route
+  and in total (background tasks count in the totals only)
+- N+1 detection: when one request sends the same command to the same
+  collection with the same filter shape (field names, not values) at least
+  METRICS_N_PLUS_ONE_THRESHOLD times (default 10), the route is flagged with
+  the repeated shape - a per-row ``find_one`` loop shows up here
+- ``render_prometheus`` produces the text exposition format for
+  /api/metrics (Bearer $METRICS_TOKEN, or an admin session when no token is
+  configured); ``summary`` the admin JSON (slowest routes with estimated
+  p50/p95/p99, DB calls per request, N+1 findings)
+- ``register_gauge`` adds values owned by other modules (audit sink queue
+  depth, flush latency)
+
+METRICS_ENABLED=0 turns the middleware and listener into no-ops.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', '10'))
+
+# Seconds; Prometheus convention (le="+Inf" is implied by the count)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_CALL_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+UNMATCHED_ROUTE = "<unmatched>"
+# Commands that are driver housekeeping, not application round-trips
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions",
+                    "killCursors", "buildInfo", "getLastError"}
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[int]:
+        total, result = 0, []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for bound, count in zip(self.buckets, self.counts):
+            if seen + count >= rank and count:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]  # beyond the last bucket
+
+
+class _RequestStats:
+    """DB commands issued while serving one request (filled from executor threads)."""
+
+    __slots__ = ("lock", "commands", "seconds", "shapes")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.shapes: Dict[Tuple[str, str, str], int] = defaultdict(int)
+
+
+_current: ContextVar[Optional[_RequestStats]] = ContextVar("metrics_request", default=None)
+
+
+def _filter_shape(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == "find":
+        spec = command.get("filter") or {}
+    elif command_name in ("update", "delete"):
+        entries = command.get("updates") or command.get("deletes") or [{}]
+        spec = entries[0].get("q") or {}
+    elif command_name in ("count", "distinct"):
+        spec = command.get("query") or {}
+    elif command_name == "findAndModify":
+        spec = command.get("query") or {}
+    elif command_name == "aggregate":
+        stages = command.get("pipeline") or [{}]
+        spec = stages[0].get("$match", {}) if stages else {}
+    else:
+        return ""
+    return ",".join(sorted(spec)) if isinstance(spec, dict) else ""
+
+
+def _collection(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    value = command.get(command_name)
+    return value if isinstance(value, str) else ""
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.routes: Dict[Tuple[str, str], Histogram] = {}
+        self.statuses: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.route_db_calls: Dict[Tuple[str, str], Histogram] = {}
+        self.route_db: Dict[Tuple[str, str, str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+        self.db: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0, 0])
+        self.n_plus_one: Dict[Tuple[str, str, str, str, str], Dict[str, Any]] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Optional[float]]]] = {}
+        # (connection, request_id) -> (collection, command) of in-flight commands
+        self._inflight: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+    # -- gauges ---------------------------------------------------------
+
+    def register_gauge(self, name: str, help_text: str, read: Callable[[], Optional[float]]):
+        self._gauges[name] = (help_text, read)
+
+    # -- database commands ----------------------------------------------
+
+    def command_started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = _collection(event.command_name, command)
+        self._inflight[(event.connection_id, event.request_id)] = (collection, event.command_name)
+        stats = _current.get()
+        if stats is not None:
+            shape = _filter_shape(event.command_name, command)
+            with stats.lock:
+                stats.shapes[(collection, event.command_name, shape)] += 1
+
+    def command_finished(self, event, failed: bool):
+        key = self._inflight.pop((event.connection_id, event.request_id), None)
+        if key is None:
+            return
+        seconds = event.duration_micros / 1_000_000
+        with self._lock:
+            totals = self.db[key]
+            totals[0] += 1
+            totals[1] += seconds
+            if failed:
+                totals[2] += 1
+        stats = _current.get()
+        if stats is not None:
+            with stats.lock:
+                stats.commands[key] += 1
+                stats.seconds[key] += seconds
+
+    # -- requests -------------------------------------------------------
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: _RequestStats):
+        with stats.lock:
+            commands = dict(stats.commands)
+            timings = dict(stats.seconds)
+            repeated = [(shape, count) for shape, count in stats.shapes.items() if count >= N_PLUS_ONE_THRESHOLD]
+        key = (method, route)
+        with self._lock:
+            if key not in self.routes:
+                self.routes[key] = Histogram(LATENCY_BUCKETS)
+                self.route_db_calls[key] = Histogram(DB_CALL_BUCKETS)
+            self.routes[key].observe(seconds)
+            self.statuses[(method, route, f"{status // 100}xx")] += 1
+            self.route_db_calls[key].observe(sum(commands.values()))
+            for (collection, command), count in commands.items():
+                totals = self.route_db[(method, route, collection, command)]
+                totals[0] += count
+                totals[1] += timings.get((collection, command), 0.0)
+            for (collection, command, shape), count in repeated:
+                finding_key = (method, route, collection, command, shape)
+                finding = self.n_plus_one.setdefault(finding_key, {
+                    "method": method, "route": route, "collection": collection, "command": command,
+                    "filter_fields": shape.split(",") if shape else [], "requests": 0, "max_repeats": 0,
+                })
+                finding["requests"] += 1
+                finding["max_repeats"] = max(finding["max_repeats"], count)
+                finding["last_seen"] = time.time()
+
+    # -- output ---------------------------------------------------------
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            header("http_request_duration_seconds", "histogram", "Request latency by route template")
+            for (method, route), histogram in sorted(self.routes.items()):
+                labels = f'method="{method}",route="{_escape(route)}"'
+                _histogram_lines(lines, "http_request_duration_seconds", labels, histogram)
+            header("http_requests_total", "counter", "Requests by route template and status class")
+            for (method, route, status), count in sorted(self.statuses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+            header("http_request_db_commands", "histogram", "MongoDB commands issued per request")
+            for (method, route), histogram in sorted(self.route_db_calls.items()):
+                labels = f'method="{method}",route="{_escape(route)}"'
+                _histogram_lines(lines, "http_request_db_commands", labels, histogram)
+            header("http_route_db_commands_total", "counter", "MongoDB commands by route, collection and command")
+            for (method, route, collection, command), (count, _) in sorted(self.route_db.items()):
+                lines.append(f'http_route_db_commands_total{{method="{method}",route="{_escape(route)}",'
+                             f'collection="{collection}",command="{command}"}} {count}')
+            header("http_route_db_seconds_total", "counter", "MongoDB command time by route, collection and command")
+            for (method, route, collection, command), (_, seconds) in sorted(self.route_db.items()):
+                lines.append(f'http_route_db_seconds_total{{method="{method}",route="{_escape(route)}",'
+                             f'collection="{collection}",command="{command}"}} {seconds:.6f}')
+            header("mongodb_commands_total", "counter", "MongoDB commands by collection and command")
+            for (collection, command), (count, _, _) in sorted(self.db.items()):
+                lines.append(f'mongodb_commands_total{{collection="{collection}",command="{command}"}} {count}')
+            header("mongodb_command_seconds_total", "counter", "MongoDB command time by collection and command")
+            for (collection, command), (_, seconds, _) in sorted(self.db.items()):
+                lines.append(f'mongodb_command_seconds_total{{collection="{collection}",command="{command}"}} {seconds:.6f}')
+            header("mongodb_command_failures_total", "counter", "Failed MongoDB commands by collection and command")
+            for (collection, command), (_, _, failures) in sorted(self.db.items()):
+                lines.append(f'mongodb_command_failures_total{{collection="{collection}",command="{command}"}} {failures}')
+            header("http_route_n_plus_one_requests_total", "counter",
+                   f"Requests repeating one command/filter shape at least {N_PLUS_ONE_THRESHOLD} times")
+            for finding in self.n_plus_one.values():
+                lines.append(f'http_route_n_plus_one_requests_total{{method="{finding["method"]}",'
+                             f'route="{_escape(finding["route"])}",collection="{finding["collection"]}",'
+                             f'command="{finding["command"]}",filter="{",".join(finding["filter_fields"])}"}} '
+                             f'{finding["requests"]}')
+        for name, (help_text, read) in sorted(self._gauges.items()):
+            value = read()
+            if value is None:
+                continue
+            header(name, "gauge", help_text)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, limit: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            routes = []
+            for (method, route), histogram in self.routes.items():
+                calls = self.route_db_calls[(method, route)]
+                db_seconds = sum(seconds for (m, r, _, _), (_, seconds) in self.route_db.items()
+                                 if m == method and r == route)
+                routes.append({
+                    "method": method,
+                    "route": route,
+                    "requests": histogram.count,
+                    "total_seconds": round(histogram.sum, 3),
+                    "avg_ms": round(histogram.sum / histogram.count * 1000, 2),
+                    "p50_ms": _ms(histogram.quantile(0.50)),
+                    "p95_ms": _ms(histogram.quantile(0.95)),
+                    "p99_ms": _ms(histogram.quantile(0.99)),
+                    "avg_db_commands": round(calls.sum / calls.count, 1) if calls.count else 0,
+                    "avg_db_ms": round(db_seconds / histogram.count * 1000, 2),
+                })
+            collections = [
+                {"collection": collection, "command": command, "count": count,
+                 "total_ms": round(seconds * 1000, 1), "avg_ms": round(seconds / count * 1000, 3) if count else 0,
+                 "failures": failures}
+                for (collection, command), (count, seconds, failures) in self.db.items()
+            ]
+            findings = sorted(self.n_plus_one.values(), key=lambda f: -f["max_repeats"])
+        return {
+            "uptime_seconds": round(time.time() - self.started_at),
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "slowest_routes": sorted(routes, key=lambda r: -(r["p95_ms"] or 0))[:limit],
+            "busiest_routes": sorted(routes, key=lambda r: -r["total_seconds"])[:limit],
+            "most_db_commands": sorted(routes, key=lambda r: -r["avg_db_commands"])[:limit],
+            "db_commands": sorted(collections, key=lambda c: -c["total_ms"])[:limit],
+            "n_plus_one": [dict(finding) for finding in findings],
+            "gauges": {name: read() for name, (_, read) in self._gauges.items()},
+        }
+
+
+def _histogram_lines(lines: List[str], name: str, labels: str, histogram: Histogram):
+    for bound, count in zip(histogram.buckets, histogram.cumulative()):
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+
+_ESCAPE = re.compile(r'(["\\])')
+
+
+def _escape(value: str) -> str:
+    return _ESCAPE.sub(r'\\\1', value)
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+registry = MetricsRegistry()
+
+
+class DBCommandListener(monitoring.CommandListener):
+    """Pass to the Motor client as event_listeners=[DBCommandListener()]."""
+
+    def started(self, event):
+        if ENABLED:
+            registry.command_started(event)
+
+    def succeeded(self, event):
+        if ENABLED:
+            registry.command_finished(event, failed=False)
+
+    def failed(self, event):
+        if ENABLED:
+            registry.command_finished(event, failed=True)
+
+
+class MetricsMiddleware:
+    """
+    Pure-ASGI request timing. Add it before the other middleware so it runs
+    innermost and sees the scope the router fills in (``scope["route"]``).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = _RequestStats()
+        token = _current.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path", None) or UNMATCHED_ROUTE
+            registry.record_request(scope["method"], template, status_code, elapsed, stats)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Sequence Counter Migration Script for Gold Shop ERP
+===================================================
+Seeds the ``counters`` collection used by sequences.py from the invoice,
+purchase and return numbers already stored, and builds the unique indexes
+that guard those numbers.
+
+Run this ONCE after deploying the sequence service. It is safe to re-run:
+counters are only ever raised ($max), never lowered.
+
+Duplicate numbers created by the old count-based generator block the unique
+index for that field. They are listed so they can be renumbered by hand;
+the index is then created on the next run (or on the next server startup).
+
+Usage:
+    python migrate_sequence_counters.py [--dry-run]
+"""
+
+import asyncio
+import os
+import re
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_indexes import ensure_indexes
+from sequences import SEQUENCES, counter_key, seed_counter
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'gold_shop_erp')
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[DB_NAME]
+
+
+async def collect_highest_numbers(name: str) -> dict:
+    """
+    Scan a sequence's number field once and return the highest numeric
+    suffix per counter key (one key per year for yearly sequences).
+    """
+    spec = SEQUENCES[name]
+    if spec.yearly:
+        pattern = re.compile(r"^" + re.escape(spec.prefix).replace(r"\{year\}", r"(\d{4})") + r"(\d+)$")
+    else:
+        pattern = re.compile(r"^" + re.escape(spec.prefix) + r"()(\d+)$")
+
+    highest = {}
+    cursor = db[spec.collection].find({spec.field: {"$type": "string"}}, {spec.field: 1, "_id": 0})
+    async for doc in cursor:
+        match = pattern.match(doc[spec.field])
+        if not match:
+            continue
+        year = int(match.group(1)) if spec.yearly else None
+        key = counter_key(name, year)
+        highest[key] = max(highest.get(key, (0, year))[0], int(match.group(2))), year
+    return highest
+
+
+async def find_duplicates(name: str) -> list:
+    """Numbers stored on more than one document."""
+    spec = SEQUENCES[name]
+    pipeline = [
+        {"$match": {spec.field: {"$type": "string"}}},
+        {"$group": {"_id": f"${spec.field}", "count": {"$sum": 1}, "ids": {"$push": "$id"}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    return await db[spec.collection].aggregate(pipeline).to_list(None)
+
+
+async def drop_legacy_indexes(dry_run: bool):
+    """Drop non-unique indexes on sequenced fields so the unique ones can be built."""
+    for spec in SEQUENCES.values():
+        indexes = await db[spec.collection].index_information()
+        for index_name, info in indexes.items():
+            if [k for k, _ in info["key"]] == [spec.field] and not info.get("unique"):
+                print(f"  {'Would drop' if dry_run else 'Dropping'} non-unique index {spec.collection}.{index_name}")
+                if not dry_run:
+                    await db[spec.collection].drop_index(index_name)
+
+
+async def migrate(dry_run: bool = False):
+    print("\n" + "=" * 80)
+    print("  Sequence Counter Migration - Gold Shop ERP")
+    print(f"  {'DRY RUN MODE - No changes will be made' if dry_run else 'PRODUCTION MODE - Data will be updated'}")
+    print(f"  Started at: {datetime.now(timezone.utc).isoformat()}")
+    print("=" * 80)
+
+    duplicates_found = False
+    for name, spec in SEQUENCES.items():
+        print(f"\nSequence: {name} ({spec.collection}.{spec.field})")
+        highest = await collect_highest_numbers(name)
+        if not highest:
+            print("  No existing numbers found")
+        for key, (value, year) in sorted(highest.items()):
+            current = await db.counters.find_one({"_id": key})
+            current_value = current.get("seq", 0) if current else 0
+            print(f"  {key}: highest existing = {value}, counter = {current_value}")
+            if not dry_run and value > current_value:
+                await seed_counter(db, name, year, value)
+                print(f"    ✓ Counter raised to {value}")
+
+        duplicates = await find_duplicates(name)
+        for dup in duplicates:
+            duplicates_found = True
+            print(f"  ✗ Duplicate {spec.field} {dup['_id']} on {dup['count']} documents: {', '.join(map(str, dup['ids']))}")
+
+    print("\nIndexes:")
+    await drop_legacy_indexes(dry_run)
+    if not dry_run:
+        result = await ensure_indexes(db)
+        for failure in result["failed"]:
+            print(f"  ✗ {failure['collection']}.{failure['index']}: {failure['error']}")
+        print(f"  ✓ {len(result['ensured'])} indexes ensured")
+
+    print("\n" + "=" * 80)
+    if duplicates_found:
+        print("  ⚠️  Duplicate numbers found - renumber them and re-run to build the unique indexes")
+    if dry_run:
+        print("  ℹ️  This was a DRY RUN. No changes were made to the database.")
+    else:
+        print("  ✓ Migration completed")
+    print("=" * 80)
+
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Seed document number counters from existing data')
+    parser.add_argument('--dry-run', action='store_true', help='Show what would change without making changes')
+    args = parser.parse_args()
+
+    try:
+        await migrate(dry_run=args.dry_run)
+    except Exception as e:
+        print(f"\n✗ Migration failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,181 @@
+"""
+Keyset (Cursor) Pagination
+--------------------------
+Opt-in cursor mode for the list endpoints.
+
+Page-number mode uses ``.skip((page - 1) * page_size)`` plus a
+``count_documents`` per page, so deep pages get linearly slower: the server
+still walks every skipped document. Cursor mode instead resumes after the last
+row of the previous page with a range condition on the sort key:
+
+    sort:   (sort_field desc, id desc)
+    filter: sort_field < last.sort_field
+            OR (sort_field == last.sort_field AND id < last.id)
+
+so every page is an index seek on the ``(sort_field, id)`` indexes registered
+below, however deep it is. Rows whose sort field is still a legacy ISO string
+sort after every date (BSON type order), so once the cursor is a date they are
+matched by an extra ``$type: "string"`` branch and paged among themselves by
+string order, the same order page-number mode returns them in. The cursor handed to clients is an opaque
+base64url token of the last row's ``(sort value, id)``.
+
+Request parameters (see ``paginate_find``):
+- ``cursor=``          start cursor mode (empty value = first page)
+- ``cursor=<token>``   next page, the token being the previous ``next_cursor``
+- ``count=exact|estimated|none``  total count in cursor mode (default
+  estimated: collection metadata for unfiltered lists, otherwise an exact
+  count capped at ESTIMATED_COUNT_LIMIT)
+
+Page-number mode (no ``cursor`` parameter) is unchanged.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from db_indexes import LIVE_ONLY, register_indexes
+
+ESTIMATED_COUNT_LIMIT = 10000
+COUNT_MODES = ("exact", "estimated", "none")
+
+# Sort key + id tiebreaker for every list endpoint offering cursor mode
+register_indexes("invoices", [
+    {"name": "live_date_id", "keys": [("date", -1), ("id", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+register_indexes("transactions", [
+    {"name": "live_date_id", "keys": [("date", -1), ("id", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+register_indexes("stock_movements", [
+    {"name": "live_date_id", "keys": [("date", -1), ("id", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+register_indexes("audit_logs", [
+    {"name": "timestamp_id", "keys": [("timestamp", -1), ("id", -1)], "options": {}},
+])
+register_indexes("jobcards", [
+    {"name": "live_created_id", "keys": [("created_at", -1), ("id", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+register_indexes("parties", [
+    {"name": "live_created_id", "keys": [("created_at", -1), ("id", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+register_indexes("returns", [
+    {"name": "live_created_id", "keys": [("created_at", -1), ("id", -1)], "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+
+
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    """Opaque cursor token for the row (sort_value, doc_id)."""
+    if isinstance(sort_value, datetime):
+        value = ["d", sort_value.isoformat()]
+    else:
+        value = ["v", sort_value]
+    raw = json.dumps([value, doc_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[Any, str]:
+    """Inverse of encode_cursor; raises HTTPException 400 for malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        (kind, value), doc_id = json.loads(raw)
+        if kind == "d":
+            value = datetime.fromisoformat(value)
+        elif kind != "v":
+            raise ValueError(kind)
+        if not isinstance(doc_id, str):
+            raise ValueError(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    return value, doc_id
+
+
+def keyset_filter(query: Dict, sort_field: str, cursor: Tuple[Any, str]) -> Dict:
+    """Add the "after this row" condition (descending order) to a list query."""
+    sort_value, doc_id = cursor
+    if sort_value is None:
+        # Rows without a sort value come last in descending order
+        after = {sort_field: None, "id": {"$lt": doc_id}}
+    else:
+        after = {"$or": [
+            {sort_field: {"$lt": sort_value}},
+            {sort_field: sort_value, "id": {"$lt": doc_id}},
+            {sort_field: None},
+        ]}
+        if isinstance(sort_value, datetime):
+            # $lt only compares within a BSON type; legacy ISO-string values
+            # sort after every date in descending order, so they all follow
+            after["$or"].append({sort_field: {"$type": "string"}})
+    return {"$and": [query, after]} if query else after
+
+
+async def count_documents(collection, query: Dict, count: str) -> Tuple[Optional[int], bool]:
+    """
+    Total count for cursor mode.
+
+    Returns:
+        (count or None, whether the count is exact)
+    """
+    if count == "none":
+        return None, False
+    if count == "exact":
+        return await collection.count_documents(query), True
+    if not query or query == LIVE_ONLY:
+        # Metadata count; includes soft-deleted rows, hence only an estimate
+        return await collection.estimated_document_count(), False
+    total = await collection.count_documents(query, limit=ESTIMATED_COUNT_LIMIT)
+    return total, total < ESTIMATED_COUNT_LIMIT
+
+
+async def paginate_find(
+    collection,
+    query: Dict,
+    sort_field: str,
+    page: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
+    projection: Optional[Dict] = None,
+) -> Tuple[List[Dict], Dict[str, Any]]:
+    """
+    Fetch one page of a list endpoint, newest first.
+
+    Page-number mode when ``cursor`` is None (skip/limit and an exact count,
+    as before), keyset mode otherwise.
+
+    Returns:
+        (items, page_info) - pass page_info as keyword arguments to
+        server.create_pagination_response
+    """
+    if cursor is None:
+        total_count = await collection.count_documents(query)
+        items = await collection.find(query, projection).sort(sort_field, -1) \
+            .skip((page - 1) * page_size).limit(page_size).to_list(page_size)
+        return items, {"total_count": total_count, "page": page, "page_size": page_size}
+
+    page_size = max(page_size, 1)
+    count = count or "estimated"
+    if count not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count must be one of: {', '.join(COUNT_MODES)}")
+
+    page_query = keyset_filter(query, sort_field, decode_cursor(cursor)) if cursor else query
+    # One extra row tells whether another page exists
+    items = await collection.find(page_query, projection) \
+        .sort([(sort_field, -1), ("id", -1)]).limit(page_size + 1).to_list(page_size + 1)
+
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["id"])
+
+    total_count, exact = await count_documents(collection, query, count)
+    return items, {
+        "total_count": total_count,
+        "page": page,
+        "page_size": page_size,
+        "cursor": cursor,
+        "next_cursor": next_cursor,
+        "total_count_exact": exact,
+    }
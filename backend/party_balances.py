@@ -0,0 +1,299 @@
+"""
+Materialized Party Balances
+---------------------------
+One document per party in ``party_balances`` holding the money and gold
+figures shown by the party summary, gold summary, ledger and impact
+endpoints, so they are served with a single indexed lookup instead of
+re-reading (and capping at 1000) every invoice, transaction and gold ledger
+entry of the party.
+
+Stored figures (Decimal128 sums, counts as ints):
+- invoice_due_from_party:  sum of positive balance_due on live finalized invoices
+- invoice_due_to_party:    sum of |negative balance_due| on the same invoices
+- finalized_invoice_count: number of those invoices
+- credit_transaction_total / transaction_count: live transactions with party_id
+- gold_in_grams / gold_out_grams / gold_entry_count: live gold ledger entries
+
+Write paths apply deltas with $inc as invoices are finalized or paid,
+transactions and gold ledger entries are inserted or removed (payments,
+GOLD_EXCHANGE, gold deposits, purchases, returns). Deltas are only applied to
+existing documents, and every delta bumps ``version``. A party without a
+document is seeded with zeros (``initialized: False``) on first read and then
+overwritten with the raw-ledger totals by a compare-and-set on ``version``,
+retried until no delta lands between reading the version and the totals.
+``rebuild_party_balances.py`` rebuilds or verifies every party against the
+raw ledgers.
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from bson import Decimal128
+
+from db_indexes import register_indexes
+
+register_indexes("party_balances", [
+    {"name": "party_id_unique", "keys": [("party_id", 1)], "options": {"unique": True}},
+])
+
+INITIALIZE_ATTEMPTS = 5
+
+MONEY_FIELDS = ("invoice_due_from_party", "invoice_due_to_party", "credit_transaction_total")
+GOLD_FIELDS = ("gold_in_grams", "gold_out_grams")
+COUNT_FIELDS = ("finalized_invoice_count", "transaction_count", "gold_entry_count")
+
+
+def _to_decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value))
+
+
+def _empty_balance(party_id: str) -> Dict[str, Any]:
+    doc = {"party_id": party_id}
+    for field in MONEY_FIELDS + GOLD_FIELDS:
+        doc[field] = Decimal128('0')
+    for field in COUNT_FIELDS:
+        doc[field] = 0
+    return doc
+
+
+def _invoice_contribution(invoice: Optional[dict]) -> Dict[str, Decimal]:
+    """What one invoice adds to its customer's balance document."""
+    if (not invoice or invoice.get('is_deleted') or invoice.get('status') != 'finalized'
+            or not invoice.get('customer_id')):
+        return {}
+    due = _to_decimal(invoice.get('balance_due'))
+    return {
+        "invoice_due_from_party": max(due, Decimal('0')),
+        "invoice_due_to_party": max(-due, Decimal('0')),
+        "finalized_invoice_count": Decimal('1'),
+    }
+
+
+async def _apply(db, party_id: Optional[str], deltas: Dict[str, Decimal]):
+    """$inc the non-zero deltas on an existing party balance document."""
+    inc = {}
+    for field, delta in deltas.items():
+        if delta == 0:
+            continue
+        inc[field] = int(delta) if field in COUNT_FIELDS else Decimal128(delta)
+    if not party_id or not inc:
+        return
+    inc["version"] = 1
+    await db.party_balances.update_one(
+        {"party_id": party_id},
+        {"$inc": inc, "$set": {"updated_at": datetime.now(timezone.utc)}}
+    )
+
+
+async def apply_invoice_change(db, before: Optional[dict], after: Optional[dict]):
+    """Apply the difference between an invoice's state before and after a write."""
+    old = _invoice_contribution(before)
+    new = _invoice_contribution(after)
+    old_party = before.get('customer_id') if before else None
+    new_party = after.get('customer_id') if after else None
+    if old_party == new_party:
+        fields = set(old) | set(new)
+        await _apply(db, new_party, {f: new.get(f, Decimal('0')) - old.get(f, Decimal('0')) for f in fields})
+    else:
+        await _apply(db, old_party, {f: -v for f, v in old.items()})
+        await _apply(db, new_party, new)
+
+
+def _transaction_deltas(transaction: dict, sign: int) -> Dict[str, Decimal]:
+    amount = _to_decimal(transaction.get('amount')) if transaction.get('transaction_type') == 'credit' else Decimal('0')
+    return {
+        "credit_transaction_total": amount * sign,
+        "transaction_count": Decimal(sign),
+    }
+
+
+def _gold_entry_deltas(entry: dict, sign: int) -> Dict[str, Decimal]:
+    weight = _to_decimal(entry.get('weight_grams'))
+    deltas = {"gold_entry_count": Decimal(sign)}
+    if entry.get('type') == 'IN':
+        deltas["gold_in_grams"] = weight * sign
+    elif entry.get('type') == 'OUT':
+        deltas["gold_out_grams"] = weight * sign
+    return deltas
+
+
+async def _apply_many(db, changes: List[tuple]):
+    """Sum (party_id, deltas) pairs per party and apply one $inc per party."""
+    per_party: Dict[str, Dict[str, Decimal]] = {}
+    for party_id, deltas in changes:
+        if not party_id:
+            continue
+        totals = per_party.setdefault(party_id, {})
+        for field, delta in deltas.items():
+            totals[field] = totals.get(field, Decimal('0')) + delta
+    for party_id, deltas in per_party.items():
+        await _apply(db, party_id, deltas)
+
+
+async def apply_transaction_change(db, transaction: dict, sign: int):
+    """Apply a transaction insert (sign=1) or removal (sign=-1)."""
+    await _apply(db, transaction.get('party_id'), _transaction_deltas(transaction, sign))
+
+
+async def apply_transaction_changes(db, transactions: List[dict], sign: int):
+    """Batch form of apply_transaction_change: one update per party."""
+    await _apply_many(db, [(t.get('party_id'), _transaction_deltas(t, sign)) for t in transactions])
+
+
+async def apply_gold_entry_change(db, entry: dict, sign: int):
+    """Apply a gold ledger insert (sign=1) or removal (sign=-1)."""
+    await _apply(db, entry.get('party_id'), _gold_entry_deltas(entry, sign))
+
+
+async def apply_gold_entry_changes(db, entries: List[dict], sign: int):
+    """Batch form of apply_gold_entry_change: one update per party."""
+    await _apply_many(db, [(e.get('party_id'), _gold_entry_deltas(e, sign)) for e in entries])
+
+
+async def compute_party_balance_from_ledgers(db, party_id: str) -> Dict[str, Any]:
+    """Recompute a party's balance document from the raw invoices, transactions and gold ledger."""
+    doc = _empty_balance(party_id)
+
+    async for row in db.invoices.aggregate([
+        {"$match": {"customer_id": party_id, "is_deleted": False, "status": "finalized"}},
+        {"$group": {
+            "_id": None,
+            "from_party": {"$sum": {"$cond": [{"$gt": ["$balance_due", 0]}, "$balance_due", 0]}},
+            "to_party": {"$sum": {"$cond": [{"$lt": ["$balance_due", 0]}, {"$abs": "$balance_due"}, 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]):
+        doc["invoice_due_from_party"] = Decimal128(_to_decimal(row["from_party"]))
+        doc["invoice_due_to_party"] = Decimal128(_to_decimal(row["to_party"]))
+        doc["finalized_invoice_count"] = row["count"]
+
+    async for row in db.transactions.aggregate([
+        {"$match": {"party_id": party_id, "is_deleted": False}},
+        {"$group": {
+            "_id": None,
+            "credit": {"$sum": {"$cond": [{"$eq": ["$transaction_type", "credit"]}, "$amount", 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]):
+        doc["credit_transaction_total"] = Decimal128(_to_decimal(row["credit"]))
+        doc["transaction_count"] = row["count"]
+
+    async for row in db.gold_ledger.aggregate([
+        {"$match": {"party_id": party_id, "is_deleted": False}},
+        {"$group": {
+            "_id": None,
+            "gold_in": {"$sum": {"$cond": [{"$eq": ["$type", "IN"]}, "$weight_grams", 0]}},
+            "gold_out": {"$sum": {"$cond": [{"$eq": ["$type", "OUT"]}, "$weight_grams", 0]}},
+            "count": {"$sum": 1},
+        }},
+    ]):
+        doc["gold_in_grams"] = Decimal128(_to_decimal(row["gold_in"]))
+        doc["gold_out_grams"] = Decimal128(_to_decimal(row["gold_out"]))
+        doc["gold_entry_count"] = row["count"]
+
+    return doc
+
+
+async def ensure_party_balance(db, party_id: str):
+    """Create an empty balance document for a new party (no-op if one exists)."""
+    await db.party_balances.update_one(
+        {"party_id": party_id},
+        {"$setOnInsert": {**_empty_balance(party_id), "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+def _as_floats(doc: dict) -> Dict[str, Any]:
+    result = {"party_id": doc["party_id"]}
+    for field in MONEY_FIELDS + GOLD_FIELDS:
+        result[field] = float(_to_decimal(doc.get(field)))
+    for field in COUNT_FIELDS:
+        result[field] = int(doc.get(field, 0))
+    return result
+
+
+async def _initialize_party_balance(db, party_id: str) -> Dict[str, Any]:
+    """
+    Seed a zeroed document, then overwrite it with the raw-ledger totals.
+
+    Deltas applied while the totals are computed land on the seed and bump
+    its version, so the overwrite only happens when the version read before
+    computing is still current; otherwise the totals (which now include
+    those writes) are computed again.
+    """
+    await db.party_balances.update_one(
+        {"party_id": party_id},
+        {"$setOnInsert": {**_empty_balance(party_id), "initialized": False, "version": 0,
+                          "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    computed = None
+    for _ in range(INITIALIZE_ATTEMPTS):
+        seed = await db.party_balances.find_one({"party_id": party_id}, {"_id": 0})
+        if seed.get("initialized", True):
+            return seed
+        computed = await compute_party_balance_from_ledgers(db, party_id)
+        result = await db.party_balances.update_one(
+            {"party_id": party_id, "initialized": False, "version": seed.get("version")},
+            {"$set": {**computed, "initialized": True, "updated_at": datetime.now(timezone.utc)},
+             "$inc": {"version": 1}}
+        )
+        if result.modified_count:
+            return computed
+    # Writes kept landing; serve the last totals and let the next read retry
+    return computed
+
+
+async def get_party_balance(db, party_id: str) -> Dict[str, Any]:
+    """
+    Read a party's materialized balance as floats.
+    Parties without an initialized document are computed from the raw ledgers and stored.
+    """
+    doc = await db.party_balances.find_one({"party_id": party_id}, {"_id": 0})
+    if doc is None or not doc.get("initialized", True):
+        doc = await _initialize_party_balance(db, party_id)
+    return _as_floats(doc)
+
+
+def _differences(stored: dict, computed: dict) -> Dict[str, Dict[str, float]]:
+    diffs = {}
+    for field in MONEY_FIELDS + GOLD_FIELDS + COUNT_FIELDS:
+        stored_value = float(_to_decimal(stored.get(field)))
+        computed_value = float(_to_decimal(computed.get(field)))
+        if abs(stored_value - computed_value) > 0.0005:
+            diffs[field] = {"stored": stored_value, "computed": computed_value}
+    return diffs
+
+
+async def rebuild_party_balances(db, verify_only: bool = False, party_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Check (and unless verify_only, overwrite) party balance documents against the raw ledgers.
+
+    Returns:
+        Counts of parties checked/rebuilt and the per-field mismatches found
+    """
+    if party_ids is None:
+        party_ids = [p['id'] async for p in db.parties.find({}, {"_id": 0, "id": 1})]
+
+    mismatches = {}
+    rebuilt = 0
+    for party_id in party_ids:
+        computed = await compute_party_balance_from_ledgers(db, party_id)
+        stored = await db.party_balances.find_one({"party_id": party_id}) or {}
+        diffs = _differences(stored, computed) if stored else {"missing": {"stored": 0, "computed": 1}}
+        if diffs:
+            mismatches[party_id] = diffs
+        if not verify_only and (diffs or not stored):
+            await db.party_balances.replace_one(
+                {"party_id": party_id},
+                {**computed, "updated_at": datetime.now(timezone.utc)},
+                upsert=True
+            )
+            rebuilt += 1
+
+    return {"checked": len(party_ids), "rebuilt": rebuilt, "mismatches": mismatches}
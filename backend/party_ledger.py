@@ -0,0 +1,235 @@
+"""
+Party Ledger Timeline
+---------------------
+One merged, newest-first timeline of everything booked against a party:
+invoices, transactions (payments, receipts, purchase payables), gold ledger
+entries and returns, with the running money and gold balance after every
+row.
+
+``/api/parties/{id}/ledger`` returns invoices and transactions as two lists
+capped at 1000 each, leaving the merge, the sort and the balances to the
+client. The timeline is one aggregation instead: each collection is read
+through its ``(party, date, id)`` index with ``$sort`` + ``$limit`` pushed
+into its ``$unionWith`` branch, so a page costs ``page_size + 1`` index
+entries per collection however long the party's history is; the four
+branches are then merged and cut to the page in the database.
+
+Balances follow /api/parties/{id}/summary (party_balances.py):
+- money: + balance_due of every finalized invoice, - amount of every credit
+  transaction (draft invoices, debit transactions and returns carry 0; a
+  return's refund is booked through its own transaction / gold entry)
+- gold: + grams of IN entries, - grams of OUT entries
+
+so the newest row's balances equal the summary's net_money_balance and
+net_gold_balance. The first page starts from the materialized party balance
+(one lookup) and works backwards through the rows; the cursor carries the
+sort key of the last row and the balance before it, so later pages never
+re-read newer rows.
+
+Cursor tokens are opaque base64url JSON; a malformed one is a 400.
+"""
+
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Decimal128
+from fastapi import HTTPException
+
+from db_indexes import LIVE_ONLY, register_indexes
+from party_balances import get_party_balance
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# (collection, party field) of every timeline source
+SOURCES = [
+    ("invoices", "customer_id"),
+    ("transactions", "party_id"),
+    ("gold_ledger", "party_id"),
+    ("returns", "party_id"),
+]
+
+for _collection, _party_field in SOURCES:
+    register_indexes(_collection, [
+        {"name": "live_party_date_id", "keys": [(_party_field, 1), ("date", -1), ("id", -1)],
+         "options": {"partialFilterExpression": LIVE_ONLY}},
+    ])
+
+
+def _decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value))
+
+
+def encode_timeline_cursor(date: datetime, row_id: str, money: Decimal, gold: Decimal) -> str:
+    """Cursor after the row (date, row_id); money/gold are the balances before that row."""
+    raw = json.dumps([date.isoformat(), row_id, str(money), str(gold)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_timeline_cursor(token: str) -> Tuple[datetime, str, Decimal, Decimal]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date, row_id, money, gold = json.loads(raw)
+        if not isinstance(row_id, str):
+            raise ValueError(row_id)
+        return datetime.fromisoformat(date), row_id, Decimal(money), Decimal(gold)
+    except (ValueError, TypeError, InvalidOperation):
+        raise HTTPException(status_code=400, detail="Invalid ledger cursor")
+
+
+def _branch(party_field: str, party_id: str, after: Optional[Tuple[datetime, str]], limit: int,
+            project: Dict[str, Any]) -> List[Dict[str, Any]]:
+    match: Dict[str, Any] = {party_field: party_id, "is_deleted": False}
+    if after:
+        date, row_id = after
+        match["$or"] = [{"date": {"$lt": date}}, {"date": date, "id": {"$lt": row_id}}]
+    return [
+        {"$match": match},
+        {"$sort": {"date": -1, "id": -1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "id": 1, "date": 1, **project}},
+    ]
+
+
+def ledger_timeline_pipeline(party_id: str, after: Optional[Tuple[datetime, str]], limit: int) -> list:
+    """
+    Aggregation over ``invoices`` returning the next ``limit`` timeline rows
+    older than ``after`` (date, id), newest first, each with money_delta and
+    gold_delta.
+    """
+    zero = {"$literal": 0}
+    branches = {
+        "invoices": {
+            "kind": {"$literal": "invoice"},
+            "reference": "$invoice_number",
+            "description": {"$concat": [{"$ifNull": ["$invoice_type", "sale"]}, " invoice"]},
+            "status": "$status",
+            "payment_status": "$payment_status",
+            "amount": "$grand_total",
+            "paid_amount": "$paid_amount",
+            "balance_due": "$balance_due",
+            "money_delta": {"$cond": [
+                {"$eq": ["$status", "finalized"]}, {"$ifNull": ["$balance_due", 0]}, 0
+            ]},
+            "gold_delta": zero,
+        },
+        "transactions": {
+            "kind": {"$literal": "transaction"},
+            "reference": "$transaction_number",
+            "description": "$category",
+            "transaction_type": "$transaction_type",
+            "mode": "$mode",
+            "account_name": "$account_name",
+            "amount": "$amount",
+            "notes": "$notes",
+            "money_delta": {"$cond": [
+                {"$eq": ["$transaction_type", "credit"]}, {"$multiply": [{"$ifNull": ["$amount", 0]}, -1]}, 0
+            ]},
+            "gold_delta": zero,
+        },
+        "gold_ledger": {
+            "kind": {"$literal": "gold"},
+            "reference": "$reference_type",
+            "description": "$purpose",
+            "type": "$type",
+            "weight_grams": "$weight_grams",
+            "purity_entered": "$purity_entered",
+            "notes": "$notes",
+            "money_delta": zero,
+            "gold_delta": {"$switch": {"branches": [
+                {"case": {"$eq": ["$type", "IN"]}, "then": {"$ifNull": ["$weight_grams", 0]}},
+                {"case": {"$eq": ["$type", "OUT"]},
+                 "then": {"$multiply": [{"$ifNull": ["$weight_grams", 0]}, -1]}},
+            ], "default": 0}},
+        },
+        "returns": {
+            "kind": {"$literal": "return"},
+            "reference": "$return_number",
+            "description": "$return_type",
+            "status": "$status",
+            "amount": "$total_amount",
+            "refund_money_amount": "$refund_money_amount",
+            "refund_gold_grams": "$refund_gold_grams",
+            "money_delta": zero,
+            "gold_delta": zero,
+        },
+    }
+    (first, first_field), *others = SOURCES
+    pipeline = _branch(first_field, party_id, after, limit, branches[first])
+    for collection, party_field in others:
+        pipeline.append({"$unionWith": {
+            "coll": collection,
+            "pipeline": _branch(party_field, party_id, after, limit, branches[collection]),
+        }})
+    pipeline += [
+        {"$sort": {"date": -1, "id": -1}},
+        {"$limit": limit},
+    ]
+    return pipeline
+
+
+async def closing_balances(db, party_id: str) -> Tuple[Decimal, Decimal]:
+    """Current (money, gold) balance of the party from its materialized balance document."""
+    balance = await get_party_balance(db, party_id)
+    money = (_decimal(balance['invoice_due_from_party']) - _decimal(balance['invoice_due_to_party'])
+             - _decimal(balance['credit_transaction_total']))
+    gold = _decimal(balance['gold_in_grams']) - _decimal(balance['gold_out_grams'])
+    return money, gold
+
+
+async def party_ledger_timeline(db, party_id: str, page_size: int = DEFAULT_PAGE_SIZE,
+                                cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    One page of the party's timeline.
+
+    Returns:
+        {"items": [...], "pagination": {...}, "closing_balance": {...}} - each
+        item has money_balance / gold_balance after the row
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    if cursor:
+        date, row_id, money, gold = decode_timeline_cursor(cursor)
+        after: Optional[Tuple[datetime, str]] = (date, row_id)
+        closing = None
+    else:
+        after = None
+        money, gold = await closing_balances(db, party_id)
+        closing = {"money": float(money), "gold": float(gold)}
+
+    # One extra row tells whether another page exists
+    rows = [row async for row in db.invoices.aggregate(ledger_timeline_pipeline(party_id, after, page_size + 1))]
+    items = rows[:page_size]
+    for row in items:
+        money_delta = _decimal(row.pop("money_delta", None))
+        gold_delta = _decimal(row.pop("gold_delta", None))
+        row["money_delta"] = float(money_delta)
+        row["gold_delta"] = float(gold_delta)
+        row["money_balance"] = float(money)
+        row["gold_balance"] = float(gold)
+        money -= money_delta
+        gold -= gold_delta
+
+    next_cursor = None
+    if len(rows) > page_size:
+        last = items[-1]
+        next_cursor = encode_timeline_cursor(last["date"], last["id"], money, gold)
+
+    return {
+        "party_id": party_id,
+        "items": items,
+        "pagination": {
+            "page_size": page_size,
+            "cursor": cursor or "",
+            "next_cursor": next_cursor,
+            "has_next": next_cursor is not None,
+            "has_prev": bool(cursor),
+        },
+        "closing_balance": closing,
+    }
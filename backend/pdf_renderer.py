@@ -0,0 +1,368 @@
+"""
+PDF Rendering Pipeline
+----------------------
+Shared renderer for the invoice PDF and the ``/api/reports/*-pdf`` endpoints.
+
+The endpoints used to import reportlab inside the handler and draw with
+``canvas.Canvas`` on the event loop, so a large report blocked every other
+request while it rendered, and report tables were cut to the first 20-30
+rows because they were drawn as one block on the first page.
+
+Here:
+- rendering runs in a process pool (PDF_WORKERS processes, default 2;
+  0 renders in the thread pool instead). Workers import reportlab and build
+  the styles below once, then serve every request
+- page templates, paragraph styles and table styles are built once per
+  process at import time and shared by every document
+- report tables are LongTables with a repeated header row, so they flow over
+  as many pages as needed; every page gets a "Page N" footer
+- rendered invoice PDFs are cached per (invoice id, updated_at); every
+  invoice write stamps updated_at, so a cached PDF is never stale
+
+Reports are described by a picklable spec built in the endpoint:
+
+    {
+        "title": "Outstanding Report",
+        "subtitle": "Generated: ...",          # optional
+        "landscape": False,                      # optional
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [["Total: 1.000", "Paid: 2.000"]], 2.5),   # text columns, width in inches
+            ("table", header, rows, [1.2, 0.9, ...], "standard"),  # widths in inches or None
+            ("paragraph", "<b>Filters:</b> ..."),
+            ("spacer", 0.2),                     # inches
+        ],
+    }
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.responses import Response
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+from reportlab.platypus import BaseDocTemplate, Frame, LongTable, PageTemplate, Paragraph, Spacer, Table, TableStyle
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+INVOICE_PDF_CACHE_SIZE = int(os.environ.get('INVOICE_PDF_CACHE_SIZE', '256'))
+
+# ============================================================================
+# STYLES (built once per process)
+# ============================================================================
+
+_HEADER_ROW = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+]
+
+TABLE_STYLES = {
+    "standard": TableStyle(_HEADER_ROW + [
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ]),
+    "highlight": TableStyle(_HEADER_ROW + [
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ]),
+    "compact": TableStyle(_HEADER_ROW + [
+        ('FONTSIZE', (0, 0), (-1, 0), 8),
+        ('FONTSIZE', (0, 1), (-1, -1), 7),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]),
+    "banded": TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')]),
+    ]),
+}
+
+_GRID_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('TOPPADDING', (0, 0), (-1, -1), 1),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+])
+
+_SAMPLE_STYLES = getSampleStyleSheet()
+PARAGRAPH_STYLES = {
+    "title": ParagraphStyle('ReportTitle', fontName='Helvetica-Bold', fontSize=16, leading=20, spaceAfter=6),
+    "centered_title": ParagraphStyle(
+        'ReportCenteredTitle', parent=_SAMPLE_STYLES['Heading1'], fontSize=18,
+        textColor=colors.HexColor('#1f2937'), spaceAfter=30, alignment=1
+    ),
+    "subtitle": ParagraphStyle('ReportSubtitle', fontName='Helvetica', fontSize=10, leading=12, spaceAfter=14),
+    "heading": ParagraphStyle('ReportHeading', fontName='Helvetica-Bold', fontSize=12, leading=15,
+                              spaceBefore=8, spaceAfter=6),
+    "body": _SAMPLE_STYLES['Normal'],
+}
+
+
+class ReportDocTemplate(BaseDocTemplate):
+    """A4 document with one full-page frame and a page number footer."""
+
+    def __init__(self, buffer, landscape_mode: bool = False, margin: float = inch):
+        pagesize = landscape(A4) if landscape_mode else A4
+        super().__init__(buffer, pagesize=pagesize, leftMargin=margin, rightMargin=margin,
+                         topMargin=margin, bottomMargin=margin)
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='body')
+        self.addPageTemplates([PageTemplate(id='report', frames=[frame], onPage=self._footer)])
+
+    @staticmethod
+    def _footer(c, doc):
+        c.saveState()
+        c.setFont('Helvetica', 8)
+        c.drawRightString(doc.pagesize[0] - doc.rightMargin, doc.bottomMargin / 2, f"Page {doc.page}")
+        c.restoreState()
+
+
+# ============================================================================
+# RENDERERS (run inside the pool; arguments and results must be picklable)
+# ============================================================================
+
+def _block_flowables(block: Tuple) -> list:
+    kind = block[0]
+    if kind == "heading":
+        return [Paragraph(block[1], PARAGRAPH_STYLES["heading"])]
+    if kind == "paragraph":
+        return [Paragraph(block[1], PARAGRAPH_STYLES["body"])]
+    if kind == "spacer":
+        return [Spacer(1, block[1] * inch)]
+    if kind == "grid":
+        _, rows, col_width = block
+        columns = max(len(row) for row in rows)
+        rows = [row + [''] * (columns - len(row)) for row in rows]
+        return [Table(rows, colWidths=[col_width * inch] * columns, style=_GRID_STYLE, hAlign='LEFT')]
+    if kind == "table":
+        _, header, rows, col_widths, style = block
+        widths = [width * inch for width in col_widths] if col_widths else None
+        return [LongTable([header] + rows, colWidths=widths, repeatRows=1, style=TABLE_STYLES[style], hAlign='LEFT')]
+    raise ValueError(f"Unknown PDF block type: {kind}")
+
+
+def render_report_pdf(spec: Dict[str, Any]) -> bytes:
+    """Render a report spec (see module docstring) to PDF bytes."""
+    buffer = BytesIO()
+    doc = ReportDocTemplate(buffer, landscape_mode=spec.get("landscape", False),
+                            margin=spec.get("margin", 1) * inch)
+    elements = [Paragraph(spec["title"], PARAGRAPH_STYLES[spec.get("title_style", "title")])]
+    if spec.get("subtitle"):
+        elements.append(Paragraph(spec["subtitle"], PARAGRAPH_STYLES["subtitle"]))
+    for block in spec.get("blocks", []):
+        elements.extend(_block_flowables(block))
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def render_invoice_pdf(invoice: Dict[str, Any]) -> bytes:
+    """Render a single invoice (numbers already converted to float)."""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    # Header
+    p.setFont("Helvetica-Bold", 20)
+    p.drawString(50, height - 50, "Gold Shop ERP")
+    p.setFont("Helvetica", 10)
+    p.drawString(50, height - 70, "The Artisan Ledger")
+
+    # Invoice details
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(50, height - 120, f"Invoice #{invoice.get('invoice_number', '')}")
+    p.setFont("Helvetica", 10)
+    p.drawString(50, height - 140, f"Date: {str(invoice.get('date', ''))[:10]}")
+    p.drawString(50, height - 155, f"Customer: {invoice.get('customer_name', 'N/A')}")
+    p.drawString(50, height - 170, f"Type: {invoice.get('invoice_type', 'sale').upper()}")
+    p.drawString(50, height - 185, f"Status: {invoice.get('payment_status', 'unpaid').upper()}")
+
+    # Items table
+    y_position = height - 230
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(50, y_position, "Item")
+    p.drawString(250, y_position, "Qty")
+    p.drawString(300, y_position, "Weight")
+    p.drawString(370, y_position, "Rate")
+    p.drawString(450, y_position, "Total")
+
+    p.setFont("Helvetica", 9)
+    y_position -= 20
+
+    for item in invoice.get('items', []):
+        p.drawString(50, y_position, (item.get('description') or '')[:30])
+        p.drawString(250, y_position, str(item.get('qty', 0)))
+        p.drawString(300, y_position, f"{item.get('weight', 0)}g")
+        p.drawString(370, y_position, f"{item.get('metal_rate') or 0:.2f}")
+        p.drawString(450, y_position, f"{item.get('line_total') or 0:.2f}")
+        y_position -= 15
+
+        if y_position < 100:
+            p.showPage()
+            p.setFont("Helvetica", 9)
+            y_position = height - 50
+
+    # Totals
+    y_position -= 20
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(370, y_position, "Subtotal:")
+    p.drawString(450, y_position, f"{invoice.get('subtotal') or 0:.2f} OMR")
+
+    # MODULE 7: Add discount line if discount exists
+    discount_amount = invoice.get('discount_amount') or 0
+    if discount_amount > 0:
+        y_position -= 15
+        p.setFont("Helvetica", 10)
+        p.drawString(370, y_position, "Discount:")
+        p.drawString(450, y_position, f"-{discount_amount:.2f} OMR")
+
+    y_position -= 15
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(370, y_position, "VAT:")
+    p.drawString(450, y_position, f"{invoice.get('vat_total') or 0:.2f} OMR")
+    y_position -= 15
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(370, y_position, "Grand Total:")
+    p.drawString(450, y_position, f"{invoice.get('grand_total') or 0:.2f} OMR")
+    y_position -= 15
+    p.setFont("Helvetica", 10)
+    p.drawString(370, y_position, "Balance Due:")
+    p.drawString(450, y_position, f"{invoice.get('balance_due') or 0:.2f} OMR")
+
+    # Footer
+    p.setFont("Helvetica-Oblique", 8)
+    p.drawString(50, 50, "Thank you for your business!")
+
+    p.save()
+    return buffer.getvalue()
+
+
+# ============================================================================
+# PROCESS POOL
+# ============================================================================
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if _pool is None and PDF_WORKERS > 0:
+        # spawn: workers import only this module, never a copy of the app's state
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+async def render_pdf(renderer: Callable[..., bytes], *args) -> bytes:
+    """Run a renderer off the event loop (process pool, thread pool as fallback)."""
+    global _pool
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, renderer, *args)
+        except BrokenProcessPool:
+            logger.warning("PDF process pool broke; recreating it on the next render")
+            _pool = None
+    return await run_in_threadpool(renderer, *args)
+
+
+def shutdown_pdf_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def pdf_response(content: bytes, filename: str) -> Response:
+    return Response(
+        content=content,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+# ============================================================================
+# INVOICE PDF CACHE
+# ============================================================================
+
+class InvoicePDFCache:
+    """LRU of rendered invoice PDFs keyed by (invoice id, updated_at)."""
+
+    def __init__(self, max_size: int = INVOICE_PDF_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(invoice: Dict[str, Any]) -> Tuple[str, str]:
+        return invoice.get('id'), str(invoice.get('updated_at'))
+
+    def get(self, invoice: Dict[str, Any]) -> Optional[bytes]:
+        key = self.key(invoice)
+        pdf = self._entries.get(key)
+        if pdf is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return pdf
+
+    def set(self, invoice: Dict[str, Any], pdf: bytes):
+        if self.max_size <= 0:
+            return
+        invoice_id, _ = key = self.key(invoice)
+        # Older versions of the same invoice can never be requested again
+        for stale in [k for k in self._entries if k[0] == invoice_id and k != key]:
+            del self._entries[stale]
+        self._entries[key] = pdf
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes": sum(len(pdf) for pdf in self._entries.values()),
+        }
+
+
+invoice_pdf_cache = InvoicePDFCache()
+
+
+async def get_invoice_pdf(invoice: Dict[str, Any]) -> bytes:
+    """Rendered PDF for an invoice document (float-converted), from cache when unchanged."""
+    pdf = invoice_pdf_cache.get(invoice)
+    if pdf is None:
+        pdf = await render_pdf(render_invoice_pdf, invoice)
+        invoice_pdf_cache.set(invoice, pdf)
+    return pdf
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Daily Rollup Rebuild Script for Gold Shop ERP
+=============================================
+Builds (or verifies) the per-day, per-account ``daily_rollups`` documents
+from the raw transactions.
+
+Run this ONCE after deploying the rollups so existing transactions are
+counted; until it has run, the daily closing, transactions summary and
+financial summary keep scanning raw transactions. Run it again after
+restoring or seeding transactions outside the API, and whenever --verify
+reports drift. Run it while no transactions are being posted: rows written
+during the rebuild can be counted twice or missed.
+
+Usage:
+    python rebuild_daily_rollups.py [--verify]
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_indexes import ensure_indexes
+from daily_rollups import backfill_daily_rollups
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'gold_shop_erp')
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[DB_NAME]
+
+
+async def run(verify_only: bool = False):
+    print("\n" + "=" * 80)
+    print("  Daily Rollup Rebuild - Gold Shop ERP")
+    print(f"  {'VERIFY MODE - No changes will be made' if verify_only else 'REBUILD MODE - Rollups will be rewritten'}")
+    print(f"  Started at: {datetime.now(timezone.utc).isoformat()}")
+    print("=" * 80)
+
+    if not verify_only:
+        await ensure_indexes(db)
+
+    result = await backfill_daily_rollups(db, verify_only=verify_only)
+
+    for mismatch in result["mismatches"]:
+        print(f"\n  ✗ {mismatch['date']} account {mismatch['account_id']}")
+        for field, values in mismatch["fields"].items():
+            print(f"      {field}: stored {values['stored']}, transactions {values['computed']}")
+
+    print("\n" + "=" * 80)
+    print(f"  Day/account rollups checked: {result['checked']}")
+    print(f"  Mismatches:                  {len(result['mismatches'])}")
+    if verify_only:
+        print("  ℹ️  This was a VERIFY run. No changes were made to the database.")
+    else:
+        print(f"  ✓ Rollups written: {result['written']}, stale removed: {result['removed']}")
+    print("=" * 80)
+    return result
+
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rebuild or verify the daily cash-book rollups')
+    parser.add_argument('--verify', action='store_true', help='Compare stored rollups with the transactions without writing')
+    args = parser.parse_args()
+
+    try:
+        result = await run(verify_only=args.verify)
+        if args.verify and result["mismatches"]:
+            sys.exit(2)
+    except Exception as e:
+        print(f"\n✗ Rebuild failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Party Balance Rebuild Script for Gold Shop ERP
+==============================================
+Builds (or verifies) the materialized ``party_balances`` documents from the
+raw invoices, transactions and gold ledger entries.
+
+Run this ONCE after deploying the party balance store so every existing
+party has a document, and again whenever --verify reports drift. It is safe
+to re-run: documents that already match the ledgers are left untouched.
+
+Usage:
+    python rebuild_party_balances.py [--verify] [--party PARTY_ID ...]
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_indexes import ensure_indexes
+from party_balances import rebuild_party_balances
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'gold_shop_erp')
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[DB_NAME]
+
+
+async def run(verify_only: bool = False, party_ids=None):
+    print("\n" + "=" * 80)
+    print("  Party Balance Rebuild - Gold Shop ERP")
+    print(f"  {'VERIFY MODE - No changes will be made' if verify_only else 'REBUILD MODE - Balances will be rewritten'}")
+    print(f"  Started at: {datetime.now(timezone.utc).isoformat()}")
+    print("=" * 80)
+
+    if not verify_only:
+        await ensure_indexes(db)
+
+    result = await rebuild_party_balances(db, verify_only=verify_only, party_ids=party_ids)
+
+    for party_id, diffs in result["mismatches"].items():
+        print(f"\n  ✗ Party {party_id}")
+        for field, values in diffs.items():
+            print(f"      {field}: stored {values['stored']}, ledgers {values['computed']}")
+
+    print("\n" + "=" * 80)
+    print(f"  Parties checked: {result['checked']}")
+    print(f"  Mismatches:      {len(result['mismatches'])}")
+    if verify_only:
+        print("  ℹ️  This was a VERIFY run. No changes were made to the database.")
+    else:
+        print(f"  ✓ Documents rebuilt: {result['rebuilt']}")
+    print("=" * 80)
+    return result
+
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rebuild or verify materialized party balances')
+    parser.add_argument('--verify', action='store_true', help='Compare stored balances with the ledgers without writing')
+    parser.add_argument('--party', nargs='*', help='Only these party ids')
+    args = parser.parse_args()
+
+    try:
+        result = await run(verify_only=args.verify, party_ids=args.party or None)
+        if args.verify and result["mismatches"]:
+            sys.exit(2)
+    except Exception as e:
+        print(f"\n✗ Rebuild failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
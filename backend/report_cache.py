@@ -0,0 +1,107 @@
+"""
+Shared Report Cache
+-------------------
+Short-lived in-process cache of computed report data.
+
+A report is usually opened on screen and then exported to Excel and/or PDF
+with the same filters, and each variant used to recompute the whole report.
+``ReportCache`` keys a computation by report name and filter values so the
+three variants (and concurrent viewers) share one result:
+
+- an entry lives REPORT_CACHE_TTL_SECONDS (default 30; 0 disables caching)
+- concurrent requests for the same key while it is being computed await the
+  one computation instead of starting their own
+- ``notify(module)`` drops every entry when a write to a module that feeds
+  the cached reports is audit-logged (invoices, purchases, returns, ...),
+  and ``invalidate()`` drops them unconditionally (transaction inserts)
+- a computation that started before an invalidation is returned to its
+  callers but not stored
+
+Cached values are shared between requests: callers must not mutate them.
+The cache is per process, so with several workers the TTL bounds how stale a
+report can be after a write handled by another worker.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+DEFAULT_TTL_SECONDS = float(os.environ.get('REPORT_CACHE_TTL_SECONDS', '30'))
+DEFAULT_MAX_SIZE = int(os.environ.get('REPORT_CACHE_MAX_SIZE', '128'))
+
+# Audit log modules whose writes change cached report figures
+REPORT_MODULES = {"invoice", "purchases", "returns", "party", "account", "transaction"}
+
+
+class ReportCache:
+    """TTL + LRU map of (report, filters) -> computed report, with in-flight sharing."""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_size: int = DEFAULT_MAX_SIZE,
+                 modules: Iterable[str] = REPORT_MODULES):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.modules = set(modules)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value for ``key``, computing it once with ``compute()`` when missing."""
+        if self.ttl_seconds <= 0:
+            self.misses += 1
+            return await compute()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.shared += 1
+            # shield: one caller disconnecting must not cancel the others' computation
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.ensure_future(compute())
+        self._inflight[key] = future
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if generation == self._generation:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def notify(self, module: Optional[str] = None) -> None:
+        """Drop cached reports after a write to ``module`` (any module when None)."""
+        if module is None or module in self.modules:
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        # Later callers start a fresh computation instead of joining a stale one
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries), "inflight": len(self._inflight),
+            "hits": self.hits, "misses": self.misses, "shared": self.shared,
+        }
+
+
+report_cache = ReportCache()
@@ -0,0 +1,445 @@
+"""
+Background Report Jobs
+----------------------
+MongoDB-backed queue for the heavy ``/api/reports/*-export`` and ``*-pdf``
+endpoints, executed by in-process workers.
+
+The export endpoints run inside the request: five managers pulling month-end
+reports at once keep five requests busy for the whole build and compete with
+invoice and payment traffic for the event loop and the database. With jobs:
+
+    POST /api/jobs                   {"kind": "outstanding-pdf", "params": {...}}
+    GET  /api/jobs/{id}              status, stage, progress, queue position
+    GET  /api/jobs/{id}/download     the finished file
+
+Queue:
+- jobs live in ``report_jobs``; a worker claims the oldest queued job with a
+  single find_one_and_update, so any number of app processes can share the
+  queue
+- each process runs REPORT_JOB_WORKERS workers (default 2), which caps how
+  many reports build concurrently no matter how many are requested
+- a running job refreshes ``heartbeat_at``; a job whose worker died is
+  reclaimed after REPORT_JOB_STALE_SECONDS, up to MAX_ATTEMPTS times
+
+Deduplication: while a job is queued or running it holds ``active_key`` (a
+hash of kind + params) under a unique partial index. An identical request
+hits the duplicate key, joins the existing job and gets its id.
+
+Artifacts are stored in GridFS (bucket ``report_artifacts``, the default) or
+under REPORT_JOB_DIR on local disk (REPORT_JOB_STORAGE=disk, single host
+only). Finished jobs and their files are removed after
+REPORT_JOB_RETENTION_HOURS.
+
+A job kind is an existing endpoint function: the worker calls it with the
+job's params and the requesting user and stores the response body, so a job
+produces exactly the file the synchronous endpoint returns.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+
+from db_indexes import register_indexes
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', '2'))
+STORAGE = os.environ.get('REPORT_JOB_STORAGE', 'gridfs')
+ARTIFACT_DIR = os.environ.get('REPORT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'report_jobs'))
+RETENTION_HOURS = float(os.environ.get('REPORT_JOB_RETENTION_HOURS', '24'))
+POLL_SECONDS = float(os.environ.get('REPORT_JOB_POLL_SECONDS', '2'))
+STALE_SECONDS = float(os.environ.get('REPORT_JOB_STALE_SECONDS', '120'))
+HEARTBEAT_SECONDS = STALE_SECONDS / 4
+CLEANUP_INTERVAL_SECONDS = 600
+MAX_ATTEMPTS = 3
+GRIDFS_BUCKET = "report_artifacts"
+CHUNK_SIZE = 256 * 1024
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+register_indexes("report_jobs", [
+    {"name": "id_unique", "keys": [("id", 1)], "options": {"unique": True}},
+    # One queued/running job per distinct request (deduplication)
+    {"name": "active_key_unique", "keys": [("active_key", 1)],
+     "options": {"unique": True, "partialFilterExpression": {"active_key": {"$exists": True}}}},
+    {"name": "status_created", "keys": [("status", 1), ("created_at", 1)], "options": {}},
+    {"name": "requested_by_created", "keys": [("requested_by", 1), ("created_at", -1)], "options": {}},
+])
+
+JobHandler = Callable[..., Awaitable[Any]]
+
+
+class ReportJobRequest(BaseModel):
+    kind: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _filename(response, default: str) -> str:
+    match = re.search(r'filename="?([^";]+)"?', response.headers.get("content-disposition", ""))
+    return match.group(1) if match else default
+
+
+async def _response_chunks(response) -> AsyncIterator[bytes]:
+    """Body of a Response or StreamingResponse, chunk by chunk."""
+    if isinstance(response, StreamingResponse):
+        async for chunk in response.body_iterator:
+            yield chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+    else:
+        yield response.body
+
+
+class ReportJobQueue:
+    """Job submission, worker loop and artifact storage for report jobs."""
+
+    def __init__(self, db, load_user: Callable[[str], Awaitable[Any]], storage: str = STORAGE,
+                 workers: int = WORKERS):
+        self.db = db
+        self.load_user = load_user
+        self.storage = storage
+        self.workers = workers
+        self.handlers: Dict[str, JobHandler] = {}
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    # ------------------------------------------------------------------
+    # Registration and submission
+    # ------------------------------------------------------------------
+
+    def register(self, kind: str, handler: JobHandler):
+        """Register an endpoint function (taking ``current_user``) as a job kind."""
+        self.handlers[kind] = handler
+
+    def _normalize_params(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        handler = self.handlers.get(kind)
+        if handler is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown job kind '{kind}'. Available: {', '.join(sorted(self.handlers))}"
+            )
+        accepted = set(inspect.signature(handler).parameters) - {"current_user"}
+        unknown = set(params) - accepted
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown parameters for {kind}: {', '.join(sorted(unknown))}")
+        normalized = {}
+        for name, value in params.items():
+            if value is None or value == "":
+                continue
+            if not isinstance(value, (str, int, float, bool)):
+                raise HTTPException(status_code=400, detail=f"Parameter '{name}' must be a scalar value")
+            normalized[name] = value
+        return normalized
+
+    @staticmethod
+    def dedup_key(kind: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps([kind, params], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def submit(self, kind: str, params: Dict[str, Any], user_id: str) -> Tuple[Dict, bool]:
+        """
+        Queue a job, or join the identical job already queued/running.
+
+        Returns:
+            (job document, whether an existing job was reused)
+        """
+        params = self._normalize_params(kind, params)
+        key = self.dedup_key(kind, params)
+        for _ in range(3):
+            existing = await self.db.report_jobs.find_one_and_update(
+                {"active_key": key},
+                {"$addToSet": {"requested_by": user_id}},
+                return_document=ReturnDocument.AFTER
+            )
+            if existing:
+                existing.pop("_id", None)
+                return existing, True
+            job = {
+                "id": str(uuid.uuid4()),
+                "kind": kind,
+                "params": params,
+                "dedup_key": key,
+                "active_key": key,
+                "status": QUEUED,
+                "stage": "queued",
+                "progress": 0,
+                "attempts": 0,
+                "requested_by": [user_id],
+                "created_by": user_id,
+                "created_at": _now(),
+                "started_at": None,
+                "finished_at": None,
+                "heartbeat_at": None,
+                "error": None,
+                "artifact": None,
+            }
+            try:
+                await self.db.report_jobs.insert_one(job)
+            except DuplicateKeyError:
+                continue  # An identical job was queued concurrently; join it
+            job.pop("_id", None)
+            self._wakeup.set()
+            return job, False
+        raise HTTPException(status_code=503, detail="Could not queue the job, please retry")
+
+    async def get(self, job_id: str, user_id: Optional[str] = None) -> Dict:
+        """Job document visible to user_id (any requester of the job); 404 otherwise."""
+        query = {"id": job_id}
+        if user_id is not None:
+            query["requested_by"] = user_id
+        job = await self.db.report_jobs.find_one(query, {"_id": 0})
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    async def list_for_user(self, user_id: str, limit: int = 50) -> List[Dict]:
+        return await self.db.report_jobs.find({"requested_by": user_id}, {"_id": 0}) \
+            .sort("created_at", -1).limit(limit).to_list(limit)
+
+    async def describe(self, job: Dict) -> Dict[str, Any]:
+        """Public status view of a job."""
+        view = {
+            "id": job["id"],
+            "kind": job["kind"],
+            "params": job["params"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+            "attempts": job["attempts"],
+            "created_at": job["created_at"],
+            "started_at": job.get("started_at"),
+            "finished_at": job.get("finished_at"),
+            "error": job.get("error"),
+        }
+        if job["status"] == QUEUED:
+            view["queue_position"] = await self.db.report_jobs.count_documents(
+                {"status": QUEUED, "created_at": {"$lt": job["created_at"]}}
+            ) + 1
+        artifact = job.get("artifact")
+        if job["status"] == COMPLETED and artifact:
+            view["download_url"] = f"/api/jobs/{job['id']}/download"
+            view["filename"] = artifact["filename"]
+            view["media_type"] = artifact["media_type"]
+            view["size"] = artifact["size"]
+        return view
+
+    # ------------------------------------------------------------------
+    # Artifacts
+    # ------------------------------------------------------------------
+
+    def _bucket(self):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        return AsyncIOMotorGridFSBucket(self.db, bucket_name=GRIDFS_BUCKET)
+
+    async def _store(self, job: Dict, chunks: AsyncIterator[bytes], filename: str) -> Tuple[str, int]:
+        """Write the artifact; returns (storage reference, size in bytes)."""
+        size = 0
+        if self.storage == "gridfs":
+            grid_in = self._bucket().open_upload_stream(
+                filename, chunk_size_bytes=CHUNK_SIZE, metadata={"job_id": job["id"], "kind": job["kind"]}
+            )
+            try:
+                async for chunk in chunks:
+                    await grid_in.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                await grid_in.abort()
+                raise
+            await grid_in.close()
+            return str(grid_in._id), size
+
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        path = os.path.join(ARTIFACT_DIR, f"{job['id']}_{os.path.basename(filename)}")
+        output = await run_in_threadpool(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await run_in_threadpool(output.write, chunk)
+                size += len(chunk)
+        finally:
+            await run_in_threadpool(output.close)
+        return path, size
+
+    async def _delete_artifact(self, artifact: Optional[Dict]):
+        if not artifact:
+            return
+        try:
+            if artifact["storage"] == "gridfs":
+                await self._bucket().delete(ObjectId(artifact["ref"]))
+            elif os.path.exists(artifact["ref"]):
+                await run_in_threadpool(os.remove, artifact["ref"])
+        except Exception as e:
+            logger.warning(f"Could not delete report artifact {artifact['ref']}: {e}")
+
+    async def download(self, job: Dict) -> StreamingResponse:
+        """Stream a completed job's artifact."""
+        artifact = job.get("artifact")
+        if job["status"] != COMPLETED or not artifact:
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}, no file to download yet")
+
+        if artifact["storage"] == "gridfs":
+            grid_out = await self._bucket().open_download_stream(ObjectId(artifact["ref"]))
+
+            async def chunks():
+                while True:
+                    chunk = await grid_out.readchunk()
+                    if not chunk:
+                        break
+                    yield chunk
+        else:
+            if not os.path.exists(artifact["ref"]):
+                raise HTTPException(status_code=410, detail="Job file is no longer available")
+            source = await run_in_threadpool(open, artifact["ref"], "rb")
+
+            async def chunks():
+                try:
+                    while True:
+                        chunk = await run_in_threadpool(source.read, CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+                finally:
+                    source.close()
+
+        return StreamingResponse(
+            chunks(),
+            media_type=artifact["media_type"],
+            headers={"Content-Disposition": f"attachment; filename={artifact['filename']}"}
+        )
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    async def _claim(self) -> Optional[Dict]:
+        now = _now()
+        job = await self.db.report_jobs.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED},
+                # Worker died mid-job: heartbeat stopped
+                {"status": RUNNING, "heartbeat_at": {"$lt": now - timedelta(seconds=STALE_SECONDS)}},
+            ]},
+            {"$set": {"status": RUNNING, "stage": "running", "progress": 10, "started_at": now,
+                      "heartbeat_at": now, "worker_id": self.worker_id},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            job.pop("_id", None)
+        return job
+
+    async def _update(self, job: Dict, fields: Dict[str, Any], finished: bool = False):
+        update: Dict[str, Any] = {"$set": fields}
+        if finished:
+            update["$unset"] = {"active_key": ""}
+        # Only the claiming worker may update (a reclaimed job belongs to another)
+        await self.db.report_jobs.update_one({"id": job["id"], "worker_id": self.worker_id}, update)
+
+    async def _heartbeat(self, job: Dict):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await self._update(job, {"heartbeat_at": _now()})
+
+    async def run_job(self, job: Dict):
+        """Execute one claimed job and record the outcome."""
+        if job["attempts"] > MAX_ATTEMPTS:
+            await self._update(job, {"status": FAILED, "stage": "failed", "finished_at": _now(),
+                                     "error": f"Gave up after {MAX_ATTEMPTS} attempts"}, finished=True)
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            user = await self.load_user(job["created_by"])
+            if user is None:
+                raise HTTPException(status_code=403, detail="Requesting user no longer exists")
+            response = await self.handlers[job["kind"]](current_user=user, **job["params"])
+
+            await self._update(job, {"stage": "storing", "progress": 80})
+            filename = _filename(response, f"{job['kind']}_{job['id']}")
+            ref, size = await self._store(job, _response_chunks(response), filename)
+            await self._update(job, {
+                "status": COMPLETED, "stage": "completed", "progress": 100, "finished_at": _now(),
+                "artifact": {"storage": self.storage, "ref": ref, "filename": filename,
+                             "media_type": response.media_type, "size": size},
+            }, finished=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Report job {job['id']} ({job['kind']}) failed: {error}")
+            await self._update(job, {"status": FAILED, "stage": "failed", "finished_at": _now(),
+                                     "error": error}, finished=True)
+        finally:
+            heartbeat.cancel()
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+                if job is not None:
+                    await self.run_job(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Report job worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+                self._wakeup.clear()
+            except asyncio.TimeoutError:
+                pass
+
+    async def cleanup(self) -> int:
+        """Delete finished jobs (and their files) older than the retention period."""
+        cutoff = _now() - timedelta(hours=RETENTION_HOURS)
+        removed = 0
+        async for job in self.db.report_jobs.find(
+            {"status": {"$in": [COMPLETED, FAILED]}, "finished_at": {"$lt": cutoff}},
+            {"_id": 0, "id": 1, "artifact": 1}
+        ):
+            await self._delete_artifact(job.get("artifact"))
+            await self.db.report_jobs.delete_one({"id": job["id"]})
+            removed += 1
+        return removed
+
+    async def _janitor(self):
+        while True:
+            try:
+                removed = await self.cleanup()
+                if removed:
+                    logger.info(f"Removed {removed} expired report jobs")
+            except Exception as e:
+                logger.error(f"Report job cleanup failed: {e}")
+            await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+
+    def start(self):
+        """Start the worker and cleanup tasks (call from app startup)."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._janitor()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
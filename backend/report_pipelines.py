@@ -0,0 +1,359 @@
+"""
+Report Aggregation Pipelines
+----------------------------
+Server-side MongoDB aggregations behind the reporting endpoints.
+
+Report totals used to be computed by loading documents into Python with a
+to_list(10000) cap, converting every Decimal128 to float and summing row by
+row, so totals were silently wrong above the cap. The pipelines here sum
+Decimal128 values inside MongoDB with no row limit and return only the
+aggregated figures; conversion to float happens once per total.
+Transaction credit/debit totals come from the per-day rollups maintained in
+daily_rollups.py.
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from bson import Decimal128
+
+from daily_rollups import rollup_totals
+from db_indexes import LIVE_ONLY, register_indexes
+
+
+def _num(value) -> float:
+    """Aggregation result (Decimal128, int, float or None) to float."""
+    if value is None:
+        return 0.0
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    return float(value)
+
+
+def date_range_filter(start: Optional[datetime], end: Optional[datetime]) -> Optional[Dict[str, Any]]:
+    """Inclusive date condition for a $match, or None when unbounded."""
+    condition = {}
+    if start:
+        condition["$gte"] = start
+    if end:
+        condition["$lte"] = end
+    return condition or None
+
+
+async def _first(cursor) -> Dict[str, Any]:
+    async for row in cursor:
+        return row
+    return {}
+
+
+async def financial_summary_figures(db, start: Optional[datetime], end: Optional[datetime],
+                                    closing_range: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute every figure of /api/reports/financial-summary with aggregations.
+
+    Args:
+        db: Motor database
+        start, end: Optional inclusive date bounds for transactions, invoices and returns
+        closing_range: Date condition applied to daily closings
+
+    Returns:
+        The financial summary response body
+    """
+    # ---- Accounts: balances by kind in one pass ----
+    account_type = {"$toLower": {"$ifNull": ["$account_type", ""]}}
+    account_name = {"$toLower": {"$ifNull": ["$name", ""]}}
+    is_asset = {"$eq": [account_type, "asset"]}
+    balance = {"$ifNull": ["$current_balance", 0]}
+
+    accounts = await _first(db.accounts.aggregate([
+        {"$match": {"is_deleted": False}},
+        {"$facet": {
+            "balances": [{"$group": {
+                "_id": None,
+                "cash": {"$sum": {"$cond": [
+                    {"$and": [is_asset, {"$regexMatch": {"input": account_name, "regex": "cash"}}]}, balance, 0]}},
+                "bank": {"$sum": {"$cond": [
+                    {"$and": [is_asset, {"$regexMatch": {"input": account_name, "regex": "bank"}}]}, balance, 0]}},
+                "income": {"$sum": {"$cond": [{"$eq": [account_type, "income"]}, balance, 0]}},
+                "expense": {"$sum": {"$cond": [{"$eq": [account_type, "expense"]}, balance, 0]}},
+                "total": {"$sum": balance},
+            }}],
+            "income_ids": [
+                {"$match": {"account_type": {"$regex": "^income$", "$options": "i"}}},
+                {"$group": {"_id": None, "ids": {"$push": "$id"}}},
+            ],
+        }},
+    ]))
+    balances = (accounts.get("balances") or [{}])[0]
+    income_ids = ((accounts.get("income_ids") or [{}])[0]).get("ids", [])
+
+    # ---- Transactions: credit/debit totals and sales split from the daily rollups ----
+    txn_dates = date_range_filter(start, end)
+    income = set(income_ids)
+    total_credit = total_debit = sales_credits = total_sales_returns = Decimal('0')
+    for account_id, figures in (await rollup_totals(db, start, end)).items():
+        total_credit += figures["credit_total"]
+        total_debit += figures["debit_total"]
+        # sales_return category on any account, plus every debit to an income account
+        total_sales_returns += figures["sales_return_total"]
+        if account_id in income:
+            sales_credits += figures["credit_total"]
+            total_sales_returns += figures["debit_total"] - figures["sales_return_debit_total"]
+
+    # ---- Invoices: outstanding on finalized invoices ----
+    invoice_match: Dict[str, Any] = {"is_deleted": False, "status": "finalized"}
+    if txn_dates:
+        invoice_match["date"] = txn_dates
+    invoice_totals = await _first(db.invoices.aggregate([
+        {"$match": invoice_match},
+        {"$group": {"_id": None, "outstanding": {"$sum": {"$ifNull": ["$balance_due", 0]}}}},
+    ]))
+
+    # ---- Daily closings: reconciliation difference ----
+    closing_totals = await _first(db.daily_closings.aggregate([
+        {"$match": {"is_deleted": False, "date": closing_range}},
+        {"$group": {"_id": None, "difference": {"$sum": {"$subtract": [
+            {"$ifNull": ["$actual_closing", 0]}, {"$ifNull": ["$expected_closing", 0]}
+        ]}}}},
+    ]))
+
+    # ---- Returns: counts by type ----
+    returns_match: Dict[str, Any] = {"is_deleted": False, "status": "finalized"}
+    if txn_dates:
+        returns_match["date"] = txn_dates
+    returns_counts = {"sale_return": 0, "purchase_return": 0}
+    returns_total = 0
+    async for row in db.returns.aggregate([
+        {"$match": returns_match},
+        {"$group": {"_id": "$return_type", "count": {"$sum": 1}}},
+    ]):
+        returns_total += row["count"]
+        if row["_id"] in returns_counts:
+            returns_counts[row["_id"]] = row["count"]
+
+    return {
+        "total_sales": float(sales_credits - total_sales_returns),
+        "total_sales_returns": float(total_sales_returns),
+        "total_credit": float(total_credit),
+        "total_debit": float(total_debit),
+        "net_flow": float(total_credit - total_debit),
+        "cash_balance": _num(balances.get("cash")),
+        "bank_balance": _num(balances.get("bank")),
+        "net_profit": _num(balances.get("income")) - _num(balances.get("expense")),
+        "total_account_balance": _num(balances.get("total")),
+        "total_outstanding": _num(invoice_totals.get("outstanding")),
+        "daily_closing_difference": _num(closing_totals.get("difference")),
+        "returns_summary": {
+            "sales_returns_count": returns_counts["sale_return"],
+            "purchase_returns_count": returns_counts["purchase_return"],
+            "total_returns_count": returns_total,
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Outstanding report
+# ---------------------------------------------------------------------------
+
+# Categories of the transactions that feed the outstanding report: Purchase
+# credits are vendor payables; all three give the party's last payment date
+OUTSTANDING_TXN_CATEGORIES = ["Sales Invoice", "Purchase Invoice", "Purchase"]
+DAY_MS = 86400000
+
+register_indexes("invoices", [
+    {"name": "live_status_balance", "keys": [("status", 1), ("balance_due", 1)],
+     "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+register_indexes("transactions", [
+    {"name": "live_category_party", "keys": [("category", 1), ("party_id", 1)],
+     "options": {"partialFilterExpression": LIVE_ONLY}},
+])
+
+
+def _as_date(field: str) -> Dict[str, Any]:
+    """Date field (datetime or legacy ISO string) as a date, null when unusable."""
+    return {"$convert": {"input": field, "to": "date", "onError": None, "onNull": None}}
+
+
+def _aging_sum(low: int, high: Optional[int]) -> Dict[str, Any]:
+    days = [{"$gte": ["$overdue_days", low]}]
+    if high is not None:
+        days.append({"$lte": ["$overdue_days", high]})
+    return {"$sum": {"$cond": [{"$and": days}, "$aging_amount", 0]}}
+
+
+def _outstanding_invoice_match(party_id: Optional[str], party_type: Optional[str],
+                               start: Optional[datetime], end: Optional[datetime],
+                               include_paid: bool) -> Dict[str, Any]:
+    is_walk_in = {"customer_type": "walk_in"}
+    conditions: list = [
+        {"is_deleted": False, "status": "finalized"},
+        # Invoices without a walk-in name or a saved customer have no party
+        {"$or": [is_walk_in, {"customer_id": {"$nin": [None, ""]}}]},
+    ]
+    if not include_paid:
+        conditions.append({"balance_due": {"$gt": 0}})
+    dates = date_range_filter(start, end)
+    if dates:
+        conditions.append({"date": dates})
+    if party_id and party_id.startswith("walk_in_"):
+        name = party_id[len("walk_in_"):]
+        conditions.append({**is_walk_in, "walk_in_name": {"$in": [name, None]} if name == "Unknown" else name})
+    elif party_id:
+        conditions.append({"customer_id": party_id, "customer_type": {"$ne": "walk_in"}})
+    if party_type == "customer":
+        conditions.append({"$or": [is_walk_in, {"invoice_type": "sale"}]})
+    elif party_type == "vendor":
+        conditions.append({"customer_type": {"$ne": "walk_in"}, "invoice_type": {"$ne": "sale"}})
+    elif party_type:
+        conditions.append({"_id": {"$exists": False}})
+    return {"$and": conditions}
+
+
+def outstanding_report_pipeline(party_id: Optional[str], party_type: Optional[str],
+                                start: Optional[datetime], end: Optional[datetime],
+                                include_paid: bool, now: datetime) -> list:
+    """
+    Per-party outstanding rows in one aggregation over ``invoices``.
+
+    Finalized invoices (the filters are pushed into the first $match so the
+    invoice indexes apply) are reshaped into one row per invoice; $unionWith
+    adds the Purchase/Sales Invoice/Purchase Invoice transactions of the
+    same parties. Each row carries its aging amount and days overdue (from
+    the due date, else the invoice or transaction date), and a single $group
+    folds them into party totals, the 0-7 / 8-30 / 31+ day buckets and the
+    last invoice/payment dates. Party ids of walk-in customers are
+    ``walk_in_<name>``.
+    """
+    is_walk_in = {"$eq": ["$customer_type", "walk_in"]}
+    walk_in_name = {"$ifNull": ["$walk_in_name", "Unknown"]}
+    balance_due = {"$ifNull": ["$balance_due", 0]}
+
+    # Purchase credits are vendor payables, counted unless only customers are asked for
+    if party_type in (None, "vendor"):
+        payable: Any = {"$and": [{"$eq": ["$category", "Purchase"]}, {"$eq": ["$transaction_type", "credit"]}]}
+    else:
+        payable = {"$literal": False}
+    amount = {"$ifNull": ["$amount", 0]}
+    payable_amount = {"$cond": [payable, amount, 0]}
+
+    txn_match: Dict[str, Any] = {
+        "is_deleted": False,
+        "category": {"$in": OUTSTANDING_TXN_CATEGORIES},
+        "party_id": party_id or {"$nin": [None, ""]},
+    }
+
+    return [
+        {"$match": _outstanding_invoice_match(party_id, party_type, start, end, include_paid)},
+        {"$project": {
+            "_id": 0,
+            "party_id": {"$cond": [is_walk_in, {"$concat": ["walk_in_", walk_in_name]}, "$customer_id"]},
+            "party_name": {"$cond": [
+                is_walk_in, {"$concat": [walk_in_name, " (Walk-in)"]}, {"$ifNull": ["$customer_name", "Unknown"]}
+            ]},
+            "party_type": {"$cond": [
+                {"$or": [is_walk_in, {"$eq": ["$invoice_type", "sale"]}]}, "customer", "vendor"
+            ]},
+            "is_invoice": {"$literal": True},
+            "payable": {"$literal": False},
+            "invoiced": {"$ifNull": ["$grand_total", 0]},
+            "paid": {"$ifNull": ["$paid_amount", 0]},
+            "outstanding": balance_due,
+            "aging_amount": {"$cond": [{"$gt": [balance_due, 0]}, balance_due, 0]},
+            "aging_from": _as_date({"$ifNull": ["$due_date", "$date"]}),
+            "invoice_date": _as_date("$date"),
+            "payment_date": {"$literal": None},
+        }},
+        {"$unionWith": {"coll": "transactions", "pipeline": [
+            {"$match": txn_match},
+            {"$project": {
+                "_id": 0,
+                "party_id": "$party_id",
+                "party_name": {"$ifNull": ["$party_name", "Unknown Vendor"]},
+                "party_type": {"$literal": "vendor"},
+                "is_invoice": {"$literal": False},
+                "payable": payable,
+                "invoiced": {"$literal": 0},
+                "paid": {"$literal": 0},
+                "outstanding": payable_amount,
+                "aging_amount": {"$cond": [{"$gt": [payable_amount, 0]}, payable_amount, 0]},
+                "aging_from": _as_date("$date"),
+                "invoice_date": {"$literal": None},
+                "payment_date": _as_date("$date"),
+            }},
+        ]}},
+        {"$addFields": {"overdue_days": {"$cond": [
+            {"$and": [{"$gt": ["$aging_amount", 0]}, {"$ne": ["$aging_from", None]}]},
+            {"$floor": {"$divide": [{"$subtract": [now, "$aging_from"]}, DAY_MS]}},
+            None,
+        ]}}},
+        {"$group": {
+            "_id": "$party_id",
+            # Name and type come from the party's earliest invoice, else from its payable transactions
+            "first_invoice": {"$min": {"$cond": [
+                "$is_invoice", {"date": "$invoice_date", "name": "$party_name", "type": "$party_type"}, None
+            ]}},
+            "payable_name": {"$max": {"$cond": ["$payable", "$party_name", None]}},
+            "has_row": {"$max": {"$or": ["$is_invoice", "$payable"]}},
+            "total_invoiced": {"$sum": "$invoiced"},
+            "total_paid": {"$sum": "$paid"},
+            "total_outstanding": {"$sum": "$outstanding"},
+            "overdue_0_7": _aging_sum(0, 7),
+            "overdue_8_30": _aging_sum(8, 30),
+            "overdue_31_plus": _aging_sum(31, None),
+            "last_invoice_date": {"$max": "$invoice_date"},
+            "last_payment_date": {"$max": "$payment_date"},
+            "invoice_count": {"$sum": {"$cond": ["$is_invoice", 1, 0]}},
+        }},
+        # Parties that only have payment transactions are not part of the report
+        {"$match": {"has_row": True}},
+        {"$sort": {"total_outstanding": -1, "_id": 1}},
+    ]
+
+
+async def outstanding_report_figures(db, party_id: Optional[str] = None, party_type: Optional[str] = None,
+                                     start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                     include_paid: bool = False,
+                                     now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Compute the /api/reports/outstanding body with outstanding_report_pipeline.
+
+    Party rows are streamed from the aggregation cursor (no row cap) and
+    the summary totals are folded from them on the way, so the data is
+    read once.
+
+    Returns:
+        {"summary": {...}, "parties": [...]} with float amounts and ISO dates
+    """
+    now = now or datetime.now(timezone.utc)
+    summary = {
+        "customer_due": 0.0, "vendor_payable": 0.0, "total_outstanding": 0.0,
+        "total_overdue_0_7": 0.0, "total_overdue_8_30": 0.0, "total_overdue_31_plus": 0.0,
+    }
+    parties = []
+    pipeline = outstanding_report_pipeline(party_id, party_type, start, end, include_paid, now)
+    async for row in db.invoices.aggregate(pipeline, allowDiskUse=True):
+        first_invoice = row.get("first_invoice") or {}
+        party = {
+            "party_id": row["_id"],
+            "party_name": first_invoice.get("name") or row.get("payable_name") or "Unknown Vendor",
+            "party_type": first_invoice.get("type") or "vendor",
+            "total_invoiced": _num(row.get("total_invoiced")),
+            "total_paid": _num(row.get("total_paid")),
+            "total_outstanding": _num(row.get("total_outstanding")),
+            "overdue_0_7": _num(row.get("overdue_0_7")),
+            "overdue_8_30": _num(row.get("overdue_8_30")),
+            "overdue_31_plus": _num(row.get("overdue_31_plus")),
+            "last_invoice_date": row["last_invoice_date"].isoformat() if row.get("last_invoice_date") else None,
+            "last_payment_date": row["last_payment_date"].isoformat() if row.get("last_payment_date") else None,
+            "invoice_count": row.get("invoice_count", 0),
+        }
+        parties.append(party)
+        due_key = "customer_due" if party["party_type"] == "customer" else "vendor_payable"
+        summary[due_key] += party["total_outstanding"]
+        summary["total_overdue_0_7"] += party["overdue_0_7"]
+        summary["total_overdue_8_30"] += party["overdue_8_30"]
+        summary["total_overdue_31_plus"] += party["overdue_31_plus"]
+    summary["total_outstanding"] = summary["customer_due"] + summary["vendor_payable"]
+    return {"summary": summary, "parties": parties}
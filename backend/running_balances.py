@@ -0,0 +1,219 @@
+"""
+Running Balance Checkpoints
+---------------------------
+Computes the per-transaction running balance shown by GET /api/transactions
+without replaying an account's full history.
+
+The running balance of a transaction is the account's opening balance plus
+the signed sum (credit +, debit -) of every live transaction of the same
+account ordered by (date, _id) up to and including it.
+
+A checkpoint stores that signed sum at one transaction position. To find the
+balance at a transaction we take the latest checkpoint at or before it and
+add the transactions in between with a single $group, so the work per row is
+bounded by CHECKPOINT_INTERVAL instead of the account history. Checkpoints
+are written lazily by readers once the gap grows past the interval.
+
+Write paths call ``invalidate_balance_checkpoints`` after a transaction is
+inserted or removed. That drops checkpoints at or after the transaction's
+date (a no-op for the usual "dated now" insert) and bumps the account's
+checkpoint version, which readers check so a checkpoint computed
+concurrently with a back-dated write is never kept.
+
+Run ``python running_balances.py --rebuild`` after bulk edits made outside
+the API (seed or fix scripts); checkpoints are then rebuilt on demand.
+"""
+
+import asyncio
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from bson import Decimal128
+
+from db_indexes import register_indexes
+
+# Maximum number of transactions summed between a checkpoint and a row
+CHECKPOINT_INTERVAL = 500
+
+register_indexes("balance_checkpoints", [
+    {"name": "account_position", "keys": [("account_id", 1), ("date", -1), ("txn_oid", -1)], "options": {}},
+])
+register_indexes("balance_checkpoint_versions", [
+    {"name": "account_id_unique", "keys": [("account_id", 1)], "options": {"unique": True}},
+])
+
+
+def _to_decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0')
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    return Decimal(str(value))
+
+
+def _signed_amount(txn: dict) -> Decimal:
+    """Credit adds to the running balance, anything else subtracts."""
+    amount = _to_decimal(txn.get('amount'))
+    return amount if txn.get('transaction_type') == 'credit' else -amount
+
+
+def _after(date, oid) -> dict:
+    """Filter for positions strictly after (date, oid)."""
+    return {"$or": [{"date": {"$gt": date}}, {"date": date, "_id": {"$gt": oid}}]}
+
+
+def _at_or_before(date, oid) -> dict:
+    """Filter for positions at or before (date, oid)."""
+    return {"$or": [{"date": {"$lt": date}}, {"date": date, "_id": {"$lte": oid}}]}
+
+
+async def _signed_sum_between(db, account_id: str, start: Optional[Tuple], end: Tuple) -> Tuple[Decimal, int]:
+    """Signed sum and count of live transactions in the (start, end] position range."""
+    conditions = [_at_or_before(*end)]
+    if start is not None:
+        conditions.append(_after(*start))
+
+    pipeline = [
+        {"$match": {"account_id": account_id, "is_deleted": False, "$and": conditions}},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": {"$cond": [
+                {"$eq": ["$transaction_type", "credit"]},
+                "$amount",
+                {"$multiply": ["$amount", -1]}
+            ]}},
+            "count": {"$sum": 1}
+        }}
+    ]
+    async for row in db.transactions.aggregate(pipeline):
+        return _to_decimal(row.get('total')), row.get('count', 0)
+    return Decimal('0'), 0
+
+
+async def _checkpoint_version(db, account_id: str) -> int:
+    doc = await db.balance_checkpoint_versions.find_one({"account_id": account_id})
+    return doc.get('version', 0) if doc else 0
+
+
+async def _save_checkpoint(db, account_id: str, position: Tuple, total: Decimal, version: int):
+    """Store a checkpoint unless a write to the account raced with its computation."""
+    date, oid = position
+    result = await db.balance_checkpoints.insert_one({
+        "account_id": account_id,
+        "date": date,
+        "txn_oid": oid,
+        "total": Decimal128(total),
+    })
+    if await _checkpoint_version(db, account_id) != version:
+        await db.balance_checkpoints.delete_one({"_id": result.inserted_id})
+
+
+async def _latest_checkpoint(db, account_id: str, position: Tuple) -> Optional[dict]:
+    date, oid = position
+    return await db.balance_checkpoints.find_one(
+        {"account_id": account_id,
+         "$or": [{"date": {"$lt": date}}, {"date": date, "txn_oid": {"$lte": oid}}]},
+        sort=[("date", -1), ("txn_oid", -1)]
+    )
+
+
+async def compute_running_balances(db, transactions: List[dict], opening_balances: Dict[str, float]) -> Dict[str, Tuple[float, float]]:
+    """
+    Compute (balance_before, balance_after) for each transaction on a page.
+
+    Args:
+        db: Motor database
+        transactions: Transaction documents including their Mongo ``_id``
+        opening_balances: Opening balance per account_id (missing = 0)
+
+    Returns:
+        Mapping of transaction id to (balance_before, balance_after), rounded to 3 decimals
+    """
+    by_account: Dict[str, List[dict]] = {}
+    for txn in transactions:
+        by_account.setdefault(txn['account_id'], []).append(txn)
+
+    balances = {}
+    for account_id, account_txns in by_account.items():
+        version = await _checkpoint_version(db, account_id)
+        opening = _to_decimal(opening_balances.get(account_id, 0))
+        account_txns.sort(key=lambda t: (t['date'], t['_id']))
+
+        base_position = None
+        base_total = Decimal('0')
+        for txn in account_txns:
+            position = (txn['date'], txn['_id'])
+
+            # The oldest row on the page anchors on the nearest checkpoint;
+            # later rows build on the row before them
+            if base_position is None:
+                checkpoint = await _latest_checkpoint(db, account_id, position)
+                if checkpoint is not None:
+                    base_position = (checkpoint['date'], checkpoint['txn_oid'])
+                    base_total = _to_decimal(checkpoint['total'])
+
+            delta, count = await _signed_sum_between(db, account_id, base_position, position)
+            total = base_total + delta
+            if count >= CHECKPOINT_INTERVAL:
+                await _save_checkpoint(db, account_id, position, total, version)
+
+            base_position = position
+            base_total = total
+
+            balance_after = opening + total
+            balance_before = balance_after - _signed_amount(txn)
+            balances[txn['id']] = (round(float(balance_before), 3), round(float(balance_after), 3))
+
+    return balances
+
+
+async def invalidate_balance_checkpoints(db, account_id: Optional[str], date) -> None:
+    """
+    Drop checkpoints affected by a transaction inserted or removed at ``date``.
+    Must be called after the transaction write itself.
+    """
+    if not account_id:
+        return
+    await db.balance_checkpoint_versions.update_one(
+        {"account_id": account_id},
+        {"$inc": {"version": 1}},
+        upsert=True
+    )
+    if date is None:
+        await db.balance_checkpoints.delete_many({"account_id": account_id})
+    else:
+        await db.balance_checkpoints.delete_many({"account_id": account_id, "date": {"$gte": date}})
+
+
+async def rebuild_balance_checkpoints(db) -> int:
+    """Discard all checkpoints; they are recomputed lazily on the next reads."""
+    result = await db.balance_checkpoints.delete_many({})
+    await db.balance_checkpoint_versions.update_many({}, {"$inc": {"version": 1}})
+    return result.deleted_count
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description='Manage running balance checkpoints')
+    parser.add_argument('--rebuild', action='store_true', help='Discard all checkpoints so they are rebuilt on demand')
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+        db = client[os.environ.get('DB_NAME', 'gold_shop_erp')]
+        if args.rebuild:
+            removed = await rebuild_balance_checkpoints(db)
+            print(f"✅ Removed {removed} balance checkpoints")
+        else:
+            count = await db.balance_checkpoints.count_documents({})
+            print(f"ℹ️  {count} balance checkpoints stored")
+        client.close()
+
+    asyncio.run(main())
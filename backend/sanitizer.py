@@ -0,0 +1,194 @@
+"""
+JSON Input Sanitization Engine
+------------------------------
+Strips HTML from the string values of JSON request bodies for the input
+sanitization middleware.
+
+The engine walks the decoded body once:
+- UUID and ISO-date patterns are precompiled; such values and short IDs are
+  left untouched, as before
+- strings without ``<``, ``&`` or control characters cannot be changed by
+  bleach beyond escaping ``>`` and trimming, so they skip bleach entirely
+- results are memoized in a bounded LRU cache, so repeated values such as
+  item descriptions and categories are cleaned once
+- containers are copied only when one of their values actually changes; when
+  nothing changes the original request bytes are forwarded without a
+  json.dumps round trip
+
+Per-route schemas limit sanitization to the listed fields (dotted paths,
+``*`` matches any list index or object key). Routes without a schema have
+every string sanitized. An empty schema turns sanitization off for a route,
+e.g. endpoints whose bodies carry passwords.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from validators import sanitize_html
+
+_UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+_ISO_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+# Characters bleach rewrites other than '>': markup/entity starts and control
+# characters (bleach turns them into '?' or drops them, and \r into \n)
+_NEEDS_BLEACH_RE = re.compile(r'[<&\x00-\x08\x0b-\x1f]')
+
+# Longer strings are cleaned without being cached
+CACHEABLE_LENGTH = 512
+
+# Schema trie leaf: sanitize every string below this point
+_ALL = True
+
+SchemaNode = Union[bool, Dict[str, Any]]
+
+
+def is_technical_value(value: str) -> bool:
+    """
+    Check if value is a technical field that shouldn't be sanitized.
+    Returns True for UUIDs, ISO dates and short ID-like strings.
+    """
+    if _UUID_RE.match(value) or _ISO_DATE_RE.match(value):
+        return True
+    # Short technical strings (likely IDs)
+    return len(value) < 5 and value.replace('-', '').replace('_', '').isalnum()
+
+
+def _clean(value: str) -> str:
+    if not value or is_technical_value(value):
+        return value
+    if _NEEDS_BLEACH_RE.search(value):
+        return sanitize_html(value)
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    return value.strip()
+
+
+def _compile_schema(fields: Iterable[str]) -> Dict[str, Any]:
+    """Turn dotted field paths into a nested trie."""
+    trie: Dict[str, Any] = {}
+    for field in fields:
+        node = trie
+        parts = field.split('.')
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is _ALL:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = _ALL
+    return trie
+
+
+def _compile_route(path: str) -> re.Pattern:
+    """'/api/users/{user_id}/x' -> regex matching one path segment per parameter."""
+    pattern = re.sub(r'\\\{[^/]+?\\\}', r'[^/]+', re.escape(path))
+    return re.compile(f'^{pattern}$')
+
+
+class SanitizationEngine:
+    """Single-pass JSON sanitizer with per-route schemas and a string cache."""
+
+    def __init__(self, cache_size: int = 4096):
+        self._exact_routes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._template_routes: List[Tuple[str, re.Pattern, Dict[str, Any]]] = []
+        self._clean_cached = lru_cache(maxsize=cache_size)(_clean)
+
+    # ---- schemas ----
+
+    def register_schema(self, method: str, path: str, fields: Iterable[str]) -> None:
+        """
+        Only sanitize the given fields for a route.
+
+        Args:
+            method: HTTP method (POST, PUT, PATCH)
+            path: Route path, may contain {params} (e.g. /api/users/{user_id})
+            fields: Dotted field paths such as "notes" or "items.*.description";
+                    an empty list disables sanitization for the route
+        """
+        schema = _compile_schema(fields)
+        method = method.upper()
+        if '{' in path:
+            self._template_routes.append((method, _compile_route(path), schema))
+        else:
+            self._exact_routes[(method, path)] = schema
+
+    def schema_for(self, method: str, path: str) -> Optional[Dict[str, Any]]:
+        schema = self._exact_routes.get((method, path))
+        if schema is not None:
+            return schema
+        for route_method, pattern, route_schema in self._template_routes:
+            if route_method == method and pattern.match(path):
+                return route_schema
+        return None
+
+    # ---- values ----
+
+    def sanitize_string(self, value: str) -> str:
+        if len(value) <= CACHEABLE_LENGTH:
+            return self._clean_cached(value)
+        return _clean(value)
+
+    def sanitize(self, value: Any, schema: SchemaNode = _ALL) -> Tuple[Any, bool]:
+        """
+        Sanitize a decoded JSON value.
+
+        Returns:
+            (value, changed) - containers are only copied when changed is True
+        """
+        if isinstance(value, str):
+            if schema is not _ALL:
+                return value, False
+            cleaned = self.sanitize_string(value)
+            return cleaned, cleaned != value
+        if isinstance(value, dict):
+            result = value
+            for key, item in value.items():
+                child = schema if schema is _ALL else schema.get(key, schema.get('*'))
+                if child is None:
+                    continue
+                cleaned, changed = self.sanitize(item, child)
+                if changed:
+                    if result is value:
+                        result = dict(value)
+                    result[key] = cleaned
+            return result, result is not value
+        if isinstance(value, list):
+            child = schema if schema is _ALL else schema.get('*')
+            if child is None:
+                return value, False
+            result = value
+            for index, item in enumerate(value):
+                cleaned, changed = self.sanitize(item, child)
+                if changed:
+                    if result is value:
+                        result = list(value)
+                    result[index] = cleaned
+            return result, result is not value
+        return value, False
+
+    def sanitize_body(self, body: bytes, method: str = 'POST', path: str = '') -> bytes:
+        """
+        Sanitize a JSON request body.
+        Returns the original bytes object when nothing needed changing or the
+        body is not JSON.
+        """
+        schema = self.schema_for(method, path)
+        if schema is not None and not schema:
+            return body
+        try:
+            data = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return body
+        cleaned, changed = self.sanitize(data, _ALL if schema is None else schema)
+        if not changed:
+            return body
+        return json.dumps(cleaned).encode('utf-8')
+
+    def cache_info(self):
+        return self._clean_cached.cache_info()
+
+
+sanitizer = SanitizationEngine()
+register_sanitization_schema = sanitizer.register_schema
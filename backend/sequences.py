@@ -0,0 +1,176 @@
+"""
+Document Number Sequencer
+-------------------------
+Atomic generator for human-readable document numbers:
+
+- Invoices:  INV-{year}-NNNN
+- Purchases: PUR-{year}-NNNN
+- Returns:   RET-NNNNN
+
+Numbers used to be derived from count_documents on a regex, which scans the
+collection on every create and hands the same number to two concurrent
+creates. Each sequence now lives in the ``counters`` collection
+(``{"_id": "invoice:2026", "seq": 42}``) and is advanced with a single
+find_one_and_update + $inc, which MongoDB applies atomically.
+
+Block reservation (optional):
+    Set SEQUENCE_BLOCK_SIZE > 1 to let each worker process reserve that many
+    numbers per round-trip and hand them out locally. Numbers stay unique but
+    are no longer strictly in creation order across workers, and unused
+    numbers of a block are skipped when a worker restarts.
+
+A counter that does not exist yet is seeded from the highest number already
+stored, so deployments that skipped ``migrate_sequence_counters.py`` keep
+numbering where they left off. Unique indexes on the number fields guard
+against duplicates either way.
+"""
+
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db_indexes import register_indexes
+
+SEQUENCE_BLOCK_SIZE = max(1, int(os.environ.get('SEQUENCE_BLOCK_SIZE', '1')))
+
+
+@dataclass(frozen=True)
+class SequenceSpec:
+    collection: str  # Collection holding the numbered documents
+    field: str  # Field that stores the number
+    prefix: str  # Number prefix; "{year}" is replaced for yearly sequences
+    width: int  # Zero-padded width of the numeric part
+    yearly: bool  # Restart numbering every calendar year
+
+
+SEQUENCES: Dict[str, SequenceSpec] = {
+    "invoice": SequenceSpec("invoices", "invoice_number", "INV-{year}-", 4, True),
+    "purchase": SequenceSpec("purchases", "purchase_number", "PUR-{year}-", 4, True),
+    "return": SequenceSpec("returns", "return_number", "RET-", 5, False),
+}
+
+# Unique guards on every sequenced number field. Documents created before a
+# field existed (e.g. legacy purchases without purchase_number) are excluded.
+for _spec in SEQUENCES.values():
+    register_indexes(_spec.collection, [{
+        "name": f"{_spec.field}_unique",
+        "keys": [(_spec.field, 1)],
+        "options": {"unique": True, "partialFilterExpression": {_spec.field: {"$type": "string"}}},
+    }])
+
+
+def sequence_prefix(name: str, year: Optional[int] = None) -> str:
+    spec = SEQUENCES[name]
+    return spec.prefix.format(year=year) if spec.yearly else spec.prefix
+
+
+def counter_key(name: str, year: Optional[int] = None) -> str:
+    return f"{name}:{year}" if SEQUENCES[name].yearly else name
+
+
+def format_number(name: str, value: int, year: Optional[int] = None) -> str:
+    spec = SEQUENCES[name]
+    return f"{sequence_prefix(name, year)}{str(value).zfill(spec.width)}"
+
+
+async def highest_existing_number(db, name: str, year: Optional[int] = None) -> int:
+    """Highest numeric suffix already stored for a sequence (0 if none)."""
+    spec = SEQUENCES[name]
+    pattern = re.compile(rf"^{re.escape(sequence_prefix(name, year))}(\d+)$")
+    highest = 0
+    cursor = db[spec.collection].find(
+        {spec.field: {"$regex": pattern.pattern}},
+        {spec.field: 1, "_id": 0}
+    )
+    async for doc in cursor:
+        match = pattern.match(doc.get(spec.field) or '')
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+async def seed_counter(db, name: str, year: Optional[int] = None, value: Optional[int] = None) -> int:
+    """
+    Raise a counter to at least ``value`` (default: highest existing number).
+    Never moves a counter backwards. Returns the value seeded from.
+    """
+    if value is None:
+        value = await highest_existing_number(db, name, year)
+    try:
+        await db.counters.update_one(
+            {"_id": counter_key(name, year)},
+            {"$max": {"seq": value}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another worker created the counter first; $max again on the existing doc
+        await db.counters.update_one({"_id": counter_key(name, year)}, {"$max": {"seq": value}})
+    return value
+
+
+class _SequenceAllocator:
+    """Hands out numbers for one counter, reserving them in blocks."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.next_value = 0
+        self.block_end = -1
+        self.seeded = False
+        self.lock = asyncio.Lock()
+
+    async def _reserve(self, db, block_size: int) -> Tuple[int, int]:
+        for attempt in range(2):
+            try:
+                doc = await db.counters.find_one_and_update(
+                    {"_id": self.key},
+                    {"$inc": {"seq": block_size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                break
+            except DuplicateKeyError:
+                # Concurrent upsert of a brand-new counter; the retry increments it
+                if attempt:
+                    raise
+        high = doc["seq"]
+        return high - block_size + 1, high
+
+    async def next(self, db, name: str, year: Optional[int], block_size: int) -> int:
+        async with self.lock:
+            if not self.seeded:
+                if not await db.counters.find_one({"_id": self.key}):
+                    await seed_counter(db, name, year)
+                self.seeded = True
+            if self.next_value > self.block_end:
+                self.next_value, self.block_end = await self._reserve(db, block_size)
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+
+_allocators: Dict[str, _SequenceAllocator] = {}
+
+
+async def next_sequence_number(db, name: str, block_size: Optional[int] = None) -> str:
+    """
+    Return the next formatted number for a sequence ("invoice", "purchase", "return").
+
+    Args:
+        db: Motor database
+        name: Sequence name from SEQUENCES
+        block_size: Numbers reserved per round-trip (defaults to SEQUENCE_BLOCK_SIZE)
+    """
+    spec = SEQUENCES[name]
+    year = datetime.now(timezone.utc).year if spec.yearly else None
+    key = counter_key(name, year)
+    allocator = _allocators.get(key)
+    if allocator is None:
+        allocator = _allocators.setdefault(key, _SequenceAllocator(key))
+    value = await allocator.next(db, name, year, block_size or SEQUENCE_BLOCK_SIZE)
+    return format_number(name, value, year)
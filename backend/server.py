@@ -1,4 +1,5 @@
 from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, Response, Request, Cookie, Query
+from fastapi.responses import PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -6,11 +7,12 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import os
+import asyncio
 import re
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
@@ -18,14 +20,58 @@ import jwt
 from decimal import Decimal
 from bson import Decimal128, ObjectId
 import secrets
+import hmac
+
+from db_indexes import ensure_indexes, get_index_report
+from running_balances import compute_running_balances, invalidate_balance_checkpoints
+from sequences import next_sequence_number
+from bson_json import BSONJSONResponse, decimal128_to_float
+from report_pipelines import financial_summary_figures, outstanding_report_figures
+from report_cache import report_cache
+from party_ledger import party_ledger_timeline
+from daily_rollups import apply_rollup_change, apply_rollup_changes, init_daily_rollups, rollup_totals, sum_totals
+from user_cache import user_cache
+from dashboard_snapshot import get_dashboard_snapshot, mark_dashboard_stale, run_dashboard_refresher
+from pagination import paginate_find
+from excel_export import STREAM_BATCH_SIZE, ExcelExport, excel_date
+from pdf_renderer import get_invoice_pdf, pdf_response, render_pdf, render_report_pdf, shutdown_pdf_pool
+from report_jobs import ReportJobQueue, ReportJobRequest
+from stock_reservations import WEIGHT_TOLERANCE, deduct_stock, recover_stock_reservations, stock_line
+from inventory_snapshots import (
+    invalidate_inventory_snapshots, movement_flow, reconcile_inventory, run_inventory_snapshotter, stock_at,
+)
+from pymongo import UpdateOne
+from audit_sink import AuditSink
+from audit_partitions import AuditPartitions, run_audit_archiver
+from metrics import DBCommandListener, MetricsMiddleware, registry as metrics_registry
+from party_balances import (
+    apply_gold_entry_change, apply_gold_entry_changes, apply_invoice_change, apply_transaction_change,
+    apply_transaction_changes, ensure_party_balance, get_party_balance,
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# The command listener attributes every MongoDB round-trip to the request issuing it (metrics.py)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[DBCommandListener()])
 db = client[os.environ['DB_NAME']]
 
+# Audit records are buffered and written in batches off the request path,
+# into one collection per month
+audit_sink = AuditSink(db)
+audit_partitions = AuditPartitions(db)
+metrics_registry.register_gauge("audit_sink_queue_depth", "Audit records buffered and not yet written",
+                                lambda: audit_sink.stats()["queue_depth"])
+metrics_registry.register_gauge("audit_sink_last_flush_ms", "Duration of the last audit flush",
+                                lambda: audit_sink.stats()["last_flush_ms"])
+metrics_registry.register_gauge("audit_sink_failed_flushes", "Audit flushes that failed and were retried",
+                                lambda: audit_sink.stats()["failed_flushes"])
+metrics_registry.register_gauge("report_cache_hits", "Report computations served from the shared report cache",
+                                lambda: report_cache.stats()["hits"])
+metrics_registry.register_gauge("report_cache_misses", "Report computations run because nothing was cached",
+                                lambda: report_cache.stats()["misses"])
+
 # ============================================================================
 # ACCOUNTING CONFIGURATION - STRICT TAXONOMY
 # ============================================================================
@@ -86,6 +132,19 @@ JWT_EXPIRATION_HOURS = 24
 # RATE LIMITING CONFIGURATION
 # ============================================================================
 
+def decode_access_token(request: Request, token: str) -> dict:
+    """
+    Decode a JWT once per request.
+    The payload is kept on request.state so the rate limiter key function and
+    get_current_user share a single decode.
+    """
+    cached = getattr(request.state, 'jwt_payload', None)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    request.state.jwt_payload = (token, payload)
+    return payload
+
 # Custom function to get user ID from request for rate limiting
 def get_user_identifier(request: Request) -> str:
     """
@@ -104,7 +163,7 @@ def get_user_identifier(request: Request) -> str:
         
         if token:
             try:
-                payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+                payload = decode_access_token(request, token)
                 user_id = payload.get('user_id')
                 if user_id:
                     return f"user:{user_id}"
@@ -117,7 +176,11 @@ def get_user_identifier(request: Request) -> str:
     return f"ip:{get_remote_address(request)}"
 
 # Initialize rate limiter with custom key function
-limiter = Limiter(key_func=get_user_identifier)
+# RATE_LIMIT_ENABLED=false switches it off for load tests against a scratch database (load_test.py)
+limiter = Limiter(
+    key_func=get_user_identifier,
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').strip().lower() not in ('0', 'false', 'no')
+)
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -130,200 +193,23 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer(auto_error=False)  # auto_error=False makes it optional
 
 # ============================================================================
-# SECURITY HEADERS MIDDLEWARE
-# ============================================================================
-
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response as StarletteResponse
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware to add comprehensive security headers to all HTTP responses.
-    
-    Security Headers Implemented:
-    - Content-Security-Policy (CSP): Restricts resource loading to prevent XSS
-    - X-Frame-Options: Prevents clickjacking attacks
-    - X-Content-Type-Options: Prevents MIME type sniffing
-    - Strict-Transport-Security (HSTS): Enforces HTTPS connections
-    - X-XSS-Protection: Enables browser XSS filtering
-    - Referrer-Policy: Controls referrer information
-    - Permissions-Policy: Controls browser features/APIs
-    """
-    
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Content Security Policy (CSP)
-        # Note: 'unsafe-inline' and 'unsafe-eval' are required for React apps
-        # In production with build optimization, these can be replaced with nonces/hashes
-        csp_directives = [
-            "default-src 'self'",
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval'",
-            "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com",
-            "img-src 'self' data: https: blob:",
-            "font-src 'self' data: https://fonts.gstatic.com",
-            "connect-src 'self' http://localhost:3000 http://localhost:8001 http://127.0.0.1:3000 http://127.0.0.1:8001",
-            "frame-ancestors 'none'",
-            "base-uri 'self'",
-            "form-action 'self'",
-            "object-src 'none'",
-            "upgrade-insecure-requests"
-        ]
-        response.headers['Content-Security-Policy'] = "; ".join(csp_directives)
-        
-        # X-Frame-Options: Prevent clickjacking by denying iframe embedding
-        response.headers['X-Frame-Options'] = 'DENY'
-        
-        # X-Content-Type-Options: Prevent MIME type sniffing
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        
-        # Strict-Transport-Security (HSTS): Force HTTPS for 1 year including subdomains
-        # preload: Allows inclusion in browser HSTS preload lists
-        response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains; preload'
-        
-        # X-XSS-Protection: Enable browser XSS filtering
-        # mode=block: Block page rendering if XSS detected
-        response.headers['X-XSS-Protection'] = '1; mode=block'
-        
-        # Referrer-Policy: Control referrer information sent with requests
-        response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        
-        # Permissions-Policy: Disable unnecessary browser features
-        # Restricts access to geolocation, camera, microphone, etc.
-        permissions_policy = [
-            "geolocation=()",
-            "camera=()",
-            "microphone=()",
-            "payment=()",
-            "usb=()",
-            "magnetometer=()",
-            "gyroscope=()",
-            "accelerometer=()"
-        ]
-        response.headers['Permissions-Policy'] = ", ".join(permissions_policy)
-        
-        return response
-
-
-# ============================================================================
-# INPUT SANITIZATION MIDDLEWARE
+# SECURITY MIDDLEWARE & CSRF TOKENS
 # ============================================================================
 
+# HTTPS redirect, security headers, input sanitization and CSRF protection
+# live in security_middleware.py as one fused pure-ASGI middleware
+from security_middleware import SecurityMiddleware
+from sanitizer import register_sanitization_schema
+
+# Routes whose bodies carry passwords or tokens: only sanitize the display
+# fields, never the secrets (bleach would silently alter '<', '&' or '>')
+register_sanitization_schema("POST", "/api/auth/register", ["username", "email", "full_name", "role"])
+register_sanitization_schema("POST", "/api/auth/login", ["username"])
+register_sanitization_schema("POST", "/api/auth/reset-password", [])
+register_sanitization_schema("POST", "/api/users/{user_id}/change-password", [])
 from validators import sanitize_html, sanitize_text_field, PartyValidator
 import json
 
-class InputSanitizationMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware to automatically sanitize all incoming request data.
-    
-    Protection Features:
-    - Removes HTML tags and scripts from text inputs
-    - Escapes special characters
-    - Validates data types
-    - Prevents XSS attacks through input sanitization
-    
-    Applied to all POST, PUT, PATCH requests with JSON body.
-    """
-    
-    def sanitize_value(self, value: Any) -> Any:
-        """
-        Recursively sanitize values in request data.
-        """
-        if isinstance(value, str):
-            # Only sanitize strings that are not UUIDs, dates, or specific fields
-            # Avoid sanitizing IDs, dates, and technical fields
-            if len(value) > 0 and not self._is_technical_field(value):
-                return sanitize_html(value)
-            return value
-        elif isinstance(value, dict):
-            return {k: self.sanitize_value(v) for k, v in value.items()}
-        elif isinstance(value, list):
-            return [self.sanitize_value(item) for item in value]
-        else:
-            return value
-    
-    def _is_technical_field(self, value: str) -> bool:
-        """
-        Check if value is a technical field that shouldn't be sanitized.
-        Returns True for UUIDs, ISO dates, email-like patterns.
-        """
-        # Check for UUID pattern
-        if re.match(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', value, re.IGNORECASE):
-            return True
-        # Check for ISO date pattern
-        if re.match(r'^\d{4}-\d{2}-\d{2}', value):
-            return True
-        # Short technical strings (likely IDs)
-        if len(value) < 5 and value.replace('-', '').replace('_', '').isalnum():
-            return True
-        return False
-    
-    async def dispatch(self, request: Request, call_next):
-        # Only sanitize body data on state-changing methods
-        if request.method in ['POST', 'PUT', 'PATCH']:
-            try:
-                # Read the body
-                body = await request.body()
-                if body:
-                    try:
-                        # Parse JSON
-                        data = json.loads(body)
-                        # Sanitize the data
-                        sanitized_data = self.sanitize_value(data)
-                        # Update request body with sanitized data
-                        request._body = json.dumps(sanitized_data).encode('utf-8')
-                    except json.JSONDecodeError:
-                        # Not JSON, skip sanitization
-                        pass
-            except Exception as e:
-                # If any error in sanitization, log but don't break the request
-                logging.warning(f"Input sanitization error: {str(e)}")
-        
-        response = await call_next(request)
-        return response
-
-
-# ============================================================================
-# HTTPS ENFORCEMENT MIDDLEWARE (Phase 7)
-# ============================================================================
-
-class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware to enforce HTTPS by redirecting all HTTP requests to HTTPS.
-    
-    Security Benefits:
-    - Forces encrypted connections
-    - Works with HSTS header for comprehensive HTTPS enforcement
-    - Prevents downgrade attacks
-    
-    Note: In production, this should be combined with HSTS preloading
-    """
-    
-    async def dispatch(self, request: Request, call_next):
-        # Check if request is HTTP (not HTTPS)
-        # In production with reverse proxy, check X-Forwarded-Proto header
-        forwarded_proto = request.headers.get('X-Forwarded-Proto', '')
-        
-        # If explicitly HTTP or no secure connection
-        if forwarded_proto == 'http' or (
-            not forwarded_proto and 
-            request.url.scheme == 'http' and 
-            request.url.hostname not in ['localhost', '127.0.0.1', 'testserver']
-        ):
-            # Construct HTTPS URL
-            https_url = request.url.replace(scheme='https')
-            return StarletteResponse(
-                status_code=301,  # Permanent redirect
-                headers={'Location': str(https_url)}
-            )
-        
-        response = await call_next(request)
-        return response
-
-# ============================================================================
-# CSRF PROTECTION MIDDLEWARE
-# ============================================================================
-
 def generate_csrf_token() -> str:
     """
     Generate a cryptographically secure CSRF token.
@@ -331,63 +217,6 @@ def generate_csrf_token() -> str:
     """
     return secrets.token_urlsafe(32)
 
-class CSRFProtectionMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware to validate CSRF tokens on state-changing HTTP methods.
-    
-    Implementation: Double-Submit Cookie Pattern
-    - CSRF token is stored in a readable cookie (not httponly)
-    - Client must send the token in X-CSRF-Token header
-    - Server validates that cookie value matches header value
-    
-    Protected Methods: POST, PUT, PATCH, DELETE
-    Exempt Endpoints: /api/auth/login, /api/auth/register, /api/auth/request-password-reset,
-                      /api/auth/reset-password, /api/health
-    
-    Security Benefits:
-    - CSRF attacks can't read cookies (same-origin policy)
-    - Requires both cookie AND custom header to match
-    - Only state-changing operations are protected
-    """
-    
-    # Endpoints that are exempt from CSRF validation
-    EXEMPT_PATHS = {
-        '/api/auth/login',
-        '/api/auth/register',
-        '/api/auth/request-password-reset',
-        '/api/auth/reset-password',
-        '/api/health'
-    }
-    
-    async def dispatch(self, request: Request, call_next):
-        # Only validate CSRF on state-changing methods
-        if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            # Skip CSRF validation for exempt endpoints
-            if request.url.path not in self.EXEMPT_PATHS:
-                # Get CSRF token from cookie
-                csrf_cookie = request.cookies.get('csrf_token')
-                
-                # Get CSRF token from header
-                csrf_header = request.headers.get('X-CSRF-Token')
-                
-                # Validate that both exist and match
-                if not csrf_cookie or not csrf_header:
-                    return StarletteResponse(
-                        content='{"detail": "CSRF token missing"}',
-                        status_code=403,
-                        media_type='application/json'
-                    )
-                
-                if csrf_cookie != csrf_header:
-                    return StarletteResponse(
-                        content='{"detail": "CSRF token validation failed"}',
-                        status_code=403,
-                        media_type='application/json'
-                    )
-        
-        response = await call_next(request)
-        return response
-
 # ============================================================================
 # PERMISSION SYSTEM - RBAC Configuration
 # ============================================================================
@@ -498,7 +327,7 @@ def decimal_to_float(obj):
     elif isinstance(obj, list):
         return [decimal_to_float(item) for item in obj]
     elif isinstance(obj, Decimal128):
-        return float(obj.to_decimal())
+        return decimal128_to_float(obj)
     elif isinstance(obj, datetime):
         return obj.isoformat()
     elif isinstance(obj, ObjectId):
@@ -515,7 +344,7 @@ def safe_float(value):
     if value is None:
         return 0.0
     if isinstance(value, Decimal128):
-        return float(value.to_decimal())
+        return decimal128_to_float(value)
     return float(value) if value else 0.0
 
 # ============================================================================
@@ -886,25 +715,43 @@ class PaginationResponse(BaseModel):
     items: List[Any]
     pagination: PaginationMetadata
 
-def create_pagination_response(items: list, total_count: int, page: int, page_size: int):
+def create_pagination_response(items: list, total_count: Optional[int], page: int, page_size: int,
+                               cursor: Optional[str] = None, next_cursor: Optional[str] = None,
+                               total_count_exact: bool = True):
     """
     Helper function to create standardized pagination response
     
     Args:
         items: List of items for current page
-        total_count: Total number of items across all pages
+        total_count: Total number of items across all pages (None when not counted)
         page: Current page number (1-indexed)
         page_size: Number of items per page
+        cursor: Cursor of this page in keyset mode (None in page-number mode)
+        next_cursor: Cursor of the next page in keyset mode (None on the last page)
+        total_count_exact: False when total_count is an estimate
     
     Returns:
-        Dictionary with items and pagination metadata
+        JSON response with items and pagination metadata
+        (Decimal128/datetime/ObjectId values are serialized directly)
     """
+    if cursor is not None:
+        # Keyset mode (see pagination.py)
+        return BSONJSONResponse({
+            "items": items,
+            "pagination": {
+                "total_count": total_count,
+                "total_count_exact": total_count_exact,
+                "page_size": page_size,
+                "cursor": cursor,
+                "next_cursor": next_cursor,
+                "has_next": next_cursor is not None,
+                "has_prev": bool(cursor)
+            }
+        })
+
     total_pages = (total_count + page_size - 1) // page_size  # Ceiling division
     
-    # Convert Decimal128 to float for JSON serialization
-    items = [decimal_to_float(item) for item in items]
-    
-    return {
+    return BSONJSONResponse({
         "items": items,
         "pagination": {
             "total_count": total_count,
@@ -914,7 +761,7 @@ def create_pagination_response(items: list, total_count: int, page: int, page_si
             "has_next": page < total_pages,
             "has_prev": page > 1
         }
-    }
+    })
 
 class UserRole(BaseModel):
     role: str
@@ -1147,6 +994,7 @@ class Invoice(BaseModel):
     finalized_at: Optional[datetime] = None  # Set when invoice is finalized
     finalized_by: Optional[str] = None
     paid_at: Optional[datetime] = None  # Set when balance becomes zero (first full payment)
+    updated_at: Optional[datetime] = None  # Set on every change (invoice PDF cache key)
     items: List[InvoiceItem] = []
     subtotal: float = 0
     discount_amount: float = 0.0  # Invoice-level discount amount
@@ -1280,6 +1128,7 @@ class Purchase(BaseModel):
     """
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    purchase_number: Optional[str] = None  # PUR-{year}-NNNN, assigned on create (legacy purchases have none)
     
     # Vendor information (either saved vendor OR walk-in)
     vendor_party_id: Optional[str] = None  # Required for saved vendors, None for walk-in
@@ -1421,7 +1270,78 @@ async def create_audit_log(user_id: str, user_name: str, module: str, record_id:
         action=action,
         changes=changes
     )
-    await db.audit_logs.insert_one(log.model_dump())
+    collection = await audit_partitions.collection_for("audit_logs", log.timestamp)
+    await audit_sink.write(collection, log.model_dump())
+    mark_dashboard_stale(module)
+    report_cache.notify(module)
+
+async def insert_transaction(transaction: Transaction):
+    """
+    Persist a finance transaction and keep derived balance data in sync.
+    All transaction inserts should go through this helper.
+    """
+    transaction_doc = convert_transaction_to_decimal(transaction.model_dump())
+    await db.transactions.insert_one(transaction_doc)
+    await invalidate_balance_checkpoints(db, transaction.account_id, transaction.date)
+    await apply_transaction_change(db, transaction_doc, 1)
+    await apply_rollup_change(db, transaction_doc, 1)
+    report_cache.invalidate()
+
+async def insert_transactions(transactions: List[Transaction]):
+    """
+    Batch form of insert_transaction for documents that post several rows:
+    one insert_many, checkpoints invalidated once per account and party
+    balances updated once per party.
+    """
+    if not transactions:
+        return
+    transaction_docs = [convert_transaction_to_decimal(t.model_dump()) for t in transactions]
+    await db.transactions.insert_many(transaction_docs)
+    earliest: Dict[str, datetime] = {}
+    for transaction in transactions:
+        account_id = transaction.account_id
+        if account_id not in earliest or transaction.date < earliest[account_id]:
+            earliest[account_id] = transaction.date
+    for account_id, date in earliest.items():
+        await invalidate_balance_checkpoints(db, account_id, date)
+    await apply_transaction_changes(db, transaction_docs, 1)
+    await apply_rollup_changes(db, transaction_docs, 1)
+    report_cache.invalidate()
+
+async def after_transaction_removed(transaction_doc: dict):
+    """Keep derived balance data in sync after a transaction is soft or hard deleted."""
+    await invalidate_balance_checkpoints(db, transaction_doc.get('account_id'), transaction_doc.get('date'))
+    await apply_transaction_change(db, transaction_doc, -1)
+    await apply_rollup_change(db, transaction_doc, -1)
+
+async def insert_gold_ledger_entry(entry_doc: dict):
+    """
+    Persist a gold ledger entry and update the party's materialized gold balance.
+    All gold ledger inserts should go through this helper.
+    """
+    await db.gold_ledger.insert_one(entry_doc)
+    await apply_gold_entry_change(db, entry_doc, 1)
+
+async def insert_gold_ledger_entries(entry_docs: List[dict]):
+    """Batch form of insert_gold_ledger_entry: one insert_many, one balance update per party."""
+    if not entry_docs:
+        return
+    await db.gold_ledger.insert_many(entry_docs)
+    await apply_gold_entry_changes(db, entry_docs, 1)
+
+async def find_inventory_headers(names, projection: Optional[dict] = None) -> Dict[str, dict]:
+    """Live inventory headers by name, fetched with one $in query."""
+    names = list({name for name in names if name})
+    if not names:
+        return {}
+    headers = {}
+    async for header in db.inventory_headers.find({"name": {"$in": names}, "is_deleted": False}, projection):
+        headers.setdefault(header["name"], header)
+    return headers
+
+async def after_gold_ledger_entry_removed(entry_doc: dict):
+    """Update the party's materialized gold balance after an entry is soft or hard deleted."""
+    await apply_gold_entry_change(db, entry_doc, -1)
 
 # ============================================================================
 # AUTHENTICATION & SECURITY HELPER FUNCTIONS
@@ -1467,7 +1387,8 @@ async def create_auth_audit_log(username: str, action: str, success: bool,
         failure_reason=failure_reason,
         ip_address=ip_address
     )
-    await db.auth_audit_logs.insert_one(log.model_dump())
+    collection = await audit_partitions.collection_for("auth_audit_logs", log.timestamp)
+    await audit_sink.write(collection, log.model_dump())
 
 async def check_account_lockout(user_doc: dict) -> tuple[bool, Optional[str]]:
     """
@@ -1514,6 +1435,7 @@ async def handle_successful_login(user_id: str):
             'last_login': datetime.now(timezone.utc)
         }}
     )
+    user_cache.invalidate(user_id)
 
 def get_user_permissions(role: str) -> List[str]:
     """Get permissions for a given role"""
@@ -1714,6 +1636,25 @@ def require_permission(permission: str):
         return current_user
     return permission_checker
 
+async def load_user(user_id: str) -> Optional[User]:
+    """Active user by id with role permissions filled in, or None"""
+    # Recently resolved users are served from the in-process cache
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user.model_copy()
+    
+    user_doc = await db.users.find_one({"id": user_id, "is_deleted": False}, {"_id": 0})
+    if not user_doc:
+        return None
+    
+    # Populate permissions based on role if not already set
+    if 'permissions' not in user_doc or not user_doc['permissions']:
+        user_doc['permissions'] = get_user_permissions(user_doc.get('role', 'staff'))
+    
+    user = User(**user_doc)
+    user_cache.set(user_id, user)
+    return user.model_copy()
+
 async def get_current_user(
     request: Request,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
@@ -1736,20 +1677,15 @@ async def get_current_user(
         )
     
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_access_token(request, token)
         user_id = payload.get('user_id')
         if not user_id:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
         
-        user_doc = await db.users.find_one({"id": user_id, "is_deleted": False}, {"_id": 0})
-        if not user_doc:
+        user = await load_user(user_id)
+        if user is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-        
-        # Populate permissions based on role if not already set
-        if 'permissions' not in user_doc or not user_doc['permissions']:
-            user_doc['permissions'] = get_user_permissions(user_doc.get('role', 'staff'))
-        
-        return User(**user_doc)
+        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except jwt.InvalidTokenError:
@@ -1914,6 +1850,8 @@ async def get_me(request: Request, current_user: User = Depends(get_current_user
 @api_router.post("/auth/logout")
 async def logout(response: Response, current_user: User = Depends(get_current_user)):
     """Logout endpoint - clears authentication and CSRF cookies, creates audit log"""
+    user_cache.invalidate(current_user.id)
+    
     # Clear the authentication cookie
     response.delete_cookie(
         key="access_token",
@@ -2019,6 +1957,7 @@ async def reset_password(request: Request, reset_data: dict):
             'locked_until': None  # Unlock account if locked
         }}
     )
+    user_cache.invalidate(user_id)
     
     # Mark token as used
     await db.password_reset_tokens.update_one(
@@ -2072,6 +2011,7 @@ async def update_user(request: Request, user_id: str, update_data: dict, current
         update_data['permissions'] = get_user_permissions(update_data['role'])
     
     await db.users.update_one({"id": user_id}, {"$set": update_data})
+    user_cache.invalidate(user_id)
     await create_audit_log(current_user.id, current_user.full_name, "user", user_id, "update", update_data)
     return {"message": "User updated successfully"}
 
@@ -2089,6 +2029,7 @@ async def delete_user(request: Request, user_id: str, current_user: User = Depen
         {"id": user_id},
         {"$set": {"is_deleted": True, "deleted_at": datetime.now(timezone.utc), "deleted_by": current_user.id}}
     )
+    user_cache.invalidate(user_id)
     await create_audit_log(current_user.id, current_user.full_name, "user", user_id, "delete")
     return {"message": "User deleted successfully"}
 
@@ -2101,8 +2042,9 @@ async def get_auth_audit_logs(
     current_user: User = Depends(require_permission('audit.view'))
 ):
     """Get authentication audit logs - admin only"""
-    logs = await db.auth_audit_logs.find({}, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
-    total_count = await db.auth_audit_logs.count_documents({})
+    await audit_sink.flush()  # include records still buffered
+    collections = await audit_partitions.read_collections("auth_audit_logs")
+    logs, total_count = await audit_partitions.find(collections, {}, "timestamp", skip, limit, {"_id": 0})
     
     return {
         "logs": logs,
@@ -2146,6 +2088,7 @@ async def change_password(user_id: str, password_data: dict, current_user: User
     
     hashed_password = pwd_context.hash(new_password)
     await db.users.update_one({"id": user_id}, {"$set": {"hashed_password": hashed_password}})
+    user_cache.invalidate(user_id)
     await create_audit_log(current_user.id, current_user.full_name, "user", user_id, "password_change")
     
     # Log password change
@@ -2343,6 +2286,8 @@ async def get_stock_movements(
     header_id: Optional[str] = None,
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     current_user: User = Depends(require_permission('inventory.view'))
 ):
     if not user_has_permission(current_user, 'inventory.view'):
@@ -2352,30 +2297,12 @@ async def get_stock_movements(
     if header_id:
         query['header_id'] = header_id
     
-    # Get total count
-    total_count = await db.stock_movements.count_documents(query)
-    
-    # Calculate pagination
-    total_pages = (total_count + page_size - 1) // page_size
-    skip = (page - 1) * page_size
-    
-    # Get paginated movements
-    movements = await db.stock_movements.find(query, {"_id": 0}).sort("date", -1).skip(skip).limit(page_size).to_list(page_size)
-    
-    # Convert Decimal128 to float for JSON serialization
-    movements = [decimal_to_float(movement) for movement in movements]
+    # Get paginated movements (page-number or cursor mode, see pagination.py)
+    movements, page_info = await paginate_find(
+        db.stock_movements, query, "date", page, page_size, cursor, count, {"_id": 0}
+    )
     
-    return {
-        "items": movements,
-        "pagination": {
-            "page": page,
-            "page_size": page_size,
-            "total_count": total_count,
-            "total_pages": total_pages,
-            "has_next": page < total_pages,
-            "has_prev": page > 1
-        }
-    }
+    return create_pagination_response(movements, **page_info)
 
 @api_router.post("/inventory/movements", response_model=StockMovement, status_code=201)
 async def create_stock_movement(movement_data: dict, current_user: User = Depends(require_permission('inventory.adjust'))):
@@ -2448,6 +2375,7 @@ async def create_stock_movement(movement_data: dict, current_user: User = Depend
     # Insert stock movement for audit trail with Decimal128 conversion
     movement_dict = convert_stock_movement_to_decimal(movement.model_dump())
     await db.stock_movements.insert_one(movement_dict)
+    await invalidate_inventory_snapshots(db, [movement_dict])
     
     # Create audit log for manual inventory adjustment
     await create_audit_log(
@@ -2465,22 +2393,11 @@ async def create_stock_movement(movement_data: dict, current_user: User = Depend
         }
     )
     
-    # DIRECT UPDATE: Update header's current quantity and weight
-    new_qty = header.get('current_qty', 0) + qty_delta
-    new_weight = header.get('current_weight', 0) + weight_delta
-    
-    # Validate stock doesn't go negative (safety check, should not happen with positive deltas)
-    if new_qty < 0 or new_weight < 0:
-        # Delete the movement we just created
-        await db.stock_movements.delete_one({"id": movement.id})
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Insufficient stock. Available: {header.get('current_qty', 0)} qty, {header.get('current_weight', 0)}g. Requested: {abs(qty_delta)} qty, {abs(weight_delta)}g"
-        )
-    
+    # Atomic increment: deltas are validated non-negative above, and $inc
+    # cannot overwrite a concurrent invoice decrement the way read-then-$set could
     await db.inventory_headers.update_one(
         {"id": movement_data['header_id']},
-        {"$set": {"current_qty": new_qty, "current_weight": new_weight}}
+        {"$inc": {"current_qty": qty_delta, "current_weight": weight_delta}}
     )
     
     await create_audit_log(current_user.id, current_user.full_name, "stock_movement", movement.id, "create", 
@@ -2525,28 +2442,38 @@ async def delete_stock_movement(movement_id: str, current_user: User = Depends(r
     if not header:
         raise HTTPException(status_code=404, detail="Inventory header not found")
     
-    # Calculate reversed values
-    new_qty = header.get('current_qty', 0) - movement['qty_delta']
-    new_weight = header.get('current_weight', 0) - movement['weight_delta']
-    
-    # Validate reversal won't make stock negative
-    if new_qty < 0 or new_weight < 0:
+    # Reverse the stock change with a conditional $inc (as stock_reservations.deduct_stock
+    # does): it only matches while the header still holds the movement's stock
+    qty_delta = safe_float(movement['qty_delta'])
+    weight_delta = safe_float(movement['weight_delta'])
+    reversal = await db.inventory_headers.update_one(
+        {
+            "id": movement['header_id'],
+            "current_qty": {"$gte": qty_delta},
+            "current_weight": {"$gte": weight_delta - WEIGHT_TOLERANCE},
+        },
+        {"$inc": {"current_qty": -qty_delta, "current_weight": -weight_delta}}
+    )
+    # matched, not modified: a zero-delta movement matches but changes nothing
+    if reversal.matched_count == 0:
+        header = await db.inventory_headers.find_one({"id": movement['header_id']}, {"_id": 0}) or header
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot delete movement: would result in negative stock. Current: {header.get('current_qty', 0)} qty, {header.get('current_weight', 0)}g. Movement: {movement['qty_delta']} qty, {movement['weight_delta']}g"
+            detail=f"Cannot delete movement: would result in negative stock. Current: {header.get('current_qty', 0)} qty, {header.get('current_weight', 0)}g. Movement: {qty_delta} qty, {weight_delta}g"
         )
     
-    # Soft delete the movement
-    await db.stock_movements.update_one(
-        {"id": movement_id},
+    # Soft delete the movement; give the stock back if a concurrent request deleted it first
+    deleted = await db.stock_movements.update_one(
+        {"id": movement_id, "is_deleted": False},
         {"$set": {"is_deleted": True}}
     )
-    
-    # Reverse the stock change in header
-    await db.inventory_headers.update_one(
-        {"id": movement['header_id']},
-        {"$set": {"current_qty": new_qty, "current_weight": new_weight}}
-    )
+    if deleted.modified_count == 0:
+        await db.inventory_headers.update_one(
+            {"id": movement['header_id']},
+            {"$inc": {"current_qty": qty_delta, "current_weight": weight_delta}}
+        )
+        raise HTTPException(status_code=404, detail="Stock movement not found")
+    await invalidate_inventory_snapshots(db, [movement])
     
     # Create audit log
     await create_audit_log(
@@ -2571,6 +2498,76 @@ async def delete_stock_movement(movement_id: str, current_user: User = Depends(r
         "reversed_weight": movement['weight_delta']
     }
 
+def parse_stock_as_of(date: str) -> Tuple[datetime, datetime]:
+    """
+    (as_of, end) for a stock-as-of query: a plain YYYY-MM-DD means the end
+    of that UTC day, a timestamp is taken as given; ``end`` is the exclusive
+    bound on movement dates.
+    """
+    try:
+        if len(date) == 10:
+            day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            return day + timedelta(days=1) - timedelta(microseconds=1), day + timedelta(days=1)
+        as_of = datetime.fromisoformat(date.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date. Use YYYY-MM-DD or an ISO 8601 timestamp")
+    if as_of.tzinfo is None:
+        as_of = as_of.replace(tzinfo=timezone.utc)
+    return as_of, as_of + timedelta(microseconds=1)
+
+def stock_as_of_row(header: dict, state: dict) -> dict:
+    return {
+        "header_id": header['id'],
+        "header_name": header.get('name'),
+        "is_deleted": header.get('is_deleted', False),
+        "qty": float(state['qty']),
+        "weight": round(float(state['weight']), 3),
+        "movement_count": state.get('movement_count', 0),
+        "last_movement_id": state.get('last_movement_id'),
+        "last_movement_date": state.get('last_movement_date'),
+        "snapshot_as_of": state.get('as_of'),
+    }
+
+@api_router.get("/inventory/as-of", response_class=BSONJSONResponse)
+async def get_inventory_as_of(date: str, current_user: User = Depends(require_permission('inventory.view'))):
+    """
+    Stock (qty and weight) of every inventory header at a point in time,
+    from the movements dated up to ``date``: the latest snapshot before it
+    plus one aggregation over the movements since (inventory_snapshots.py).
+    Headers deleted since are listed while they held stock at that time.
+    """
+    as_of, end = parse_stock_as_of(date)
+    headers = await db.inventory_headers.find({}, {"_id": 0, "id": 1, "name": 1, "is_deleted": 1}).to_list(None)
+    states = await stock_at(db, [header['id'] for header in headers], end)
+    
+    rows = []
+    for header in sorted(headers, key=lambda h: h.get('name') or ''):
+        state = states[header['id']]
+        if header.get('is_deleted') and not state['qty'] and not state['weight']:
+            continue
+        rows.append(stock_as_of_row(header, state))
+    
+    return {
+        "as_of": as_of,
+        "headers": rows,
+        "totals": {
+            "qty": sum(row['qty'] for row in rows),
+            "weight": round(sum(row['weight'] for row in rows), 3),
+        },
+    }
+
+@api_router.get("/inventory/headers/{header_id}/as-of", response_class=BSONJSONResponse)
+async def get_inventory_header_as_of(header_id: str, date: str,
+                                     current_user: User = Depends(require_permission('inventory.view'))):
+    """Stock (qty and weight) of one inventory header at a point in time"""
+    as_of, end = parse_stock_as_of(date)
+    header = await db.inventory_headers.find_one({"id": header_id}, {"_id": 0, "id": 1, "name": 1, "is_deleted": 1})
+    if not header:
+        raise HTTPException(status_code=404, detail="Inventory header not found")
+    
+    states = await stock_at(db, [header_id], end)
+    return {"as_of": as_of, **stock_as_of_row(header, states[header_id])}
+
 @api_router.get("/inventory/stock-totals")
 async def get_stock_totals(
     page: int = 1,
@@ -2620,75 +2617,19 @@ async def get_stock_totals(
 # ============================================================================
 
 @api_router.get("/dashboard")
-async def get_dashboard(current_user: User = Depends(require_permission('reports.view'))):
+async def get_dashboard(
+    refresh: bool = Query(False, description="Recompute the snapshot instead of serving the stored one"),
+    current_user: User = Depends(require_permission('reports.view'))
+):
     """
     Dashboard endpoint - Returns pre-aggregated statistics
-    Combines data from multiple endpoints for convenience
+    Served from the dashboard snapshot (see dashboard_snapshot.py); the
+    "snapshot" block tells when the figures were computed.
     """
     try:
-        # Get inventory headers count and totals
-        headers = await db.inventory_headers.find({"is_deleted": False}, {"_id": 0}).to_list(1000)
-        # Convert Decimal128 to float for calculations
-        headers = [decimal_to_float(h) for h in headers]
-        total_headers = len(headers)
-        total_stock_weight = sum(h.get('current_weight', 0) for h in headers)
-        total_stock_qty = sum(h.get('current_qty', 0) for h in headers)
-        
-        # Get outstanding summary
-        invoices = await db.invoices.find(
-            {"is_deleted": False, "payment_status": {"$ne": "paid"}}, 
-            {"_id": 0}
-        ).to_list(10000)
-        # Convert Decimal128 to float for calculations
-        invoices = [decimal_to_float(inv) for inv in invoices]
-        total_outstanding = sum(inv.get('balance_due', 0) for inv in invoices)
-        
-        # Get low stock items (qty < 5)
-        low_stock_items = len([h for h in headers if h.get('current_qty', 0) < 5])
-        
-        # Get parties count
-        customers_count = await db.parties.count_documents({"is_deleted": False, "party_type": "customer"})
-        vendors_count = await db.parties.count_documents({"is_deleted": False, "party_type": "vendor"})
-        
-        # Get recent invoices (last 5)
-        recent_invoices = await db.invoices.find(
-            {"is_deleted": False}, 
-            {"_id": 0}
-        ).sort("created_at", -1).limit(5).to_list(5)
-        # Convert Decimal128 to float for JSON serialization
-        recent_invoices = [decimal_to_float(inv) for inv in recent_invoices]
-        
-        # Get job cards count by status
-        total_jobcards = await db.jobcards.count_documents({"is_deleted": False})
-        pending_jobcards = await db.jobcards.count_documents({"is_deleted": False, "status": "pending"})
-        completed_jobcards = await db.jobcards.count_documents({"is_deleted": False, "status": "completed"})
-        
-        return {
-            "inventory": {
-                "total_categories": total_headers,
-                "total_stock_weight_grams": round(total_stock_weight, 3),
-                "total_stock_qty": round(total_stock_qty, 2),
-                "low_stock_items": low_stock_items
-            },
-            "financial": {
-                "total_outstanding_omr": round(total_outstanding, 2),
-                "outstanding_invoices_count": len(invoices)
-            },
-            "parties": {
-                "total_customers": customers_count,
-                "total_vendors": vendors_count,
-                "total": customers_count + vendors_count
-            },
-            "job_cards": {
-                "total": total_jobcards,
-                "pending": pending_jobcards,
-                "completed": completed_jobcards
-            },
-            "recent_activity": {
-                "recent_invoices": recent_invoices[:5]
-            },
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
+        dashboard = await get_dashboard_snapshot(db, force=refresh)
+        dashboard["timestamp"] = datetime.now(timezone.utc).isoformat()
+        return BSONJSONResponse(dashboard)
     except Exception as e:
         logging.error(f"Dashboard error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to load dashboard: {str(e)}")
@@ -2922,6 +2863,8 @@ async def get_parties(
     date_to: Optional[str] = None,
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     current_user: User = Depends(require_permission('parties.view'))
 ):
     """Get parties with server-side filtering and pagination support"""
@@ -2950,16 +2893,12 @@ async def get_parties(
         if date_query:
             query['created_at'] = date_query
     
-    # Calculate skip value
-    skip = (page - 1) * page_size
-    
-    # Get total count for pagination (with filters applied)
-    total_count = await db.parties.count_documents(query)
-    
-    # Get paginated results (with filters applied)
-    parties = await db.parties.find(query, {"_id": 0}).skip(skip).limit(page_size).to_list(page_size)
+    # Get paginated results (with filters applied), newest first
+    parties, page_info = await paginate_find(
+        db.parties, query, "created_at", page, page_size, cursor, count, {"_id": 0}
+    )
     
-    return create_pagination_response(parties, total_count, page, page_size)
+    return create_pagination_response(parties, **page_info)
 
 @api_router.post("/parties", response_model=Party, status_code=201)
 @limiter.limit("1000/hour")  # General authenticated rate limit: 1000 requests per hour
@@ -2991,6 +2930,7 @@ async def create_party(request: Request, party_data: dict, current_user: User =
     
     party = Party(**validated_data.dict(), created_by=current_user.id)
     await db.parties.insert_one(party.model_dump())
+    await ensure_party_balance(db, party.id)
     await create_audit_log(current_user.id, current_user.full_name, "party", party.id, "create")
     return party
 
@@ -3091,20 +3031,10 @@ async def get_party_impact(party_id: str, current_user: User = Depends(require_p
     linked_gold_ledger_count = await db.gold_ledger.count_documents({"party_id": party_id, "is_deleted": False})
     linked_transactions_count = await db.transactions.count_documents({"party_id": party_id, "is_deleted": False})
     
-    # Get outstanding balances
-    money_outstanding = 0
-    invoices = await db.invoices.find({"customer_id": party_id, "is_deleted": False, "status": "finalized"}, {"_id": 0, "balance_due": 1}).to_list(1000)
-    for inv in invoices:
-        money_outstanding += inv.get('balance_due', 0)
-    
-    # Get gold balance
-    gold_entries = await db.gold_ledger.find({"party_id": party_id, "is_deleted": False}, {"_id": 0, "type": 1, "weight_grams": 1}).to_list(1000)
-    gold_balance = 0
-    for entry in gold_entries:
-        if entry.get('type') == 'IN':
-            gold_balance += entry.get('weight_grams', 0)
-        else:
-            gold_balance -= entry.get('weight_grams', 0)
+    # Get outstanding money and gold balances from the materialized party balance
+    balance = await get_party_balance(db, party_id)
+    money_outstanding = balance['invoice_due_from_party'] - balance['invoice_due_to_party']
+    gold_balance = balance['gold_in_grams'] - balance['gold_out_grams']
     
     impact = {
         "party_name": party.get("name"),
@@ -3453,12 +3383,28 @@ async def get_party_ledger(party_id: str, current_user: User = Depends(require_p
     invoices = await db.invoices.find({"customer_id": party_id, "is_deleted": False}, {"_id": 0}).to_list(1000)
     transactions = await db.transactions.find({"party_id": party_id, "is_deleted": False}, {"_id": 0}).to_list(1000)
     
-    outstanding = 0
-    for inv in invoices:
-        outstanding += inv.get('balance_due', 0)
+    # Outstanding covers every finalized invoice, not just the listed ones
+    balance = await get_party_balance(db, party_id)
+    outstanding = round(balance['invoice_due_from_party'] - balance['invoice_due_to_party'], 2)
     
     return {"invoices": invoices, "transactions": transactions, "outstanding": outstanding}
 
+@api_router.get("/parties/{party_id}/timeline")
+async def get_party_ledger_timeline(
+    party_id: str,
+    page_size: int = 50,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(require_permission('parties.view'))
+):
+    """
+    Merged ledger of a party, newest first: invoices, transactions, gold ledger
+    entries and returns with the running money and gold balance after each row.
+    Pass the previous page's next_cursor to continue (see party_ledger.py).
+    """
+    if not cursor and not await db.parties.find_one({"id": party_id, "is_deleted": False}, {"_id": 0, "id": 1}):
+        raise HTTPException(status_code=404, detail="Party not found")
+    return BSONJSONResponse(await party_ledger_timeline(db, party_id, page_size, cursor))
+
 # Gold Ledger Endpoints
 @api_router.post("/gold-ledger", response_model=GoldLedgerEntry, status_code=201)
 async def create_gold_ledger_entry(entry_data: dict, current_user: User = Depends(require_permission('finance.create'))):
@@ -3496,7 +3442,7 @@ async def create_gold_ledger_entry(entry_data: dict, current_user: User = Depend
         created_by=current_user.id
     )
     
-    await db.gold_ledger.insert_one(convert_gold_ledger_to_decimal(entry.model_dump()))
+    await insert_gold_ledger_entry(convert_gold_ledger_to_decimal(entry.model_dump()))
     await create_audit_log(current_user.id, current_user.full_name, "gold_ledger", entry.id, "create")
     return entry
 
@@ -3558,6 +3504,7 @@ async def delete_gold_ledger_entry(entry_id: str, current_user: User = Depends(r
             "deleted_by": current_user.id
         }}
     )
+    await after_gold_ledger_entry_removed(entry)
     
     await create_audit_log(current_user.id, current_user.full_name, "gold_ledger", entry_id, "delete")
     return {"message": "Gold ledger entry deleted successfully"}
@@ -3617,7 +3564,7 @@ async def create_gold_deposit(deposit_data: dict, current_user: User = Depends(r
         created_by=current_user.id
     )
     
-    await db.gold_ledger.insert_one(convert_gold_ledger_to_decimal(entry.model_dump()))
+    await insert_gold_ledger_entry(convert_gold_ledger_to_decimal(entry.model_dump()))
     await create_audit_log(current_user.id, current_user.full_name, "gold_deposit", entry.id, "create")
     return entry
 
@@ -3675,25 +3622,10 @@ async def get_party_gold_summary(party_id: str, current_user: User = Depends(req
     if not party:
         raise HTTPException(status_code=404, detail="Party not found")
     
-    # Get all gold ledger entries for this party
-    entries = await db.gold_ledger.find({"party_id": party_id, "is_deleted": False}, {"_id": 0}).to_list(1000)
-    
-    # Calculate gold balance
-    gold_due_from_party = 0.0  # Party owes shop (IN entries - shop received from party)
-    gold_due_to_party = 0.0     # Shop owes party (OUT entries - shop gave to party)
-    
-    for entry in entries:
-        weight = round(entry.get('weight_grams', 0), 3)
-        if entry.get('type') == 'IN':
-            # Shop received gold from party - party owes shop
-            gold_due_from_party += weight
-        elif entry.get('type') == 'OUT':
-            # Shop gave gold to party - shop owes party
-            gold_due_to_party += weight
-    
-    # Round to 3 decimal places
-    gold_due_from_party = round(gold_due_from_party, 3)
-    gold_due_to_party = round(gold_due_to_party, 3)
+    # Gold balance from the materialized party balance
+    balance = await get_party_balance(db, party_id)
+    gold_due_from_party = round(balance['gold_in_grams'], 3)  # Party owes shop (IN entries - shop received from party)
+    gold_due_to_party = round(balance['gold_out_grams'], 3)   # Shop owes party (OUT entries - shop gave to party)
     net_gold_balance = round(gold_due_from_party - gold_due_to_party, 3)
     
     return {
@@ -3702,7 +3634,7 @@ async def get_party_gold_summary(party_id: str, current_user: User = Depends(req
         "gold_due_from_party": gold_due_from_party,  # Party owes shop
         "gold_due_to_party": gold_due_to_party,      # Shop owes party
         "net_gold_balance": net_gold_balance,        # Positive = party owes shop, Negative = shop owes party
-        "total_entries": len(entries)
+        "total_entries": balance['gold_entry_count']
     }
 
 @api_router.get("/parties/{party_id}/summary")
@@ -3716,51 +3648,19 @@ async def get_party_summary(party_id: str, current_user: User = Depends(require_
     if not party:
         raise HTTPException(status_code=404, detail="Party not found")
     
-    # Get gold ledger entries
-    gold_entries = await db.gold_ledger.find({"party_id": party_id, "is_deleted": False}, {"_id": 0}).to_list(1000)
-    
-    # Calculate gold balances
-    gold_due_from_party = 0.0  # Party owes shop (IN entries)
-    gold_due_to_party = 0.0     # Shop owes party (OUT entries)
+    # Materialized balance: one indexed lookup instead of reading every ledger
+    balance = await get_party_balance(db, party_id)
     
-    for entry in gold_entries:
-        weight = round(entry.get('weight_grams', 0), 3)
-        if entry.get('type') == 'IN':
-            gold_due_from_party += weight
-        elif entry.get('type') == 'OUT':
-            gold_due_to_party += weight
-    
-    gold_due_from_party = round(gold_due_from_party, 3)
-    gold_due_to_party = round(gold_due_to_party, 3)
+    # Gold balances
+    gold_due_from_party = round(balance['gold_in_grams'], 3)  # Party owes shop (IN entries)
+    gold_due_to_party = round(balance['gold_out_grams'], 3)   # Shop owes party (OUT entries)
     net_gold_balance = round(gold_due_from_party - gold_due_to_party, 3)
     
-    # Get invoices for money calculations - ONLY FINALIZED invoices
-    invoices = await db.invoices.find({"customer_id": party_id, "is_deleted": False, "status": "finalized"}, {"_id": 0}).to_list(1000)
-    
-    # Get transactions
-    transactions = await db.transactions.find({"party_id": party_id, "is_deleted": False}, {"_id": 0}).to_list(1000)
-    
-    # Calculate money balances
-    money_due_from_party = 0.0  # Outstanding invoices (party owes shop)
-    money_due_to_party = 0.0     # Credits or vendor payables (shop owes party)
-    
-    # Sum up outstanding invoices
-    for inv in invoices:
-        balance_due = inv.get('balance_due', 0)
-        if balance_due > 0:
-            money_due_from_party += balance_due
-        elif balance_due < 0:
-            # Negative balance means shop owes party (overpayment/credit)
-            money_due_to_party += abs(balance_due)
-    
-    # Check transactions for additional credits (vendor payments, etc.)
-    for txn in transactions:
-        # If transaction is credit type and to this party, shop owes them
-        if txn.get('transaction_type') == 'credit':
-            money_due_to_party += txn.get('amount', 0)
-    
-    money_due_from_party = round(money_due_from_party, 2)
-    money_due_to_party = round(money_due_to_party, 2)
+    # Money balances - ONLY FINALIZED invoices
+    # Party owes shop: positive balance_due on invoices
+    money_due_from_party = round(balance['invoice_due_from_party'], 2)
+    # Shop owes party: negative balance_due (overpayment/credit) plus credit transactions to this party
+    money_due_to_party = round(balance['invoice_due_to_party'] + balance['credit_transaction_total'], 2)
     net_money_balance = round(money_due_from_party - money_due_to_party, 2)
     
     # Clean party data for response
@@ -3780,14 +3680,14 @@ async def get_party_summary(party_id: str, current_user: User = Depends(require_
             "gold_due_from_party": gold_due_from_party,
             "gold_due_to_party": gold_due_to_party,
             "net_gold_balance": net_gold_balance,
-            "total_entries": len(gold_entries)
+            "total_entries": balance['gold_entry_count']
         },
         "money": {
             "money_due_from_party": money_due_from_party,
             "money_due_to_party": money_due_to_party,
             "net_money_balance": net_money_balance,
-            "total_invoices": len(invoices),
-            "total_transactions": len(transactions)
+            "total_invoices": balance['finalized_invoice_count'],
+            "total_transactions": balance['transaction_count']
         }
     }
 
@@ -4031,6 +3931,7 @@ async def create_purchase(request: Request, purchase_data: dict, current_user: U
     
     # Set creation and finalization metadata
     finalize_time = datetime.now(timezone.utc)
+    purchase_data["purchase_number"] = await next_sequence_number(db, "purchase")
     purchase_data["created_by"] = current_user.username
     purchase_data["status"] = calculated_status
     purchase_data["finalized_at"] = finalize_time
@@ -4057,104 +3958,90 @@ async def create_purchase(request: Request, purchase_data: dict, current_user: U
     # ========== AUTO-FINALIZATION: CREATE ALL ACCOUNTING ENTRIES ==========
     
     # === OPERATION 1: Create Stock IN movements (for each item or single legacy item) ===
-    if items_list and len(items_list) > 0:
-        # Multiple items: Create separate stock movements for each
-        for item in purchase_data["items"]:
-            purity = purchase_data["valuation_purity_fixed"]  # Always 916
-            header_name = f"Gold {purity // 41.6:.0f}K"  # 916 = 22K
-            
-            header = await db.inventory_headers.find_one({"name": header_name, "is_deleted": False})
-            if not header:
-                # Create new inventory header
-                header = InventoryHeader(
-                    name=header_name,
-                    purity=purity,
-                    current_qty=0,
-                    current_weight=0,
-                    created_by=current_user.username
-                )
-                await db.inventory_headers.insert_one(header.model_dump())
-            
-            # Create Stock IN movement for this item
-            movement = StockMovement(
-                date=purchase.date,
-                movement_type="Stock IN",
-                header_id=header.get("id") if isinstance(header, dict) else header.id,
-                header_name=header_name,
-                description=f"Purchase from {vendor_name}: {item['description']}",
-                qty_delta=1,
-                weight_delta=item["weight_grams"],
-                purity=purity,
-                reference_type="purchase",
-                reference_id=purchase_id,
-                created_by=current_user.username,
-                notes=f"Calculation: Purity Ratio=({item['entered_purity']}/916)={item['entered_purity']/916:.4f} → Adjusted Weight={item['weight_grams']}g×{item['entered_purity']/916:.4f}={item['weight_grams']*item['entered_purity']/916:.3f}g → Converted Weight={item['weight_grams']*item['entered_purity']/916:.3f}g÷{conversion_factor}={item['weight_grams']*item['entered_purity']/916/conversion_factor:.3f}g → Amount={item['weight_grams']*item['entered_purity']/916/conversion_factor:.3f}g×{item['rate_per_gram_22k']}OMR/g={item['calculated_amount']}OMR | Entered purity: {item['entered_purity']}, Stock valuation: {purity}"
-            )
-            movement_dict = convert_stock_movement_to_decimal(movement.model_dump())
-            await db.stock_movements.insert_one(movement_dict)
-            
-            # Update inventory header
-            header_id = header.get("id") if isinstance(header, dict) else header.id
-            await db.inventory_headers.update_one(
-                {"id": header_id},
-                {"$inc": {
-                    "current_qty": 1,
-                    "current_weight": item["weight_grams"]
-                }}
-            )
-    else:
-        # Legacy single item
-        purity = purchase_data["valuation_purity_fixed"]  # Always 916
-        header_name = f"Gold {purity // 41.6:.0f}K"  # 916 = 22K
-        
-        header = await db.inventory_headers.find_one({"name": header_name, "is_deleted": False})
-        if not header:
-            # Create new inventory header
-            header = InventoryHeader(
-                name=header_name,
-                purity=purity,
-                current_qty=0,
-                current_weight=0,
-                created_by=current_user.username
-            )
-            await db.inventory_headers.insert_one(header.model_dump())
-        
-        # Create Stock IN movement
+    # Batched whatever the item count: one header lookup, one insert_many for
+    # the movements and one bulk_write with the summed increments per header
+    purity = purchase_data["valuation_purity_fixed"]  # Always 916
+    header_name = f"Gold {purity // 41.6:.0f}K"  # 916 = 22K
+    
+    header = (await find_inventory_headers([header_name])).get(header_name)
+    if not header:
+        # Create new inventory header
+        header = InventoryHeader(
+            name=header_name,
+            purity=purity,
+            current_qty=0,
+            current_weight=0,
+            created_by=current_user.username
+        ).model_dump()
+        await db.inventory_headers.insert_one(dict(header))
+    
+    movement_docs = []
+    increments: Dict[str, Dict[str, float]] = {}
+    
+    def add_stock_in(description: str, weight: float, notes: str):
         movement = StockMovement(
             date=purchase.date,
             movement_type="Stock IN",
-            header_id=header.get("id") if isinstance(header, dict) else header.id,
+            header_id=header["id"],
             header_name=header_name,
-            description=f"Purchase from {vendor_name}: {purchase_data.get('description', '')}",
+            description=description,
             qty_delta=1,
-            weight_delta=purchase.weight_grams,
+            weight_delta=weight,
             purity=purity,
             reference_type="purchase",
             reference_id=purchase_id,
             created_by=current_user.username,
-            notes=f"Calculation: Purity Ratio=({purchase.entered_purity}/916)={purchase.entered_purity/916:.4f} → Adjusted Weight={purchase.weight_grams}g×{purchase.entered_purity/916:.4f}={purchase.weight_grams*purchase.entered_purity/916:.3f}g → Converted Weight={purchase.weight_grams*purchase.entered_purity/916:.3f}g÷{conversion_factor}={purchase.weight_grams*purchase.entered_purity/916/conversion_factor:.3f}g → Amount={purchase.weight_grams*purchase.entered_purity/916/conversion_factor:.3f}g×{purchase_data.get('rate_per_gram')}OMR/g={purchase_data['amount_total']}OMR | Entered purity: {purchase.entered_purity}, Stock valuation: {purity}"
+            notes=notes
         )
-        movement_dict = convert_stock_movement_to_decimal(movement.model_dump())
-        await db.stock_movements.insert_one(movement_dict)
-        
-        # Update inventory header
-        header_id = header.get("id") if isinstance(header, dict) else header.id
-        await db.inventory_headers.update_one(
-            {"id": header_id},
-            {"$inc": {
-                "current_qty": 1,
-                "current_weight": purchase.weight_grams
-            }}
+        movement_docs.append(convert_stock_movement_to_decimal(movement.model_dump()))
+        totals = increments.setdefault(header["id"], {"current_qty": 0, "current_weight": 0.0})
+        totals["current_qty"] += 1
+        totals["current_weight"] += weight
+    
+    if items_list and len(items_list) > 0:
+        # Multiple items: Create separate stock movements for each
+        for item in purchase_data["items"]:
+            add_stock_in(
+                f"Purchase from {vendor_name}: {item['description']}",
+                item["weight_grams"],
+                f"Calculation: Purity Ratio=({item['entered_purity']}/916)={item['entered_purity']/916:.4f} → Adjusted Weight={item['weight_grams']}g×{item['entered_purity']/916:.4f}={item['weight_grams']*item['entered_purity']/916:.3f}g → Converted Weight={item['weight_grams']*item['entered_purity']/916:.3f}g÷{conversion_factor}={item['weight_grams']*item['entered_purity']/916/conversion_factor:.3f}g → Amount={item['weight_grams']*item['entered_purity']/916/conversion_factor:.3f}g×{item['rate_per_gram_22k']}OMR/g={item['calculated_amount']}OMR | Entered purity: {item['entered_purity']}, Stock valuation: {purity}"
+            )
+    else:
+        # Legacy single item
+        add_stock_in(
+            f"Purchase from {vendor_name}: {purchase_data.get('description', '')}",
+            purchase.weight_grams,
+            f"Calculation: Purity Ratio=({purchase.entered_purity}/916)={purchase.entered_purity/916:.4f} → Adjusted Weight={purchase.weight_grams}g×{purchase.entered_purity/916:.4f}={purchase.weight_grams*purchase.entered_purity/916:.3f}g → Converted Weight={purchase.weight_grams*purchase.entered_purity/916:.3f}g÷{conversion_factor}={purchase.weight_grams*purchase.entered_purity/916/conversion_factor:.3f}g → Amount={purchase.weight_grams*purchase.entered_purity/916/conversion_factor:.3f}g×{purchase_data.get('rate_per_gram')}OMR/g={purchase_data['amount_total']}OMR | Entered purity: {purchase.entered_purity}, Stock valuation: {purity}"
         )
     
+    await db.stock_movements.insert_many(movement_docs)
+    await invalidate_inventory_snapshots(db, movement_docs)
+    await db.inventory_headers.bulk_write([
+        UpdateOne({"id": header_id}, {"$inc": {
+            "current_qty": totals["current_qty"],
+            "current_weight": round(totals["current_weight"], 3)
+        }})
+        for header_id, totals in increments.items()
+    ], ordered=False)
+    
+    # Ledger rows are collected and written with one insert_many per collection
+    new_transactions = []
+    new_gold_entries = []
+    current_year = datetime.now(timezone.utc).year
+    existing_txns = None
+    
+    async def next_txn_number() -> str:
+        nonlocal existing_txns
+        if existing_txns is None:
+            existing_txns = await db.transactions.count_documents({"transaction_number": {"$regex": f"^TXN-{current_year}-"}})
+        existing_txns += 1
+        return f"TXN-{current_year}-{existing_txns:04d}"
+    
     # === OPERATION 2: Create CREDIT transaction if paid_amount_money > 0 ===
     if purchase_data["paid_amount_money"] > 0:
-        current_year = datetime.now(timezone.utc).year
-        existing_txns = await db.transactions.count_documents({"transaction_number": {"$regex": f"^TXN-{current_year}-"}})
-        payment_txn_number = f"TXN-{current_year}-{existing_txns + 1:04d}"
-        
-        account = await db.accounts.find_one({"id": purchase_data["account_id"], "is_deleted": False})
+        payment_txn_number = await next_txn_number()
         
+        # `account` was looked up when validating the payment above
         payment_transaction = Transaction(
             transaction_number=payment_txn_number,
             date=purchase.date,
@@ -4171,15 +4058,7 @@ async def create_purchase(request: Request, purchase_data: dict, current_user: U
             notes=f"Payment for purchase from {vendor_name} ({purchase_data['weight_grams']}g total)",
             created_by=current_user.username
         )
-        # Convert to Decimal128 for precise storage
-        await db.transactions.insert_one(convert_transaction_to_decimal(payment_transaction.model_dump()))
-        
-        # Update account balance
-        delta = -payment_transaction.amount
-        await db.accounts.update_one(
-            {"id": purchase_data["account_id"]}, 
-            {"$inc": {"current_balance": delta}}
-        )
+        new_transactions.append(payment_transaction)
     
     # === OPERATION 3: Create GoldLedgerEntry OUT if advance_in_gold_grams > 0 ===
     # Only for saved vendors (walk-in vendors don't have gold ledger)
@@ -4203,7 +4082,7 @@ async def create_purchase(request: Request, purchase_data: dict, current_user: U
                 notes=f"Advance gold settled in purchase from {vendor_name}",
                 created_by=current_user.username
             )
-            await db.gold_ledger.insert_one(convert_gold_ledger_to_decimal(advance_entry.model_dump()))
+            new_gold_entries.append(convert_gold_ledger_to_decimal(advance_entry.model_dump()))
     
     # === OPERATION 4: Create GoldLedgerEntry IN if exchange_in_gold_grams > 0 ===
     # Only for saved vendors (walk-in vendors don't have gold ledger)
@@ -4227,16 +4106,14 @@ async def create_purchase(request: Request, purchase_data: dict, current_user: U
                 notes=f"Gold exchanged in purchase from {vendor_name}",
                 created_by=current_user.username
             )
-            await db.gold_ledger.insert_one(convert_gold_ledger_to_decimal(exchange_entry.model_dump()))
+            new_gold_entries.append(convert_gold_ledger_to_decimal(exchange_entry.model_dump()))
     
     # === OPERATION 5: Create vendor payable transaction ONLY for balance_due_money ===
     # Only for saved vendors (walk-in vendors don't have payables)
     balance_due = purchase_data["balance_due_money"]
     
     if balance_due > 0 and not is_walk_in and vendor_party_id:
-        current_year = datetime.now(timezone.utc).year
-        existing_txns = await db.transactions.count_documents({"transaction_number": {"$regex": f"^TXN-{current_year}-"}})
-        payable_txn_number = f"TXN-{current_year}-{existing_txns + 1:04d}"
+        payable_txn_number = await next_txn_number()
         
         purchases_account = await db.accounts.find_one({"name": "Purchases", "is_deleted": False})
         if not purchases_account:
@@ -4270,8 +4147,19 @@ async def create_purchase(request: Request, purchase_data: dict, current_user: U
             notes=f"Vendor payable for purchase: {desc}",
             created_by=current_user.username
         )
-        # Convert to Decimal128 for precise storage
-        await db.transactions.insert_one(convert_transaction_to_decimal(payable_transaction.model_dump()))
+        new_transactions.append(payable_transaction)
+    
+    # Decimal128 conversion and derived balances happen in the batch helpers
+    await insert_transactions(new_transactions)
+    await insert_gold_ledger_entries(new_gold_entries)
+    
+    if purchase_data["paid_amount_money"] > 0:
+        # Update account balance
+        delta = -payment_transaction.amount
+        await db.accounts.update_one(
+            {"id": purchase_data["account_id"]}, 
+            {"$inc": {"current_balance": delta}}
+        )
     
     # Create audit log
     audit_changes = {
@@ -4440,7 +4328,7 @@ async def add_payment_to_purchase(
         created_by=current_user.username
     )
     # Convert to Decimal128 for precise storage
-    await db.transactions.insert_one(convert_transaction_to_decimal(payment_transaction.model_dump()))
+    await insert_transaction(payment_transaction)
     
     # Update account balance (CREDIT = money OUT)
     delta = -payment_amount
@@ -4565,9 +4453,6 @@ async def get_purchases(
     # Get paginated results
     purchases = await db.purchases.find(query).sort("date", -1).skip(skip).limit(page_size).to_list(page_size)
     
-    # CRITICAL FIX: Process purchases through decimal_to_float to handle Decimal serialization
-    purchases = [decimal_to_float(p) for p in purchases]
-    
     return create_pagination_response(purchases, total_count, page, page_size)
 
 @api_router.patch("/purchases/{purchase_id}")
@@ -4833,21 +4718,19 @@ async def finalize_purchase(purchase_id: str, current_user: User = Depends(requi
 async def get_jobcards(
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     current_user: User = Depends(require_permission('jobcards.view'))
 ):
-    """Get job cards with pagination support"""
+    """Get job cards with pagination support (page-number or cursor mode)"""
     query = {"is_deleted": False, "card_type": {"$ne": "template"}}
     
-    # Calculate skip value
-    skip = (page - 1) * page_size
-    
-    # Get total count for pagination
-    total_count = await db.jobcards.count_documents(query)
-    
     # Get paginated results, sorted by creation date (newest first)
-    jobcards = await db.jobcards.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(page_size).to_list(page_size)
+    jobcards, page_info = await paginate_find(
+        db.jobcards, query, "created_at", page, page_size, cursor, count, {"_id": 0}
+    )
     
-    return create_pagination_response(jobcards, total_count, page, page_size)
+    return create_pagination_response(jobcards, **page_info)
 
 @api_router.get("/jobcards/{jobcard_id}")
 async def get_jobcard(jobcard_id: str, current_user: User = Depends(require_permission('jobcards.view'))):
@@ -5186,9 +5069,7 @@ async def convert_jobcard_to_invoice(jobcard_id: str, invoice_data: dict, curren
         if not walk_in_name:
             raise HTTPException(status_code=400, detail="walk_in_name is required for walk-in customers")
     
-    year = datetime.now(timezone.utc).year
-    count = await db.invoices.count_documents({"invoice_number": {"$regex": f"^INV-{year}"}})
-    invoice_number = f"INV-{year}-{str(count + 1).zfill(4)}"
+    invoice_number = await next_sequence_number(db, "invoice")
     
     vat_percent = 5.0
     invoice_items = []
@@ -5464,27 +5345,22 @@ async def get_invoices(
     request: Request,
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     current_user: User = Depends(require_permission('invoices.view'))
 ):
-    """Get invoices with pagination support"""
+    """Get invoices with pagination support (page-number or cursor mode)"""
     if not user_has_permission(current_user, 'invoices.view'):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have permission to view invoices")
     
     query = {"is_deleted": False}
     
-    # Calculate skip value
-    skip = (page - 1) * page_size
-    
-    # Get total count for pagination
-    total_count = await db.invoices.count_documents(query)
-    
     # Get paginated results
-    invoices = await db.invoices.find(query, {"_id": 0}).sort("date", -1).skip(skip).limit(page_size).to_list(page_size)
-    
-    # Convert Decimal128 to float for JSON serialization
-    invoices = [decimal_to_float(invoice) for invoice in invoices]
+    invoices, page_info = await paginate_find(
+        db.invoices, query, "date", page, page_size, cursor, count, {"_id": 0}
+    )
     
-    return create_pagination_response(invoices, total_count, page, page_size)
+    return create_pagination_response(invoices, **page_info)
 
 @api_router.get("/invoices/returnable")
 async def get_returnable_invoices(
@@ -5678,7 +5554,7 @@ async def get_invoice(invoice_id: str, current_user: User = Depends(require_perm
     invoice = await db.invoices.find_one({"id": invoice_id, "is_deleted": False}, {"_id": 0})
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    return Invoice(**invoice)
+    return Invoice(**decimal_to_float(invoice))
 
 @api_router.patch("/invoices/{invoice_id}")
 async def update_invoice(invoice_id: str, update_data: dict, current_user: User = Depends(require_permission('invoices.create'))):
@@ -5703,6 +5579,7 @@ async def update_invoice(invoice_id: str, update_data: dict, current_user: User
         del update_data["finalized_at"]
     if "finalized_by" in update_data:
         del update_data["finalized_by"]
+    update_data["updated_at"] = datetime.now(timezone.utc)
     
     await db.invoices.update_one({"id": invoice_id}, {"$set": update_data})
     await create_audit_log(current_user.id, current_user.full_name, "invoice", invoice_id, "update", update_data)
@@ -5776,21 +5653,34 @@ async def finalize_invoice(invoice_id: str, current_user: User = Depends(require
     finalized_at = datetime.now(timezone.utc)
     
     # Step 1: Update invoice to finalized status
-    await db.invoices.update_one(
-        {"id": invoice_id},
+    # Conditional on the status, so concurrent finalizations of one invoice cannot both take stock
+    claimed = await db.invoices.update_one(
+        {"id": invoice_id, "is_deleted": False, "status": {"$ne": "finalized"}},
         {
             "$set": {
                 "status": "finalized",
                 "finalized_at": finalized_at,
-                "finalized_by": current_user.id
+                "finalized_by": current_user.id,
+                "updated_at": finalized_at
             }
         }
     )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=400, detail="Invoice is already finalized")
     
-    # Step 2: DIRECTLY REDUCE from inventory headers and create audit trail
+    # CRITICAL: Status rollback must NOT delete timestamps (audit safety)
+    # Keep finalized_at timestamp for audit trail, only change status
+    unfinalize = {"status": "draft", "finalized_by": None}
+    
+    # Step 2: Reduce inventory headers and create the audit trail, all or nothing
     # ONLY for SALE invoices - SERVICE invoices skip stock deduction entirely
-    stock_errors = []
     if is_sale_invoice:
+        stock_lines = []
+        movements = []
+        # One $in lookup for every category on the invoice
+        headers = await find_inventory_headers(
+            [item.category for item in invoice.items if item.weight > 0], {"_id": 0, "id": 1, "name": 1}
+        )
         for item in invoice.items:
             # CRITICAL FIX: ALWAYS create Stock OUT movement for items with weight > 0
             # This ensures complete audit trail and accurate inventory reports
@@ -5801,34 +5691,12 @@ async def finalize_invoice(invoice_id: str, current_user: User = Depends(require
                 
                 # Try to find matching inventory header for stock reduction
                 if item.category:
-                    header = await db.inventory_headers.find_one(
-                        {"name": item.category, "is_deleted": False}, 
-                        {"_id": 0}
-                    )
+                    header = headers.get(item.category)
                     
                     if header:
                         header_id_for_movement = header['id']
                         header_name_for_movement = header['name']
-                        
-                        # Calculate new stock values
-                        current_qty = header.get('current_qty', 0)
-                        current_weight = header.get('current_weight', 0)
-                        new_qty = current_qty - item.qty
-                        new_weight = current_weight - item.weight
-                        
-                        # Check for insufficient stock
-                        if new_qty < 0 or new_weight < 0:
-                            stock_errors.append(
-                                f"{item.category}: Need {item.qty} qty/{item.weight}g, but only {current_qty} qty/{current_weight}g available"
-                            )
-                            # Continue to next item - don't create movement if insufficient stock
-                            continue
-                        
-                        # DIRECT UPDATE: Reduce from inventory header
-                        await db.inventory_headers.update_one(
-                            {"id": header['id']},
-                            {"$set": {"current_qty": new_qty, "current_weight": new_weight}}
-                        )
+                        stock_lines.append(stock_line(header, item.qty, item.weight, item.category))
                 
                 # CRITICAL: ALWAYS create Stock OUT movement for audit trail
                 # Even if no inventory header exists, the movement must be recorded
@@ -5844,16 +5712,28 @@ async def finalize_invoice(invoice_id: str, current_user: User = Depends(require
                     reference_id=invoice.id,
                     created_by=current_user.id
                 )
-                movement_dict = convert_stock_movement_to_decimal(movement.model_dump())
-                await db.stock_movements.insert_one(movement_dict)
+                movements.append(convert_stock_movement_to_decimal(movement.model_dump()))
         
-        # If there were stock errors, rollback the invoice finalization
-        # CRITICAL: Status rollback must NOT delete timestamps (audit safety)
-        # Keep finalized_at timestamp for audit trail, only change status
-        if stock_errors:
+        # Conditional $inc per header (transaction on a replica set, reservation log otherwise)
+        try:
+            stock_errors = await deduct_stock(
+                db, stock_lines, movements,
+                reference={"type": "invoice", "id": invoice_id},
+                compensate={"collection": "invoices", "filter": {"id": invoice_id, "status": "finalized"},
+                            "set": unfinalize}
+            )
+        except Exception:
             await db.invoices.update_one(
                 {"id": invoice_id},
-                {"$set": {"status": "draft", "finalized_by": None}}
+                {"$set": {**unfinalize, "updated_at": datetime.now(timezone.utc)}}
+            )
+            raise
+        
+        # If there were stock errors nothing was deducted; rollback the invoice finalization
+        if stock_errors:
+            await db.invoices.update_one(
+                {"id": invoice_id},
+                {"$set": {**unfinalize, "updated_at": datetime.now(timezone.utc)}}
             )
             raise HTTPException(
                 status_code=400,
@@ -5911,6 +5791,7 @@ async def finalize_invoice(invoice_id: str, current_user: User = Depends(require
     
     # Fetch and return updated invoice
     updated_invoice = await db.invoices.find_one({"id": invoice_id}, {"_id": 0})
+    await apply_invoice_change(db, existing, updated_invoice)
     return decimal_to_float(updated_invoice)
 
 @api_router.post("/invoices/{invoice_id}/add-payment")
@@ -6051,7 +5932,7 @@ async def add_payment_to_invoice(
         )
         
         # Insert gold ledger entry with decimal conversion
-        await db.gold_ledger.insert_one(convert_gold_ledger_to_decimal(gold_ledger_entry.model_dump()))
+        await insert_gold_ledger_entry(convert_gold_ledger_to_decimal(gold_ledger_entry.model_dump()))
         
         # Fetch or create default account for gold exchange transactions
         account = await db.accounts.find_one({"name": "Gold Exchange Income", "is_deleted": False}, {"_id": 0})
@@ -6112,7 +5993,7 @@ async def add_payment_to_invoice(
         )
         
         # Insert credit transaction with Decimal128 conversion
-        await db.transactions.insert_one(convert_transaction_to_decimal(credit_transaction.model_dump()))
+        await insert_transaction(credit_transaction)
         
         # Update Gold Exchange Income account balance (increase for credit on income)
         await db.accounts.update_one(
@@ -6173,33 +6054,19 @@ async def add_payment_to_invoice(
             gold_stock_errors = []
             
             if is_sale_invoice:
+                stock_lines = []
+                movements = []
+                # One $in lookup for every category on the invoice
+                headers = await find_inventory_headers(
+                    [item.category for item in invoice.items if item.weight > 0], {"_id": 0, "id": 1, "name": 1}
+                )
                 for item in invoice.items:
                     if item.weight > 0 and item.category:
                         # Find the inventory header by category name
-                        header = await db.inventory_headers.find_one(
-                            {"name": item.category, "is_deleted": False}, 
-                            {"_id": 0}
-                        )
+                        header = headers.get(item.category)
                         
                         if header:
-                            # Calculate new stock values
-                            current_qty = header.get('current_qty', 0)
-                            current_weight = header.get('current_weight', 0)
-                            new_qty = current_qty - item.qty
-                            new_weight = current_weight - item.weight
-                            
-                            # Check for insufficient stock
-                            if new_qty < 0 or new_weight < 0:
-                                gold_stock_errors.append(
-                                    f"{item.category}: Need {item.qty} qty/{item.weight}g, but only {current_qty} qty/{current_weight}g available"
-                                )
-                                continue
-                            
-                            # DIRECT UPDATE: Reduce from inventory header
-                            await db.inventory_headers.update_one(
-                                {"id": header['id']},
-                                {"$set": {"current_qty": new_qty, "current_weight": new_weight}}
-                            )
+                            stock_lines.append(stock_line(header, item.qty, item.weight, item.category))
                             
                             # Create stock movement for audit trail
                             movement = StockMovement(
@@ -6214,8 +6081,12 @@ async def add_payment_to_invoice(
                                 reference_id=invoice.id,
                                 created_by=current_user.id
                             )
-                            movement_dict = convert_stock_movement_to_decimal(movement.model_dump())
-                            await db.stock_movements.insert_one(movement_dict)
+                            movements.append(convert_stock_movement_to_decimal(movement.model_dump()))
+                
+                # Conditional $inc per header, all or nothing (see stock_reservations)
+                gold_stock_errors = await deduct_stock(
+                    db, stock_lines, movements, reference={"type": "invoice", "id": invoice.id}
+                )
             
             # If stock errors occurred, rollback finalization but keep payment
             if gold_stock_errors:
@@ -6273,10 +6144,12 @@ async def add_payment_to_invoice(
                     }
                 )
         
+        update_data["updated_at"] = datetime.now(timezone.utc)
         await db.invoices.update_one(
             {"id": invoice_id},
             {"$set": update_data}
         )
+        await apply_invoice_change(db, existing, {**existing, **update_data})
         
         # Create audit logs
         await create_audit_log(
@@ -6410,7 +6283,7 @@ async def add_payment_to_invoice(
         )
         
         # Insert debit transaction with Decimal128 conversion
-        await db.transactions.insert_one(convert_transaction_to_decimal(debit_transaction.model_dump()))
+        await insert_transaction(debit_transaction)
         
         # Update Cash/Bank account balance (increase for debit on asset)
         await db.accounts.update_one(
@@ -6451,7 +6324,7 @@ async def add_payment_to_invoice(
         )
         
         # Insert credit transaction with Decimal128 conversion
-        await db.transactions.insert_one(convert_transaction_to_decimal(credit_transaction.model_dump()))
+        await insert_transaction(credit_transaction)
         
         # Update Sales Income account balance (increase for credit on income)
         await db.accounts.update_one(
@@ -6512,33 +6385,19 @@ async def add_payment_to_invoice(
             stock_errors = []
             
             if is_sale_invoice:
+                stock_lines = []
+                movements = []
+                # One $in lookup for every category on the invoice
+                headers = await find_inventory_headers(
+                    [item.category for item in invoice.items if item.weight > 0], {"_id": 0, "id": 1, "name": 1}
+                )
                 for item in invoice.items:
                     if item.weight > 0 and item.category:
                         # Find the inventory header by category name
-                        header = await db.inventory_headers.find_one(
-                            {"name": item.category, "is_deleted": False}, 
-                            {"_id": 0}
-                        )
+                        header = headers.get(item.category)
                         
                         if header:
-                            # Calculate new stock values
-                            current_qty = header.get('current_qty', 0)
-                            current_weight = header.get('current_weight', 0)
-                            new_qty = current_qty - item.qty
-                            new_weight = current_weight - item.weight
-                            
-                            # Check for insufficient stock
-                            if new_qty < 0 or new_weight < 0:
-                                stock_errors.append(
-                                    f"{item.category}: Need {item.qty} qty/{item.weight}g, but only {current_qty} qty/{current_weight}g available"
-                                )
-                                continue
-                            
-                            # DIRECT UPDATE: Reduce from inventory header
-                            await db.inventory_headers.update_one(
-                                {"id": header['id']},
-                                {"$set": {"current_qty": new_qty, "current_weight": new_weight}}
-                            )
+                            stock_lines.append(stock_line(header, item.qty, item.weight, item.category))
                             
                             # Create stock movement for audit trail
                             movement = StockMovement(
@@ -6553,8 +6412,12 @@ async def add_payment_to_invoice(
                                 reference_id=invoice.id,
                                 created_by=current_user.id
                             )
-                            movement_dict = convert_stock_movement_to_decimal(movement.model_dump())
-                            await db.stock_movements.insert_one(movement_dict)
+                            movements.append(convert_stock_movement_to_decimal(movement.model_dump()))
+                
+                # Conditional $inc per header, all or nothing (see stock_reservations)
+                stock_errors = await deduct_stock(
+                    db, stock_lines, movements, reference={"type": "invoice", "id": invoice.id}
+                )
             
             # If stock errors occurred, rollback finalization but keep payment
             if stock_errors:
@@ -6611,10 +6474,12 @@ async def add_payment_to_invoice(
                     }
                 )
         
+        update_data["updated_at"] = datetime.now(timezone.utc)
         await db.invoices.update_one(
             {"id": invoice_id},
             {"$set": update_data}
         )
+        await apply_invoice_change(db, existing, {**existing, **update_data})
         
         # Create audit logs for both transactions (double-entry)
         await create_audit_log(
@@ -6746,112 +6611,20 @@ async def delete_invoice(invoice_id: str, current_user: User = Depends(require_p
     
     await db.invoices.update_one(
         {"id": invoice_id},
-        {"$set": {"is_deleted": True}}
+        {"$set": {"is_deleted": True, "updated_at": datetime.now(timezone.utc)}}
     )
     await create_audit_log(current_user.id, current_user.full_name, "invoice", invoice_id, "delete")
     return {"message": "Invoice deleted successfully"}
 
 @api_router.get("/invoices/{invoice_id}/pdf")
 async def generate_invoice_pdf(invoice_id: str, current_user: User = Depends(require_permission('invoices.view'))):
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    
     invoice = await db.invoices.find_one({"id": invoice_id, "is_deleted": False}, {"_id": 0})
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    p.setFont("Helvetica-Bold", 20)
-    p.drawString(50, height - 50, "Gold Shop ERP")
-    p.setFont("Helvetica", 10)
-    p.drawString(50, height - 70, "The Artisan Ledger")
-    
-    # Invoice details
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(50, height - 120, f"Invoice #{invoice.get('invoice_number', '')}")
-    p.setFont("Helvetica", 10)
-    invoice_date = invoice.get('date', '')
-    if isinstance(invoice_date, str):
-        date_str = invoice_date[:10]
-    else:
-        date_str = str(invoice_date)[:10]
-    p.drawString(50, height - 140, f"Date: {date_str}")
-    p.drawString(50, height - 155, f"Customer: {invoice.get('customer_name', 'N/A')}")
-    p.drawString(50, height - 170, f"Type: {invoice.get('invoice_type', 'sale').upper()}")
-    p.drawString(50, height - 185, f"Status: {invoice.get('payment_status', 'unpaid').upper()}")
-    
-    # Items table
-    y_position = height - 230
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(50, y_position, "Item")
-    p.drawString(250, y_position, "Qty")
-    p.drawString(300, y_position, "Weight")
-    p.drawString(370, y_position, "Rate")
-    p.drawString(450, y_position, "Total")
-    
-    p.setFont("Helvetica", 9)
-    y_position -= 20
-    
-    for item in invoice.get('items', []):
-        p.drawString(50, y_position, item.get('description', '')[:30])
-        p.drawString(250, y_position, str(item.get('qty', 0)))
-        p.drawString(300, y_position, f"{item.get('weight', 0)}g")
-        p.drawString(370, y_position, f"{item.get('metal_rate', 0):.2f}")
-        p.drawString(450, y_position, f"{item.get('line_total', 0):.2f}")
-        y_position -= 15
-        
-        if y_position < 100:
-            p.showPage()
-            y_position = height - 50
-    
-    # Totals
-    y_position -= 20
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(370, y_position, "Subtotal:")
-    p.drawString(450, y_position, f"{invoice.get('subtotal', 0):.2f} OMR")
-    
-    # MODULE 7: Add discount line if discount exists
-    discount_amount = invoice.get('discount_amount', 0)
-    if discount_amount > 0:
-        y_position -= 15
-        p.setFont("Helvetica", 10)
-        p.drawString(370, y_position, "Discount:")
-        p.drawString(450, y_position, f"-{discount_amount:.2f} OMR")
-    
-    y_position -= 15
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(370, y_position, "VAT:")
-    p.drawString(450, y_position, f"{invoice.get('vat_total', 0):.2f} OMR")
-    y_position -= 15
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(370, y_position, "Grand Total:")
-    p.drawString(450, y_position, f"{invoice.get('grand_total', 0):.2f} OMR")
-    y_position -= 15
-    p.setFont("Helvetica", 10)
-    p.drawString(370, y_position, "Balance Due:")
-    p.drawString(450, y_position, f"{invoice.get('balance_due', 0):.2f} OMR")
-    
-    # Footer
-    p.setFont("Helvetica-Oblique", 8)
-    p.drawString(50, 50, "Thank you for your business!")
-    
-    p.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=invoice_{invoice.get('invoice_number', 'unknown')}.pdf"}
-    )
+    # Rendered in the PDF pool; cached until the invoice's updated_at changes
+    pdf = await get_invoice_pdf(decimal_to_float(invoice))
+    return pdf_response(pdf, f"invoice_{invoice.get('invoice_number', 'unknown')}.pdf")
 
 @api_router.get("/invoices/{invoice_id}/full-details")
 async def get_invoice_full_details(invoice_id: str, current_user: User = Depends(require_permission('invoices.view'))):
@@ -6927,9 +6700,7 @@ async def create_invoice(invoice_data: dict, current_user: User = Depends(requir
     if not user_has_permission(current_user, 'invoices.create'):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have permission to create invoices")
     
-    year = datetime.now(timezone.utc).year
-    count = await db.invoices.count_documents({"invoice_number": {"$regex": f"^INV-{year}"}})
-    invoice_number = f"INV-{year}-{str(count + 1).zfill(4)}"
+    invoice_number = await next_sequence_number(db, "invoice")
     
     # Remove conflicting keys and add required fields
     invoice_data_clean = {k: v for k, v in invoice_data.items() if k not in ['invoice_number', 'created_by']}
@@ -6968,7 +6739,7 @@ async def create_invoice(invoice_data: dict, current_user: User = Depends(requir
                 notes=f"Gold received for invoice {invoice_number}. Rate: {invoice.gold_received_rate:.2f} OMR/g, Value: {gold_value:.2f} OMR",
                 created_by=current_user.id
             )
-            await db.gold_ledger.insert_one(convert_gold_ledger_to_decimal(gold_ledger_entry.model_dump()))
+            await insert_gold_ledger_entry(convert_gold_ledger_to_decimal(gold_ledger_entry.model_dump()))
             
             # Create Money Transaction for gold value (DEBIT - money IN equivalent)
             year = datetime.now(timezone.utc).year
@@ -7007,7 +6778,7 @@ async def create_invoice(invoice_data: dict, current_user: User = Depends(requir
                 reference_id=invoice.id,
                 created_by=current_user.id
             )
-            await db.transactions.insert_one(convert_transaction_to_decimal(transaction.model_dump()))
+            await insert_transaction(transaction)
             
             # Update account balance
             await db.accounts.update_one(
@@ -7129,6 +6900,8 @@ async def delete_account(request: Request, account_id: str, current_user: User =
 async def get_transactions(
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     account_id: Optional[str] = None,
     account_type: Optional[str] = None,  # "cash" or "bank"
     transaction_type: Optional[str] = None,  # "credit" or "debit"
@@ -7174,16 +6947,12 @@ async def get_transactions(
             query["account_id"] = {"$in": account_ids}
         else:
             # No accounts of this type exist, return empty
-            return create_pagination_response([], 0, page, page_size)
-    
-    # Calculate skip value
-    skip = (page - 1) * page_size
-    
-    # Get total count for pagination
-    total_count = await db.transactions.count_documents(query)
+            return create_pagination_response([], 0, page, page_size, cursor=cursor)
     
     # Get paginated results sorted by date (newest first)
-    transactions = await db.transactions.find(query, {"_id": 0}).sort("date", -1).skip(skip).limit(page_size).to_list(page_size)
+    transactions, page_info = await paginate_find(
+        db.transactions, query, "date", page, page_size, cursor, count
+    )
     
     # Enhance each transaction with account type and running balance
     account_cache = {}
@@ -7212,60 +6981,18 @@ async def get_transactions(
         else:
             txn['transaction_source'] = 'Manual Entry'
     
-    # Calculate running balance for display
-    # For simplicity, we'll calculate the balance at the time of transaction
-    # by getting all transactions for that account up to that date
+    # Running balance per transaction, read from checkpoints instead of
+    # replaying the account history (see running_balances.py)
+    opening_balances = {
+        account_id: account.get('opening_balance')
+        for account_id, account in account_cache.items()
+    }
+    balances = await compute_running_balances(db, transactions, opening_balances)
     for txn in transactions:
-        # Get all transactions for this account up to and including this transaction date
-        prior_txns = await db.transactions.find({
-            "account_id": txn['account_id'],
-            "is_deleted": False,
-            "date": {"$lte": txn['date']}
-        }, {"_id": 0}).sort("date", 1).to_list(10000)
-        
-        # Get the account's opening balance
-        account = account_cache.get(txn['account_id'])
-        if account:
-            # Convert Decimal128 to float for calculations
-            if isinstance(account['opening_balance'], Decimal128):
-                running_balance = float(account['opening_balance'].to_decimal())
-            else:
-                running_balance = float(account['opening_balance']) if account['opening_balance'] is not None else 0.0
-        else:
-            running_balance = 0.0
-        
-        # Calculate running balance up to current transaction
-        balance_before = running_balance
-        for pt in prior_txns:
-            # Convert Decimal128 to float for calculations
-            if isinstance(pt['amount'], Decimal128):
-                amount = float(pt['amount'].to_decimal())
-            else:
-                amount = float(pt['amount']) if pt['amount'] is not None else 0.0
-            
-            if pt['transaction_type'] == 'credit':
-                running_balance += amount
-            else:
-                running_balance -= amount
-            
-            # If this is the current transaction, capture before and after
-            if pt['id'] == txn['id']:
-                # Convert Decimal128 to float for calculations
-                if isinstance(txn['amount'], Decimal128):
-                    txn_amount = float(txn['amount'].to_decimal())
-                else:
-                    txn_amount = float(txn['amount']) if txn['amount'] is not None else 0.0
-                
-                if txn['transaction_type'] == 'credit':
-                    balance_before = running_balance - txn_amount
-                else:
-                    balance_before = running_balance + txn_amount
-                break
-        
-        txn['balance_before'] = round(balance_before, 3)
-        txn['balance_after'] = round(running_balance, 3)
+        txn.pop('_id', None)
+        txn['balance_before'], txn['balance_after'] = balances[txn['id']]
     
-    return create_pagination_response(transactions, total_count, page, page_size)
+    return create_pagination_response(transactions, **page_info)
 
 @api_router.post("/transactions", response_model=Transaction)
 async def create_transaction(transaction_data: dict, current_user: User = Depends(require_permission('finance.create'))):
@@ -7304,7 +7031,7 @@ async def create_transaction(transaction_data: dict, current_user: User = Depend
         created_by=current_user.id
     )
     
-    await db.transactions.insert_one(convert_transaction_to_decimal(transaction.model_dump()))
+    await insert_transaction(transaction)
     
     # Calculate balance delta using account-type-aware logic
     account_type = account.get('account_type', 'asset')
@@ -7349,64 +7076,37 @@ async def get_transactions_summary(
     - Cash vs Bank breakdown
     """
     try:
-        query = {"is_deleted": False}
-        
         # Date range filter
-        if start_date or end_date:
-            date_query = {}
-            if start_date:
-                try:
-                    date_query["$gte"] = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                except ValueError:
-                    raise HTTPException(status_code=400, detail="Invalid start_date format")
-            if end_date:
-                try:
-                    date_query["$lte"] = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                except ValueError:
-                    raise HTTPException(status_code=400, detail="Invalid end_date format")
-            if date_query:
-                query["date"] = date_query
-        
-        # Account filter
-        if account_id:
-            query["account_id"] = account_id
-        
-        # Get all transactions matching the query
-        transactions = await db.transactions.find(query, {"_id": 0}).to_list(10000)
-        
-        # Calculate totals
-        total_credit = 0.0
-        total_debit = 0.0
+        range_start = None
+        range_end = None
+        if start_date:
+            try:
+                range_start = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid start_date format")
+        if end_date:
+            try:
+                range_end = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid end_date format")
+        
+        # Per-account sums from the daily rollups (non-credit types count as debit)
+        per_account = await rollup_totals(db, range_start, range_end, account_id)
+        totals = sum_totals(per_account)
+        total_credit = float(totals['credit_total'])
+        total_debit = float(totals['debit_total'] + totals['other_total'])
+        transaction_count = totals['credit_count'] + totals['debit_count'] + totals['other_count']
         account_breakdown = {}
         
-        for txn in transactions:
-            try:
-                txn_type = txn.get('transaction_type', 'debit')
-                amount = float(txn.get('amount', 0))
-                
-                if txn_type == 'credit':
-                    total_credit += amount
-                else:
-                    total_debit += amount
-                
-                # Account-wise breakdown
-                acc_id = txn.get('account_id')
-                if acc_id:
-                    if acc_id not in account_breakdown:
-                        account_breakdown[acc_id] = {
-                            'account_id': acc_id,
-                            'account_name': txn.get('account_name', 'Unknown'),
-                            'credit': 0.0,
-                            'debit': 0.0
-                        }
-                    
-                    if txn_type == 'credit':
-                        account_breakdown[acc_id]['credit'] += amount
-                    else:
-                        account_breakdown[acc_id]['debit'] += amount
-            except (KeyError, TypeError, ValueError) as e:
-                # Skip malformed transaction
-                continue
+        for acc_id, figures in per_account.items():
+            # Account-wise breakdown
+            if acc_id:
+                account_breakdown[acc_id] = {
+                    'account_id': acc_id,
+                    'account_name': 'Unknown',
+                    'credit': float(figures['credit_total']),
+                    'debit': float(figures['debit_total'] + figures['other_total'])
+                }
         
         # Get accounts to determine cash vs bank
         try:
@@ -7470,7 +7170,7 @@ async def get_transactions_summary(
             "net_flow": round(net_flow, 3),
             "total_in": round(total_in, 3),  # Money IN to cash/bank accounts
             "total_out": round(total_out, 3),  # Money OUT from cash/bank accounts
-            "transaction_count": len(transactions),
+            "transaction_count": transaction_count,
             "cash_summary": {
                 "credit": round(cash_credit, 3),
                 "debit": round(cash_debit, 3),
@@ -7656,18 +7356,10 @@ async def calculate_daily_closing(date: str, current_user: User = Depends(requir
         )
         opening_cash = previous_closing['actual_closing'] if previous_closing else 0.0
         
-        # Get all transactions for the target date
-        transactions = await db.transactions.find(
-            {
-                "date": {"$gte": start_of_day, "$lte": end_of_day},
-                "is_deleted": False
-            },
-            {"_id": 0}
-        ).to_list(None)
-        
-        # Calculate total credit and debit
-        total_credit = sum(t['amount'] for t in transactions if t['transaction_type'] == 'credit')
-        total_debit = sum(t['amount'] for t in transactions if t['transaction_type'] == 'debit')
+        # The day's credit/debit totals from its daily rollups
+        totals = sum_totals(await rollup_totals(db, start_of_day, end_of_day))
+        total_credit = float(totals['credit_total'])
+        total_debit = float(totals['debit_total'])
         
         # Round to 3 decimal places (OMR standard)
         opening_cash = round(opening_cash, 3)
@@ -7681,9 +7373,9 @@ async def calculate_daily_closing(date: str, current_user: User = Depends(requir
             "total_credit": total_credit,
             "total_debit": total_debit,
             "expected_closing": expected_closing,
-            "transaction_count": len(transactions),
-            "credit_count": sum(1 for t in transactions if t['transaction_type'] == 'credit'),
-            "debit_count": sum(1 for t in transactions if t['transaction_type'] == 'debit'),
+            "transaction_count": totals['credit_count'] + totals['debit_count'] + totals['other_count'],
+            "credit_count": totals['credit_count'],
+            "debit_count": totals['debit_count'],
             "has_previous_closing": previous_closing is not None
         }
     except ValueError:
@@ -7746,6 +7438,8 @@ async def get_audit_logs(
     date_to: Optional[str] = None,
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     current_user: User = Depends(require_permission('audit.view'))
 ):
     """
@@ -7759,8 +7453,11 @@ async def get_audit_logs(
     - date_to: Filter logs up to this date (ISO format: YYYY-MM-DD)
     - page: Page number (default: 1)
     - page_size: Items per page (default: 10)
+    - cursor: Keyset mode - empty for the first page, then the previous next_cursor
+    - count: Total count in cursor mode - exact, estimated (default) or none
     """
     query = {}
+    from_date = to_date = None
     
     # Module filter
     if module:
@@ -7794,16 +7491,15 @@ async def get_audit_logs(
         if date_query:
             query['timestamp'] = date_query
     
-    # Calculate skip value
-    skip = (page - 1) * page_size
-    
-    # Get total count for pagination
-    total_count = await db.audit_logs.count_documents(query)
-    
-    # Get paginated results
-    logs = await db.audit_logs.find(query, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(page_size).to_list(page_size)
+    # Get paginated results (flushing records still buffered first) from
+    # the month partitions covering the date range only
+    await audit_sink.flush()
+    collections = await audit_partitions.read_collections("audit_logs", from_date, to_date)
+    logs, page_info = await audit_partitions.paginate(
+        collections, query, "timestamp", page, page_size, cursor, count, {"_id": 0}
+    )
     
-    return create_pagination_response(logs, total_count, page, page_size)
+    return create_pagination_response(logs, **page_info)
 
 @api_router.get("/reports/inventory-export")
 async def export_inventory(
@@ -7813,11 +7509,6 @@ async def export_inventory(
     category: Optional[str] = None,
     current_user: User = Depends(require_permission('reports.view'))
 ):
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, PatternFill
-    
     # Build query with filters
     query = {"is_deleted": False}
     if start_date:
@@ -7833,95 +7524,52 @@ async def export_inventory(
     if category:
         query['header_name'] = category
     
-    # Get filtered inventory data
-    movements = await db.stock_movements.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    
-    # Create workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Inventory Movements"
-    
-    # Headers
-    headers = ["Date", "Type", "Category", "Description", "Quantity", "Weight (g)", "Purity", "Notes"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.font = Font(color="FFFFFF", bold=True)
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Data
-    for row_idx, movement in enumerate(movements, 2):
-        ws.cell(row=row_idx, column=1, value=str(movement.get('date', ''))[:10])
-        ws.cell(row=row_idx, column=2, value=movement.get('movement_type', ''))
-        ws.cell(row=row_idx, column=3, value=movement.get('header_name', ''))
-        ws.cell(row=row_idx, column=4, value=movement.get('description', ''))
-        ws.cell(row=row_idx, column=5, value=movement.get('qty_delta', 0))
-        ws.cell(row=row_idx, column=6, value=movement.get('weight_delta', 0))
-        ws.cell(row=row_idx, column=7, value=movement.get('purity', 0))
-        ws.cell(row=row_idx, column=8, value=movement.get('notes', ''))
-    
-    # Adjust column widths
-    for col in range(1, 9):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=inventory_export.xlsx"}
+    # Stream filtered movements into a write-only workbook (no row cap)
+    export = ExcelExport()
+    ws = export.sheet(
+        "Inventory Movements",
+        headers=["Date", "Type", "Category", "Description", "Quantity", "Weight (g)", "Purity", "Notes"],
+        widths=[15] * 8
     )
+    await export.write_rows(ws, db.stock_movements.find(query, {"_id": 0}).sort("date", -1), lambda movement: [
+        str(movement.get('date', ''))[:10],
+        movement.get('movement_type', ''),
+        movement.get('header_name', ''),
+        movement.get('description', ''),
+        movement.get('qty_delta', 0),
+        movement.get('weight_delta', 0),
+        movement.get('purity', 0),
+        movement.get('notes', ''),
+    ])
+    
+    return await export.response("inventory_export.xlsx")
 
 @api_router.get("/reports/parties-export")
 async def export_parties(
     party_type: Optional[str] = None,
     current_user: User = Depends(require_permission('reports.view'))
 ):
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill
-    
     # Build query with filters
     query = {"is_deleted": False}
     if party_type:
         query['party_type'] = party_type
     
-    parties = await db.parties.find(query, {"_id": 0}).to_list(10000)
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Parties"
-    
-    headers = ["Name", "Phone", "Type", "Address", "Notes", "Created At"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    
-    for row_idx, party in enumerate(parties, 2):
-        ws.cell(row=row_idx, column=1, value=party.get('name', ''))
-        ws.cell(row=row_idx, column=2, value=party.get('phone', ''))
-        ws.cell(row=row_idx, column=3, value=party.get('party_type', ''))
-        ws.cell(row=row_idx, column=4, value=party.get('address', ''))
-        ws.cell(row=row_idx, column=5, value=party.get('notes', ''))
-        ws.cell(row=row_idx, column=6, value=str(party.get('created_at', ''))[:10])
-    
-    for col in range(1, 7):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 20
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=parties_export.xlsx"}
+    export = ExcelExport()
+    ws = export.sheet(
+        "Parties",
+        headers=["Name", "Phone", "Type", "Address", "Notes", "Created At"],
+        widths=[20] * 6
     )
+    await export.write_rows(ws, db.parties.find(query, {"_id": 0}), lambda party: [
+        party.get('name', ''),
+        party.get('phone', ''),
+        party.get('party_type', ''),
+        party.get('address', ''),
+        party.get('notes', ''),
+        str(party.get('created_at', ''))[:10],
+    ])
+    
+    return await export.response("parties_export.xlsx")
 
 @api_router.get("/reports/invoices-export")
 async def export_invoices(
@@ -7937,13 +7585,10 @@ async def export_invoices(
     - Sheet 2: Line Items (detailed breakdown)
     - Sheet 3: Totals & Statistics
     
-    All numeric columns are proper numbers (not strings) for Excel calculations
+    All numeric columns are proper numbers (not strings) for Excel calculations.
+    Invoices are streamed once; summary and line item rows are written side
+    by side and the totals accumulated on the way.
     """
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    
     # Build query with filters
     query = {"is_deleted": False}
     if start_date:
@@ -7959,177 +7604,106 @@ async def export_invoices(
     if payment_status:
         query['payment_status'] = payment_status
     
-    invoices = await db.invoices.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    
-    # Convert Decimal128 to float for Excel export calculations
-    invoices = [decimal_to_float(inv) for inv in invoices]
-    
-    wb = openpyxl.Workbook()
-    
-    # ===========================================================================
-    # SHEET 1: Invoice Summary
-    # ===========================================================================
-    ws1 = wb.active
-    ws1.title = "Invoice Summary"
-    
-    # Headers with styling
-    summary_headers = [
-        "Invoice #", "Date", "Customer", "Customer Type", "Type", 
-        "Status", "Grand Total", "Paid Amount", "Balance Due", "Payment Status"
-    ]
-    
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    for col, header in enumerate(summary_headers, 1):
-        cell = ws1.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Data rows with proper data types
-    for row_idx, inv in enumerate(invoices, 2):
-        ws1.cell(row=row_idx, column=1, value=inv.get('invoice_number', ''))
-        ws1.cell(row=row_idx, column=2, value=str(inv.get('date', ''))[:10])
-        
-        # Customer name (handle walk-in)
-        customer_name = inv.get('walk_in_name') or inv.get('customer_name', 'N/A')
-        ws1.cell(row=row_idx, column=3, value=customer_name)
-        ws1.cell(row=row_idx, column=4, value=inv.get('customer_type', 'walk_in'))
-        ws1.cell(row=row_idx, column=5, value=inv.get('invoice_type', ''))
-        ws1.cell(row=row_idx, column=6, value=inv.get('status', 'draft'))
-        
-        # Numeric columns (proper numbers, not strings)
-        ws1.cell(row=row_idx, column=7, value=float(inv.get('grand_total', 0)))
-        ws1.cell(row=row_idx, column=8, value=float(inv.get('paid_amount', 0)))
-        ws1.cell(row=row_idx, column=9, value=float(inv.get('balance_due', 0)))
-        ws1.cell(row=row_idx, column=10, value=inv.get('payment_status', ''))
-    
-    # Set column widths
-    ws1.column_dimensions['A'].width = 15
-    ws1.column_dimensions['B'].width = 12
-    ws1.column_dimensions['C'].width = 25
-    ws1.column_dimensions['D'].width = 15
-    ws1.column_dimensions['E'].width = 10
-    ws1.column_dimensions['F'].width = 12
-    ws1.column_dimensions['G'].width = 15
-    ws1.column_dimensions['H'].width = 15
-    ws1.column_dimensions['I'].width = 15
-    ws1.column_dimensions['J'].width = 15
+    export = ExcelExport()
     
     # ===========================================================================
-    # SHEET 2: Invoice Line Items (Detailed)
+    # SHEET 1: Invoice Summary / SHEET 2: Invoice Line Items (Detailed)
     # ===========================================================================
-    ws2 = wb.create_sheet(title="Invoice Line Items")
-    
-    line_item_headers = [
-        "Invoice #", "Date", "Customer", "Item Category", "Description", 
-        "Qty", "Purity", "Weight (g)", "Gold Rate", "Gold Value", 
-        "Making Charge", "VAT %", "VAT Amount", "Line Total"
-    ]
+    ws1 = export.sheet(
+        "Invoice Summary",
+        headers=[
+            "Invoice #", "Date", "Customer", "Customer Type", "Type",
+            "Status", "Grand Total", "Paid Amount", "Balance Due", "Payment Status"
+        ],
+        widths=[15, 12, 25, 15, 10, 12, 15, 15, 15, 15]
+    )
+    ws2 = export.sheet(
+        "Invoice Line Items",
+        headers=[
+            "Invoice #", "Date", "Customer", "Item Category", "Description",
+            "Qty", "Purity", "Weight (g)", "Gold Rate", "Gold Value",
+            "Making Charge", "VAT %", "VAT Amount", "Line Total"
+        ],
+        widths=[15] * 5 + [12] * 9
+    )
     
-    for col, header in enumerate(line_item_headers, 1):
-        cell = ws2.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center', vertical='center')
+    totals = {"invoices": 0, "metal": 0.0, "making": 0.0, "vat": 0.0, "grand": 0.0, "paid": 0.0, "outstanding": 0.0}
     
-    # Populate line items from all invoices
-    current_row = 2
-    for inv in invoices:
+    def summary_row(inv):
         invoice_number = inv.get('invoice_number', '')
         invoice_date = str(inv.get('date', ''))[:10]
+        # Customer name (handle walk-in)
         customer_name = inv.get('walk_in_name') or inv.get('customer_name', 'N/A')
         
+        totals["invoices"] += 1
+        totals["vat"] += safe_float(inv.get('vat_total', 0))
+        totals["grand"] += safe_float(inv.get('grand_total', 0))
+        totals["paid"] += safe_float(inv.get('paid_amount', 0))
+        totals["outstanding"] += safe_float(inv.get('balance_due', 0))
+        
         for item in inv.get('items', []):
-            ws2.cell(row=current_row, column=1, value=invoice_number)
-            ws2.cell(row=current_row, column=2, value=invoice_date)
-            ws2.cell(row=current_row, column=3, value=customer_name)
-            ws2.cell(row=current_row, column=4, value=item.get('category', ''))
-            ws2.cell(row=current_row, column=5, value=item.get('description', ''))
-            
-            # Numeric values
-            ws2.cell(row=current_row, column=6, value=int(item.get('qty', 1)))
-            ws2.cell(row=current_row, column=7, value=int(item.get('purity', 916)))
-            ws2.cell(row=current_row, column=8, value=float(item.get('weight', 0)))
-            ws2.cell(row=current_row, column=9, value=float(item.get('metal_rate', 0)))
-            ws2.cell(row=current_row, column=10, value=float(item.get('gold_value', 0)))
-            ws2.cell(row=current_row, column=11, value=float(item.get('making_value', 0)))
-            ws2.cell(row=current_row, column=12, value=float(item.get('vat_percent', 5)))
-            ws2.cell(row=current_row, column=13, value=float(item.get('vat_amount', 0)))
-            ws2.cell(row=current_row, column=14, value=float(item.get('line_total', 0)))
-            
-            current_row += 1
+            gold_value = safe_float(item.get('gold_value', 0))
+            making_value = safe_float(item.get('making_value', 0))
+            totals["metal"] += gold_value
+            totals["making"] += making_value
+            export.append(ws2, [
+                invoice_number,
+                invoice_date,
+                customer_name,
+                item.get('category', ''),
+                item.get('description', ''),
+                int(item.get('qty', 1)),
+                int(item.get('purity', 916)),
+                safe_float(item.get('weight', 0)),
+                safe_float(item.get('metal_rate', 0)),
+                gold_value,
+                making_value,
+                safe_float(item.get('vat_percent', 5)),
+                safe_float(item.get('vat_amount', 0)),
+                safe_float(item.get('line_total', 0)),
+            ])
+        
+        return [
+            invoice_number,
+            invoice_date,
+            customer_name,
+            inv.get('customer_type', 'walk_in'),
+            inv.get('invoice_type', ''),
+            inv.get('status', 'draft'),
+            safe_float(inv.get('grand_total', 0)),
+            safe_float(inv.get('paid_amount', 0)),
+            safe_float(inv.get('balance_due', 0)),
+            inv.get('payment_status', ''),
+        ]
     
-    # Set column widths for line items
-    for col in ['A', 'B', 'C', 'D', 'E']:
-        ws2.column_dimensions[col].width = 15
-    for col in ['F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N']:
-        ws2.column_dimensions[col].width = 12
+    await export.write_rows(ws1, db.invoices.find(query, {"_id": 0}).sort("date", -1), summary_row)
     
     # ===========================================================================
     # SHEET 3: Totals & Statistics
     # ===========================================================================
-    ws3 = wb.create_sheet(title="Totals")
-    
-    # Calculate totals
-    total_invoices = len(invoices)
-    metal_total = sum(
-        item.get('gold_value', 0) 
-        for inv in invoices 
-        for item in inv.get('items', [])
-    )
-    making_total = sum(
-        item.get('making_value', 0) 
-        for inv in invoices 
-        for item in inv.get('items', [])
-    )
-    vat_total = sum(safe_float(inv.get('vat_total', 0)) for inv in invoices)
-    grand_total = sum(safe_float(inv.get('grand_total', 0)) for inv in invoices)
-    paid_total = sum(safe_float(inv.get('paid_amount', 0)) for inv in invoices)
-    outstanding_total = sum(safe_float(inv.get('balance_due', 0)) for inv in invoices)
+    ws3 = export.sheet("Totals", widths=[30, 20])
+    export.append(ws3, ['INVOICE TOTALS SUMMARY'], style=ExcelExport.TITLE)
+    export.append(ws3, [])
     
-    # Style for totals sheet
-    title_font = Font(bold=True, size=14)
-    label_font = Font(bold=True)
-    
-    ws3['A1'] = 'INVOICE TOTALS SUMMARY'
-    ws3['A1'].font = title_font
-    
-    row = 3
     totals_data = [
-        ('Total Invoices', total_invoices),
+        ('Total Invoices', totals["invoices"]),
         ('', ''),
-        ('Metal Total (OMR)', metal_total),
-        ('Making Charges Total (OMR)', making_total),
-        ('VAT Total (OMR)', vat_total),
+        ('Metal Total (OMR)', totals["metal"]),
+        ('Making Charges Total (OMR)', totals["making"]),
+        ('VAT Total (OMR)', totals["vat"]),
         ('', ''),
-        ('Grand Total (OMR)', grand_total),
-        ('Total Paid (OMR)', paid_total),
-        ('Total Outstanding (OMR)', outstanding_total),
+        ('Grand Total (OMR)', totals["grand"]),
+        ('Total Paid (OMR)', totals["paid"]),
+        ('Total Outstanding (OMR)', totals["outstanding"]),
     ]
-    
     for label, value in totals_data:
-        ws3.cell(row=row, column=1, value=label).font = label_font
+        row = [export.cell(ws3, label, ExcelExport.LABEL)]
         if value != '':
             # Make sure numeric values are stored as numbers
-            if isinstance(value, (int, float)):
-                ws3.cell(row=row, column=2, value=float(value))
-        row += 1
-    
-    ws3.column_dimensions['A'].width = 30
-    ws3.column_dimensions['B'].width = 20
-    
-    # Save to buffer
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=invoices_export.xlsx"}
-    )
+            row.append(float(value))
+        ws3.append(row)
+    
+    return await export.response("invoices_export.xlsx")
 
 @api_router.get("/reports/transactions-export")
 async def export_transactions(
@@ -8139,77 +7713,49 @@ async def export_transactions(
     party_id: Optional[str] = None,
     current_user: User = Depends(require_permission('reports.view'))
 ):
-    """Export transactions report as Excel"""
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, PatternFill
-    
-    # Get filtered transaction data
-    data = await view_transactions_report(
+    """Export transactions report as Excel (same filters as the transactions view, newest first)"""
+    query = transactions_report_query(
         start_date=start_date,
         end_date=end_date,
         transaction_type=transaction_type,
-        party_id=party_id,
-        sort_by='date_desc',
-        current_user=current_user
+        party_id=party_id
+    )
+    
+    export = ExcelExport()
+    ws = export.sheet(
+        "Transactions",
+        headers=["Date", "Transaction #", "Type", "Mode", "Party Name", "Account", "Amount (OMR)", "Category", "Notes"],
+        widths=[15] * 9
     )
     
-    # Create workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Transactions"
-    
-    # Headers
-    headers = ["Date", "Transaction #", "Type", "Mode", "Party Name", "Account", "Amount (OMR)", "Category", "Notes"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.font = Font(color="FFFFFF", bold=True)
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Data
-    for row_idx, txn in enumerate(data['transactions'], 2):
-        txn_date = txn.get('date', '')
-        if isinstance(txn_date, str):
-            txn_date = txn_date[:10]
-        elif hasattr(txn_date, 'strftime'):
-            txn_date = txn_date.strftime('%Y-%m-%d')
-        
-        ws.cell(row=row_idx, column=1, value=txn_date)
-        ws.cell(row=row_idx, column=2, value=txn.get('transaction_number', ''))
-        ws.cell(row=row_idx, column=3, value=txn.get('transaction_type', ''))
-        ws.cell(row=row_idx, column=4, value=txn.get('mode', ''))
-        ws.cell(row=row_idx, column=5, value=txn.get('party_name', ''))
-        ws.cell(row=row_idx, column=6, value=txn.get('account_name', ''))
-        ws.cell(row=row_idx, column=7, value=txn.get('amount', 0))
-        ws.cell(row=row_idx, column=8, value=txn.get('category', ''))
-        ws.cell(row=row_idx, column=9, value=txn.get('notes', ''))
+    # Totals are accumulated while streaming and written below the rows
+    summary = {"credit": 0.0, "debit": 0.0}
+    
+    def transaction_row(txn):
+        if txn.get('transaction_type') in summary:
+            summary[txn['transaction_type']] += safe_float(txn.get('amount', 0))
+        return [
+            excel_date(txn.get('date', '')),
+            txn.get('transaction_number', ''),
+            txn.get('transaction_type', ''),
+            txn.get('mode', ''),
+            txn.get('party_name', ''),
+            txn.get('account_name', ''),
+            txn.get('amount', 0),
+            txn.get('category', ''),
+            txn.get('notes', ''),
+        ]
+    
+    await export.write_rows(ws, db.transactions.find(query, {"_id": 0}).sort("date", -1), transaction_row)
     
     # Add summary at the bottom
-    last_row = len(data['transactions']) + 3
-    ws.cell(row=last_row, column=1, value="Summary:").font = Font(bold=True)
-    ws.cell(row=last_row + 1, column=1, value="Total Credit:")
-    ws.cell(row=last_row + 1, column=2, value=data['summary']['total_credit'])
-    ws.cell(row=last_row + 2, column=1, value="Total Debit:")
-    ws.cell(row=last_row + 2, column=2, value=data['summary']['total_debit'])
-    ws.cell(row=last_row + 3, column=1, value="Net Balance:")
-    ws.cell(row=last_row + 3, column=2, value=data['summary']['net_balance'])
-    
-    # Adjust column widths
-    for col in range(1, 10):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=transactions_export_{datetime.now().strftime('%Y%m%d')}.xlsx"}
-    )
+    export.append(ws, [])
+    export.append(ws, ["Summary:"], style=ExcelExport.LABEL)
+    export.append(ws, ["Total Credit:", summary["credit"]])
+    export.append(ws, ["Total Debit:", summary["debit"]])
+    export.append(ws, ["Net Balance:", summary["credit"] - summary["debit"]])
+    
+    return await export.response(f"transactions_export_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 @api_router.get("/reports/outstanding-export")
 async def export_outstanding(
@@ -8219,14 +7765,9 @@ async def export_outstanding(
     end_date: Optional[str] = None,
     current_user: User = Depends(require_permission('reports.view'))
 ):
-    """Export outstanding report as Excel"""
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, PatternFill
-    
+    """Export outstanding report as Excel (one row per party from the outstanding report)"""
     # Get filtered outstanding data
-    data = await get_outstanding_report(
+    data = await build_outstanding_report(
         party_id=party_id,
         party_type=party_type,
         start_date=start_date,
@@ -8235,81 +7776,42 @@ async def export_outstanding(
         current_user=current_user
     )
     
-    # Create workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Outstanding"
+    export = ExcelExport()
+    ws = export.sheet(
+        "Outstanding",
+        headers=[
+            "Party Name", "Type", "Total Invoiced", "Total Paid", "Outstanding",
+            "Overdue 0-7d", "Overdue 8-30d", "Overdue 31+d", "Last Invoice Date", "Last Payment Date"
+        ],
+        widths=[15] * 10
+    )
     
-    # Headers
-    headers = [
-        "Party Name", "Type", "Total Invoiced", "Total Paid", "Outstanding", 
-        "Overdue 0-7d", "Overdue 8-30d", "Overdue 31+d", "Last Invoice Date", "Last Payment Date"
-    ]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.font = Font(color="FFFFFF", bold=True)
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Data
-    for row_idx, party in enumerate(data['parties'], 2):
-        last_invoice = party.get('last_invoice_date')
-        if last_invoice and hasattr(last_invoice, 'strftime'):
-            last_invoice = last_invoice.strftime('%Y-%m-%d')
-        elif isinstance(last_invoice, str):
-            last_invoice = last_invoice[:10]
-        else:
-            last_invoice = ''
-        
-        last_payment = party.get('last_payment_date')
-        if last_payment and hasattr(last_payment, 'strftime'):
-            last_payment = last_payment.strftime('%Y-%m-%d')
-        elif isinstance(last_payment, str):
-            last_payment = last_payment[:10]
-        else:
-            last_payment = ''
-        
-        ws.cell(row=row_idx, column=1, value=party.get('party_name', ''))
-        ws.cell(row=row_idx, column=2, value=party.get('party_type', ''))
-        ws.cell(row=row_idx, column=3, value=party.get('total_invoiced', 0))
-        ws.cell(row=row_idx, column=4, value=party.get('total_paid', 0))
-        ws.cell(row=row_idx, column=5, value=party.get('total_outstanding', 0))
-        ws.cell(row=row_idx, column=6, value=party.get('overdue_0_7', 0))
-        ws.cell(row=row_idx, column=7, value=party.get('overdue_8_30', 0))
-        ws.cell(row=row_idx, column=8, value=party.get('overdue_31_plus', 0))
-        ws.cell(row=row_idx, column=9, value=last_invoice)
-        ws.cell(row=row_idx, column=10, value=last_payment)
+    for party in data['parties']:
+        export.append(ws, [
+            party.get('party_name', ''),
+            party.get('party_type', ''),
+            party.get('total_invoiced', 0),
+            party.get('total_paid', 0),
+            party.get('total_outstanding', 0),
+            party.get('overdue_0_7', 0),
+            party.get('overdue_8_30', 0),
+            party.get('overdue_31_plus', 0),
+            excel_date(party.get('last_invoice_date') or None),
+            excel_date(party.get('last_payment_date') or None),
+        ])
     
     # Add summary at the bottom
-    last_row = len(data['parties']) + 3
-    ws.cell(row=last_row, column=1, value="Summary:").font = Font(bold=True)
-    ws.cell(row=last_row + 1, column=1, value="Customer Due (Receivable):")
-    ws.cell(row=last_row + 1, column=2, value=data['summary']['customer_due'])
-    ws.cell(row=last_row + 2, column=1, value="Vendor Payable:")
-    ws.cell(row=last_row + 2, column=2, value=data['summary']['vendor_payable'])
-    ws.cell(row=last_row + 3, column=1, value="Total Outstanding:")
-    ws.cell(row=last_row + 3, column=2, value=data['summary']['total_outstanding'])
-    ws.cell(row=last_row + 4, column=1, value="Overdue 0-7 Days:")
-    ws.cell(row=last_row + 4, column=2, value=data['summary']['total_overdue_0_7'])
-    ws.cell(row=last_row + 5, column=1, value="Overdue 8-30 Days:")
-    ws.cell(row=last_row + 5, column=2, value=data['summary']['total_overdue_8_30'])
-    ws.cell(row=last_row + 6, column=1, value="Overdue 31+ Days:")
-    ws.cell(row=last_row + 6, column=2, value=data['summary']['total_overdue_31_plus'])
-    
-    # Adjust column widths
-    for col in range(1, 11):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=outstanding_export_{datetime.now().strftime('%Y%m%d')}.xlsx"}
-    )
+    summary = data['summary']
+    export.append(ws, [])
+    export.append(ws, ["Summary:"], style=ExcelExport.LABEL)
+    export.append(ws, ["Customer Due (Receivable):", summary['customer_due']])
+    export.append(ws, ["Vendor Payable:", summary['vendor_payable']])
+    export.append(ws, ["Total Outstanding:", summary['total_outstanding']])
+    export.append(ws, ["Overdue 0-7 Days:", summary['total_overdue_0_7']])
+    export.append(ws, ["Overdue 8-30 Days:", summary['total_overdue_8_30']])
+    export.append(ws, ["Overdue 31+ Days:", summary['total_overdue_31_plus']])
+    
+    return await export.response(f"outstanding_export_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 # New VIEW endpoints for displaying reports in UI
 @api_router.get("/reports/inventory-view")
@@ -8401,15 +7903,14 @@ async def view_parties_report(
         "count": len(parties)
     }
 
-@api_router.get("/reports/invoices-view")
-async def view_invoices_report(
+async def build_invoices_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     invoice_type: Optional[str] = None,
     payment_status: Optional[str] = None,
     party_id: Optional[str] = None,  # NEW: Filter by specific party
     sort_by: Optional[str] = None,  # NEW: "date_asc", "date_desc", "amount_desc", "outstanding_desc"
-    current_user: User = Depends(require_permission('reports.view'))
+    current_user: Optional[User] = None
 ):
     """View invoices with filters - returns JSON for UI"""
     query = {"is_deleted": False}
@@ -8452,8 +7953,7 @@ async def view_invoices_report(
     total_paid = sum(safe_float(inv.get('paid_amount', 0)) for inv in invoices)
     total_balance = sum(safe_float(inv.get('balance_due', 0)) for inv in invoices)
     
-    # CRITICAL FIX: Convert entire response including invoices array to prevent Decimal128 serialization errors
-    return decimal_to_float({
+    return {
         "invoices": invoices,
         "summary": {
             "total_amount": total_amount,
@@ -8461,19 +7961,38 @@ async def view_invoices_report(
             "total_balance": total_balance
         },
         "count": len(invoices)
-    })
+    }
 
-@api_router.get("/reports/transactions-view")
-async def view_transactions_report(
+@api_router.get("/reports/invoices-view")
+async def view_invoices_report(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    transaction_type: Optional[str] = None,
-    account_id: Optional[str] = None,
+    invoice_type: Optional[str] = None,
+    payment_status: Optional[str] = None,
     party_id: Optional[str] = None,  # NEW: Filter by specific party
-    sort_by: Optional[str] = None,  # NEW: "date_asc", "date_desc", "amount_desc"
+    sort_by: Optional[str] = None,  # NEW: "date_asc", "date_desc", "amount_desc", "outstanding_desc"
     current_user: User = Depends(require_permission('reports.view'))
 ):
-    """View financial transactions with filters - returns JSON for UI"""
+    """Report data from build_invoices_report, serialized straight from BSON (no decimal_to_float copy)"""
+    data = await build_invoices_report(
+        start_date=start_date,
+        end_date=end_date,
+        invoice_type=invoice_type,
+        payment_status=payment_status,
+        party_id=party_id,
+        sort_by=sort_by,
+        current_user=current_user
+    )
+    return BSONJSONResponse(data)
+
+def transactions_report_query(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    account_id: Optional[str] = None,
+    party_id: Optional[str] = None
+) -> dict:
+    """Transaction filter shared by the transactions view, PDF and Excel export"""
     query = {"is_deleted": False}
     if start_date:
         query['date'] = {"$gte": datetime.fromisoformat(start_date)}
@@ -8489,6 +8008,19 @@ async def view_transactions_report(
         query['account_id'] = account_id
     if party_id:
         query['party_id'] = party_id
+    return query
+
+async def build_transactions_report(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    account_id: Optional[str] = None,
+    party_id: Optional[str] = None,  # NEW: Filter by specific party
+    sort_by: Optional[str] = None,  # NEW: "date_asc", "date_desc", "amount_desc"
+    current_user: Optional[User] = None
+):
+    """View financial transactions with filters - returns JSON for UI"""
+    query = transactions_report_query(start_date, end_date, transaction_type, account_id, party_id)
     
     # Apply sorting
     sort_field = "date"
@@ -8510,8 +8042,7 @@ async def view_transactions_report(
     total_credit = sum(safe_float(txn.get('amount', 0)) for txn in transactions if txn.get('transaction_type') == 'credit')
     total_debit = sum(safe_float(txn.get('amount', 0)) for txn in transactions if txn.get('transaction_type') == 'debit')
     
-    # CRITICAL FIX: Convert entire response including transactions array to prevent Decimal128 serialization errors
-    return decimal_to_float({
+    return {
         "transactions": transactions,
         "summary": {
             "total_credit": total_credit,
@@ -8519,7 +8050,29 @@ async def view_transactions_report(
             "net_balance": total_credit - total_debit
         },
         "count": len(transactions)
-    })
+    }
+
+@api_router.get("/reports/transactions-view")
+async def view_transactions_report(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    account_id: Optional[str] = None,
+    party_id: Optional[str] = None,  # NEW: Filter by specific party
+    sort_by: Optional[str] = None,  # NEW: "date_asc", "date_desc", "amount_desc"
+    current_user: User = Depends(require_permission('reports.view'))
+):
+    """Report data from build_transactions_report, serialized straight from BSON (no decimal_to_float copy)"""
+    data = await build_transactions_report(
+        start_date=start_date,
+        end_date=end_date,
+        transaction_type=transaction_type,
+        account_id=account_id,
+        party_id=party_id,
+        sort_by=sort_by,
+        current_user=current_user
+    )
+    return BSONJSONResponse(data)
 
 @api_router.get("/reports/invoice/{invoice_id}")
 async def get_invoice_report(invoice_id: str, current_user: User = Depends(require_permission('reports.view'))):
@@ -8618,17 +8171,19 @@ async def get_inventory_stock_report(
     
     movements = await db.stock_movements.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
     
-    # Convert Decimal128 to float for calculations
+    # Convert Decimal128 to float for display
     movements = [decimal_to_float(m) for m in movements]
     header = decimal_to_float(header)
     
-    # Calculate stock totals
-    total_in = sum(safe_float(m.get('qty_delta', 0)) for m in movements if safe_float(m.get('qty_delta', 0)) > 0)
-    total_out = sum(abs(safe_float(m.get('qty_delta', 0))) for m in movements if safe_float(m.get('qty_delta', 0)) < 0)
+    # Stock totals over every movement in the range, summed in MongoDB
+    date_range = query.get('date', {})
+    flow = (await movement_flow(db, [header_id], date_range.get('$gte'), date_range.get('$lte'))).get(header_id, {})
+    total_in = flow.get('qty_in', 0.0)
+    total_out = flow.get('qty_out', 0.0)
     current_stock = total_in - total_out
     
-    total_weight_in = sum(safe_float(m.get('weight_delta', 0)) for m in movements if safe_float(m.get('weight_delta', 0)) > 0)
-    total_weight_out = sum(abs(safe_float(m.get('weight_delta', 0))) for m in movements if safe_float(m.get('weight_delta', 0)) < 0)
+    total_weight_in = flow.get('weight_in', 0.0)
+    total_weight_out = flow.get('weight_out', 0.0)
     current_weight = total_weight_in - total_weight_out
     
     return {
@@ -8666,396 +8221,76 @@ async def get_financial_summary(
     - Net Flow = Total Credit - Total Debit
     - Net Profit = Total Income - Total Expenses
     """
-    # Build query for transactions
-    txn_query = {"is_deleted": False}
-    if start_date:
-        txn_query['date'] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        end_dt = datetime.fromisoformat(end_date)
-        if 'date' in txn_query:
-            txn_query['date']['$lte'] = end_dt
-        else:
-            txn_query['date'] = {"$lte": end_dt}
-    
-    # Build query for invoices (only for outstanding calculation)
-    invoice_query = {"is_deleted": False, "status": "finalized"}
-    if start_date:
-        invoice_query['date'] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        end_dt = datetime.fromisoformat(end_date)
-        if 'date' in invoice_query:
-            invoice_query['date']['$lte'] = end_dt
-        else:
-            invoice_query['date'] = {"$lte": end_dt}
-    
-    # Get data from database
-    transactions = await db.transactions.find(txn_query, {"_id": 0}).to_list(10000)
-    accounts = await db.accounts.find({"is_deleted": False}, {"_id": 0}).to_list(1000)
-    invoices = await db.invoices.find(invoice_query, {"_id": 0}).to_list(10000)
-    
-    # Convert Decimal128 to float for calculations (prevents TypeError with mixed types)
-    transactions = [decimal_to_float(txn) for txn in transactions]
-    accounts = [decimal_to_float(acc) for acc in accounts]
-    invoices = [decimal_to_float(inv) for inv in invoices]
-    
-    # ============================================================================
-    # LEDGER-BASED CALCULATIONS (Authoritative Source)
-    # ============================================================================
-    
-    # Build account maps for efficient lookups
-    account_type_map = {acc.get('id'): acc.get('account_type', '').lower() for acc in accounts if 'id' in acc}
-    account_name_map = {acc.get('id'): acc.get('name', '') for acc in accounts if 'id' in acc}
-    
-    # Calculate balances from ACCOUNTS table (current state)
-    cash_balance = sum(
-        acc.get('current_balance', 0) for acc in accounts 
-        if acc.get('account_type', '').lower() == 'asset' and 
-        'cash' in acc.get('name', '').lower()
-    )
-    
-    bank_balance = sum(
-        acc.get('current_balance', 0) for acc in accounts 
-        if acc.get('account_type', '').lower() == 'asset' and 
-        'bank' in acc.get('name', '').lower()
-    )
-    
-    # Calculate Total Sales from INCOME ACCOUNTS (credits increase income)
-    # Sum of all credits to Income-type accounts
-    # Subtract sales returns (debits to income accounts)
-    total_sales_credits = sum(
-        txn.get('amount', 0) for txn in transactions
-        if txn.get('transaction_type') == 'credit' and
-        account_type_map.get(txn.get('account_id'), '') == 'income'
-    )
-    
-    # Sales returns reduce total sales (debits or category="sales_return")
-    total_sales_returns = sum(
-        txn.get('amount', 0) for txn in transactions
-        if (txn.get('category') == 'sales_return' or 
-            (txn.get('transaction_type') == 'debit' and
-             account_type_map.get(txn.get('account_id'), '') == 'income'))
-    )
-    
-    # Net Sales = Gross Sales - Returns
-    total_sales = total_sales_credits - total_sales_returns
-    
-    # Calculate Total Income and Expenses for Net Profit
-    total_income = sum(
-        acc.get('current_balance', 0) for acc in accounts
-        if acc.get('account_type', '').lower() == 'income'
-    )
-    
-    total_expenses = sum(
-        acc.get('current_balance', 0) for acc in accounts
-        if acc.get('account_type', '').lower() == 'expense'
-    )
+    # All figures are computed server-side by aggregation pipelines on
+    # Decimal128 values with no row cap (see report_pipelines.py)
+    start_dt = datetime.fromisoformat(start_date) if start_date else None
+    end_dt = datetime.fromisoformat(end_date) if end_date else None
     
-    # Net Profit = Income - Expenses (ledger balances)
-    # Note: Expense accounts have positive balances representing costs incurred
-    net_profit = total_income - total_expenses
-    
-    # Calculate Total Credit and Debit from TRANSACTIONS
-    total_credit = sum(
-        txn.get('amount', 0) for txn in transactions 
-        if txn.get('transaction_type') == 'credit'
-    )
-    
-    total_debit = sum(
-        txn.get('amount', 0) for txn in transactions 
-        if txn.get('transaction_type') == 'debit'
-    )
-    
-    # Net Flow = Total Credits - Total Debits
-    net_flow = total_credit - total_debit
-    
-    # ============================================================================
-    # INVOICE-BASED CALCULATIONS (Informational Only)
-    # ============================================================================
-    
-    # Outstanding is still calculated from invoices (customer/vendor balances)
-    total_outstanding = sum(safe_float(inv.get('balance_due', 0)) for inv in invoices)
-    
-    # Total account balance (sum of all account balances)
-    total_account_balance = sum(safe_float(acc.get('current_balance', 0)) for acc in accounts)
-    
-    # Daily closing difference (for reconciliation)
-    daily_closing_difference = 0
-    closing_query = {"is_deleted": False}
+    # Daily closing difference covers the requested range, or today when no full range is given
     if start_date and end_date:
-        closing_query['date'] = {
-            "$gte": datetime.fromisoformat(start_date),
-            "$lte": datetime.fromisoformat(end_date)
-        }
+        closing_range = {"$gte": start_dt, "$lte": end_dt}
     else:
         today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        closing_query['date'] = {"$gte": today}
-    
-    closings = await db.daily_closings.find(closing_query, {"_id": 0}).to_list(100)
-    for closing in closings:
-        expected = closing.get('expected_closing', 0)
-        actual = closing.get('actual_closing', 0)
-        daily_closing_difference += (actual - expected)
-    
-    # Get returns metrics for the period
-    returns_query = {"is_deleted": False, "status": "finalized"}
-    if start_date:
-        returns_query['date'] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        end_dt = datetime.fromisoformat(end_date)
-        if 'date' in returns_query:
-            returns_query['date']['$lte'] = end_dt
-        else:
-            returns_query['date'] = {"$lte": end_dt}
-    
-    returns_docs = await db.returns.find(returns_query, {"_id": 0}).to_list(1000)
+        closing_range = {"$gte": today}
     
-    total_sales_returns_count = len([r for r in returns_docs if r.get('return_type') == 'sale_return'])
-    total_purchase_returns_count = len([r for r in returns_docs if r.get('return_type') == 'purchase_return'])
-    
-    return {
-        "total_sales": total_sales,  # LEDGER-BASED: Net Sales (Credits - Returns)
-        "total_sales_returns": total_sales_returns,  # Total sales returns amount
-        "total_credit": total_credit,  # LEDGER-BASED: All credits
-        "total_debit": total_debit,  # LEDGER-BASED: All debits
-        "net_flow": net_flow,  # LEDGER-BASED: Credit - Debit
-        "cash_balance": cash_balance,  # LEDGER-BASED: Cash account balance
-        "bank_balance": bank_balance,  # LEDGER-BASED: Bank account balance
-        "net_profit": net_profit,  # LEDGER-BASED: Income - Expenses (includes returns impact)
-        "total_account_balance": total_account_balance,  # Sum of all accounts
-        "total_outstanding": total_outstanding,  # Invoice-based (informational)
-        "daily_closing_difference": daily_closing_difference,  # Reconciliation
-        "returns_summary": {
-            "sales_returns_count": total_sales_returns_count,
-            "purchase_returns_count": total_purchase_returns_count,
-            "total_returns_count": len(returns_docs)
-        }
-    }
+    return await financial_summary_figures(db, start_dt, end_dt, closing_range)
 
 
-@api_router.get("/reports/outstanding")
-async def get_outstanding_report(
+async def build_outstanding_report(
     party_id: Optional[str] = None,
     party_type: Optional[str] = None,  # "customer", "vendor", or None for both
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     include_paid: bool = False,  # Include fully paid invoices
-    current_user: User = Depends(require_permission('reports.view'))
+    current_user: Optional[User] = None
 ):
     """
     Get outstanding report with overdue buckets
     Shows total invoiced, paid, outstanding per party
     Includes overdue buckets: 0-7, 8-30, 31+ days
+
+    Computed by one aggregation (report_pipelines.outstanding_report_figures)
+    and shared through report_cache, so the view, Excel and PDF variants with
+    the same filters reuse one computation. The result is shared: do not mutate it.
     """
-    # Build invoice query
-    invoice_query = {"is_deleted": False, "status": "finalized"}
-    
-    if not include_paid:
-        # Only include invoices with outstanding balance
-        invoice_query['balance_due'] = {"$gt": 0}
-    
-    if start_date:
-        invoice_query['date'] = {"$gte": datetime.fromisoformat(start_date)}
-    if end_date:
-        end_dt = datetime.fromisoformat(end_date)
-        if 'date' in invoice_query:
-            invoice_query['date']['$lte'] = end_dt
-        else:
-            invoice_query['date'] = {"$lte": end_dt}
-    
-    # Get all invoices
-    invoices = await db.invoices.find(invoice_query, {"_id": 0}).to_list(10000)
-    
-    # Get all transactions for payment tracking
-    # CRITICAL FIX: Include "Purchase" category for vendor payables from purchase finalization
-    transactions = await db.transactions.find(
-        {"is_deleted": False, "category": {"$in": ["Sales Invoice", "Purchase Invoice", "Purchase"]}},
-        {"_id": 0}
-    ).to_list(10000)
-    
-    # Calculate today for overdue calculations
-    today = datetime.now(timezone.utc)
-    
-    # Group by party
-    party_data = {}
-    
-    for inv in invoices:
-        # Determine party info
-        if inv.get('customer_type') == 'walk_in':
-            party_key = f"walk_in_{inv.get('walk_in_name', 'Unknown')}"
-            party_name = f"{inv.get('walk_in_name', 'Unknown')} (Walk-in)"
-            ptype = "customer"
-        elif inv.get('customer_id'):
-            party_key = inv['customer_id']
-            party_name = inv.get('customer_name', 'Unknown')
-            ptype = "customer" if inv.get('invoice_type') == 'sale' else "vendor"
-        else:
-            continue
-        
-        # Filter by party_id if specified
-        if party_id and party_key != party_id:
-            continue
-        
-        # Filter by party_type if specified
-        if party_type and ptype != party_type:
-            continue
-        
-        # Initialize party data
-        if party_key not in party_data:
-            party_data[party_key] = {
-                "party_id": party_key,
-                "party_name": party_name,
-                "party_type": ptype,
-                "total_invoiced": 0,
-                "total_paid": 0,
-                "total_outstanding": 0,
-                "overdue_0_7": 0,
-                "overdue_8_30": 0,
-                "overdue_31_plus": 0,
-                "last_invoice_date": None,
-                "last_payment_date": None,
-                "invoice_count": 0
-            }
-        
-        # Update totals
-        party_data[party_key]['total_invoiced'] += safe_float(inv.get('grand_total', 0))
-        party_data[party_key]['total_paid'] += safe_float(inv.get('paid_amount', 0))
-        party_data[party_key]['total_outstanding'] += safe_float(inv.get('balance_due', 0))
-        party_data[party_key]['invoice_count'] += 1
-        
-        # Update last invoice date
-        inv_date = inv.get('date')
-        if inv_date:
-            if isinstance(inv_date, str):
-                inv_date = datetime.fromisoformat(inv_date)
-            if not party_data[party_key]['last_invoice_date'] or inv_date > party_data[party_key]['last_invoice_date']:
-                party_data[party_key]['last_invoice_date'] = inv_date
-        
-        # Calculate overdue only if balance_due > 0
-        if safe_float(inv.get('balance_due', 0)) > 0:
-            # Use due_date if available, else fallback to invoice date
-            due_date = inv.get('due_date') or inv.get('date')
-            if due_date:
-                if isinstance(due_date, str):
-                    due_date = datetime.fromisoformat(due_date)
-                
-                # CRITICAL FIX: Ensure due_date is timezone-aware to match today
-                if due_date.tzinfo is None:
-                    due_date = due_date.replace(tzinfo=timezone.utc)
-                
-                overdue_days = (today - due_date).days
-                
-                if overdue_days >= 0:  # Only count if actually overdue
-                    outstanding_amount = safe_float(inv.get('balance_due', 0))
-                    if 0 <= overdue_days <= 7:
-                        party_data[party_key]['overdue_0_7'] += outstanding_amount
-                    elif 8 <= overdue_days <= 30:
-                        party_data[party_key]['overdue_8_30'] += outstanding_amount
-                    elif overdue_days > 30:
-                        party_data[party_key]['overdue_31_plus'] += outstanding_amount
-    
-    # CRITICAL FIX: Process Purchase transactions to add vendor payables from purchase finalization
-    # These are credit transactions (we owe vendor) with category "Purchase" and transaction_type "credit"
-    for txn in transactions:
-        if txn.get('category') == 'Purchase' and txn.get('transaction_type') == 'credit':
-            party_key = txn.get('party_id')
-            if not party_key:
-                continue
-            
-            # Filter by party_id if specified
-            if party_id and party_key != party_id:
-                continue
-            
-            # Filter by party_type (vendor payables only)
-            if party_type and party_type != 'vendor':
-                continue
-            
-            # Get party name
-            party_name = txn.get('party_name', 'Unknown Vendor')
-            
-            # Initialize party data if not exists
-            if party_key not in party_data:
-                party_data[party_key] = {
-                    "party_id": party_key,
-                    "party_name": party_name,
-                    "party_type": "vendor",
-                    "total_invoiced": 0,
-                    "total_paid": 0,
-                    "total_outstanding": 0,
-                    "overdue_0_7": 0,
-                    "overdue_8_30": 0,
-                    "overdue_31_plus": 0,
-                    "last_invoice_date": None,
-                    "last_payment_date": None,
-                    "invoice_count": 0
-                }
-            
-            # Add vendor payable amount to outstanding
-            txn_amount = safe_float(txn.get('amount', 0))
-            party_data[party_key]['total_outstanding'] += txn_amount
-            
-            # Calculate overdue for vendor payables
-            txn_date = txn.get('date')
-            if txn_date and txn_amount > 0:
-                if isinstance(txn_date, str):
-                    txn_date = datetime.fromisoformat(txn_date)
-                
-                # CRITICAL FIX: Ensure txn_date is timezone-aware to match today
-                if txn_date.tzinfo is None:
-                    txn_date = txn_date.replace(tzinfo=timezone.utc)
-                
-                overdue_days = (today - txn_date).days
-                
-                if overdue_days >= 0:  # Only count if actually overdue
-                    if 0 <= overdue_days <= 7:
-                        party_data[party_key]['overdue_0_7'] += txn_amount
-                    elif 8 <= overdue_days <= 30:
-                        party_data[party_key]['overdue_8_30'] += txn_amount
-                    elif overdue_days > 30:
-                        party_data[party_key]['overdue_31_plus'] += txn_amount
-    
-    # Get last payment dates from transactions
-    for txn in transactions:
-        party_key = txn.get('party_id')
-        if party_key and party_key in party_data:
-            txn_date = txn.get('date')
-            if txn_date:
-                if isinstance(txn_date, str):
-                    txn_date = datetime.fromisoformat(txn_date)
-                if not party_data[party_key]['last_payment_date'] or txn_date > party_data[party_key]['last_payment_date']:
-                    party_data[party_key]['last_payment_date'] = txn_date
-    
-    # Convert dates to ISO strings for JSON serialization
-    for party in party_data.values():
-        if party['last_invoice_date']:
-            party['last_invoice_date'] = party['last_invoice_date'].isoformat()
-        if party['last_payment_date']:
-            party['last_payment_date'] = party['last_payment_date'].isoformat()
-    
-    # Calculate summary totals
-    customer_due = sum(p['total_outstanding'] for p in party_data.values() if p['party_type'] == 'customer')
-    vendor_payable = sum(p['total_outstanding'] for p in party_data.values() if p['party_type'] == 'vendor')
-    total_outstanding = customer_due + vendor_payable
-    
-    total_overdue_0_7 = sum(p['overdue_0_7'] for p in party_data.values())
-    total_overdue_8_30 = sum(p['overdue_8_30'] for p in party_data.values())
-    total_overdue_31_plus = sum(p['overdue_31_plus'] for p in party_data.values())
-    
-    # CRITICAL FIX: Convert entire response including parties array to prevent Decimal128 serialization errors
-    return decimal_to_float({
-        "summary": {
-            "customer_due": customer_due,
-            "vendor_payable": vendor_payable,
-            "total_outstanding": total_outstanding,
-            "total_overdue_0_7": total_overdue_0_7,
-            "total_overdue_8_30": total_overdue_8_30,
-            "total_overdue_31_plus": total_overdue_31_plus
-        },
-        "parties": list(party_data.values())
-    })
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) if end_date else None
+    key = ("outstanding", party_id, party_type, start, end, include_paid)
+    return await report_cache.get_or_compute(key, lambda: outstanding_report_figures(
+        db, party_id=party_id, party_type=party_type, start=start, end=end, include_paid=include_paid
+    ))
 
 
 # ==================== PDF EXPORT ENDPOINTS ====================
 
+@api_router.get("/reports/outstanding")
+async def get_outstanding_report(
+    party_id: Optional[str] = None,
+    party_type: Optional[str] = None,  # "customer", "vendor", or None for both
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    include_paid: bool = False,  # Include fully paid invoices
+    current_user: User = Depends(require_permission('reports.view'))
+):
+    """Report data from build_outstanding_report, serialized straight from BSON (no decimal_to_float copy)"""
+    data = await build_outstanding_report(
+        party_id=party_id,
+        party_type=party_type,
+        start_date=start_date,
+        end_date=end_date,
+        include_paid=include_paid,
+        current_user=current_user
+    )
+    return BSONJSONResponse(data)
+
+def report_period_subtitle(start: Optional[str] = None, end: Optional[str] = None) -> str:
+    """'Generated: ...' line under a report PDF title, with the period when filtered"""
+    subtitle = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    if start or end:
+        subtitle += f" | Period: {start or 'Start'} to {end or 'End'}"
+    return subtitle
+
+
 @api_router.get("/reports/outstanding-pdf")
 async def export_outstanding_pdf(
     party_id: Optional[str] = None,
@@ -9065,31 +8300,7 @@ async def export_outstanding_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export outstanding report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data from outstanding report
-    params = {}
-    if party_id:
-        params['party_id'] = party_id
-    if party_type:
-        params['party_type'] = party_type
-    if start_date:
-        params['start_date'] = start_date
-    if end_date:
-        params['end_date'] = end_date
-    
-    # Call outstanding report endpoint logic
-    from urllib.parse import urlencode
-    import httpx
-    
-    # Get outstanding data by calling the endpoint function directly
-    data = await get_outstanding_report(
+    data = await build_outstanding_report(
         party_id=party_id,
         party_type=party_type,
         start_date=start_date,
@@ -9098,53 +8309,9 @@ async def export_outstanding_pdf(
         current_user=current_user
     )
     
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Outstanding Report")
-    
-    # Date range
-    c.setFont("Helvetica", 10)
-    date_str = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if start_date or end_date:
-        date_str += f" | Period: {start_date or 'Start'} to {end_date or 'End'}"
-    c.drawString(inch, height - inch - 0.3*inch, date_str)
-    
-    # Summary section
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Summary")
-    y_position -= 0.3*inch
-    
-    c.setFont("Helvetica", 10)
     summary = data['summary']
-    c.drawString(inch, y_position, f"Customer Due: {summary['customer_due']:.3f}")
-    c.drawString(inch + 2.5*inch, y_position, f"Vendor Payable: {summary['vendor_payable']:.3f}")
-    y_position -= 0.2*inch
-    c.drawString(inch, y_position, f"Total Outstanding: {summary['total_outstanding']:.3f}")
-    y_position -= 0.3*inch
-    
-    c.setFont("Helvetica-Bold", 11)
-    c.drawString(inch, y_position, "Overdue Buckets:")
-    y_position -= 0.2*inch
-    c.setFont("Helvetica", 10)
-    c.drawString(inch, y_position, f"0-7 days: {summary['total_overdue_0_7']:.3f}")
-    c.drawString(inch + 2*inch, y_position, f"8-30 days: {summary['total_overdue_8_30']:.3f}")
-    c.drawString(inch + 4*inch, y_position, f"31+ days: {summary['total_overdue_31_plus']:.3f}")
-    y_position -= 0.5*inch
-    
-    # Parties table
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Party-wise Outstanding")
-    y_position -= 0.3*inch
-    
-    # Create table data
-    table_data = [['Party Name', 'Type', 'Invoiced', 'Paid', 'Outstanding', '0-7d', '8-30d', '31+d']]
-    for party in data['parties'][:20]:  # Limit to 20 parties per page
-        table_data.append([
+    rows = [
+        [
             party['party_name'][:25],
             party['party_type'],
             f"{party['total_invoiced']:.2f}",
@@ -9153,33 +8320,32 @@ async def export_outstanding_pdf(
             f"{party['overdue_0_7']:.2f}",
             f"{party['overdue_8_30']:.2f}",
             f"{party['overdue_31_plus']:.2f}"
-        ])
-    
-    # Create table
-    table = Table(table_data, colWidths=[2*inch, 0.7*inch, 0.8*inch, 0.8*inch, 0.9*inch, 0.6*inch, 0.7*inch, 0.7*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    # Draw table
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=outstanding_report_{datetime.now().strftime('%Y%m%d')}.pdf"}
+        ]
+        for party in data['parties']
+    ]
+    spec = {
+        "title": "Outstanding Report",
+        "subtitle": report_period_subtitle(start_date, end_date),
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [
+                [f"Customer Due: {summary['customer_due']:.3f}", f"Vendor Payable: {summary['vendor_payable']:.3f}"],
+                [f"Total Outstanding: {summary['total_outstanding']:.3f}"],
+            ], 2.5),
+            ("heading", "Overdue Buckets:"),
+            ("grid", [[
+                f"0-7 days: {summary['total_overdue_0_7']:.3f}",
+                f"8-30 days: {summary['total_overdue_8_30']:.3f}",
+                f"31+ days: {summary['total_overdue_31_plus']:.3f}",
+            ]], 2),
+            ("heading", "Party-wise Outstanding"),
+            ("table", ['Party Name', 'Type', 'Invoiced', 'Paid', 'Outstanding', '0-7d', '8-30d', '31+d'],
+             rows, [2, 0.7, 0.8, 0.8, 0.9, 0.6, 0.7, 0.7], "highlight"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"outstanding_report_{datetime.now().strftime('%Y%m%d')}.pdf"
     )
 
 
@@ -9193,16 +8359,7 @@ async def export_invoices_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export invoices report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data
-    data = await view_invoices_report(
+    data = decimal_to_float(await build_invoices_report(
         start_date=start_date,
         end_date=end_date,
         invoice_type=invoice_type,
@@ -9210,82 +8367,38 @@ async def export_invoices_pdf(
         party_id=party_id,
         sort_by=None,
         current_user=current_user
-    )
-    
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Invoices Report")
-    
-    c.setFont("Helvetica", 10)
-    date_str = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if start_date or end_date:
-        date_str += f" | Period: {start_date or 'Start'} to {end_date or 'End'}"
-    c.drawString(inch, height - inch - 0.3*inch, date_str)
-    
-    # Summary
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Summary")
-    y_position -= 0.3*inch
+    ))
     
-    c.setFont("Helvetica", 10)
     summary = data['summary']
-    c.drawString(inch, y_position, f"Total Amount: {summary['total_amount']:.3f}")
-    c.drawString(inch + 2.5*inch, y_position, f"Total Paid: {summary['total_paid']:.3f}")
-    y_position -= 0.2*inch
-    c.drawString(inch, y_position, f"Total Balance: {summary['total_balance']:.3f}")
-    c.drawString(inch + 2.5*inch, y_position, f"Count: {data['count']}")
-    y_position -= 0.5*inch
-    
-    # Table
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Invoices")
-    y_position -= 0.3*inch
-    
-    table_data = [['Invoice #', 'Date', 'Customer', 'Type', 'Amount', 'Paid', 'Balance']]
-    for inv in data['invoices'][:25]:
-        inv_date = inv.get('date', '')
-        if isinstance(inv_date, str):
-            inv_date = inv_date[:10]
-        elif hasattr(inv_date, 'strftime'):
-            inv_date = inv_date.strftime('%Y-%m-%d')
-        
+    rows = []
+    for inv in data['invoices']:
         customer = inv.get('customer_name') or inv.get('walk_in_name') or 'N/A'
-        table_data.append([
+        rows.append([
             inv.get('invoice_number', '')[:15],
-            inv_date,
+            excel_date(inv.get('date', '')),
             customer[:20],
             inv.get('invoice_type', '')[:4],
             f"{inv.get('grand_total', 0):.2f}",
             f"{inv.get('paid_amount', 0):.2f}",
             f"{inv.get('balance_due', 0):.2f}"
         ])
-    
-    table = Table(table_data, colWidths=[1.2*inch, 0.9*inch, 1.5*inch, 0.6*inch, 0.8*inch, 0.8*inch, 0.8*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=invoices_report_{datetime.now().strftime('%Y%m%d')}.pdf"}
+    spec = {
+        "title": "Invoices Report",
+        "subtitle": report_period_subtitle(start_date, end_date),
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [
+                [f"Total Amount: {summary['total_amount']:.3f}", f"Total Paid: {summary['total_paid']:.3f}"],
+                [f"Total Balance: {summary['total_balance']:.3f}", f"Count: {data['count']}"],
+            ], 2.5),
+            ("heading", "Invoices"),
+            ("table", ['Invoice #', 'Date', 'Customer', 'Type', 'Amount', 'Paid', 'Balance'],
+             rows, [1.2, 0.9, 1.5, 0.6, 0.8, 0.8, 0.8], "standard"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"invoices_report_{datetime.now().strftime('%Y%m%d')}.pdf"
     )
 
 
@@ -9295,69 +8408,34 @@ async def export_parties_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export parties report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data
-    data = await view_parties_report(
+    data = decimal_to_float(await view_parties_report(
         party_type=party_type,
         sort_by="outstanding_desc",
         current_user=current_user
-    )
-    
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Parties Report")
-    
-    c.setFont("Helvetica", 10)
-    c.drawString(inch, height - inch - 0.3*inch, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-    
-    # Table
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, f"Total Parties: {data['count']}")
-    y_position -= 0.4*inch
-    
-    table_data = [['Party Name', 'Type', 'Phone', 'Email', 'Outstanding']]
-    for party in data['parties'][:30]:
-        table_data.append([
-            party.get('name', '')[:25],
-            party.get('party_type', '')[:8],
-            party.get('phone', '')[:15],
-            party.get('email', '')[:20],
+    ))
+    
+    rows = [
+        [
+            (party.get('name') or '')[:25],
+            (party.get('party_type') or '')[:8],
+            (party.get('phone') or '')[:15],
+            (party.get('email') or '')[:20],
             f"{party.get('outstanding', 0):.2f}"
-        ])
-    
-    table = Table(table_data, colWidths=[2*inch, 0.8*inch, 1.2*inch, 1.5*inch, 1*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=parties_report_{datetime.now().strftime('%Y%m%d')}.pdf"}
+        ]
+        for party in data['parties']
+    ]
+    spec = {
+        "title": "Parties Report",
+        "subtitle": report_period_subtitle(),
+        "blocks": [
+            ("heading", f"Total Parties: {data['count']}"),
+            ("table", ['Party Name', 'Type', 'Phone', 'Email', 'Outstanding'],
+             rows, [2, 0.8, 1.2, 1.5, 1], "standard"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"parties_report_{datetime.now().strftime('%Y%m%d')}.pdf"
     )
 
 
@@ -9370,16 +8448,7 @@ async def export_transactions_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export transactions report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data
-    data = await view_transactions_report(
+    data = decimal_to_float(await build_transactions_report(
         start_date=start_date,
         end_date=end_date,
         transaction_type=transaction_type,
@@ -9387,80 +8456,37 @@ async def export_transactions_pdf(
         party_id=party_id,
         sort_by=None,
         current_user=current_user
-    )
-    
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
+    ))
     
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Transactions Report")
-    
-    c.setFont("Helvetica", 10)
-    date_str = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if start_date or end_date:
-        date_str += f" | Period: {start_date or 'Start'} to {end_date or 'End'}"
-    c.drawString(inch, height - inch - 0.3*inch, date_str)
-    
-    # Summary
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Summary")
-    y_position -= 0.3*inch
-    
-    c.setFont("Helvetica", 10)
     summary = data['summary']
-    c.drawString(inch, y_position, f"Total Credit: {summary['total_credit']:.3f}")
-    c.drawString(inch + 2.5*inch, y_position, f"Total Debit: {summary['total_debit']:.3f}")
-    y_position -= 0.2*inch
-    c.drawString(inch, y_position, f"Net Balance: {summary['net_balance']:.3f}")
-    c.drawString(inch + 2.5*inch, y_position, f"Count: {data['count']}")
-    y_position -= 0.5*inch
-    
-    # Table
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Transactions")
-    y_position -= 0.3*inch
-    
-    table_data = [['TXN #', 'Date', 'Type', 'Account', 'Party', 'Amount']]
-    for txn in data['transactions'][:30]:
-        txn_date = txn.get('date', '')
-        if isinstance(txn_date, str):
-            txn_date = txn_date[:10]
-        elif hasattr(txn_date, 'strftime'):
-            txn_date = txn_date.strftime('%Y-%m-%d')
-        
-        table_data.append([
+    rows = [
+        [
             txn.get('transaction_number', '')[:15],
-            txn_date,
+            excel_date(txn.get('date', '')),
             txn.get('transaction_type', '')[:6],
-            txn.get('account_name', '')[:20],
-            txn.get('party_name', 'N/A')[:15],
+            (txn.get('account_name') or '')[:20],
+            (txn.get('party_name') or 'N/A')[:15],
             f"{txn.get('amount', 0):.2f}"
-        ])
-    
-    table = Table(table_data, colWidths=[1.2*inch, 0.9*inch, 0.7*inch, 1.5*inch, 1.2*inch, 0.8*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=transactions_report_{datetime.now().strftime('%Y%m%d')}.pdf"}
+        ]
+        for txn in data['transactions']
+    ]
+    spec = {
+        "title": "Transactions Report",
+        "subtitle": report_period_subtitle(start_date, end_date),
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [
+                [f"Total Credit: {summary['total_credit']:.3f}", f"Total Debit: {summary['total_debit']:.3f}"],
+                [f"Net Balance: {summary['net_balance']:.3f}", f"Count: {data['count']}"],
+            ], 2.5),
+            ("heading", "Transactions"),
+            ("table", ['TXN #', 'Date', 'Type', 'Account', 'Party', 'Amount'],
+             rows, [1.2, 0.9, 0.7, 1.5, 1.2, 0.8], "standard"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"transactions_report_{datetime.now().strftime('%Y%m%d')}.pdf"
     )
 
 
@@ -9473,96 +8499,44 @@ async def export_inventory_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export inventory report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data
-    data = await view_inventory_report(
+    data = decimal_to_float(await view_inventory_report(
         start_date=start_date,
         end_date=end_date,
         movement_type=movement_type,
         category=category,
         sort_by=None,
         current_user=current_user
-    )
-    
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Inventory Report")
-    
-    c.setFont("Helvetica", 10)
-    date_str = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if start_date or end_date:
-        date_str += f" | Period: {start_date or 'Start'} to {end_date or 'End'}"
-    c.drawString(inch, height - inch - 0.3*inch, date_str)
+    ))
     
-    # Summary
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Summary")
-    y_position -= 0.3*inch
-    
-    c.setFont("Helvetica", 10)
     summary = data['summary']
-    c.drawString(inch, y_position, f"Total In: {summary['total_in']:.2f} pcs")
-    c.drawString(inch + 2.5*inch, y_position, f"Total Out: {summary['total_out']:.2f} pcs")
-    y_position -= 0.2*inch
-    c.drawString(inch, y_position, f"Weight In: {summary['total_weight_in']:.3f} g")
-    c.drawString(inch + 2.5*inch, y_position, f"Weight Out: {summary['total_weight_out']:.3f} g")
-    y_position -= 0.5*inch
-    
-    # Table
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Stock Movements")
-    y_position -= 0.3*inch
-    
-    table_data = [['Date', 'Category', 'Type', 'Qty', 'Weight', 'Reference']]
-    for mov in data['movements'][:30]:
-        mov_date = mov.get('date', '')
-        if isinstance(mov_date, str):
-            mov_date = mov_date[:10]
-        elif hasattr(mov_date, 'strftime'):
-            mov_date = mov_date.strftime('%Y-%m-%d')
-        
-        table_data.append([
-            mov_date,
+    rows = [
+        [
+            excel_date(mov.get('date', '')),
             (mov.get('header_name') or '')[:15],
             (mov.get('movement_type') or '')[:10],
             f"{mov.get('qty_delta', 0):.1f}",
             f"{mov.get('weight_delta', 0):.2f}",
             (mov.get('reference_type') or '')[:12]
-        ])
-    
-    table = Table(table_data, colWidths=[0.9*inch, 1.3*inch, 1*inch, 0.7*inch, 0.9*inch, 1.2*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename=inventory_report_{datetime.now().strftime('%Y%m%d')}.pdf"}
+        ]
+        for mov in data['movements']
+    ]
+    spec = {
+        "title": "Inventory Report",
+        "subtitle": report_period_subtitle(start_date, end_date),
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [
+                [f"Total In: {summary['total_in']:.2f} pcs", f"Total Out: {summary['total_out']:.2f} pcs"],
+                [f"Weight In: {summary['total_weight_in']:.3f} g", f"Weight Out: {summary['total_weight_out']:.3f} g"],
+            ], 2.5),
+            ("heading", "Stock Movements"),
+            ("table", ['Date', 'Category', 'Type', 'Qty', 'Weight', 'Reference'],
+             rows, [0.9, 1.3, 1, 0.7, 0.9, 1.2], "standard"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"inventory_report_{datetime.now().strftime('%Y%m%d')}.pdf"
     )
 
 
@@ -9570,108 +8544,94 @@ async def export_inventory_pdf(
 # MODULE 5/10: SALES HISTORY REPORT (Finalized Invoices Only)
 # ============================================================================
 
-@api_router.get("/reports/sales-history")
-async def get_sales_history_report(
+def history_date_query(date_from: Optional[str], date_to: Optional[str]) -> dict:
+    """{"date": {...}} bounds for the history reports ({} when no range is given)"""
+    bounds = {}
+    if date_from:
+        bounds['$gte'] = datetime.fromisoformat(date_from)
+    if date_to:
+        bounds['$lte'] = datetime.fromisoformat(date_to)
+    return {"date": bounds} if bounds else {}
+
+
+def history_date_display(value) -> str:
+    """YYYY-MM-DD for the history report rows (strings are truncated as stored)"""
+    if isinstance(value, str):
+        return value[:10]
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+async def reference_totals(collection, query: dict, field: str, absolute: bool = False) -> Dict[str, float]:
+    """
+    Sum one field per reference_id over the matching documents.
+    
+    Only reference_id and the summed field are read, and the cursor is
+    consumed in batches, so memory grows with the number of references
+    rather than the number of documents.
+    """
+    totals: Dict[str, float] = {}
+    cursor = collection.find(query, {"_id": 0, "reference_id": 1, field: 1})
+    async for doc in cursor.batch_size(STREAM_BATCH_SIZE):
+        ref_id = doc.get('reference_id')
+        if not ref_id:
+            continue
+        value = safe_float(doc.get(field, 0))
+        totals[ref_id] = totals.get(ref_id, 0.0) + (abs(value) if absolute else value)
+    return totals
+
+
+async def iter_sales_history(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     party_id: Optional[str] = None,
     search: Optional[str] = None,
-    current_user: User = Depends(require_permission('reports.view'))
-):
+    totals: Optional[dict] = None
+) -> AsyncIterator[dict]:
     """
-    Get sales history report using SOURCE-OF-TRUTH DATA.
+    Sales history records, newest invoice first, streamed from one aggregation.
+    When given, ``totals`` accumulates invoices/weight/sales (unrounded) for the summary.
     
-    CRITICAL FIX: Uses StockMovements and Transactions for accurate reporting
-    - Weight data from StockMovements (type="Stock OUT")
-    - Financial data from Transactions (income account credits)
-    - Sales returns are automatically reflected
-    
-    Filters:
-    - date_from/date_to: Date range filter
-    - party_id: Filter by specific party (or "all" for all parties)
-    - search: Search in customer name, phone, or invoice_id
-    
-    Returns table with:
-    - invoice_id
-    - customer name + phone (handles both saved and walk-in)
-    - date
-    - total_weight_grams (from StockMovements)
-    - purity summary ("Mixed" if multiple purities, otherwise single purity)
-    - grand_total (from Transactions)
+    Weight comes from the "Stock OUT" movements and the amount from the
+    sales-income credits in the same date range, both summed per invoice up
+    front. The customer's phone is joined with $lookup instead of a
+    parties.find_one per invoice.
     """
-    # Query for FINALIZED invoices only (for display details)
-    query = {
-        "is_deleted": False,
-        "status": "finalized"  # CRITICAL: Only finalized invoices
-    }
-    
-    # Date filters
-    if date_from:
-        query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-    if date_to:
-        end_dt = datetime.fromisoformat(date_to)
-        if 'date' in query:
-            query['date']['$lte'] = end_dt
-        else:
-            query['date'] = {"$lte": end_dt}
+    date_query = history_date_query(date_from, date_to)
     
-    # Party filter
+    # Query for FINALIZED invoices only (for display details)
+    query = {"is_deleted": False, "status": "finalized", **date_query}
     if party_id and party_id != 'all':
         query['customer_id'] = party_id
     
-    # Get invoices
-    invoices = await db.invoices.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    # Convert Decimal128 to float for calculations
-    invoices = [decimal_to_float(inv) for inv in invoices]
-    
-    # Build queries for SOURCE-OF-TRUTH data
-    stock_query = {"is_deleted": False, "movement_type": "Stock OUT"}
-    txn_query = {"is_deleted": False}
-    
-    if date_from:
-        stock_query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-        txn_query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-    if date_to:
-        end_dt = datetime.fromisoformat(date_to)
-        if 'date' in stock_query:
-            stock_query['date']['$lte'] = end_dt
-            txn_query['date']['$lte'] = end_dt
-        else:
-            stock_query['date'] = {"$lte": end_dt}
-            txn_query['date'] = {"$lte": end_dt}
-    
-    # Get StockMovements and Transactions
-    stock_movements = await db.stock_movements.find(stock_query, {"_id": 0}).to_list(10000)
-    transactions = await db.transactions.find(txn_query, {"_id": 0}).to_list(10000)
+    # Per-invoice totals from the SOURCE-OF-TRUTH collections
+    weight_by_invoice = await reference_totals(
+        db.stock_movements,
+        {"is_deleted": False, "movement_type": "Stock OUT", **date_query},
+        "weight_delta", absolute=True
+    )
+    amount_by_invoice = await reference_totals(
+        db.transactions,
+        {
+            "is_deleted": False,
+            "category": {"$in": ['sales', 'sales_income']},
+            "transaction_type": "credit",
+            **date_query
+        },
+        "amount"
+    )
     
-    # Convert Decimal128 to float for calculations
-    stock_movements = [decimal_to_float(m) for m in stock_movements]
-    transactions = [decimal_to_float(t) for t in transactions]
-    
-    # Build maps for quick lookup by reference_id (invoice.id)
-    stock_by_invoice = {}
-    for movement in stock_movements:
-        ref_id = movement.get('reference_id')
-        if ref_id:
-            if ref_id not in stock_by_invoice:
-                stock_by_invoice[ref_id] = []
-            stock_by_invoice[ref_id].append(movement)
-    
-    txn_by_invoice = {}
-    for txn in transactions:
-        ref_id = txn.get('reference_id')
-        # Only count income account transactions for sales
-        if ref_id and txn.get('category') in ['sales', 'sales_income']:
-            if ref_id not in txn_by_invoice:
-                txn_by_invoice[ref_id] = []
-            txn_by_invoice[ref_id].append(txn)
-    
-    # Process each invoice using SOURCE-OF-TRUTH data
-    sales_records = []
-    total_sales = 0.0
-    total_weight = 0.0
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"date": -1}},
+        {"$lookup": {"from": "parties", "localField": "customer_id", "foreignField": "id", "as": "party"}},
+        {"$project": {"_id": 0}},
+    ]
+    search_lower = search.lower() if search else None
     
-    for inv in invoices:
+    async for inv in db.invoices.aggregate(pipeline):
+        inv = decimal_to_float(inv)
         invoice_id = inv.get('id')
         
         # Get customer info (handle both saved and walk-in)
@@ -9680,24 +8640,20 @@ async def get_sales_history_report(
             customer_phone = inv.get('walk_in_phone', '')
         else:
             customer_name = inv.get('customer_name', 'Unknown Customer')
-            # Fetch phone from party if saved customer
             customer_phone = ''
-            if inv.get('customer_id'):
-                party = await db.parties.find_one({"id": inv['customer_id']}, {"_id": 0, "phone": 1})
-                if party:
-                    customer_phone = party.get('phone', '')
+            if inv.get('customer_id') and inv.get('party'):
+                customer_phone = inv['party'][0].get('phone', '')
         
-        # Get weight from StockMovements (SOURCE-OF-TRUTH)
-        invoice_movements = stock_by_invoice.get(invoice_id, [])
-        invoice_weight = sum(abs(safe_float(m.get('weight_delta', 0))) for m in invoice_movements)
-        
-        # Get sales amount from Transactions (SOURCE-OF-TRUTH)
-        invoice_txns = txn_by_invoice.get(invoice_id, [])
-        invoice_amount = sum(safe_float(t.get('amount', 0)) for t in invoice_txns if t.get('transaction_type') == 'credit')
+        # Apply search filter (if provided)
+        if search_lower and not (
+            search_lower in customer_name.lower() or
+            search_lower in customer_phone.lower() or
+            search_lower in inv.get('invoice_number', '').lower()
+        ):
+            continue
         
         # Calculate purity summary from invoice items (for display only)
-        items = inv.get('items', [])
-        purities = list(set(item.get('purity') for item in items if item.get('purity')))
+        purities = list(set(item.get('purity') for item in inv.get('items', []) if item.get('purity')))
         if len(purities) == 0:
             purity_summary = "N/A"
         elif len(purities) == 1:
@@ -9705,42 +8661,64 @@ async def get_sales_history_report(
         else:
             purity_summary = "Mixed"
         
-        # Apply search filter (if provided)
-        if search:
-            search_lower = search.lower()
-            if not (
-                search_lower in customer_name.lower() or
-                search_lower in customer_phone.lower() or
-                search_lower in inv.get('invoice_number', '').lower()
-            ):
-                continue  # Skip this invoice if search doesn't match
-        
-        # Format date
-        invoice_date = inv.get('date', '')
-        if isinstance(invoice_date, str):
-            invoice_date = invoice_date[:10]
-        elif hasattr(invoice_date, 'strftime'):
-            invoice_date = invoice_date.strftime('%Y-%m-%d')
-        
-        sales_records.append({
+        invoice_weight = weight_by_invoice.get(invoice_id, 0)
+        invoice_amount = amount_by_invoice.get(invoice_id, 0)
+        if totals is not None:
+            totals["invoices"] = totals.get("invoices", 0) + 1
+            totals["weight"] = totals.get("weight", 0.0) + invoice_weight
+            totals["sales"] = totals.get("sales", 0.0) + invoice_amount
+        
+        yield {
             "invoice_id": inv.get('invoice_number', ''),
             "customer_name": customer_name,
             "customer_phone": customer_phone,
-            "date": invoice_date,
+            "date": history_date_display(inv.get('date', '')),
             "total_weight_grams": round(invoice_weight, 3),  # FROM STOCKMOVEMENTS
             "purity_summary": purity_summary,
             "grand_total": round(invoice_amount, 2)  # FROM TRANSACTIONS
-        })
-        
-        total_sales += invoice_amount
-        total_weight += invoice_weight
+        }
+
+
+@api_router.get("/reports/sales-history")
+async def get_sales_history_report(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    party_id: Optional[str] = None,
+    search: Optional[str] = None,
+    current_user: User = Depends(require_permission('reports.view'))
+):
+    """
+    Get sales history report using SOURCE-OF-TRUTH DATA.
+    
+    CRITICAL FIX: Uses StockMovements and Transactions for accurate reporting
+    - Weight data from StockMovements (type="Stock OUT")
+    - Financial data from Transactions (income account credits)
+    - Sales returns are automatically reflected
+    
+    Filters:
+    - date_from/date_to: Date range filter
+    - party_id: Filter by specific party (or "all" for all parties)
+    - search: Search in customer name, phone, or invoice_id
+    
+    Returns table with:
+    - invoice_id
+    - customer name + phone (handles both saved and walk-in)
+    - date
+    - total_weight_grams (from StockMovements)
+    - purity summary ("Mixed" if multiple purities, otherwise single purity)
+    - grand_total (from Transactions)
+    """
+    totals = {"invoices": 0, "weight": 0.0, "sales": 0.0}
+    sales_records = [
+        record async for record in iter_sales_history(date_from, date_to, party_id, search, totals=totals)
+    ]
     
     return {
         "sales_records": sales_records,
         "summary": {
-            "total_sales": round(total_sales, 2),  # FROM TRANSACTIONS
-            "total_weight": round(total_weight, 3),  # FROM STOCKMOVEMENTS
-            "total_invoices": len(sales_records)
+            "total_sales": round(totals["sales"], 2),  # FROM TRANSACTIONS
+            "total_weight": round(totals["weight"], 3),  # FROM STOCKMOVEMENTS
+            "total_invoices": totals["invoices"]
         }
     }
 
@@ -9753,83 +8731,43 @@ async def export_sales_history(
     search: Optional[str] = None,
     current_user: User = Depends(require_permission('reports.view'))
 ):
-    """Export sales history report as Excel file with applied filters"""
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment
-    
-    # Get data using the main report function
-    data = await get_sales_history_report(
-        date_from=date_from,
-        date_to=date_to,
-        party_id=party_id,
-        search=search,
-        current_user=current_user
-    )
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Sales History"
-    
-    # Add summary section
-    ws.merge_cells('A1:G1')
-    title_cell = ws['A1']
-    title_cell.value = "Sales History Report (Finalized Invoices)"
-    title_cell.font = Font(bold=True, size=14)
-    title_cell.alignment = Alignment(horizontal='center')
-    
-    ws['A2'] = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if date_from or date_to:
-        ws['A3'] = f"Period: {date_from or 'Start'} to {date_to or 'End'}"
-    
-    # Summary row
-    summary_row = 5
-    ws[f'A{summary_row}'] = "Total Invoices:"
-    ws[f'B{summary_row}'] = data['summary']['total_invoices']
-    ws[f'C{summary_row}'] = "Total Weight:"
-    ws[f'D{summary_row}'] = f"{data['summary']['total_weight']:.3f} g"
-    ws[f'E{summary_row}'] = "Total Sales:"
-    ws[f'F{summary_row}'] = f"{data['summary']['total_sales']:.2f} OMR"
-    
-    # Headers
-    header_row = summary_row + 2
-    headers = ["Invoice #", "Customer Name", "Phone", "Date", "Weight (g)", "Purity", "Grand Total (OMR)"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col, value=header)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data rows
-    for row_idx, record in enumerate(data['sales_records'], header_row + 1):
-        ws.cell(row=row_idx, column=1, value=record['invoice_id'])
-        ws.cell(row=row_idx, column=2, value=record['customer_name'])
-        ws.cell(row=row_idx, column=3, value=record['customer_phone'])
-        ws.cell(row=row_idx, column=4, value=record['date'])
-        ws.cell(row=row_idx, column=5, value=record['total_weight_grams'])
-        ws.cell(row=row_idx, column=6, value=record['purity_summary'])
-        ws.cell(row=row_idx, column=7, value=record['grand_total'])
-    
-    # Column widths
-    ws.column_dimensions['A'].width = 18
-    ws.column_dimensions['B'].width = 25
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 12
-    ws.column_dimensions['G'].width = 18
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    filename = f"sales_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    """Export sales history report as Excel file with applied filters (rows streamed, summary below them)"""
+    export = ExcelExport()
+    ws = export.sheet("Sales History", widths=[18, 25, 15, 12, 15, 12, 18])
+    
+    # Title section (write-only sheets are filled top to bottom)
+    ws.merged_cells.add('A1:G1')
+    export.append(ws, ["Sales History Report (Finalized Invoices)"], style=ExcelExport.TITLE)
+    export.append(ws, [f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"])
+    export.append(ws, [f"Period: {date_from or 'Start'} to {date_to or 'End'}"] if date_from or date_to else [])
+    export.append(ws, [])
+    
+    # Headers and data rows
+    export.append(
+        ws,
+        ["Invoice #", "Customer Name", "Phone", "Date", "Weight (g)", "Purity", "Grand Total (OMR)"],
+        style=ExcelExport.HEADER
     )
+    totals = {"invoices": 0, "weight": 0.0, "sales": 0.0}
+    await export.write_rows(ws, iter_sales_history(date_from, date_to, party_id, search, totals=totals), lambda record: [
+        record['invoice_id'],
+        record['customer_name'],
+        record['customer_phone'],
+        record['date'],
+        record['total_weight_grams'],
+        record['purity_summary'],
+        record['grand_total'],
+    ])
+    
+    # Summary (known only once every row has been written)
+    export.append(ws, [])
+    export.append(ws, [
+        "Total Invoices:", totals["invoices"],
+        "Total Weight:", f"{totals['weight']:.3f} g",
+        "Total Sales:", f"{totals['sales']:.2f} OMR",
+    ])
+    
+    return await export.response(f"sales_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
 
 
 @api_router.get("/reports/sales-history-pdf")
@@ -9841,15 +8779,6 @@ async def export_sales_history_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export sales history report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data using the main report function
     data = await get_sales_history_report(
         date_from=date_from,
         date_to=date_to,
@@ -9858,89 +8787,130 @@ async def export_sales_history_pdf(
         current_user=current_user
     )
     
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Sales History Report")
-    
-    c.setFont("Helvetica", 10)
-    date_str = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if date_from or date_to:
-        date_str += f" | Period: {date_from or 'Start'} to {date_to or 'End'}"
-    c.drawString(inch, height - inch - 0.3*inch, date_str)
-    
-    # Summary section
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Summary")
-    y_position -= 0.3*inch
-    
-    c.setFont("Helvetica", 10)
     summary = data['summary']
-    c.drawString(inch, y_position, f"Total Invoices: {summary['total_invoices']}")
-    c.drawString(inch + 2.5*inch, y_position, f"Total Weight: {summary['total_weight']:.3f} g")
-    y_position -= 0.2*inch
-    c.drawString(inch, y_position, f"Total Sales: {summary['total_sales']:.2f} OMR")
-    y_position -= 0.5*inch
-    
-    # Table header
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Sales Records")
-    y_position -= 0.3*inch
-    
-    # Create table data
-    table_data = [['Invoice #', 'Customer', 'Phone', 'Date', 'Weight (g)', 'Purity', 'Total (OMR)']]
-    
-    # Add sales records (limit to 30 records per page for now)
-    for record in data['sales_records'][:30]:
-        table_data.append([
-            record.get('invoice_id', '')[:15],
-            record.get('customer_name', '')[:20],
-            record.get('customer_phone', '')[:12],
-            record.get('date', '')[:10],
+    rows = [
+        [
+            (record.get('invoice_id') or '')[:15],
+            (record.get('customer_name') or '')[:20],
+            (record.get('customer_phone') or '')[:12],
+            (record.get('date') or '')[:10],
             f"{record.get('total_weight_grams', 0):.2f}",
             record.get('purity_summary', ''),
             f"{record.get('grand_total', 0):.2f}"
-        ])
+        ]
+        for record in data['sales_records']
+    ]
+    spec = {
+        "title": "Sales History Report",
+        "subtitle": report_period_subtitle(date_from, date_to),
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [
+                [f"Total Invoices: {summary['total_invoices']}", f"Total Weight: {summary['total_weight']:.3f} g"],
+                [f"Total Sales: {summary['total_sales']:.2f} OMR"],
+            ], 2.5),
+            ("heading", "Sales Records"),
+            ("table", ['Invoice #', 'Customer', 'Phone', 'Date', 'Weight (g)', 'Purity', 'Total (OMR)'],
+             rows, [1.0, 1.3, 0.9, 0.8, 0.8, 0.7, 0.9], "compact"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"sales_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    )
+
+
+async def iter_purchase_history(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    vendor_party_id: Optional[str] = None,
+    search: Optional[str] = None,
+    totals: Optional[dict] = None
+) -> AsyncIterator[dict]:
+    """
+    Purchase history records, newest purchase first, streamed from one aggregation.
+    When given, ``totals`` accumulates purchases/weight/amount (unrounded) for the summary.
+    """
+    date_query = history_date_query(date_from, date_to)
+    
+    # Query for ALL COMMITTED purchases (excludes only Draft/Voided)
+    query = {
+        "is_deleted": False,
+        "status": {"$in": ["Paid", "Partially Paid", "Finalized (Unpaid)"]},  # CRITICAL: All committed purchases
+        **date_query
+    }
+    if vendor_party_id and vendor_party_id != 'all':
+        query['vendor_party_id'] = vendor_party_id
     
-    # Create and style table
-    table = Table(table_data, colWidths=[1.0*inch, 1.3*inch, 0.9*inch, 0.8*inch, 0.8*inch, 0.7*inch, 0.9*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 8),
-        ('FONTSIZE', (0, 1), (-1, -1), 7),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-    ]))
-    
-    # Draw table
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    filename = f"sales_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    # Per-purchase totals from the SOURCE-OF-TRUTH collections
+    weight_by_purchase = await reference_totals(
+        db.stock_movements,
+        {"is_deleted": False, "movement_type": "Stock IN", **date_query},
+        "weight_delta", absolute=True
     )
+    amount_by_purchase = await reference_totals(
+        db.transactions,
+        {
+            "is_deleted": False,
+            "category": {"$in": ['purchase', 'purchases', 'inventory_purchase']},
+            "transaction_type": "credit",
+            **date_query
+        },
+        "amount"
+    )
+    
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"date": -1}},
+        {"$lookup": {"from": "parties", "localField": "vendor_party_id", "foreignField": "id", "as": "vendor"}},
+        {"$project": {"_id": 0}},
+    ]
+    search_lower = search.lower() if search else None
+    
+    async for purchase in db.purchases.aggregate(pipeline):
+        purchase_id = purchase.get('id')
+        
+        # Vendor info from the joined (live) party
+        vendor_name = "Unknown Vendor"
+        vendor_phone = ""
+        vendor = next((v for v in purchase.get('vendor', []) if v.get('is_deleted') is False), None)
+        if purchase.get('vendor_party_id') and vendor:
+            vendor_name = vendor.get('name', 'Unknown Vendor')
+            vendor_phone = vendor.get('phone', '')
+        
+        # Apply search filter (if provided)
+        if search_lower and not (
+            search_lower in vendor_name.lower() or
+            search_lower in vendor_phone.lower() or
+            search_lower in purchase.get('description', '').lower()
+        ):
+            continue
+        
+        purchase_weight = weight_by_purchase.get(purchase_id, 0)
+        purchase_amount = amount_by_purchase.get(purchase_id, 0)
+        if totals is not None:
+            totals["purchases"] = totals.get("purchases", 0) + 1
+            totals["weight"] = totals.get("weight", 0.0) + purchase_weight
+            totals["amount"] = totals.get("amount", 0.0) + purchase_amount
+        
+        yield {
+            "vendor_name": vendor_name,
+            "vendor_phone": vendor_phone,
+            "date": history_date_display(purchase.get('date', '')),
+            "description": purchase.get('description', ''),
+            "weight_grams": round(purchase_weight, 3),  # FROM STOCKMOVEMENTS
+            "entered_purity": purchase.get('entered_purity', 0),
+            "valuation_purity": "22K",  # valuation_purity 916 = 22K
+            "amount_total": round(purchase_amount, 2)  # FROM TRANSACTIONS
+        }
 
 
-@api_router.get("/reports/purchase-history")
-async def get_purchase_history_report(
+async def build_purchase_history_report(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     vendor_party_id: Optional[str] = None,
     search: Optional[str] = None,
-    current_user: User = Depends(require_permission('reports.view'))
+    current_user: Optional[User] = None
 ):
     """
     Get purchase history report using SOURCE-OF-TRUTH DATA.
@@ -9968,227 +8938,86 @@ async def get_purchase_history_report(
     - total_weight (from StockMovements)
     - total_purchases (count)
     """
-    # Query for ALL COMMITTED purchases (excludes only Draft/Voided)
-    query = {
-        "is_deleted": False,
-        "status": {"$in": ["Paid", "Partially Paid", "Finalized (Unpaid)"]}  # CRITICAL: All committed purchases
-    }
-    
-    # Date filters
-    if date_from:
-        query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-    if date_to:
-        end_dt = datetime.fromisoformat(date_to)
-        if 'date' in query:
-            query['date']['$lte'] = end_dt
-        else:
-            query['date'] = {"$lte": end_dt}
-    
-    # Vendor filter
-    if vendor_party_id and vendor_party_id != 'all':
-        query['vendor_party_id'] = vendor_party_id
-    
-    # Get purchases
-    purchases = await db.purchases.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    
-    # Build queries for SOURCE-OF-TRUTH data
-    stock_query = {"is_deleted": False, "movement_type": "Stock IN"}
-    txn_query = {"is_deleted": False}
-    
-    if date_from:
-        stock_query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-        txn_query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-    if date_to:
-        end_dt = datetime.fromisoformat(date_to)
-        if 'date' in stock_query:
-            stock_query['date']['$lte'] = end_dt
-            txn_query['date']['$lte'] = end_dt
-        else:
-            stock_query['date'] = {"$lte": end_dt}
-            txn_query['date'] = {"$lte": end_dt}
-    
-    # Get StockMovements and Transactions
-    stock_movements = await db.stock_movements.find(stock_query, {"_id": 0}).to_list(10000)
-    transactions = await db.transactions.find(txn_query, {"_id": 0}).to_list(10000)
-    
-    # Build maps for quick lookup by reference_id (purchase.id)
-    stock_by_purchase = {}
-    for movement in stock_movements:
-        ref_id = movement.get('reference_id')
-        if ref_id:
-            if ref_id not in stock_by_purchase:
-                stock_by_purchase[ref_id] = []
-            stock_by_purchase[ref_id].append(movement)
-    
-    txn_by_purchase = {}
-    for txn in transactions:
-        ref_id = txn.get('reference_id')
-        # Only count purchase-related transactions
-        if ref_id and txn.get('category') in ['purchase', 'purchases', 'inventory_purchase']:
-            if ref_id not in txn_by_purchase:
-                txn_by_purchase[ref_id] = []
-            txn_by_purchase[ref_id].append(txn)
-    
-    # Process each purchase using SOURCE-OF-TRUTH data
-    purchase_records = []
-    total_amount = 0.0
-    total_weight = 0.0
-    
-    for purchase in purchases:
-        purchase_id = purchase.get('id')
-        
-        # Get vendor info from parties collection
-        vendor_name = "Unknown Vendor"
-        vendor_phone = ""
-        if purchase.get('vendor_party_id'):
-            vendor = await db.parties.find_one(
-                {"id": purchase['vendor_party_id'], "is_deleted": False},
-                {"_id": 0, "name": 1, "phone": 1}
-            )
-            if vendor:
-                vendor_name = vendor.get('name', 'Unknown Vendor')
-                vendor_phone = vendor.get('phone', '')
-        
-        # Apply search filter (if provided)
-        if search:
-            search_lower = search.lower()
-            if not (
-                search_lower in vendor_name.lower() or
-                search_lower in vendor_phone.lower() or
-                search_lower in purchase.get('description', '').lower()
-            ):
-                continue  # Skip this purchase if search doesn't match
-        
-        # Get weight from StockMovements (SOURCE-OF-TRUTH)
-        purchase_movements = stock_by_purchase.get(purchase_id, [])
-        purchase_weight = sum(abs(safe_float(m.get('weight_delta', 0))) for m in purchase_movements)
-        
-        # Get purchase amount from Transactions (SOURCE-OF-TRUTH)
-        purchase_txns = txn_by_purchase.get(purchase_id, [])
-        purchase_amount = sum(safe_float(t.get('amount', 0)) for t in purchase_txns if t.get('transaction_type') == 'credit')
-        
-        # Format date
-        purchase_date = purchase.get('date', '')
-        if isinstance(purchase_date, str):
-            purchase_date = purchase_date[:10]
-        elif hasattr(purchase_date, 'strftime'):
-            purchase_date = purchase_date.strftime('%Y-%m-%d')
-        
-        # Convert valuation_purity 916 to "22K" display
-        valuation_purity_display = "22K"  # 916 purity = 22K
-        
-        purchase_records.append({
-            "vendor_name": vendor_name,
-            "vendor_phone": vendor_phone,
-            "date": purchase_date,
-            "description": purchase.get('description', ''),
-            "weight_grams": round(purchase_weight, 3),  # FROM STOCKMOVEMENTS
-            "entered_purity": purchase.get('entered_purity', 0),
-            "valuation_purity": valuation_purity_display,
-            "amount_total": round(purchase_amount, 2)  # FROM TRANSACTIONS
-        })
-        
-        total_amount += purchase_amount
-        total_weight += purchase_weight
+    totals = {"purchases": 0, "weight": 0.0, "amount": 0.0}
+    purchase_records = [
+        record async for record in iter_purchase_history(date_from, date_to, vendor_party_id, search, totals=totals)
+    ]
     
-    # CRITICAL FIX: Convert entire response including purchase_records array to prevent Decimal128 serialization errors
-    return decimal_to_float({
+    # Decimal128 values are serialized directly by the response class
+    return {
         "purchase_records": purchase_records,
         "summary": {
-            "total_amount": round(total_amount, 2),  # FROM TRANSACTIONS
-            "total_weight": round(total_weight, 3),  # FROM STOCKMOVEMENTS
-            "total_purchases": len(purchase_records)
+            "total_amount": round(totals["amount"], 2),  # FROM TRANSACTIONS
+            "total_weight": round(totals["weight"], 3),  # FROM STOCKMOVEMENTS
+            "total_purchases": totals["purchases"]
         }
-    })
+    }
 
-@api_router.get("/reports/purchase-history-export")
-async def export_purchase_history(
+@api_router.get("/reports/purchase-history")
+async def get_purchase_history_report(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     vendor_party_id: Optional[str] = None,
     search: Optional[str] = None,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(require_permission('reports.view'))
 ):
-    """Export purchase history report as Excel file with applied filters"""
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment
-    
-    # Get data using the main report function
-    data = await get_purchase_history_report(
+    """Report data from build_purchase_history_report, serialized straight from BSON (no decimal_to_float copy)"""
+    data = await build_purchase_history_report(
         date_from=date_from,
         date_to=date_to,
         vendor_party_id=vendor_party_id,
         search=search,
         current_user=current_user
     )
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Purchase History"
-    
-    # Add summary section
-    ws.merge_cells('A1:H1')
-    title_cell = ws['A1']
-    title_cell.value = "Purchase History Report (All Committed Purchases)"
+    return BSONJSONResponse(data)
 
-    title_cell.font = Font(bold=True, size=14)
-    title_cell.alignment = Alignment(horizontal='center')
-    
-    ws['A2'] = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if date_from or date_to:
-        ws['A3'] = f"Period: {date_from or 'Start'} to {date_to or 'End'}"
-    
-    # Summary row
-    summary_row = 5
-    ws[f'A{summary_row}'] = "Total Purchases:"
-    ws[f'B{summary_row}'] = data['summary']['total_purchases']
-    ws[f'C{summary_row}'] = "Total Weight:"
-    ws[f'D{summary_row}'] = f"{data['summary']['total_weight']:.3f} g"
-    ws[f'E{summary_row}'] = "Total Amount:"
-    ws[f'F{summary_row}'] = f"{data['summary']['total_amount']:.2f} OMR"
-    
-    # Headers
-    header_row = summary_row + 2
-    headers = ["Vendor Name", "Phone", "Date", "Description", "Weight (g)", "Entered Purity", "Valuation Purity", "Amount (OMR)"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=header_row, column=col, value=header)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data rows
-    for row_idx, record in enumerate(data['purchase_records'], header_row + 1):
-        ws.cell(row=row_idx, column=1, value=record['vendor_name'])
-        ws.cell(row=row_idx, column=2, value=record['vendor_phone'])
-        ws.cell(row=row_idx, column=3, value=record['date'])
-        ws.cell(row=row_idx, column=4, value=record['description'])
-        ws.cell(row=row_idx, column=5, value=record['weight_grams'])
-        ws.cell(row=row_idx, column=6, value=record['entered_purity'])
-        ws.cell(row=row_idx, column=7, value=record['valuation_purity'])
-        ws.cell(row=row_idx, column=8, value=record['amount_total'])
-    
-    # Column widths
-    ws.column_dimensions['A'].width = 25
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 12
-    ws.column_dimensions['D'].width = 30
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 18
-    ws.column_dimensions['G'].width = 18
-    ws.column_dimensions['H'].width = 18
-    
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    filename = f"purchase_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+@api_router.get("/reports/purchase-history-export")
+async def export_purchase_history(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    vendor_party_id: Optional[str] = None,
+    search: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Export purchase history report as Excel file with applied filters (rows streamed, summary below them)"""
+    export = ExcelExport()
+    ws = export.sheet("Purchase History", widths=[25, 15, 12, 30, 15, 18, 18, 18])
+    
+    # Title section (write-only sheets are filled top to bottom)
+    ws.merged_cells.add('A1:H1')
+    export.append(ws, ["Purchase History Report (All Committed Purchases)"], style=ExcelExport.TITLE)
+    export.append(ws, [f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"])
+    export.append(ws, [f"Period: {date_from or 'Start'} to {date_to or 'End'}"] if date_from or date_to else [])
+    export.append(ws, [])
+    
+    # Headers and data rows
+    export.append(
+        ws,
+        ["Vendor Name", "Phone", "Date", "Description", "Weight (g)", "Entered Purity", "Valuation Purity", "Amount (OMR)"],
+        style=ExcelExport.HEADER
     )
+    totals = {"purchases": 0, "weight": 0.0, "amount": 0.0}
+    records = iter_purchase_history(date_from, date_to, vendor_party_id, search, totals=totals)
+    await export.write_rows(ws, records, lambda record: [
+        record['vendor_name'],
+        record['vendor_phone'],
+        record['date'],
+        record['description'],
+        record['weight_grams'],
+        record['entered_purity'],
+        record['valuation_purity'],
+        record['amount_total'],
+    ])
+    
+    # Summary (known only once every row has been written)
+    export.append(ws, [])
+    export.append(ws, [
+        "Total Purchases:", totals["purchases"],
+        "Total Weight:", f"{totals['weight']:.3f} g",
+        "Total Amount:", f"{totals['amount']:.2f} OMR",
+    ])
+    
+    return await export.response(f"purchase_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
 
 
 
@@ -10201,95 +9030,43 @@ async def export_purchase_history_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export purchase history report as PDF"""
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import inch
-    from reportlab.pdfgen import canvas
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle
-    from io import BytesIO
-    from fastapi.responses import StreamingResponse
-    
-    # Get data using the main report function
-    data = await get_purchase_history_report(
+    data = decimal_to_float(await build_purchase_history_report(
         date_from=date_from,
         date_to=date_to,
         vendor_party_id=vendor_party_id,
         search=search,
         current_user=current_user
-    )
-    
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # Header
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(inch, height - inch, "Purchase History Report (All Committed)")
-    
-    c.setFont("Helvetica", 10)
-    date_str = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    if date_from or date_to:
-        date_str += f" | Period: {date_from or 'Start'} to {date_to or 'End'}"
-    c.drawString(inch, height - inch - 0.3*inch, date_str)
-    
-    # Summary section
-    y_position = height - inch - 0.8*inch
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Summary")
-    y_position -= 0.3*inch
+    ))
     
-    c.setFont("Helvetica", 10)
     summary = data['summary']
-    c.drawString(inch, y_position, f"Total Purchases: {summary['total_purchases']}")
-    c.drawString(inch + 2.5*inch, y_position, f"Total Weight: {summary['total_weight']:.3f} g")
-    y_position -= 0.2*inch
-    c.drawString(inch, y_position, f"Total Amount: {summary['total_amount']:.2f} OMR")
-    y_position -= 0.5*inch
-    
-    # Table header
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(inch, y_position, "Purchase Records")
-    y_position -= 0.3*inch
-    
-    # Create table data
-    table_data = [['Vendor', 'Phone', 'Date', 'Weight (g)', 'Purity', 'Amount (OMR)']]
-    
-    # Add purchase records (limit to 30 records per page for now)
-    for record in data['purchase_records'][:30]:
-        table_data.append([
-            record.get('vendor_name', '')[:20],
-            record.get('vendor_phone', '')[:12],
-            record.get('date', '')[:10],
+    rows = [
+        [
+            (record.get('vendor_name') or '')[:20],
+            (record.get('vendor_phone') or '')[:12],
+            (record.get('date') or '')[:10],
             f"{record.get('weight_grams', 0):.2f}",
             f"{record.get('entered_purity', '')}K",
             f"{record.get('amount_total', 0):.2f}"
-        ])
-    
-    # Create and style table
-    table = Table(table_data, colWidths=[1.5*inch, 1.0*inch, 0.9*inch, 0.9*inch, 0.8*inch, 1.0*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 8),
-        ('FONTSIZE', (0, 1), (-1, -1), 7),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-    ]))
-    
-    # Draw table
-    table.wrapOn(c, width, height)
-    table.drawOn(c, inch, y_position - len(table_data) * 0.25*inch)
-    
-    c.save()
-    buffer.seek(0)
-    
-    filename = f"purchase_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        ]
+        for record in data['purchase_records']
+    ]
+    spec = {
+        "title": "Purchase History Report (All Committed)",
+        "subtitle": report_period_subtitle(date_from, date_to),
+        "blocks": [
+            ("heading", "Summary"),
+            ("grid", [
+                [f"Total Purchases: {summary['total_purchases']}", f"Total Weight: {summary['total_weight']:.3f} g"],
+                [f"Total Amount: {summary['total_amount']:.2f} OMR"],
+            ], 2.5),
+            ("heading", "Purchase Records"),
+            ("table", ['Vendor', 'Phone', 'Date', 'Weight (g)', 'Purity', 'Amount (OMR)'],
+             rows, [1.5, 1.0, 0.9, 0.9, 0.8, 1.0], "compact"),
+        ],
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"purchase_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     )
 
 
@@ -10412,24 +9189,16 @@ async def get_returns_summary_report(
     }
 
 
-@api_router.get("/reports/returns-export")
-async def export_returns_report(
+def returns_report_query(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     return_type: Optional[str] = None,
     status: Optional[str] = None,
     refund_mode: Optional[str] = None,
     party_id: Optional[str] = None,
-    search: Optional[str] = None,
-    current_user: User = Depends(require_permission('reports.view'))
-):
-    """Export returns report as Excel file with applied filters"""
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-    
-    # Build query
+    search: Optional[str] = None
+) -> dict:
+    """Returns filter shared by the Excel and PDF returns exports"""
     query = {"is_deleted": False}
     
     # Date filters
@@ -10458,108 +9227,64 @@ async def export_returns_report(
     if party_id and party_id != 'all':
         query['party_id'] = party_id
     
-    # Get returns
-    returns = await db.returns.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    
-    # Apply search filter
+    # Search filter (case-insensitive substring, evaluated by MongoDB)
     if search:
-        search_lower = search.lower()
-        returns = [
-            ret for ret in returns
-            if (search_lower in ret.get('party_name', '').lower() or
-                search_lower in ret.get('return_number', '').lower() or
-                search_lower in ret.get('reason', '').lower())
+        search_pattern = {"$regex": re.escape(search), "$options": "i"}
+        query['$or'] = [
+            {"party_name": search_pattern},
+            {"return_number": search_pattern},
+            {"reason": search_pattern}
         ]
     
-    # Create workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Returns Report"
-    
-    # Styles
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    return query
+
+
+@api_router.get("/reports/returns-export")
+async def export_returns_report(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    return_type: Optional[str] = None,
+    status: Optional[str] = None,
+    refund_mode: Optional[str] = None,
+    party_id: Optional[str] = None,
+    search: Optional[str] = None,
+    current_user: User = Depends(require_permission('reports.view'))
+):
+    """Export returns report as Excel file with applied filters"""
+    query = returns_report_query(date_from, date_to, return_type, status, refund_mode, party_id, search)
+    
+    export = ExcelExport()
+    ws = export.sheet(
+        "Returns Report",
+        headers=[
+            "Return #", "Date", "Return Type", "Party Name", "Status",
+            "Refund Mode", "Refund Amount (OMR)", "Gold Weight Returned (g)",
+            "Linked Invoice/Purchase #", "Payment Mode", "Notes"
+        ],
+        widths=[15, 12, 15, 20, 12, 12, 18, 20, 22, 15, 30],
+        header_style=ExcelExport.BOXED_HEADER
     )
     
-    # Headers
-    headers = [
-        "Return #", "Date", "Return Type", "Party Name", "Status",
-        "Refund Mode", "Refund Amount (OMR)", "Gold Weight Returned (g)",
-        "Linked Invoice/Purchase #", "Payment Mode", "Notes"
-    ]
-    
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
-    
-    # Data rows
-    for row_num, ret in enumerate(returns, 2):
-        # Format date
-        ret_date = ret.get('date', '')
-        if isinstance(ret_date, str):
-            ret_date = ret_date[:10]
-        elif hasattr(ret_date, 'strftime'):
-            ret_date = ret_date.strftime('%Y-%m-%d')
-        
-        # Get refund amount
-        refund_amount = ret.get('refund_money_amount', 0)
-        if isinstance(refund_amount, Decimal128):
-            refund_amount = float(refund_amount.to_decimal())
-        
-        # Get gold weight
-        gold_weight = ret.get('refund_gold_grams', 0)
-        if isinstance(gold_weight, Decimal128):
-            gold_weight = float(gold_weight.to_decimal())
-        
-        # Return type display
-        return_type_display = "Sales Return" if ret.get('return_type') == 'sale_return' else "Purchase Return"
-        
-        # Refund mode display
-        refund_mode_display = ret.get('refund_mode', '').capitalize()
-        
-        row_data = [
+    def return_row(ret):
+        return [
             ret.get('return_number', ''),
-            ret_date,
-            return_type_display,
+            excel_date(ret.get('date', '')),
+            "Sales Return" if ret.get('return_type') == 'sale_return' else "Purchase Return",
             ret.get('party_name', ''),
             ret.get('status', '').capitalize(),
-            refund_mode_display,
-            round(refund_amount, 2),
-            round(gold_weight, 3),
+            ret.get('refund_mode', '').capitalize(),
+            round(safe_float(ret.get('refund_money_amount', 0)), 2),
+            round(safe_float(ret.get('refund_gold_grams', 0)), 3),
             ret.get('reference_number', ret.get('reference_id', '')[:8]),
             ret.get('payment_mode', '').replace('_', ' ').title() if ret.get('payment_mode') else '',
-            ret.get('notes', '')
+            ret.get('notes', ''),
         ]
-        
-        for col_num, value in enumerate(row_data, 1):
-            cell = ws.cell(row=row_num, column=col_num, value=value)
-            cell.border = thin_border
-    
-    # Adjust column widths
-    column_widths = [15, 12, 15, 20, 12, 12, 18, 20, 22, 15, 30]
-    for col_num, width in enumerate(column_widths, 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col_num)].width = width
-    
-    # Save to BytesIO
-    buffer = BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    filename = f"returns_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    
+    await export.write_rows(
+        ws, db.returns.find(query, {"_id": 0}).sort("date", -1), return_row, style=ExcelExport.BOXED
     )
+    
+    return await export.response(f"returns_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
 
 
 @api_router.get("/reports/returns-pdf")
@@ -10574,76 +9299,22 @@ async def export_returns_pdf(
     current_user: User = Depends(require_permission('reports.view'))
 ):
     """Export returns report as PDF file with applied filters"""
-    from fastapi.responses import StreamingResponse
-    from io import BytesIO
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4, landscape
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    
-    # Build query
-    query = {"is_deleted": False}
-    
-    # Date filters
-    if date_from:
-        query['date'] = {"$gte": datetime.fromisoformat(date_from)}
-    if date_to:
-        end_dt = datetime.fromisoformat(date_to)
-        if 'date' in query:
-            query['date']['$lte'] = end_dt
-        else:
-            query['date'] = {"$lte": end_dt}
-    
-    # Return type filter
-    if return_type and return_type != 'all':
-        query['return_type'] = return_type
-    
-    # Status filter
-    if status and status != 'all':
-        query['status'] = status
-    
-    # Refund mode filter
-    if refund_mode and refund_mode != 'all':
-        query['refund_mode'] = refund_mode
-    
-    # Party filter
-    if party_id and party_id != 'all':
-        query['party_id'] = party_id
-    
-    # Get returns
-    returns = await db.returns.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    
-    # Apply search filter
-    if search:
-        search_lower = search.lower()
-        returns = [
-            ret for ret in returns
-            if (search_lower in ret.get('party_name', '').lower() or
-                search_lower in ret.get('return_number', '').lower() or
-                search_lower in ret.get('reason', '').lower())
-        ]
+    query = returns_report_query(date_from, date_to, return_type, status, refund_mode, party_id, search)
     
-    # Create PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
-    
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.HexColor('#1f2937'),
-        spaceAfter=30,
-        alignment=1  # Center
-    )
-    elements.append(Paragraph("Returns Report", title_style))
-    elements.append(Spacer(1, 0.2 * inch))
+    rows = []
+    async for ret in db.returns.find(query, {"_id": 0}).sort("date", -1).batch_size(1000):
+        rows.append([
+            ret.get('return_number', '')[:10],
+            excel_date(ret.get('date', '')),
+            "Sales" if ret.get('return_type') == 'sale_return' else "Purchase",
+            ret.get('party_name', '')[:15],
+            ret.get('status', '').capitalize()[:8],
+            ret.get('refund_mode', '').capitalize()[:8],
+            f"{safe_float(ret.get('refund_money_amount', 0)):.2f}",
+            f"{safe_float(ret.get('refund_gold_grams', 0)):.3f}"
+        ])
     
-    # Filter info
+    blocks = [("spacer", 0.2)]
     filter_info = []
     if date_from:
         filter_info.append(f"From: {date_from}")
@@ -10653,80 +9324,91 @@ async def export_returns_pdf(
         filter_info.append(f"Type: {return_type}")
     if status and status != 'all':
         filter_info.append(f"Status: {status}")
-    
     if filter_info:
-        filter_text = " | ".join(filter_info)
-        elements.append(Paragraph(f"<b>Filters:</b> {filter_text}", styles['Normal']))
-        elements.append(Spacer(1, 0.2 * inch))
-    
-    # Table data
-    table_data = [[
-        "Return #", "Date", "Type", "Party", "Status",
-        "Refund Mode", "Amount (OMR)", "Gold (g)"
-    ]]
-    
-    for ret in returns:
-        # Format date
-        ret_date = ret.get('date', '')
-        if isinstance(ret_date, str):
-            ret_date = ret_date[:10]
-        elif hasattr(ret_date, 'strftime'):
-            ret_date = ret_date.strftime('%Y-%m-%d')
-        
-        # Get refund amount
-        refund_amount = ret.get('refund_money_amount', 0)
-        if isinstance(refund_amount, Decimal128):
-            refund_amount = float(refund_amount.to_decimal())
-        
-        # Get gold weight
-        gold_weight = ret.get('refund_gold_grams', 0)
-        if isinstance(gold_weight, Decimal128):
-            gold_weight = float(gold_weight.to_decimal())
-        
-        # Return type display (abbreviated for PDF)
-        return_type_display = "Sales" if ret.get('return_type') == 'sale_return' else "Purchase"
-        
-        table_data.append([
-            ret.get('return_number', '')[:10],
-            ret_date,
-            return_type_display,
-            ret.get('party_name', '')[:15],
-            ret.get('status', '').capitalize()[:8],
-            ret.get('refund_mode', '').capitalize()[:8],
-            f"{refund_amount:.2f}",
-            f"{gold_weight:.3f}"
-        ])
-    
-    # Create table
-    table = Table(table_data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f3f4f6')])
-    ]))
-    
-    elements.append(table)
-    
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    
-    filename = f"returns_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        blocks += [("paragraph", f"<b>Filters:</b> {' | '.join(filter_info)}"), ("spacer", 0.2)]
+    blocks.append((
+        "table",
+        ["Return #", "Date", "Type", "Party", "Status", "Refund Mode", "Amount (OMR)", "Gold (g)"],
+        rows, None, "banded"
+    ))
+    spec = {
+        "title": "Returns Report",
+        "title_style": "centered_title",
+        "landscape": True,
+        "margin": 30 / 72,
+        "blocks": blocks,
+    }
+    return pdf_response(
+        await render_pdf(render_report_pdf, spec),
+        f"returns_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     )
 
 
+# ============================================================================
+# BACKGROUND REPORT JOBS
+# ============================================================================
+
+report_jobs = ReportJobQueue(db, load_user)
+
+# Job kind -> the endpoint that builds the file (kind matches the route name)
+for _kind, _endpoint in {
+    "inventory-export": export_inventory,
+    "parties-export": export_parties,
+    "invoices-export": export_invoices,
+    "transactions-export": export_transactions,
+    "outstanding-export": export_outstanding,
+    "sales-history-export": export_sales_history,
+    "purchase-history-export": export_purchase_history,
+    "returns-export": export_returns_report,
+    "outstanding-pdf": export_outstanding_pdf,
+    "invoices-pdf": export_invoices_pdf,
+    "parties-pdf": export_parties_pdf,
+    "transactions-pdf": export_transactions_pdf,
+    "inventory-pdf": export_inventory_pdf,
+    "sales-history-pdf": export_sales_history_pdf,
+    "purchase-history-pdf": export_purchase_history_pdf,
+    "returns-pdf": export_returns_pdf,
+}.items():
+    report_jobs.register(_kind, _endpoint)
+
+
+@api_router.post("/jobs", status_code=202)
+async def create_report_job(
+    job_request: ReportJobRequest,
+    current_user: User = Depends(require_permission('reports.view'))
+):
+    """
+    Queue a report export/PDF to be built in the background.
+    
+    ``kind`` is the report route name (e.g. "outstanding-pdf") and ``params``
+    its query parameters. An identical job already queued or running is
+    shared instead of building the report twice.
+    """
+    job, deduplicated = await report_jobs.submit(job_request.kind, job_request.params, current_user.id)
+    view = await report_jobs.describe(job)
+    view["deduplicated"] = deduplicated
+    return view
+
+
+@api_router.get("/jobs")
+async def list_report_jobs(current_user: User = Depends(require_permission('reports.view'))):
+    """Recent report jobs requested by the current user"""
+    jobs = await report_jobs.list_for_user(current_user.id)
+    return {"items": [await report_jobs.describe(job) for job in jobs]}
+
+
+@api_router.get("/jobs/{job_id}")
+async def get_report_job(job_id: str, current_user: User = Depends(require_permission('reports.view'))):
+    """Status and progress of a report job"""
+    return await report_jobs.describe(await report_jobs.get(job_id, current_user.id))
+
+
+@api_router.get("/jobs/{job_id}/download")
+async def download_report_job(job_id: str, current_user: User = Depends(require_permission('reports.view'))):
+    """Download the file produced by a completed report job"""
+    return await report_jobs.download(await report_jobs.get(job_id, current_user.id))
+
+
 
 
 # Health check endpoint (no authentication required)
@@ -10750,6 +9432,104 @@ async def health_check(request: Request):
         )
 
 
+# ========================================
+# ADMIN - DATABASE INDEXES
+# ========================================
+
+@api_router.get("/admin/indexes")
+async def get_database_indexes(current_user: User = Depends(get_current_user)):
+    """Report which catalog indexes exist, which are missing, and their sizes - admin only"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view database indexes"
+        )
+    
+    return await get_index_report(db)
+
+@api_router.post("/admin/indexes/ensure")
+async def ensure_database_indexes(current_user: User = Depends(get_current_user)):
+    """Create any missing catalog indexes - admin only"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can manage database indexes"
+        )
+    
+    result = await ensure_indexes(db)
+    await create_audit_log(current_user.id, current_user.full_name, "database", "indexes", "ensure_indexes",
+                           {"ensured": len(result['ensured']), "failed": len(result['failed'])})
+    return result
+
+@api_router.get("/metrics")
+async def get_prometheus_metrics(request: Request, credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """
+    Prometheus text exposition of route latency, DB round-trips and N+1 findings.
+    Requires "Authorization: Bearer $METRICS_TOKEN" when METRICS_TOKEN is set,
+    otherwise an admin session (as /api/admin/metrics).
+    """
+    metrics_token = os.environ.get('METRICS_TOKEN')
+    if metrics_token:
+        supplied = request.headers.get("authorization", "")
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {metrics_token}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    else:
+        current_user = await get_current_user(request, credentials)
+        if current_user.role != 'admin':
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only admins can view metrics"
+            )
+    return PlainTextResponse(metrics_registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/admin/metrics")
+async def get_metrics_summary(limit: int = 20, current_user: User = Depends(get_current_user)):
+    """Slowest routes, DB calls per request and N+1 findings since startup - admin only"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view metrics"
+        )
+    
+    return metrics_registry.summary(limit=max(1, min(limit, 200)))
+
+@api_router.get("/admin/audit-sink")
+async def get_audit_sink_stats(current_user: User = Depends(get_current_user)):
+    """Queue depth and flush latency of the buffered audit log writer - admin only"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view audit writer metrics"
+        )
+    
+    return audit_sink.stats()
+
+@api_router.get("/admin/inventory-reconciliation")
+async def get_inventory_reconciliation(current_user: User = Depends(get_current_user)):
+    """Headers whose stock differs from their stock movements (latest snapshot plus later movements) - admin only"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view inventory reconciliation"
+        )
+    
+    return await reconcile_inventory(db)
+
+@api_router.post("/admin/inventory-reconciliation/fix")
+async def fix_inventory_drift(current_user: User = Depends(get_current_user)):
+    """Set drifted headers' stock to the totals of their stock movements - admin only"""
+    if current_user.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can reconcile inventory"
+        )
+    
+    result = await reconcile_inventory(db, fix=True)
+    await create_audit_log(current_user.id, current_user.full_name, "inventory", "reconciliation", "fix_drift",
+                           {"drift": len(result['drift']), "fixed": result['fixed'], "skipped": result['skipped']})
+    return result
+
+
 # ========================================
 # WORKFLOW CONTROL - IMPACT SUMMARY ENDPOINTS
 # ========================================
@@ -11169,6 +9949,8 @@ async def delete_transaction(
         }
     )
     
+    await after_transaction_removed(transaction)
+    
     # Reverse account balance
     if account_id and balance_delta != 0:
         await db.accounts.update_one(
@@ -11322,8 +10104,7 @@ async def create_return(
         )
         
         # ========== STEP 2: GENERATE RETURN NUMBER ==========
-        returns_count = await db.returns.count_documents({})
-        return_number = f"RET-{returns_count + 1:05d}"
+        return_number = await next_sequence_number(db, "return")
         
         # ========== STEP 3: CREATE DRAFT RETURN (NO FINALIZATION) ==========
         
@@ -11421,11 +10202,14 @@ async def get_returns(
     status: Optional[str] = None,
     refund_mode: Optional[str] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
     current_user: User = Depends(require_permission('returns.view'))
 ):
     """
     Get all returns with pagination and filters.
     Filters: return_type, party_id, status, refund_mode, search
+    Pagination: page/page_size, or cursor/count for keyset mode
     """
     try:
         # Build query
@@ -11447,29 +10231,15 @@ async def get_returns(
                 {"reason": {"$regex": search, "$options": "i"}}
             ]
         
-        # Count total
-        total_count = await db.returns.count_documents(query)
-        
-        # Calculate pagination
-        skip = (page - 1) * page_size
-        total_pages = (total_count + page_size - 1) // page_size
-        
         # Fetch returns
-        cursor = db.returns.find(query).sort("created_at", -1).skip(skip).limit(page_size)
-        returns = await cursor.to_list(length=page_size)
+        returns, page_info = await paginate_find(
+            db.returns, query, "created_at", page, page_size, cursor, count
+        )
         
-        return {
-            "items": [decimal_to_float(ret) for ret in returns],
-            "pagination": {
-                "total_count": total_count,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": total_pages,
-                "has_next": page < total_pages,
-                "has_prev": page > 1
-            }
-        }
+        return create_pagination_response(returns, **page_info)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching returns: {str(e)}")
 
@@ -11767,7 +10537,7 @@ async def finalize_return(
                 reference_id=return_id,
                 created_by=current_user.id
             )
-            await db.transactions.insert_one(convert_transaction_to_decimal(transaction.model_dump()))
+            await insert_transaction(transaction)
             
             # Update Cash/Bank account balance (debit = decrease balance for asset accounts)
             await db.accounts.update_one(
@@ -11808,7 +10578,7 @@ async def finalize_return(
                     reference_id=return_id,
                     created_by=current_user.id
                 )
-                await db.transactions.insert_one(convert_transaction_to_decimal(income_transaction.model_dump()))
+                await insert_transaction(income_transaction)
                 
                 # Update Sales Income account balance (debit income = decrease balance)
                 # For income accounts: credits increase (+), debits decrease (-)
@@ -11833,7 +10603,7 @@ async def finalize_return(
                 notes=f"Sales Return Gold Refund - {return_doc.get('return_number')}",
                 created_by=current_user.id
             )
-            await db.gold_ledger.insert_one(gold_entry.model_dump())
+            await insert_gold_ledger_entry(gold_entry.model_dump())
         
         # 4. Update invoice (adjust paid_amount and balance_due)
         if reference_type == 'invoice':
@@ -11849,10 +10619,12 @@ async def finalize_return(
                         "$set": {
                             "paid_amount": round(max(0, new_paid), 2),
                             "balance_due": round(max(0, new_balance), 2),
-                            "payment_status": "unpaid" if new_balance > 0 else "paid"
+                            "payment_status": "unpaid" if new_balance > 0 else "paid",
+                            "updated_at": datetime.now(timezone.utc)
                         }
                     }
                 )
+                await apply_invoice_change(db, invoice, {**invoice, "balance_due": round(max(0, new_balance), 2)})
         
         # 5. Update customer outstanding (if saved customer)
         if party_id:
@@ -11937,7 +10709,7 @@ async def finalize_return(
                     reference_id=return_id,
                     created_by=current_user.id
                 )
-                await db.transactions.insert_one(convert_transaction_to_decimal(transaction.model_dump()))
+                await insert_transaction(transaction)
                 
                 # Update account balance (debit = increase balance for asset accounts)
                 await db.accounts.update_one(
@@ -11961,7 +10733,7 @@ async def finalize_return(
                     notes=f"Purchase Return Gold Refund - {return_doc.get('return_number')}",
                     created_by=current_user.id
                 )
-                await db.gold_ledger.insert_one(gold_entry.model_dump())
+                await insert_gold_ledger_entry(gold_entry.model_dump())
             
             # 4. Update purchase (adjust balance_due_money)
             if reference_type == 'purchase':
@@ -12096,10 +10868,14 @@ async def finalize_return(
                         )
                     # Delete transaction
                     await db.transactions.delete_one({"id": transaction_id})
+                    await after_transaction_removed(transaction)
             
             # 4. Delete gold ledger entry if created
             if gold_ledger_id:
+                gold_entry = await db.gold_ledger.find_one({"id": gold_ledger_id})
                 await db.gold_ledger.delete_one({"id": gold_ledger_id})
+                if gold_entry and not gold_entry.get('is_deleted'):
+                    await after_gold_ledger_entry_removed(gold_entry)
             
             # 5. Remove pending inventory adjustments (no actual inventory was changed)
             await db.returns.update_one(
@@ -12266,19 +11042,22 @@ app.include_router(api_router)
 
 
 
-# 1. HTTPS Redirect (Innermost)
-# app.add_middleware(HTTPSRedirectMiddleware)  <-- Comment this out
-
-# 2. Security Headers
-# app.add_middleware(SecurityHeadersMiddleware)
+# 0. Request metrics (innermost, so it sees the matched route template)
+app.add_middleware(MetricsMiddleware)
 
-# 3. Input Sanitization
-# temporarily disabling the Input Sanitization middleware
-# app.add_middleware(InputSanitizationMiddleware)
+# 1-4. Security middleware (HTTPS redirect, security headers, input sanitization, CSRF)
+# One pure-ASGI layer inside CORS. Each part is switched on with its environment
+# flag; all default to off, as they were while the old middleware was commented out.
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, 'false').strip().lower() in ('1', 'true', 'yes')
 
-# 4. CSRF Protection
-# (You can comment this out if you still have issues, but moving it 'above' CORS usually fixes it)
-# app.add_middleware(CSRFProtectionMiddleware)
+app.add_middleware(
+    SecurityMiddleware,
+    https_redirect=_env_flag('ENABLE_HTTPS_REDIRECT'),
+    security_headers=_env_flag('ENABLE_SECURITY_HEADERS'),
+    sanitize_input=_env_flag('ENABLE_INPUT_SANITIZATION'),
+    csrf=_env_flag('ENABLE_CSRF_PROTECTION'),
+)
 
 # 5. CORS Middleware (MUST BE LAST/OUTERMOST)
 # This ensures CORS headers are added to ALL responses, even 403 errors.
@@ -12318,7 +11097,36 @@ async def startup_db_init():
         await initialize_database()
     except Exception as e:
         logger.warning(f"Database initialization warning: {e}")
+    
+    try:
+        index_result = await ensure_indexes(db)
+        logger.info(f"Database indexes ensured: {len(index_result['ensured'])} ok, {len(index_result['failed'])} failed")
+    except Exception as e:
+        logger.warning(f"Index creation warning: {e}")
+
+    try:
+        await recover_stock_reservations(db)
+    except Exception as e:
+        logger.warning(f"Stock reservation recovery warning: {e}")
+
+    try:
+        await init_daily_rollups(db)
+    except Exception as e:
+        logger.warning(f"Daily rollup check warning: {e}")
+
+    app.state.dashboard_refresher = asyncio.create_task(run_dashboard_refresher(db))
+    audit_sink.start()
+    app.state.audit_archiver = asyncio.create_task(run_audit_archiver(audit_partitions))
+    app.state.inventory_snapshotter = asyncio.create_task(run_inventory_snapshotter(db))
+    report_jobs.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task_name in ("dashboard_refresher", "audit_archiver", "inventory_snapshotter"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    await report_jobs.stop()
+    await audit_sink.stop()
+    shutdown_pdf_pool()
     client.close()
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+Atomic Stock Decrements
+-----------------------
+Stock OUT for invoice finalization without read-modify-write races.
+
+finalize_invoice used to read ``inventory_headers.current_qty/current_weight``,
+compute the new values in Python and ``$set`` them back. Two cashiers
+finalizing against the same category could both read the same stock and
+oversell, or overwrite each other's decrement; and when a later item was
+short, the earlier decrements and their stock movements stayed behind while
+only the invoice status was flipped back.
+
+``deduct_stock`` takes all the lines of one invoice and either applies every
+decrement and inserts every movement, or applies nothing:
+
+- each decrement is a conditional ``$inc`` that only matches while the header
+  still holds enough stock (``current_qty >= qty``, ``current_weight >=
+  weight``), so concurrent finalizations can never take the same units twice
+- on a replica set / sharded cluster the decrements and the movement inserts
+  run in one session transaction; any shortage aborts it
+- on a standalone server (no transactions) a ``stock_reservations`` log
+  entry is written first and every applied decrement pushes a per-line
+  marker onto the header (``pending_reservations``) in the same atomic
+  update. A shortage or error releases exactly the marked lines (the release
+  matches on the marker, so it is idempotent), then the log is closed.
+  ``recover_stock_reservations`` (run on startup) finishes entries a crashed
+  process left pending: committed if their movements were inserted,
+  otherwise released and the entry's compensating update (e.g. reverting
+  the invoice to draft) applied.
+
+Round-trips do not grow with the invoice: lines of the same header are summed
+into one decrement, all decrements go out in a single ``bulk_write`` and the
+movements in one ``insert_many``; shortages are read back with one ``$in``
+query.
+
+STOCK_TRANSACTIONS=off forces the log path even on a replica set.
+"""
+
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from db_indexes import register_indexes
+from inventory_snapshots import invalidate_inventory_snapshots
+
+logger = logging.getLogger(__name__)
+
+TRANSACTIONS_MODE = os.environ.get('STOCK_TRANSACTIONS', 'auto')
+# Weights are stored as floats; tolerate float residue below half a milligram
+WEIGHT_TOLERANCE = 0.0005
+# Pending log entries younger than this may still be in flight in another process
+RECOVERY_GRACE_SECONDS = 60
+
+register_indexes("stock_reservations", [
+    {"name": "id_unique", "keys": [("id", 1)], "options": {"unique": True}},
+    {"name": "status_created", "keys": [("status", 1), ("created_at", 1)], "options": {}},
+])
+register_indexes("stock_movements", [
+    {"name": "reservation_id", "keys": [("reservation_id", 1)], "options": {"sparse": True}},
+])
+
+# id(client) -> whether the deployment supports multi-document transactions
+_transactions_supported: Dict[int, bool] = {}
+
+
+class InsufficientStock(Exception):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+async def transactions_supported(db) -> bool:
+    """True when connected to a replica set or mongos (checked once per client)."""
+    if TRANSACTIONS_MODE == "off":
+        return False
+    client = db.client
+    key = id(client)
+    if key not in _transactions_supported:
+        try:
+            hello = await client.admin.command("hello")
+            _transactions_supported[key] = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            logger.warning(f"Could not detect transaction support, using the reservation log: {e}")
+            _transactions_supported[key] = False
+    return _transactions_supported[key]
+
+
+def stock_line(header: Dict[str, Any], qty: float, weight: float, label: str) -> Dict[str, Any]:
+    """One header decrement; ``label`` names the item in shortage messages."""
+    return {"header_id": header["id"], "header_name": header.get("name"), "label": label,
+            "qty": qty, "weight": weight}
+
+
+def _marker(reservation_id: str, index: int) -> str:
+    return f"{reservation_id}:{index}"
+
+
+def _merge_lines(lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sum the lines of one header into a single decrement (first-seen order)."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for line in lines:
+        current = merged.get(line["header_id"])
+        if current is None:
+            merged[line["header_id"]] = dict(line)
+            continue
+        current["qty"] += line["qty"]
+        current["weight"] = round(current["weight"] + line["weight"], 6)
+        if line["label"] not in current["label"].split(", "):
+            current["label"] = f"{current['label']}, {line['label']}"
+    return list(merged.values())
+
+
+def _decrement(line: Dict[str, Any], marker: Optional[str] = None) -> UpdateOne:
+    update: Dict[str, Any] = {"$inc": {"current_qty": -line["qty"], "current_weight": -line["weight"]}}
+    if marker:
+        update["$push"] = {"pending_reservations": marker}
+    return UpdateOne(
+        {
+            "id": line["header_id"],
+            "current_qty": {"$gte": line["qty"]},
+            "current_weight": {"$gte": line["weight"] - WEIGHT_TOLERANCE},
+        },
+        update
+    )
+
+
+def _covers(header: Dict[str, Any], line: Dict[str, Any]) -> bool:
+    """The same test as the _decrement filter, on a header read back."""
+    return (header.get("current_qty", 0) >= line["qty"]
+            and header.get("current_weight", 0) >= line["weight"] - WEIGHT_TOLERANCE)
+
+
+def _shortage(line: Dict[str, Any], header: Optional[Dict[str, Any]]) -> str:
+    header = header or {}
+    return (
+        f"{line['label']}: Need {line['qty']} qty/{line['weight']}g, but only "
+        f"{header.get('current_qty', 0)} qty/{header.get('current_weight', 0)}g available"
+    )
+
+
+async def _read_headers(db, lines: List[Dict[str, Any]], session=None) -> Dict[str, Dict[str, Any]]:
+    headers = {}
+    async for header in db.inventory_headers.find(
+        {"id": {"$in": [line["header_id"] for line in lines]}},
+        {"_id": 0, "id": 1, "current_qty": 1, "current_weight": 1, "pending_reservations": 1},
+        session=session
+    ):
+        headers[header["id"]] = header
+    return headers
+
+
+async def _clear_markers(db, lines: List[Dict[str, Any]], markers: List[str]):
+    header_ids = list({line["header_id"] for line in lines})
+    await db.inventory_headers.update_many(
+        {"id": {"$in": header_ids}, "pending_reservations": {"$in": markers}},
+        {"$pull": {"pending_reservations": {"$in": markers}}}
+    )
+    await db.inventory_headers.update_many(
+        {"id": {"$in": header_ids}, "pending_reservations": {"$size": 0}},
+        {"$unset": {"pending_reservations": ""}}
+    )
+
+
+async def _release(db, reservation: Dict[str, Any]):
+    """Give back every line still marked on its header (idempotent)."""
+    markers = [_marker(reservation["id"], index) for index in range(len(reservation["lines"]))]
+    if markers:
+        await db.inventory_headers.bulk_write([
+            UpdateOne(
+                {"id": line["header_id"], "pending_reservations": marker},
+                {"$inc": {"current_qty": line["qty"], "current_weight": line["weight"]},
+                 "$pull": {"pending_reservations": marker}}
+            )
+            for line, marker in zip(reservation["lines"], markers)
+        ], ordered=False)
+    await _clear_markers(db, reservation["lines"], markers)
+
+
+async def _close(db, reservation: Dict[str, Any], status: str, errors: Optional[List[str]] = None):
+    if status == "committed":
+        markers = [_marker(reservation["id"], index) for index in range(len(reservation["lines"]))]
+        await _clear_markers(db, reservation["lines"], markers)
+    else:
+        await _release(db, reservation)
+    await db.stock_reservations.update_one(
+        {"id": reservation["id"]},
+        {"$set": {"status": status, "errors": errors, "finished_at": datetime.now(timezone.utc)}}
+    )
+
+
+async def _deduct_in_transaction(db, lines: List[Dict[str, Any]], movements: List[Dict[str, Any]]) -> List[str]:
+    async def apply(session):
+        # Check against the transaction snapshot first; a concurrent write to
+        # the same headers makes the bulk_write conflict and the transaction retry
+        headers = await _read_headers(db, lines, session=session)
+        errors = [_shortage(line, headers.get(line["header_id"]))
+                  for line in lines if not _covers(headers.get(line["header_id"], {}), line)]
+        if not errors and lines:
+            result = await db.inventory_headers.bulk_write(
+                [_decrement(line) for line in lines], ordered=False, session=session
+            )
+            if result.modified_count < len(lines):
+                errors = [_shortage(line, headers.get(line["header_id"])) for line in lines]
+        if errors:
+            raise InsufficientStock(errors)  # aborts the transaction
+        if movements:
+            await db.stock_movements.insert_many(movements, session=session)
+
+    async with await db.client.start_session() as session:
+        try:
+            await session.with_transaction(apply)
+        except InsufficientStock as e:
+            return e.errors
+    return []
+
+
+async def _deduct_with_log(db, lines: List[Dict[str, Any]], movements: List[Dict[str, Any]],
+                           reference: Dict[str, Any], compensate: Optional[Dict[str, Any]]) -> List[str]:
+    reservation = {
+        "id": str(uuid.uuid4()),
+        "status": "pending",
+        "reference": reference,
+        "lines": lines,
+        "compensate": compensate,
+        "created_at": datetime.now(timezone.utc),
+        "finished_at": None,
+    }
+    await db.stock_reservations.insert_one(dict(reservation))
+    try:
+        errors = []
+        if lines:
+            markers = [_marker(reservation["id"], index) for index in range(len(lines))]
+            result = await db.inventory_headers.bulk_write(
+                [_decrement(line, marker) for line, marker in zip(lines, markers)], ordered=False
+            )
+            if result.modified_count < len(lines):
+                # The lines whose marker did not land on their header were short
+                headers = await _read_headers(db, lines)
+                for line, marker in zip(lines, markers):
+                    header = headers.get(line["header_id"])
+                    if marker not in (header or {}).get("pending_reservations", []):
+                        errors.append(_shortage(line, header))
+        if errors:
+            await _close(db, reservation, "rolled_back", errors)
+            return errors
+        if movements:
+            await db.stock_movements.insert_many(
+                [{**movement, "reservation_id": reservation["id"]} for movement in movements]
+            )
+    except Exception as e:
+        await _close(db, reservation, "rolled_back", [str(e)])
+        raise
+    await _close(db, reservation, "committed")
+    return []
+
+
+async def deduct_stock(
+    db,
+    lines: List[Dict[str, Any]],
+    movements: List[Dict[str, Any]],
+    reference: Dict[str, Any],
+    compensate: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """
+    Decrement every line and insert the movements, all or nothing.
+
+    Args:
+        lines: header decrements built with ``stock_line``; lines of the
+            same header are summed into one decrement
+        movements: stock movement documents inserted when stock is taken
+        reference: what the stock is for, e.g. {"type": "invoice", "id": ...}
+        compensate: update undoing the caller's own change if a crash leaves
+            the reservation pending ({"collection", "filter", "set"});
+            applied by recover_stock_reservations only
+
+    Returns:
+        Shortage messages; when not empty nothing was applied
+    """
+    lines = _merge_lines(lines)
+    if await transactions_supported(db):
+        errors = await _deduct_in_transaction(db, lines, movements)
+    else:
+        errors = await _deduct_with_log(db, lines, movements, reference, compensate)
+    if not errors:
+        await invalidate_inventory_snapshots(db, movements)
+    return errors
+
+
+async def recover_stock_reservations(db, grace_seconds: float = RECOVERY_GRACE_SECONDS) -> Dict[str, int]:
+    """Finish reservation log entries left pending by a crashed process."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    committed = rolled_back = 0
+    async for reservation in db.stock_reservations.find({"status": "pending", "created_at": {"$lt": cutoff}}):
+        if await db.stock_movements.find_one({"reservation_id": reservation["id"]}, {"_id": 1}):
+            await _close(db, reservation, "committed")
+            committed += 1
+            continue
+        await _close(db, reservation, "rolled_back", ["recovered after interruption"])
+        compensate = reservation.get("compensate")
+        if compensate:
+            await db[compensate["collection"]].update_one(compensate["filter"], {"$set": compensate["set"]})
+        rolled_back += 1
+    if committed or rolled_back:
+        logger.warning(f"Recovered stock reservations: {committed} committed, {rolled_back} rolled back")
+    return {"committed": committed, "rolled_back": rolled_back}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Stock Finalization Stress Test
+==============================
+Fires N parallel finalize_invoice calls at a single inventory header and
+checks that stock is never oversold or lost:
+
+1. N draft invoices, one unit each, against a header holding --stock units
+   -> exactly min(N, stock) finalize, the rest fail with "Insufficient
+      stock"; header qty/weight, Stock OUT movements and finalized invoices
+      all agree
+2. N parallel finalizations of one and the same invoice
+   -> exactly one succeeds and stock moves once
+
+Runs against a real MongoDB (a standalone server exercises the reservation
+log, a replica set the transaction path) in a scratch database that is
+dropped afterwards.
+
+Usage:
+    MONGO_URL=mongodb://localhost:27017 python stress_stock_finalize.py [--invoices 100] [--stock 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ITEM_WEIGHT = 2.5
+
+
+def draft_invoice(server, number: int, category: str, user_id: str) -> dict:
+    item = server.InvoiceItem(
+        category=category, description=f"{category} #{number}", qty=1, weight=ITEM_WEIGHT,
+        net_gold_weight=ITEM_WEIGHT, gross_weight=ITEM_WEIGHT, purity=916, metal_rate=25.0,
+        gold_value=62.5, making_value=5.0, vat_percent=5.0, vat_amount=3.375, line_total=70.875
+    )
+    invoice = server.Invoice(
+        invoice_number=f"STRESS-{number:05d}", customer_type="walk_in", walk_in_name="Stress Test",
+        items=[item], subtotal=67.5, vat_total=3.375, grand_total=70.875, balance_due=70.875,
+        created_by=user_id
+    )
+    return invoice.model_dump()
+
+
+async def finalize_all(server, invoice_ids, user):
+    return await asyncio.gather(
+        *[server.finalize_invoice(invoice_id, current_user=user) for invoice_id in invoice_ids],
+        return_exceptions=True
+    )
+
+
+def tally(server, results):
+    ok = sum(1 for r in results if isinstance(r, dict))
+    short = sum(1 for r in results if isinstance(r, server.HTTPException) and "Insufficient stock" in str(r.detail))
+    already = sum(1 for r in results if isinstance(r, server.HTTPException) and "already finalized" in str(r.detail))
+    other = [r for r in results
+             if isinstance(r, Exception) and not (isinstance(r, server.HTTPException) and r.status_code == 400)]
+    return ok, short, already, other
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Parallel finalize_invoice stress test against one header')
+    parser.add_argument('--invoices', type=int, default=100, help='Parallel finalizations')
+    parser.add_argument('--stock', type=int, default=50, help='Units in the header')
+    parser.add_argument('--db', default=f"stress_stock_{uuid.uuid4().hex[:8]}", help='Scratch database name')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch database')
+    args = parser.parse_args()
+
+    os.environ['DB_NAME'] = args.db
+    import server
+    from stock_reservations import transactions_supported
+
+    db = server.db
+    failures = []
+
+    def check(label, condition):
+        print(f"  {'PASS' if condition else 'FAIL'}  {label}")
+        if not condition:
+            failures.append(label)
+
+    try:
+        await server.ensure_indexes(db)
+        path = "transaction" if await transactions_supported(db) else "reservation log"
+        print(f"Database {args.db} ({path})")
+
+        user = server.User(username="stress", email="stress@example.com", full_name="Stress Test", role="admin",
+                           permissions=server.get_user_permissions("admin"))
+        header = server.InventoryHeader(name="Stress Test Ring", current_qty=args.stock,
+                                        current_weight=args.stock * ITEM_WEIGHT, created_by=user.id)
+        await db.inventory_headers.insert_one(header.model_dump())
+
+        # 1. N invoices, one unit each
+        invoices = [draft_invoice(server, i, header.name, user.id) for i in range(args.invoices)]
+        await db.invoices.insert_many([dict(invoice) for invoice in invoices])
+        ids = [invoice["id"] for invoice in invoices]
+
+        started = time.perf_counter()
+        ok, short, _, other = tally(server, await finalize_all(server, ids, user))
+        elapsed = time.perf_counter() - started
+        print(f"\n{args.invoices} parallel finalizations, {args.stock} units in stock ({elapsed:.2f} s)")
+        print(f"  finalized {ok}, insufficient stock {short}, other errors {len(other)}")
+
+        expected = min(args.invoices, args.stock)
+        stored = await db.inventory_headers.find_one({"id": header.id})
+        movements = await db.stock_movements.count_documents({"reference_id": {"$in": ids}})
+        finalized = await db.invoices.count_documents({"id": {"$in": ids}, "status": "finalized"})
+        check(f"exactly {expected} finalized", ok == expected)
+        check("every other call reported insufficient stock", short == args.invoices - expected and not other)
+        check(f"header qty = {args.stock - expected}", stored["current_qty"] == args.stock - expected)
+        check("header weight matches", abs(stored["current_weight"] - (args.stock - expected) * ITEM_WEIGHT) < 1e-6)
+        check("one Stock OUT movement per finalized invoice", movements == ok)
+        check("invoice statuses match", finalized == ok)
+        check("no pending reservation markers", not stored.get("pending_reservations"))
+        check("no pending reservation log entries",
+              await db.stock_reservations.count_documents({"status": "pending"}) == 0)
+
+        # 2. N parallel finalizations of one invoice
+        await db.inventory_headers.update_one({"id": header.id}, {"$inc": {"current_qty": 1, "current_weight": ITEM_WEIGHT}})
+        before = await db.inventory_headers.find_one({"id": header.id})
+        single = draft_invoice(server, args.invoices, header.name, user.id)
+        await db.invoices.insert_one(dict(single))
+        ok, short, already, other = tally(server, await finalize_all(server, [single["id"]] * args.invoices, user))
+        after = await db.inventory_headers.find_one({"id": header.id})
+        print(f"\n{args.invoices} parallel finalizations of one invoice")
+        print(f"  finalized {ok}, already finalized {already}, insufficient stock {short}, other errors {len(other)}")
+        check("exactly one finalized", ok == 1 and already == args.invoices - 1)
+        check("stock moved once", before["current_qty"] - after["current_qty"] == 1)
+        check("one Stock OUT movement",
+              await db.stock_movements.count_documents({"reference_id": single["id"]}) == 1)
+        for error in other[:5]:
+            print(f"  error: {error!r}")
+    finally:
+        if not args.keep:
+            await server.client.drop_database(args.db)
+
+    print("\nFAILED: " + "; ".join(failures) if failures else "\nAll checks passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,73 @@
+"""
+Authenticated User Cache
+------------------------
+Short-lived in-process LRU cache of resolved users for get_current_user.
+
+Every authenticated request used to run ``db.users.find_one`` and rebuild the
+``User`` model (with role-based permissions filled in). The resolved user is
+cached here by user id for a few seconds and dropped whenever the user record
+changes through the API (update, delete, password change/reset, login,
+logout).
+
+The cache is per process. With several workers, a change made through one
+worker reaches the others when their entry expires, so the TTL bounds how
+long a role or deletion change can take to apply everywhere.
+
+Configuration (environment):
+- USER_CACHE_TTL_SECONDS: entry lifetime, default 30 (0 disables the cache)
+- USER_CACHE_MAX_SIZE:    maximum cached users, default 1024
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+DEFAULT_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+DEFAULT_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '1024'))
+
+
+class UserCache:
+    """TTL + LRU map of user id -> resolved user."""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_size: int = DEFAULT_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[Any]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return user
+
+    def set(self, user_id: str, user: Any) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        if user_id:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Outstanding Report Equivalence Check
+====================================
+Seeds a scratch database and compares report_pipelines.outstanding_report_figures
+(one aggregation with $unionWith/$group) with a row-by-row Python reference
+for every filter combination: party_id (saved customer, vendor, walk-in,
+walk_in_Unknown, unknown id), party_type (none, customer, vendor, and a
+value outside those two), a date range and include_paid.
+
+The reference is the builder the aggregation replaced, without its
+to_list(10000) caps, and with the rules the aggregation settled on where
+the old code depended on read order or on nulls:
+
+- a walk-in invoice with no walk_in_name, or a null one, belongs to
+  ``walk_in_Unknown`` ("Unknown (Walk-in)"); a null customer_name is "Unknown"
+- a party's name and type come from its earliest invoice (by date, then
+  name), not from whichever invoice was read first
+- a party that only has Purchase credits is named after the greatest of
+  their party_name values ("Unknown Vendor" when missing)
+
+The seed includes each of those cases, ISO-string dates, invoices with and
+without a due date, and fully paid invoices. Needs a real MongoDB (4.4+ for
+$unionWith); the scratch database is dropped afterwards unless --keep is given.
+
+Usage:
+    MONGO_URL=mongodb://localhost:27017 python verify_outstanding_report.py [--invoices 2000] [--seed 7]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+from bson import Decimal128
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from report_pipelines import OUTSTANDING_TXN_CATEGORIES, outstanding_report_figures
+
+load_dotenv(Path(__file__).parent / '.env')
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+
+TOLERANCE = 1e-6
+PARTY_FIELDS = (
+    "party_name", "party_type", "total_invoiced", "total_paid", "total_outstanding",
+    "overdue_0_7", "overdue_8_30", "overdue_31_plus", "last_invoice_date", "last_payment_date",
+    "invoice_count",
+)
+
+
+def money(value: float) -> Decimal128:
+    return Decimal128(Decimal(str(round(value, 3))))
+
+
+def number(value) -> float:
+    if value is None:
+        return 0.0
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    return float(value)
+
+
+def as_datetime(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value
+
+
+def utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def aging_bucket(days: int):
+    if days < 0:
+        return None
+    if days <= 7:
+        return "overdue_0_7"
+    if days <= 30:
+        return "overdue_8_30"
+    return "overdue_31_plus"
+
+
+def invoice_party(inv: dict):
+    """(party_id, party_name, party_type) of an invoice, None when it has no party."""
+    if inv.get('customer_type') == 'walk_in':
+        name = inv.get('walk_in_name')
+        if name is None:
+            name = 'Unknown'
+        return f"walk_in_{name}", f"{name} (Walk-in)", "customer"
+    if inv.get('customer_id'):
+        name = inv.get('customer_name')
+        if name is None:
+            name = 'Unknown'
+        return inv['customer_id'], name, "customer" if inv.get('invoice_type') == 'sale' else "vendor"
+    return None
+
+
+async def reference_report(db, party_id=None, party_type=None, start=None, end=None,
+                           include_paid=False, now=None) -> dict:
+    """Row-by-row outstanding report (the pre-aggregation builder, see module docstring)."""
+    query = {"is_deleted": False, "status": "finalized"}
+    if not include_paid:
+        query['balance_due'] = {"$gt": 0}
+    if start or end:
+        query['date'] = {}
+        if start:
+            query['date']['$gte'] = start
+        if end:
+            query['date']['$lte'] = end
+
+    party_data = {}
+    first_invoice = {}
+
+    def row(key, name, ptype):
+        return party_data.setdefault(key, {
+            "party_id": key, "party_name": name, "party_type": ptype,
+            "total_invoiced": 0.0, "total_paid": 0.0, "total_outstanding": 0.0,
+            "overdue_0_7": 0.0, "overdue_8_30": 0.0, "overdue_31_plus": 0.0,
+            "last_invoice_date": None, "last_payment_date": None, "invoice_count": 0,
+        })
+
+    async for inv in db.invoices.find(query, {"_id": 0}):
+        party = invoice_party(inv)
+        if not party:
+            continue
+        key, name, ptype = party
+        if party_id and key != party_id:
+            continue
+        if party_type and ptype != party_type:
+            continue
+
+        data = row(key, name, ptype)
+        inv_date = as_datetime(inv.get('date'))
+        earliest = (inv_date is not None, inv_date, name, ptype)
+        if key not in first_invoice or earliest < first_invoice[key]:
+            first_invoice[key] = earliest
+            data['party_name'], data['party_type'] = name, ptype
+
+        balance_due = number(inv.get('balance_due'))
+        data['total_invoiced'] += number(inv.get('grand_total'))
+        data['total_paid'] += number(inv.get('paid_amount'))
+        data['total_outstanding'] += balance_due
+        data['invoice_count'] += 1
+        if inv_date and (not data['last_invoice_date'] or inv_date > data['last_invoice_date']):
+            data['last_invoice_date'] = inv_date
+
+        due_date = as_datetime(inv.get('due_date') or inv.get('date'))
+        if balance_due > 0 and due_date:
+            bucket = aging_bucket((now - utc(due_date)).days)
+            if bucket:
+                data[bucket] += balance_due
+
+    transactions = [txn async for txn in db.transactions.find(
+        {"is_deleted": False, "category": {"$in": OUTSTANDING_TXN_CATEGORIES}}, {"_id": 0}
+    )]
+
+    # Purchase credits are vendor payables
+    payable_names = {}
+    for txn in transactions:
+        key = txn.get('party_id')
+        if txn.get('category') != 'Purchase' or txn.get('transaction_type') != 'credit' or not key:
+            continue
+        if party_id and key != party_id:
+            continue
+        if party_type and party_type != 'vendor':
+            continue
+        name = txn.get('party_name')
+        if name is None:
+            name = 'Unknown Vendor'
+        payable_names[key] = max(payable_names.get(key, name), name)
+
+        data = row(key, name, "vendor")
+        amount = number(txn.get('amount'))
+        data['total_outstanding'] += amount
+        txn_date = as_datetime(txn.get('date'))
+        if txn_date and amount > 0:
+            bucket = aging_bucket((now - utc(txn_date)).days)
+            if bucket:
+                data[bucket] += amount
+
+    for key, name in payable_names.items():
+        if key not in first_invoice:
+            party_data[key]['party_name'] = name
+
+    for txn in transactions:
+        key = txn.get('party_id')
+        txn_date = as_datetime(txn.get('date'))
+        if key in party_data and txn_date:
+            if not party_data[key]['last_payment_date'] or txn_date > party_data[key]['last_payment_date']:
+                party_data[key]['last_payment_date'] = txn_date
+
+    summary = {
+        "customer_due": 0.0, "vendor_payable": 0.0, "total_outstanding": 0.0,
+        "total_overdue_0_7": 0.0, "total_overdue_8_30": 0.0, "total_overdue_31_plus": 0.0,
+    }
+    for party in party_data.values():
+        for field in ("last_invoice_date", "last_payment_date"):
+            if party[field]:
+                party[field] = party[field].isoformat()
+        summary["customer_due" if party["party_type"] == "customer" else "vendor_payable"] += party["total_outstanding"]
+        for bucket in ("0_7", "8_30", "31_plus"):
+            summary[f"total_overdue_{bucket}"] += party[f"overdue_{bucket}"]
+    summary["total_outstanding"] = summary["customer_due"] + summary["vendor_payable"]
+    return {"summary": summary, "parties": list(party_data.values())}
+
+
+async def seed(db, invoice_count: int, rng: random.Random, now: datetime) -> dict:
+    """Random invoices/transactions plus the edge cases; returns party ids used by the filter matrix."""
+    customers = [str(uuid.uuid4()) for _ in range(20)]
+    vendors = [str(uuid.uuid4()) for _ in range(8)]
+    payables_only = str(uuid.uuid4())
+    naive_now = now.replace(tzinfo=None)
+
+    def invoice(when: datetime, **fields) -> dict:
+        grand_total = round(rng.uniform(10, 900), 3)
+        paid = rng.choice([0, grand_total, round(grand_total / 3, 3)])
+        doc = {
+            "id": str(uuid.uuid4()), "is_deleted": False, "status": "finalized", "date": when,
+            "grand_total": money(grand_total), "paid_amount": money(paid),
+            "balance_due": money(grand_total - paid), "invoice_type": "sale", "customer_type": "saved",
+        }
+        doc.update(fields)
+        return doc
+
+    invoices = []
+    for _ in range(invoice_count):
+        when = naive_now - timedelta(days=rng.randint(0, 120), hours=rng.randint(0, 23))
+        fields = {
+            "is_deleted": rng.random() < 0.05,
+            "status": rng.choice(["finalized"] * 6 + ["draft"]),
+            "invoice_type": rng.choice(["sale", "sale", "purchase"]),
+        }
+        if rng.random() < 0.5:
+            fields["due_date"] = when + timedelta(days=rng.choice([0, 7, 14, 30]))
+        if rng.random() < 0.25:
+            fields.update(customer_type="walk_in", walk_in_name=rng.choice(["Ali", "Sara", "Omar"]))
+        elif rng.random() < 0.97:
+            party = rng.choice(customers + vendors)
+            fields.update(customer_id=party, customer_name=f"Party {party[:6]}")
+        invoices.append(invoice(when, **fields))
+
+    # Walk-ins without a name: missing, null and "Unknown" are one party
+    invoices.append(invoice(naive_now - timedelta(days=3), customer_type="walk_in"))
+    invoices.append(invoice(naive_now - timedelta(days=12), customer_type="walk_in", walk_in_name=None))
+    invoices.append(invoice(naive_now - timedelta(days=40), customer_type="walk_in", walk_in_name="Unknown"))
+    # Saved customer with a null name, and invoices without a party
+    invoices.append(invoice(naive_now - timedelta(days=5), customer_id=customers[1], customer_name=None))
+    invoices.append(invoice(naive_now - timedelta(days=6), customer_id=""))
+    invoices.append(invoice(naive_now - timedelta(days=6), customer_id=None))
+    # Name and type come from the earliest invoice, inserted last here
+    renamed = customers[0]
+    invoices.append(invoice(naive_now - timedelta(days=2), customer_id=renamed, customer_name="Newer Name"))
+    invoices.append(invoice(naive_now - timedelta(days=9), customer_id=renamed, customer_name="Middle Name",
+                            invoice_type="purchase"))
+    invoices.append(invoice(naive_now - timedelta(days=60), customer_id=renamed, customer_name="Oldest Name"))
+    # Legacy ISO-string dates and an invoice_type outside sale/purchase
+    legacy_now = naive_now.replace(microsecond=0)
+    invoices.append(invoice((legacy_now - timedelta(days=20)).isoformat(), customer_id=vendors[0],
+                            customer_name="String Dates", invoice_type="purchase",
+                            due_date=(legacy_now - timedelta(days=10)).isoformat()))
+    invoices.append(invoice(naive_now - timedelta(days=15), customer_id=vendors[1], customer_name="Odd Type",
+                            invoice_type="exchange"))
+    rng.shuffle(invoices)
+    await db.invoices.insert_many(invoices)
+
+    transactions = []
+    categories = OUTSTANDING_TXN_CATEGORIES + ["Rent"]
+    for _ in range(max(invoice_count // 2, 50)):
+        party = rng.choice(customers + vendors + [None])
+        transactions.append({
+            "id": str(uuid.uuid4()), "is_deleted": rng.random() < 0.05, "category": rng.choice(categories),
+            "transaction_type": rng.choice(["credit", "debit"]), "party_id": party,
+            "party_name": f"Vendor {party[:6]}" if party else None, "amount": money(rng.uniform(1, 400)),
+            "date": naive_now - timedelta(days=rng.randint(0, 90), hours=rng.randint(0, 23)),
+        })
+    # A vendor known only through Purchase credits, under several names
+    for name in ("Beta Traders", "Alpha Traders", None):
+        transactions.append({
+            "id": str(uuid.uuid4()), "is_deleted": False, "category": "Purchase", "transaction_type": "credit",
+            "party_id": payables_only, "party_name": name, "amount": money(rng.uniform(50, 500)),
+            "date": naive_now - timedelta(days=rng.randint(0, 45)),
+        })
+    await db.transactions.insert_many(transactions)
+
+    return {"customer": customers[2], "renamed": renamed, "vendor": vendors[0], "payables_only": payables_only}
+
+
+def compare(expected: dict, actual: dict) -> list:
+    problems = []
+    want = {p["party_id"]: p for p in expected["parties"]}
+    got = {p["party_id"]: p for p in actual["parties"]}
+    for key in sorted(want.keys() - got.keys()):
+        problems.append(f"missing party {key}")
+    for key in sorted(got.keys() - want.keys()):
+        problems.append(f"unexpected party {key}")
+    for key in sorted(want.keys() & got.keys()):
+        for field in PARTY_FIELDS:
+            a, b = want[key][field], got[key][field]
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+                if abs(a - b) > TOLERANCE:
+                    problems.append(f"{key} {field}: expected {a}, got {b}")
+            elif a != b:
+                problems.append(f"{key} {field}: expected {a!r}, got {b!r}")
+    for field, value in expected["summary"].items():
+        if abs(value - actual["summary"][field]) > TOLERANCE:
+            problems.append(f"summary {field}: expected {value}, got {actual['summary'][field]}")
+    return problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Compare the outstanding report aggregation with a Python reference')
+    parser.add_argument('--invoices', type=int, default=2000, help='Random invoices to seed')
+    parser.add_argument('--seed', type=int, default=7, help='Random seed')
+    parser.add_argument('--db', default=f"outstanding_check_{uuid.uuid4().hex[:8]}", help='Scratch database name')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch database')
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[args.db]
+    now = datetime.now(timezone.utc)
+    failures = 0
+
+    try:
+        ids = await seed(db, args.invoices, random.Random(args.seed), now)
+        start = (now - timedelta(days=45)).replace(tzinfo=None)
+        end = (now - timedelta(days=4)).replace(tzinfo=None)
+
+        party_ids = [None, ids["customer"], ids["renamed"], ids["vendor"], ids["payables_only"],
+                     "walk_in_Ali", "walk_in_Unknown", "walk_in_Nobody", "no-such-party"]
+        for party_id in party_ids:
+            for party_type in (None, "customer", "vendor", "other"):
+                for start_end in ((None, None), (start, None), (None, end), (start, end)):
+                    for include_paid in (False, True):
+                        filters = dict(party_id=party_id, party_type=party_type, start=start_end[0],
+                                       end=start_end[1], include_paid=include_paid, now=now)
+                        problems = compare(await reference_report(db, **filters),
+                                           await outstanding_report_figures(db, **filters))
+                        if problems:
+                            failures += 1
+                            shown = {k: v for k, v in filters.items() if v is not None and k != 'now'}
+                            print(f"  FAIL  {shown}")
+                            for problem in problems[:5]:
+                                print(f"        {problem}")
+        combinations = len(party_ids) * 4 * 4 * 2
+        print(f"\n{combinations - failures}/{combinations} filter combinations match")
+    finally:
+        if not args.keep:
+            await client.drop_database(args.db)
+        client.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
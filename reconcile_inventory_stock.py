@@ -1,119 +1,97 @@
 #!/usr/bin/env python3
 """
-Stock Reconciliation Script
-Calculates current stock totals from stock movements and updates inventory headers
+Inventory Stock Reconciliation Script for Gold Shop ERP
+=======================================================
+Checks every inventory header's ``current_qty`` / ``current_weight``
+against its stock movements and writes today's inventory snapshots.
+
+Expected stock is each header's latest snapshot plus the movements after it
+(inventory_snapshots.py), so a run replays only the movements since the
+previous snapshot. The first run, and --rebuild, replay every movement once.
+
+Nothing is written to the headers unless --fix is given, and --fix only
+touches headers that did not change during the run and hold no pending
+stock reservation (earlier versions loaded at most 10,000 movements and
+$set every header's totals from them). Run --rebuild after movements were
+written outside the API (seed, restore or fix scripts).
+
+Usage:
+    python reconcile_inventory_stock.py [--fix] [--rebuild]
 """
+
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
-from dotenv import load_dotenv
+import sys
+from datetime import datetime, timezone
 from pathlib import Path
 
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
 ROOT_DIR = Path(__file__).parent / 'backend'
+sys.path.insert(0, str(ROOT_DIR))
+
+from db_indexes import ensure_indexes
+from inventory_snapshots import rebuild_inventory_snapshots, reconcile_inventory
+
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'gold_shop_erp')
-
-async def reconcile_inventory_stock():
-    """Reconcile inventory stock from movements"""
-    print("="*80)
-    print("INVENTORY STOCK RECONCILIATION")
-    print("="*80)
-    
-    client = AsyncIOMotorClient(mongo_url)
-    db = client[db_name]
-    
-    # Step 1: Get all inventory headers
-    print("\n[Step 1] Fetching inventory headers...")
-    headers = await db.inventory_headers.find({"is_deleted": False}).to_list(1000)
-    print(f"  ✓ Found {len(headers)} inventory headers")
-    
-    # Step 2: Get all stock movements
-    print("\n[Step 2] Fetching stock movements...")
-    movements = await db.stock_movements.find({"is_deleted": False}).to_list(10000)
-    print(f"  ✓ Found {len(movements)} stock movements")
-    
-    # Step 3: Calculate totals from movements
-    print("\n[Step 3] Calculating stock totals from movements...")
-    header_totals = {}
-    
-    for movement in movements:
-        header_id = movement.get('header_id')
-        if not header_id:
-            continue
-            
-        if header_id not in header_totals:
-            header_totals[header_id] = {
-                'qty': 0.0,
-                'weight': 0.0
-            }
-        
-        # Add the deltas
-        qty_delta = movement.get('qty_delta', 0)
-        weight_delta = movement.get('weight_delta', 0)
-        
-        header_totals[header_id]['qty'] += qty_delta
-        header_totals[header_id]['weight'] += weight_delta
-    
-    print(f"  ✓ Calculated totals for {len(header_totals)} headers")
-    
-    # Step 4: Update inventory headers with calculated totals
-    print("\n[Step 4] Updating inventory headers...")
-    updated_count = 0
-    
-    for header in headers:
-        header_id = header['id']
-        header_name = header['name']
-        
-        # Get calculated totals (default to 0 if no movements)
-        calculated_qty = header_totals.get(header_id, {}).get('qty', 0.0)
-        calculated_weight = header_totals.get(header_id, {}).get('weight', 0.0)
-        
-        # Ensure non-negative values
-        calculated_qty = max(0, calculated_qty)
-        calculated_weight = max(0, calculated_weight)
-        
-        # Get current values
-        current_qty = header.get('current_qty', 0)
-        current_weight = header.get('current_weight', 0)
-        
-        # Update if different or missing
-        if abs(current_qty - calculated_qty) > 0.001 or abs(current_weight - calculated_weight) > 0.001:
-            await db.inventory_headers.update_one(
-                {"id": header_id},
-                {
-                    "$set": {
-                        "current_qty": round(calculated_qty, 2),
-                        "current_weight": round(calculated_weight, 3)
-                    }
-                }
-            )
-            updated_count += 1
-            print(f"  ✓ Updated {header_name}:")
-            print(f"      Old: qty={current_qty}, weight={current_weight}g")
-            print(f"      New: qty={round(calculated_qty, 2)}, weight={round(calculated_weight, 3)}g")
-    
-    print(f"\n  ✓ Updated {updated_count} inventory headers")
-    
-    # Step 5: Verification
-    print("\n[Step 5] Verification...")
-    updated_headers = await db.inventory_headers.find({"is_deleted": False}).to_list(1000)
-    
-    total_qty = sum(h.get('current_qty', 0) for h in updated_headers)
-    total_weight = sum(h.get('current_weight', 0) for h in updated_headers)
-    headers_with_stock = len([h for h in updated_headers if h.get('current_qty', 0) > 0])
-    
-    print(f"\n  Total categories: {len(updated_headers)}")
-    print(f"  Categories with stock: {headers_with_stock}")
-    print(f"  Total quantity across all categories: {round(total_qty, 2)}")
-    print(f"  Total weight across all categories: {round(total_weight, 3)}g")
-    
-    print("\n" + "="*80)
-    print("✅ STOCK RECONCILIATION COMPLETED SUCCESSFULLY!")
-    print("="*80)
-    
-    client.close()
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'gold_shop_erp')
+client = AsyncIOMotorClient(MONGO_URL)
+db = client[DB_NAME]
+
+
+async def run(fix: bool = False, rebuild: bool = False):
+    print("\n" + "=" * 80)
+    print("  Inventory Stock Reconciliation - Gold Shop ERP")
+    print(f"  {'FIX MODE - Drifted headers will be corrected' if fix else 'CHECK MODE - No stock will be changed'}")
+    print(f"  Started at: {datetime.now(timezone.utc).isoformat()}")
+    print("=" * 80)
+
+    await ensure_indexes(db)
+    if rebuild:
+        written = await rebuild_inventory_snapshots(db)
+        print(f"\n  ✓ Snapshots rebuilt from a full replay: {written}")
+
+    result = await reconcile_inventory(db, fix=fix, snapshot=not rebuild)
+
+    for entry in result["drift"]:
+        status = {True: " → fixed", False: " → skipped (changed or reserved)"}.get(entry.get("fixed"), "")
+        print(f"\n  ✗ {entry['header_name']} ({entry['header_id']}){status}")
+        print(f"      qty:    stored {entry['stored_qty']}, movements {entry['expected_qty']}")
+        print(f"      weight: stored {entry['stored_weight']}g, movements {entry['expected_weight']}g")
+
+    print("\n" + "=" * 80)
+    print(f"  Headers checked: {result['checked']}")
+    print(f"  Drifted:         {len(result['drift'])}")
+    if fix:
+        print(f"  ✓ Fixed: {result['fixed']}, skipped: {result['skipped']}")
+    else:
+        print("  ℹ️  This was a CHECK run. Use --fix to correct drifted headers.")
+    print("=" * 80)
+    return result
+
+
+async def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reconcile inventory header stock with stock movements')
+    parser.add_argument('--fix', action='store_true', help='Set drifted headers to their movement totals')
+    parser.add_argument('--rebuild', action='store_true', help='Discard all snapshots and replay every movement')
+    args = parser.parse_args()
+
+    try:
+        result = await run(fix=args.fix, rebuild=args.rebuild)
+        if not args.fix and result["drift"]:
+            sys.exit(2)
+    except Exception as e:
+        print(f"\n✗ Reconciliation failed: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        client.close()
 
 if __name__ == "__main__":
-    asyncio.run(reconcile_inventory_stock())
+    asyncio.run(main())